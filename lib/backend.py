@@ -69,12 +69,15 @@ from ganeti import http
 from ganeti import utils
 from ganeti import ssh
 from ganeti import hypervisor
+from ganeti import impexpd
 from ganeti.hypervisor import hv_base
 from ganeti import constants
 from ganeti.storage import bdev
+from ganeti.storage import devwriter
 from ganeti.storage import drbd
 from ganeti.storage import extstorage
 from ganeti.storage import filestorage
+from ganeti.storage import lvmcache
 from ganeti import objects
 from ganeti import ssconf
 from ganeti import serializer
@@ -103,9 +106,13 @@ _X509_CERT_FILE = "cert"
 _IES_STATUS_FILE = "status"
 _IES_PID_FILE = "pid"
 _IES_CA_FILE = "ca"
+_DW_TASK_FILE = "task"
+_DW_STATUS_FILE = "status"
+_DW_PID_FILE = "pid"
 
-#: Valid LVS output line regex
-_LVSLINE_REGEX = re.compile(r"^ *([^|]+)\|([^|]+)\|([0-9.]+)\|([^|]{6,})\|?$")
+#: Maximum number of seconds to wait for a change of the status of DRBD
+#: devices, well below the RPC timeout
+_MAX_SYNC_WAIT_TIMEOUT = 300
 
 # Actions for the master setup script
 _MASTER_START = "start"
@@ -192,10 +199,11 @@ def _GetConfig():
   """Simple wrapper to return a SimpleStore.
 
   @rtype: L{ssconf.SimpleStore}
-  @return: a SimpleStore instance
+  @return: a SimpleStore instance, sharing the cached ssconf values of
+      this process
 
   """
-  return ssconf.SimpleStore()
+  return ssconf.SimpleStore(cached=True)
 
 
 def _GetSshRunner(cluster_name):
@@ -1251,7 +1259,7 @@ def VerifyNode(what, cluster_name, all_hvparams):
 
     # Try to contact all nodes
     val = {}
-    ssh_port_map = ssconf.SimpleStore().GetSshPortMap()
+    ssh_port_map = _GetConfig().GetSshPortMap()
     for node in nodes:
       # We only test if master candidates can communicate to other nodes.
       # We cannot test if normal nodes cannot communicate with other nodes,
@@ -1296,7 +1304,7 @@ def VerifyNode(what, cluster_name, all_hvparams):
 
   if constants.NV_LVLIST in what and vm_capable:
     try:
-      val = GetVolumeList(list(utils.ListVolumeGroups()))
+      val = GetVolumeList(list(ListVolumeGroups()))
     except RPCFail as err:
       val = str(err)
     result[constants.NV_LVLIST] = val
@@ -1304,7 +1312,7 @@ def VerifyNode(what, cluster_name, all_hvparams):
   _VerifyInstanceList(what, vm_capable, result, all_hvparams)
 
   if constants.NV_VGLIST in what and vm_capable:
-    result[constants.NV_VGLIST] = utils.ListVolumeGroups()
+    result[constants.NV_VGLIST] = ListVolumeGroups()
 
   if constants.NV_PVLIST in what and vm_capable:
     check_exclusive_pvs = constants.NV_EXCLUSIVEPVS in what
@@ -2367,23 +2375,22 @@ def GetVolumeList(vg_names):
       details.
 
   """
-  lvs = {}
-  sep = "|"
-  if not vg_names:
-    vg_names = []
-  result = utils.RunCmd(["lvs", "--noheadings", "--units=m", "--nosuffix",
-                         "--separator=%s" % sep,
-                         "-ovg_name,lv_name,lv_size,lv_attr"] + vg_names)
-  if result.failed:
-    _Fail("Failed to list logical volumes, lvs output: %s", result.output)
+  try:
+    report = lvmcache.GetReport(lvmcache.LVS)
+  except errors.GenericError as err:
+    _Fail("Failed to list logical volumes: %s", err)
 
-  for line in result.stdout.splitlines():
-    line = line.strip()
-    match = _LVSLINE_REGEX.match(line)
-    if not match:
-      logging.error("Invalid line returned from lvs output: '%s'", line)
+  lvs = {}
+  for row in report:
+    vg_name = row["vg_name"]
+    name = row["lv_name"]
+    attr = row["lv_attr"]
+    if vg_names and vg_name not in vg_names:
+      continue
+    if len(attr) < 6:
+      logging.error("Invalid attributes returned from lvs for %s/%s: '%s'",
+                    vg_name, name, attr)
       continue
-    vg_name, name, size, attr = match.groups()
     inactive = attr[4] == "-"
     online = attr[5] == "o"
     virtual = attr[0] == "v"
@@ -2391,7 +2398,7 @@ def GetVolumeList(vg_names):
       # we don't want to report such volumes as existing, since they
       # don't really hold data
       continue
-    lvs[vg_name + "/" + name] = (size, inactive, online)
+    lvs[vg_name + "/" + name] = ("%.2f" % row["lv_size"], inactive, online)
 
   return lvs
 
@@ -2404,7 +2411,10 @@ def ListVolumeGroups():
       size of the volume
 
   """
-  return utils.ListVolumeGroups()
+  vginfo = bdev.LogicalVolume.GetVGInfo([], False, filter_readonly=False)
+  if vginfo is None:
+    return {}
+  return dict((vg_name, int(vg_size)) for (_, vg_size, vg_name) in vginfo)
 
 
 def NodeVolumes():
@@ -2426,12 +2436,10 @@ def NodeVolumes():
     multiple times.
 
   """
-  result = utils.RunCmd(["lvs", "--noheadings", "--units=m", "--nosuffix",
-                         "--separator=|",
-                         "--options=lv_name,lv_size,devices,vg_name"])
-  if result.failed:
-    _Fail("Failed to list logical volumes, lvs output: %s",
-          result.output)
+  try:
+    report = lvmcache.GetReport(lvmcache.LVS)
+  except errors.GenericError as err:
+    _Fail("Failed to list logical volumes: %s", err)
 
   def parse_dev(dev):
     return dev.split("(")[0]
@@ -2439,17 +2447,12 @@ def NodeVolumes():
   def handle_dev(dev):
     return [parse_dev(x) for x in dev.split(",")]
 
-  def map_line(line):
-    line = [v.strip() for v in line]
-    return [{"name": line[0], "size": line[1],
-             "dev": dev, "vg": line[3]} for dev in handle_dev(line[2])]
-
   all_devs = []
-  for line in result.stdout.splitlines():
-    if line.count("|") >= 3:
-      all_devs.extend(map_line(line.split("|")))
-    else:
-      logging.warning("Strange line in the output from lvs: '%s'", line)
+  for row in report:
+    size = "%.2f" % row["lv_size"]
+    all_devs.extend({"name": row["lv_name"], "size": size,
+                     "dev": dev, "vg": row["vg_name"]}
+                    for dev in handle_dev(row["devices"]))
   return all_devs
 
 
@@ -3319,11 +3322,48 @@ def BlockdevCreate(disk, size, owner, on_primary, info, excl_stor):
   return device.unique_id
 
 
+def _WriteDevice(target_path, fn):
+  """Writes to a device using a L{devwriter.DeviceWriter}.
+
+  @type target_path: string
+  @param target_path: path of the device to write to
+  @type fn: callable
+  @param fn: function called with the writer
+
+  @rtype: tuple; (string, int, float)
+  @return: the methods used for writing, the number of bytes written and the
+    duration in seconds
+  @raise RPCFail: in case of failure
+
+  """
+  def _LogProgress(done, total):
+    logging.info("Writing to %s: %s of %s done", target_path,
+                 utils.FormatUnit(done // (1024 * 1024), "h"),
+                 utils.FormatUnit(total // (1024 * 1024), "h"))
+
+  try:
+    writer = devwriter.DeviceWriter(target_path, progress_fn=_LogProgress)
+    try:
+      fn(writer)
+    except:
+      writer.Abort()
+      raise
+    result = writer.Close()
+  except errors.BlockDeviceError as err:
+    _Fail("Can't write to %s: %s", target_path, err)
+
+  (methods, written, duration) = result
+  logging.info("Wrote %s to %s in %.1f seconds using %s", written, target_path,
+               duration, methods)
+  return result
+
+
 def _DumpDevice(source_path, target_path, offset, size, truncate):
   """This function images/wipes the device using a local file.
 
-  @type source_path: string
-  @param source_path: path of the image or data source (e.g., "/dev/zero")
+  @type source_path: string or None
+  @param source_path: path of the image or data source; C{None} for wiping
+    with zeroes
 
   @type target_path: string
   @param target_path: path of the device to image/wipe
@@ -3337,32 +3377,32 @@ def _DumpDevice(source_path, target_path, offset, size, truncate):
   @type truncate: bool
   @param truncate: whether the file should be truncated
 
-  @return: None
+  @rtype: tuple; (string, int, float)
+  @return: see L{_WriteDevice}
   @raise RPCFail: in case of failure
 
   """
-  # Internal sizes are always in Mebibytes; if the following "dd" command
-  # should use a different block size the offset and size given to this
-  # function must be adjusted accordingly before being passed to "dd".
-  block_size = constants.DD_BLOCK_SIZE
+  # Internal sizes are always in Mebibytes
+  offset *= constants.DD_BLOCK_SIZE
+  size *= constants.DD_BLOCK_SIZE
 
-  cmd = [constants.DD_CMD, "if=%s" % source_path, "seek=%d" % offset,
-         "bs=%s" % block_size, "oflag=direct", "of=%s" % target_path,
-         "count=%d" % size]
+  def _Write(writer):
+    if truncate:
+      writer.Truncate(offset)
+    if source_path is None:
+      writer.Zero(offset, size)
+    else:
+      writer.CopyFile(source_path, offset, size)
 
-  if not truncate:
-    cmd.append("conv=notrunc")
-
-  result = utils.RunCmd(cmd)
-
-  if result.failed:
-    _Fail("Dump command '%s' exited with error: %s; output: %s", result.cmd,
-          result.fail_reason, result.output)
+  return _WriteDevice(target_path, _Write)
 
 
 def _DownloadAndDumpDevice(source_url, target_path, size):
   """This function images a device using a downloaded image file.
 
+  The downloaded data is written in chunks of bounded size while the
+  download progresses.
+
   @type source_url: string
   @param source_url: URL of image to dump to disk
 
@@ -3372,44 +3412,41 @@ def _DownloadAndDumpDevice(source_url, target_path, size):
   @type size: int
   @param size: maximum size in MiB to write (data source might be smaller)
 
-  @rtype: NoneType
-  @return: None
+  @rtype: tuple; (string, int, float)
+  @return: see L{_WriteDevice}
   @raise RPCFail: in case of download or write failures
 
   """
-  class DDParams(object):
-    def __init__(self, current_size, total_size):
-      self.current_size = current_size
-      self.total_size = total_size
-      self.image_size_error = False
+  def _Write(writer):
+    image_size_error = []
 
-  def dd_write(ddparams, out):
-    if ddparams.current_size < ddparams.total_size:
-      ddparams.current_size += len(out)
-      target_file.write(out)
-    else:
-      ddparams.image_size_error = True
-      return -1
+    def _Feed(out):
+      if not writer.Feed(out):
+        image_size_error.append(True)
+        return -1
+      return None
 
-  target_file = open(target_path, "r+")
-  ddparams = DDParams(0, 1024 * 1024 * size)
+    writer.BeginStream(0, size * constants.DD_BLOCK_SIZE)
 
-  curl = pycurl.Curl()
-  curl.setopt(pycurl.VERBOSE, True)
-  curl.setopt(pycurl.NOSIGNAL, True)
-  curl.setopt(pycurl.USERAGENT, http.HTTP_GANETI_VERSION)
-  curl.setopt(pycurl.URL, source_url)
-  curl.setopt(pycurl.WRITEFUNCTION, lambda out: dd_write(ddparams, out))
+    curl = pycurl.Curl()
+    curl.setopt(pycurl.VERBOSE, True)
+    curl.setopt(pycurl.NOSIGNAL, True)
+    curl.setopt(pycurl.USERAGENT, http.HTTP_GANETI_VERSION)
+    curl.setopt(pycurl.URL, source_url)
+    curl.setopt(pycurl.WRITEFUNCTION, _Feed)
 
-  try:
-    curl.perform()
-  except pycurl.error:
-    if ddparams.image_size_error:
-      _Fail("Disk image larger than the disk")
-    else:
-      raise
+    try:
+      curl.perform()
+    except pycurl.error as err:
+      if image_size_error:
+        _Fail("Disk image larger than the disk")
+      _Fail("Can't download image from %s: %s", source_url, err)
+    finally:
+      curl.close()
 
-  target_file.close()
+    writer.EndStream()
+
+  return _WriteDevice(target_path, _Write)
 
 
 def BlockdevConvert(src_disk, target_disk):
@@ -3460,6 +3497,10 @@ def BlockdevWipe(disk, offset, size):
   @type size: int
   @param size: The size in MiB to write
 
+  @rtype: tuple; (string, int, float)
+  @return: the methods used for wiping, the number of bytes wiped and the
+    duration in seconds
+
   """
   try:
     rdev = _RecursiveFindBD(disk)
@@ -3477,7 +3518,161 @@ def BlockdevWipe(disk, offset, size):
   if (offset + size) > rdev.size:
     _Fail("Wipe offset and size are bigger than device size")
 
-  _DumpDevice("/dev/zero", rdev.dev_path, offset, size, True)
+  return _DumpDevice(None, rdev.dev_path, offset, size, True)
+
+
+def _GetDiskWipeGroup(disk, dev_path):
+  """Returns the group of a disk for wiping disks in parallel.
+
+  Disks in the same volume group or on the same file system share their
+  spindles, so only a few of them should be wiped at the same time.
+
+  @type disk: L{objects.Disk}
+  @type dev_path: string
+  @param dev_path: Path of the device or file of the disk
+  @rtype: string
+
+  """
+  while disk.dev_type == constants.DT_DRBD8 and disk.children:
+    # The data volume
+    disk = disk.children[0]
+
+  if disk.dev_type == constants.DT_PLAIN:
+    return "vg:%s" % disk.logical_id[0]
+
+  if disk.dev_type in constants.DTS_FILEBASED:
+    try:
+      return "fs:%s" % os.stat(os.path.dirname(dev_path)).st_dev
+    except EnvironmentError as err:
+      logging.warning("Can't stat(2) directory of %s: %s", dev_path, err)
+
+  return "dev:%s" % dev_path
+
+
+def StartDiskWipe(disks, offsets, parallel, instance):
+  """Starts wiping block devices in the background.
+
+  All disks are wiped by a single process (see L{pathutils.DISK_WIPE}),
+  which wipes at most C{parallel} disks of the same volume group or file
+  system at the same time.
+
+  @type disks: list of L{objects.Disk}
+  @param disks: the disks to wipe
+  @type offsets: list of int
+  @param offsets: for each disk, the offset in MiB to start wiping at
+  @type parallel: int
+  @param parallel: maximum number of disks wiped at the same time per volume
+    group or file system
+  @type instance: L{objects.Instance}
+  @param instance: the instance the disks belong to
+  @rtype: string
+  @return: the name of the wipe, to be used with L{GetDiskWipeStatus} and
+    L{CleanupDiskWipe}
+
+  """
+  if len(disks) != len(offsets):
+    _Fail("Number of offsets doesn't match number of disks")
+
+  task_disks = []
+  for (disk, offset) in zip(disks, offsets):
+    try:
+      rdev = _RecursiveFindBD(disk)
+    except errors.BlockDeviceError:
+      rdev = None
+
+    if not rdev:
+      _Fail("Cannot wipe device %s: device not found", disk.iv_name)
+    if offset < 0:
+      _Fail("Negative offset")
+    if offset > disk.size:
+      _Fail("Wipe offset is bigger than disk size")
+    if disk.size > rdev.size:
+      _Fail("Disk size is bigger than device size")
+
+    task_disks.append({
+      "path": rdev.dev_path,
+      "group": _GetDiskWipeGroup(disk, rdev.dev_path),
+      "offset": offset,
+      "size": disk.size,
+      })
+
+  status_dir = tempfile.mkdtemp(dir=pathutils.DISK_WIPE_DIR,
+                                prefix=("wipe-%s-" %
+                                        utils.TimestampForFilename()))
+  try:
+    task_file = utils.PathJoin(status_dir, _DW_TASK_FILE)
+    status_file = utils.PathJoin(status_dir, _DW_STATUS_FILE)
+    pid_file = utils.PathJoin(status_dir, _DW_PID_FILE)
+
+    utils.WriteFile(task_file, mode=0o400,
+                    data=serializer.DumpJson({
+                      "parallel": parallel,
+                      "disks": task_disks,
+                      }))
+
+    logfile = _InstanceLogName("wipe", instance.os, instance.name, None)
+
+    utils.StartDaemon([pathutils.DISK_WIPE, "--verbose", task_file,
+                       status_file],
+                      pidfile=pid_file, output=logfile)
+
+    return os.path.basename(status_dir)
+
+  except Exception:
+    shutil.rmtree(status_dir, ignore_errors=True)
+    raise
+
+
+def GetDiskWipeStatus(name):
+  """Returns the status of a background wipe.
+
+  @type name: string
+  @param name: the name of the wipe as returned by L{StartDiskWipe}
+  @rtype: dict
+  @return: the status as a serialized L{objects.DiskWipeStatus}
+
+  """
+  status_dir = utils.PathJoin(pathutils.DISK_WIPE_DIR, name)
+  pid = utils.ReadLockedPidFile(utils.PathJoin(status_dir, _DW_PID_FILE))
+
+  try:
+    data = utils.ReadFile(utils.PathJoin(status_dir, _DW_STATUS_FILE))
+  except EnvironmentError as err:
+    if err.errno != errno.ENOENT:
+      raise
+    data = None
+
+  if data:
+    status = serializer.LoadJson(data)
+  elif pid:
+    # Not reported yet
+    status = {}
+  else:
+    _Fail("Wiping disks (%s) stopped without reporting its status", name)
+
+  status["running"] = bool(pid)
+
+  return status
+
+
+def CleanupDiskWipe(name):
+  """Cleans up after a background wipe.
+
+  If the wipe process is still running it's killed. Afterwards the whole
+  status directory is removed.
+
+  """
+  logging.info("Finalizing disk wipe %s", name)
+
+  status_dir = utils.PathJoin(pathutils.DISK_WIPE_DIR, name)
+
+  pid = utils.ReadLockedPidFile(utils.PathJoin(status_dir, _DW_PID_FILE))
+
+  if pid:
+    logging.info("Disk wipe %s is still running with PID %s", name, pid)
+    utils.KillProcess(pid, waitpid=False)
+
+  shutil.rmtree(status_dir, ignore_errors=True)
 
 
 def BlockdevImage(disk, image, size):
@@ -3493,8 +3688,9 @@ def BlockdevImage(disk, image, size):
   @type size: int
   @param size: The size in MiB to write
 
-  @rtype: NoneType
-  @return: None
+  @rtype: tuple; (string, int, float)
+  @return: the methods used for writing, the number of bytes written and the
+    duration in seconds
   @raise RPCFail: in case of failure
 
   """
@@ -3514,9 +3710,9 @@ def BlockdevImage(disk, image, size):
     _Fail("Image size is bigger than device size")
 
   if utils.IsUrl(image):
-    _DownloadAndDumpDevice(image, rdev.dev_path, size)
+    return _DownloadAndDumpDevice(image, rdev.dev_path, size)
   else:
-    _DumpDevice(image, rdev.dev_path, 0, size, False)
+    return _DumpDevice(image, rdev.dev_path, 0, size, False)
 
 
 def BlockdevPauseResumeSync(disks, pause):
@@ -3793,6 +3989,85 @@ def BlockdevGetmirrorstatus(disks):
   return stats
 
 
+def BlockdevWaitForSyncChange(disks, sync_percents, sync_states, percent_step,
+                              timeout):
+  """Waits for a change of the mirroring status of a list of devices.
+
+  Only DRBD devices are watched (see L{drbd.DRBD8SyncWatcher}). The wait
+  ends as soon as the degradation or local disk status of any of them
+  differs from C{sync_states}, or when the progress of a synchronization
+  moves to another step of C{percent_step} percent compared to
+  C{sync_percents}.
+
+  @type disks: list of L{objects.Disk}
+  @param disks: the list of disks which we should watch
+  @type sync_percents: list
+  @param sync_percents: the last known synchronization percentage of each
+    disk, C{None} if it wasn't being synchronized
+  @type sync_states: list
+  @param sync_states: the last known (is_degraded, ldisk_status) of each
+    disk, C{None} if it is unknown
+  @type percent_step: number
+  @param percent_step: size of a progress step in percent
+  @type timeout: number
+  @param timeout: maximum number of seconds to wait
+  @rtype: list
+  @return: List of L{objects.BlockDevStatus}, one for each disk, like
+    L{BlockdevGetmirrorstatus}
+
+  """
+  if len(disks) != len(sync_percents):
+    _Fail("Number of synchronization percentages doesn't match number of"
+          " disks")
+  if len(disks) != len(sync_states):
+    _Fail("Number of synchronization states doesn't match number of disks")
+  if percent_step <= 0:
+    _Fail("Progress step must be positive")
+
+  timeout = max(0, min(timeout, _MAX_SYNC_WAIT_TIMEOUT))
+
+  rbds = []
+  minors = []
+  percents = []
+  states = []
+  changed = False
+  try:
+    for (dsk, percent, state) in zip(disks, sync_percents, sync_states):
+      rbd = _RecursiveFindBD(dsk)
+      if rbd is None:
+        _Fail("Can't find device %s", dsk)
+
+      rbds.append(rbd)
+
+      if not (isinstance(rbd, drbd.DRBD8Dev) and rbd.minor is not None):
+        continue
+
+      if state is not None:
+        state = tuple(state)
+        status = rbd.CombinedSyncStatus()
+        combined = (status.is_degraded, status.ldisk_status)
+        if combined != state:
+          changed = True
+        else:
+          status = rbd.GetSyncStatus()
+          if combined != (status.is_degraded, status.ldisk_status):
+            # The state is determined by the children, whose status doesn't
+            # change while the device is being watched
+            state = None
+
+      minors.append(rbd.minor)
+      percents.append(percent)
+      states.append(state)
+
+    if not changed:
+      drbd.DRBD8SyncWatcher(minors).Wait(percents, states, percent_step,
+                                         timeout)
+  except errors.BlockDeviceError as err:
+    _Fail("Can't watch the status of DRBD devices: %s", err, exc=True)
+
+  return [rbd.CombinedSyncStatus() for rbd in rbds]
+
+
 def BlockdevGetmirrorstatusMulti(disks):
   """Get the mirroring status of a list of devices.
 
@@ -5151,6 +5426,76 @@ def RemoveX509Certificate(name, cryptodir=pathutils.CRYPTO_KEYS_DIR):
           cert_dir, err)
 
 
+def _PrepareImportExportFile(mode, filename):
+  """Checks and prepares a file for import or export.
+
+  @type filename: string
+  @param filename: Path to the file, must be below the exports directory
+  @rtype: int or None
+  @return: Size of the file in MiB for exports, if known
+
+  """
+  if not utils.IsNormAbsPath(filename):
+    _Fail("Path '%s' is not normalized or absolute", filename)
+
+  real_filename = os.path.realpath(filename)
+  directory = os.path.dirname(real_filename)
+
+  if not utils.IsBelowDir(pathutils.EXPORT_DIR, real_filename):
+    _Fail("File '%s' is not under exports directory '%s': %s",
+          filename, pathutils.EXPORT_DIR, real_filename)
+
+  # Create directory
+  utils.Makedirs(directory, mode=0o750)
+
+  if mode != constants.IEM_EXPORT:
+    return None
+
+  # Retrieve file size
+  try:
+    st = os.stat(filename)
+  except EnvironmentError as err:
+    logging.error("Can't stat(2) %s: %s", filename, err)
+    return None
+
+  return utils.BytesToMebibyte(st.st_size)
+
+
+def _GetImportExportDevice(mode, ieio, ieargs):
+  """Returns the disk or file read or written by the native transport.
+
+  Unlike L{_GetImportExportIoCommand}, no commands are involved; the
+  import/export daemon accesses the device directly.
+
+  @param mode: Import/export mode
+  @param ieio: Input/output type
+  @param ieargs: Input/output arguments
+  @rtype: tuple; (string, int or None, int or None)
+  @return: Path, amount of data to export in MiB and expected size in MiB
+
+  """
+  assert mode in (constants.IEM_IMPORT, constants.IEM_EXPORT)
+
+  if ieio == constants.IEIO_FILE:
+    (filename, ) = ieargs
+    exp_size = _PrepareImportExportFile(mode, filename)
+    return (filename, None, exp_size)
+
+  if ieio == constants.IEIO_RAW_DISK:
+    (disk, ) = ieargs
+    real_disk = _OpenRealBD(disk)
+
+    if not real_disk.dev_path:
+      _Fail("Disk %s has no device path", disk)
+
+    if mode == constants.IEM_EXPORT:
+      return (real_disk.dev_path, disk.size, disk.size)
+
+    return (real_disk.dev_path, None, None)
+
+  _Fail("The native transport doesn't support %s I/O mode %r", mode, ieio)
+
+
 def _GetImportExportIoCommand(instance, mode, ieio, ieargs):
   """Returns the command for the requested input/output.
 
@@ -5171,18 +5516,7 @@ def _GetImportExportIoCommand(instance, mode, ieio, ieargs):
   if ieio == constants.IEIO_FILE:
     (filename, ) = ieargs
 
-    if not utils.IsNormAbsPath(filename):
-      _Fail("Path '%s' is not normalized or absolute", filename)
-
-    real_filename = os.path.realpath(filename)
-    directory = os.path.dirname(real_filename)
-
-    if not utils.IsBelowDir(pathutils.EXPORT_DIR, real_filename):
-      _Fail("File '%s' is not under exports directory '%s': %s",
-            filename, pathutils.EXPORT_DIR, real_filename)
-
-    # Create directory
-    utils.Makedirs(directory, mode=0o750)
+    exp_size = _PrepareImportExportFile(mode, filename)
 
     quoted_filename = utils.ShellQuote(filename)
 
@@ -5191,14 +5525,6 @@ def _GetImportExportIoCommand(instance, mode, ieio, ieargs):
     elif mode == constants.IEM_EXPORT:
       suffix = "< %s" % quoted_filename
 
-      # Retrieve file size
-      try:
-        st = os.stat(filename)
-      except EnvironmentError as err:
-        logging.error("Can't stat(2) %s: %s", filename, err)
-      else:
-        exp_size = utils.BytesToMebibyte(st.st_size)
-
   elif ieio == constants.IEIO_RAW_DISK:
     (disk, ) = ieargs
     real_disk = _OpenRealBD(disk)
@@ -5314,8 +5640,14 @@ def StartImportExportDaemon(mode, opts, host, port, instance, component,
   if (opts.key_name is None) ^ (opts.ca_pem is None):
     _Fail("Cluster certificate can only be used for both key and CA")
 
-  (cmd_env, cmd_prefix, cmd_suffix, exp_size) = \
-    _GetImportExportIoCommand(instance, mode, ieio, ieioargs)
+  if opts.transport == impexpd.TRANSPORT_NATIVE:
+    (device, device_size, exp_size) = \
+      _GetImportExportDevice(mode, ieio, ieioargs)
+    (cmd_env, cmd_prefix, cmd_suffix) = (None, None, None)
+  else:
+    (cmd_env, cmd_prefix, cmd_suffix, exp_size) = \
+      _GetImportExportIoCommand(instance, mode, ieio, ieioargs)
+    (device, device_size) = (None, None)
 
   if opts.key_name is None:
     # Use server.pem
@@ -5380,6 +5712,13 @@ def StartImportExportDaemon(mode, opts, host, port, instance, component,
     if cmd_suffix:
       cmd.append("--cmd-suffix=%s" % cmd_suffix)
 
+    if device:
+      cmd.append("--transport=%s" % impexpd.TRANSPORT_NATIVE)
+      cmd.append("--device=%s" % device)
+
+    if device_size is not None:
+      cmd.append("--device-size=%s" % device_size)
+
     if mode == constants.IEM_EXPORT:
       # Retry connection a few times when connecting to remote peer
       cmd.append("--connect-retries=%s" % constants.RIE_CONNECT_RETRIES)
@@ -136,8 +136,22 @@ __all__ = [
  QR_UNKNOWN,
  QR_INCOMPLETE) = range(3)
 
-#: Maximum batch size for ChooseJob
-_CHOOSE_BATCH = 25
+#: Minimum time in seconds between two rounds of querying many jobs
+_MULTI_POLL_MIN_INTERVAL = 0.5
+
+#: Maximum time in seconds between two rounds of querying many jobs
+_MULTI_POLL_MAX_INTERVAL = 5.0
+
+#: Number of failed rounds in a row after which waiting for jobs is given up
+_MULTI_POLL_MAX_ERRORS = 5
+
+#: Job states in which a job doesn't change anymore
+_JOB_FINAL_STATUSES = frozenset([
+  constants.JOB_STATUS_SUCCESS,
+  constants.JOB_STATUS_ERROR,
+  constants.JOB_STATUS_CANCELING,
+  constants.JOB_STATUS_CANCELED,
+  ])
 
 
 # constants used to create InstancePolicy dictionary
@@ -771,8 +785,23 @@ def GenericPollJob(job_id, cbs, report_cbs, cancel_fn=None,
   if not jobs:
     raise errors.JobLost("Job with id %s lost" % job_id)
 
-  status, opstatus, result = jobs[0]
+  return _CheckJobResult(*jobs[0])
+
+
+def _CheckJobResult(status, opstatus, result):
+  """Evaluates the result of a finished job.
+
+  @type status: string
+  @param status: the job status
+  @type opstatus: list
+  @param opstatus: the status of the opcodes
+  @type result: list
+  @param result: the results of the opcodes
+  @return: the opresult of the job
+  @raise errors.JobCanceled: If job is canceled
+  @raise errors.OpExecError: If job didn't succeed
 
+  """
   if status == constants.JOB_STATUS_SUCCESS:
     return result
 
@@ -796,6 +825,133 @@ def GenericPollJob(job_id, cbs, report_cbs, cancel_fn=None,
   raise errors.OpExecError(result)
 
 
+def GenericPollJobs(job_ids, cbs, report_cbs,
+                    min_interval=_MULTI_POLL_MIN_INTERVAL,
+                    max_interval=_MULTI_POLL_MAX_INTERVAL,
+                    max_errors=_MULTI_POLL_MAX_ERRORS,
+                    _time_fn=time.time, _sleep_fn=time.sleep):
+  """Waits for many jobs at once.
+
+  Instead of waiting for one job after the other, all outstanding jobs are
+  tracked together. Each round queries the status of all jobs with a single
+  call and fetches the log messages and results of running and finished
+  jobs with another one; in between, the client waits for a change of one
+  of the jobs, but at most for C{max_interval} seconds. As a round is
+  started at most every C{min_interval} seconds, the number of calls per
+  second doesn't depend on the number of jobs.
+
+  A round in which a call fails is retried after C{max_interval} seconds.
+  Only after C{max_errors} failed rounds in a row, the jobs still being
+  waited for are given up on, with the last error as their error.
+
+  @type job_ids: list
+  @param job_ids: Job IDs
+  @type cbs: Instance of L{JobPollCbBase}
+  @param cbs: Data callbacks
+  @type report_cbs: Instance of L{JobPollReportCbBase}
+  @param report_cbs: Reporting callbacks
+  @return: generator of tuples (job ID, error, opresult) in the order the
+      jobs finish; error is C{None} for successful jobs and otherwise the
+      exception L{GenericPollJob} would have raised
+
+  """
+  if min_interval <= 0 or max_interval < min_interval:
+    raise errors.ParameterError("Invalid intervals for waiting for jobs")
+
+  pending = list(job_ids)
+  log_serials = dict.fromkeys(pending)
+  statuses = dict.fromkeys(pending)
+  failed_rounds = 0
+
+  while pending:
+    start = _time_fn()
+
+    queried = pending[:]
+    try:
+      infos = cbs.QueryJobs(queried, ["status"])
+      changed = [job_id for (job_id, job_info) in zip(queried, infos)
+                 if job_info and
+                 (job_info[0] == constants.JOB_STATUS_RUNNING or
+                  job_info[0] in _JOB_FINAL_STATUSES)]
+      if changed:
+        details = cbs.QueryJobs(changed, ["status", "oplog", "opstatus",
+                                          "opresult"])
+      else:
+        details = []
+    except (errors.GenericError, rpcerr.ProtocolError) as err:
+      failed_rounds += 1
+      if failed_rounds >= max_errors:
+        for job_id in pending:
+          yield (job_id, err, None)
+        return
+      logging.warning("Querying jobs failed, retrying: %s", err)
+      _sleep_fn(max_interval)
+      continue
+
+    failed_rounds = 0
+
+    for (job_id, job_info) in zip(queried, infos):
+      if not job_info:
+        pending.remove(job_id)
+        yield (job_id, errors.JobLost("Job with id %s lost" % job_id), None)
+      else:
+        statuses[job_id] = job_info[0]
+
+    for (job_id, job_info) in zip(changed, details):
+      if job_id not in pending:
+        continue
+
+      if not job_info:
+        pending.remove(job_id)
+        yield (job_id, errors.JobLost("Job with id %s lost" % job_id), None)
+        continue
+
+      (status, oplog, opstatus, opresult) = job_info
+      statuses[job_id] = status
+
+      prev_serial = log_serials[job_id]
+      for (serial, timestamp, log_type, message) in \
+          sorted(entry for op_log in oplog for entry in op_log):
+        if prev_serial is None or serial > prev_serial:
+          report_cbs.ReportLogMessage(job_id, serial, timestamp, log_type,
+                                      message)
+          log_serials[job_id] = serial
+
+      if status in _JOB_FINAL_STATUSES:
+        pending.remove(job_id)
+        try:
+          result = _CheckJobResult(status, opstatus, opresult)
+        except errors.GenericError as err:
+          yield (job_id, err, None)
+        else:
+          yield (job_id, None, result)
+
+    if not pending:
+      break
+
+    # Wait for a change, preferably of a running job
+    running = [job_id for job_id in pending
+               if statuses[job_id] == constants.JOB_STATUS_RUNNING]
+    job_id = (running or pending)[0]
+    timeout = max(max_interval - (_time_fn() - start), 0)
+    if timeout > 0:
+      try:
+        result = cbs.WaitForJobChangeOnce(job_id, ["status"],
+                                          [statuses[job_id]],
+                                          log_serials[job_id], timeout=timeout)
+      except (errors.GenericError, rpcerr.ProtocolError) as err:
+        # The wait is only used to wake up early, the next round's queries
+        # tell whether the error persists
+        logging.warning("Waiting for job %s failed: %s", job_id, err)
+      else:
+        if result == constants.JOB_NOTCHANGED:
+          report_cbs.ReportNotChanged(job_id, statuses[job_id])
+
+    delay = min_interval - (_time_fn() - start)
+    if delay > 0:
+      _sleep_fn(delay)
+
+
 class JobPollCbBase(object):
   """Base class for L{GenericPollJob} callbacks.
 
@@ -2478,42 +2634,23 @@ class JobExecutor(object):
     for ((status, data), (idx, name, _)) in zip(results, self.queue):
       self.jobs.append((idx, status, data, name))
 
-  def _ChooseJob(self):
-    """Choose a non-waiting/queued job to poll next.
+  def _GetReporter(self):
+    """Returns the reporting callbacks for the jobs' log messages.
 
     """
-    assert self.jobs, "_ChooseJob called with empty job list"
-
-    result = self.cl.QueryJobs([i[2] for i in self.jobs[:_CHOOSE_BATCH]],
-                               ["status"])
-    assert result
-
-    for job_data, status in zip(self.jobs, result):
-      if (isinstance(status, list) and status and
-          status[0] in (constants.JOB_STATUS_QUEUED,
-                        constants.JOB_STATUS_WAITING,
-                        constants.JOB_STATUS_CANCELING)):
-        # job is still present and waiting
-        continue
-      # good candidate found (either running job or lost job)
-      self.jobs.remove(job_data)
-      return job_data
-
-    # no job found
-    return self.jobs.pop(0)
+    if self.feedback_fn:
+      return FeedbackFnJobPollReportCb(self.feedback_fn)
+    return StdioJobPollReportCb()
 
-  def GetResults(self):
-    """Wait for and return the results of all jobs.
+  def _IterResults(self):
+    """Waits for all jobs and yields their results as they complete.
 
-    @rtype: list
-    @return: list of tuples (success, job results), in the same order
-        as the submitted jobs; if a job has failed, instead of the result
-        there will be the error message
+    @return: generator of tuples (index, job ID, name, success, job result),
+        the job ID being C{None} for jobs which couldn't be submitted
 
     """
     if not self.jobs:
       self.SubmitPending()
-    results = []
     if self.verbose:
       ok_jobs = [row[2] for row in self.jobs if row[1]]
       if ok_jobs:
@@ -2523,33 +2660,67 @@ class JobExecutor(object):
     self.jobs, failures = compat.partition(self.jobs, lambda x: x[1])
     for idx, _, jid, name in failures:
       ToStderr("Failed to submit job%s: %s", self._IfName(name, " for %s"), jid)
-      results.append((idx, False, jid))
+      yield (idx, None, name, False, jid)
 
-    while self.jobs:
-      (idx, _, jid, name) = self._ChooseJob()
-      ToStdout("Waiting for job %s%s ...", jid, self._IfName(name, " for %s"))
-      try:
-        job_result = PollJob(jid, cl=self.cl, feedback_fn=self.feedback_fn)
+    if not self.jobs:
+      return
+
+    jobs = dict((jid, (idx, name)) for (idx, _, jid, name) in self.jobs)
+    ToStdout("Waiting for job%s %s ...", len(jobs) > 1 and "s" or "",
+             utils.CommaJoin(jid for (_, _, jid, _) in self.jobs))
+
+    for (jid, err, job_result) in \
+        GenericPollJobs([jid for (_, _, jid, _) in self.jobs],
+                        _LuxiJobPollCb(self.cl), self._GetReporter()):
+      (idx, name) = jobs[jid]
+      if err is None:
         success = True
-      except errors.JobLost as err:
+      elif isinstance(err, errors.JobLost):
         _, job_result = FormatError(err)
         ToStderr("Job %s%s has been archived, cannot check its result",
                  jid, self._IfName(name, " for %s"))
         success = False
-      except (errors.GenericError, rpcerr.ProtocolError) as err:
+      else:
         _, job_result = FormatError(err)
         success = False
         # the error message will always be shown, verbose or not
         ToStderr("Job %s%s has failed: %s",
                  jid, self._IfName(name, " for %s"), job_result)
 
-      results.append((idx, success, job_result))
+      yield (idx, jid, name, success, job_result)
+
+    self.jobs = []
+
+  def IterResults(self):
+    """Waits for all jobs and yields their results as they complete.
+
+    @return: generator of tuples (job ID, name, success, job result) in the
+        order the jobs finish; jobs which couldn't be submitted come first,
+        with C{None} as job ID and the error message as result
+
+    """
+    for (_, jid, name, success, job_result) in self._IterResults():
+      yield (jid, name, success, job_result)
+
+  def GetResults(self, ordered=True):
+    """Wait for and return the results of all jobs.
+
+    @type ordered: bool
+    @param ordered: whether to return the results in the order the jobs were
+        submitted in, or in the order they finished
+    @rtype: list
+    @return: list of tuples (success, job results); if a job has failed,
+        instead of the result there will be the error message
+
+    """
+    results = [(idx, success, job_result)
+               for (idx, _, _, success, job_result) in self._IterResults()]
 
-    # sort based on the index, then drop it
-    results.sort()
-    results = [i[1:] for i in results]
+    if ordered:
+      # sort based on the index, then drop it
+      results.sort(key=compat.fst)
 
-    return results
+    return [i[1:] for i in results]
 
   def WaitOrShow(self, wait):
     """Wait for job results or only print the job IDs.
@@ -1012,7 +1012,7 @@ class LUClusterVerifyGroup(LogicalUnit, _VerifyErrors):
       for prinode, inst_uuids in n_img.sbp.items():
         needed_mem = 0
         for inst_uuid in inst_uuids:
-          bep = cluster_info.FillBE(all_insts[inst_uuid])
+          bep = cluster_info.GetFilledBE(all_insts[inst_uuid])
           if bep[constants.BE_AUTO_BALANCE]:
             needed_mem += bep[constants.BE_MINMEM]
         test = n_img.mfree < needed_mem
@@ -1983,7 +1983,7 @@ class LUClusterVerifyGroup(LogicalUnit, _VerifyErrors):
       bridges.add(default_nicpp[constants.NIC_LINK])
     for inst_uuid in self.my_inst_info.values():
       for nic in inst_uuid.nics:
-        full_nic = cluster.SimpleFillNIC(nic.nicparams)
+        full_nic = cluster.GetFilledNIC(nic.nicparams)
         if full_nic[constants.NIC_MODE] == constants.NIC_MODE_BRIDGED:
           bridges.add(full_nic[constants.NIC_LINK])
 
@@ -2228,7 +2228,7 @@ class LUClusterVerifyGroup(LogicalUnit, _VerifyErrors):
       if not utils.AllDiskOfType(inst_disks, constants.DTS_MIRRORED):
         i_non_redundant.append(instance)
 
-      if not cluster.FillBE(instance)[constants.BE_AUTO_BALANCE]:
+      if not cluster.GetFilledBE(instance)[constants.BE_AUTO_BALANCE]:
         i_non_a_balanced.append(instance)
 
     feedback_fn("* Verifying orphan volumes")
@@ -66,6 +66,21 @@ _DISK_TEMPLATE_NAME_PREFIX = {
   constants.DT_SHARED_FILE: ".sharedfile",
   }
 
+#: Seconds between two queries of the status of a background disk wipe
+_WIPE_POLL_INTERVAL = 5.0
+
+#: How often a background disk wipe is resumed after it stopped unexpectedly
+_WIPE_MAX_RESUMES = 3
+
+#: Maximum number of seconds a node waits for a change of the sync status
+_SYNC_WAIT_TIMEOUT = 60
+
+#: Size of the steps (in percent) in which the sync progress is reported
+_SYNC_PERCENT_STEP = 5.0
+
+#: Seconds to wait for degraded disks to settle before reporting them
+_SYNC_DEGRADED_TIMEOUT = 10
+
 
 def CreateSingleBlockDev(lu, node_uuid, instance, device, info, force_open,
                          excl_stor):
@@ -1218,20 +1233,98 @@ def _DiskSizeInBytesToMebibytes(lu, size):
   return mib
 
 
-def _CalcEta(time_taken, written, total_size):
-  """Calculates the ETA based on size written and total size.
+def _WaitForDiskWipe(lu, node_uuid, name, sleep_fn):
+  """Waits for a background disk wipe to finish.
+
+  Progress is reported at most once a minute.
+
+  @rtype: L{objects.DiskWipeStatus}
+  @return: the last status of the wipe
+
+  """
+  node_name = lu.cfg.GetNodeName(node_uuid)
+  last_output = time.time()
+
+  while True:
+    result = lu.rpc.call_blockdev_wipe_status(node_uuid, name)
+    result.Raise("Could not get the status of wiping disks on node '%s'" %
+                 node_name)
+    status = result.payload
+
+    if not status.running:
+      return status
+
+    now = time.time()
+    if (now - last_output >= 60 and
+        status.progress_percent is not None and
+        status.progress_eta is not None):
+      lu.LogInfo(" - done: %.1f%% ETA: %s", status.progress_percent,
+                 utils.FormatSeconds(status.progress_eta))
+      last_output = now
+
+    sleep_fn(_WIPE_POLL_INTERVAL)
+
+
+def _WipeDisksInBackground(lu, instance, disks, sleep_fn):
+  """Wipes disks using a background task on the primary node.
 
-  @param time_taken: The time taken so far
-  @param written: amount written so far
-  @param total_size: The total size of data to be written
-  @return: The remaining time in seconds
+  The node wipes all disks concurrently (see L{constants.WIPE_MAX_PARALLEL}).
+  If the task stops unexpectedly, e.g. because it was killed, a new one is
+  started at the offsets the disks had been wiped up to.
+
+  @see: L{WipeDisks}
 
   """
-  avg_time = time_taken / float(written)
-  return (total_size - written) * avg_time
+  node_uuid = instance.primary_node
+  node_name = lu.cfg.GetNodeName(node_uuid)
+  devices = [device for (_, device, _) in disks]
+  offsets = [offset for (_, _, offset) in disks]
+  resumes = 0
+
+  while True:
+    result = lu.rpc.call_blockdev_wipe_start(node_uuid, (devices, instance),
+                                             offsets,
+                                             constants.WIPE_MAX_PARALLEL,
+                                             instance)
+    result.Raise("Could not start wiping disks on node '%s'" % node_name)
+    name = result.payload
 
+    try:
+      status = _WaitForDiskWipe(lu, node_uuid, name, sleep_fn)
+    finally:
+      result = lu.rpc.call_blockdev_wipe_cleanup(node_uuid, name)
+      if result.fail_msg:
+        lu.LogWarning("Failed to clean up after wiping disks on node '%s': %s",
+                      node_name, result.fail_msg)
+
+    if status.exit_status == 0:
+      for ((idx, _, _), disk_status) in zip(disks, status.disks):
+        logging.debug("Wiped disk %d using %s", idx, disk_status["methods"])
+      return
+
+    if status.exit_status is not None:
+      for ((idx, _, _), disk_status) in zip(disks, status.disks):
+        if disk_status["error"]:
+          raise errors.OpExecError("Could not wipe disk %d at offset %d: %s" %
+                                   (idx, disk_status["offset"],
+                                    disk_status["error"]))
+      raise errors.OpExecError("Could not wipe disks on node '%s': %s" %
+                               (node_name, status.error_message))
+
+    if resumes >= _WIPE_MAX_RESUMES:
+      raise errors.OpExecError("Wiping disks on node '%s' stopped"
+                               " unexpectedly %d times, giving up" %
+                               (node_name, resumes + 1))
+
+    if status.disks:
+      offsets = [disk_status["offset"] for disk_status in status.disks]
 
-def WipeDisks(lu, instance, disks=None):
+    resumes += 1
+    lu.LogWarning("Wiping disks on node '%s' stopped unexpectedly, resuming",
+                  node_name)
+
+
+def WipeDisks(lu, instance, disks=None, _sleep_fn=time.sleep):
   """Wipes instance disks.
 
   @type lu: L{LogicalUnit}
@@ -1266,47 +1359,20 @@ def WipeDisks(lu, instance, disks=None):
 
   try:
     for (idx, device, offset) in disks:
-      # The wipe size is MIN_WIPE_CHUNK_PERCENT % of the instance disk but
-      # MAX_WIPE_CHUNK at max. Truncating to integer to avoid rounding errors.
-      wipe_chunk_size = \
-        int(min(constants.MAX_WIPE_CHUNK,
-                device.size / 100.0 * constants.MIN_WIPE_CHUNK_PERCENT))
-
-      size = device.size
-      last_output = 0
-      start_time = time.time()
-
       if offset == 0:
         info_text = ""
       else:
         info_text = (" (from %s to %s)" %
                      (utils.FormatUnit(offset, "h"),
-                      utils.FormatUnit(size, "h")))
+                      utils.FormatUnit(device.size, "h")))
 
       lu.LogInfo("* Wiping disk %s%s", idx, info_text)
 
-      logging.info("Wiping disk %d for instance %s on node %s using"
-                   " chunk size %s", idx, instance.name, node_name,
-                   wipe_chunk_size)
-
-      while offset < size:
-        wipe_size = min(wipe_chunk_size, size - offset)
+    logging.info("Wiping %d disk(s) of instance %s on node %s", len(disks),
+                 instance.name, node_name)
 
-        logging.debug("Wiping disk %d, offset %s, chunk %s",
-                      idx, offset, wipe_size)
-
-        result = lu.rpc.call_blockdev_wipe(node_uuid, (device, instance),
-                                           offset, wipe_size)
-        result.Raise("Could not wipe disk %d at offset %d for size %d" %
-                     (idx, offset, wipe_size))
-
-        now = time.time()
-        offset += wipe_size
-        if now - last_output >= 60:
-          eta = _CalcEta(now - start_time, offset, size)
-          lu.LogInfo(" - done: %.1f%% ETA: %s",
-                     offset / float(size) * 100, utils.FormatSeconds(eta))
-          last_output = now
+    if disks:
+      _WipeDisksInBackground(lu, instance, disks, _sleep_fn)
   finally:
     logging.info("Resuming synchronization of disks for instance '%s'",
                  instance.name)
@@ -1370,6 +1436,11 @@ def ImageDisks(lu, instance, image, disks=None):
                                           image, device.size)
       result.Raise("Could not image disk '%d' for instance '%s' on node '%s'" %
                    (idx, instance.name, node_name))
+      if result.payload:
+        (_, written, duration) = result.payload
+        lu.LogInfo(" - wrote %s in %s",
+                   utils.FormatUnit(written // (1024 * 1024), "h"),
+                   utils.FormatSeconds(duration))
   finally:
     logging.info("Resuming synchronization of disks for instance '%s'",
                  instance.name)
@@ -1432,9 +1503,15 @@ def ExpandCheckDisks(instance_disks, disks):
     return disks
 
 
-def WaitForSync(lu, instance, disks=None, oneshot=False):
+def WaitForSync(lu, instance, disks=None, oneshot=False, _time_fn=time.time):
   """Sleep and poll for an instance's disk to sync.
 
+  Instead of polling the node at fixed intervals, the node is asked to
+  return as soon as the state of a disk changes or the sync progresses by
+  another L{_SYNC_PERCENT_STEP} percent (see C{blockdev_wait_sync_change}).
+  If that fails, e.g. because the node doesn't support it yet, the node is
+  polled for the rest of the call.
+
   """
   inst_disks = lu.cfg.GetInstanceDisks(instance.uuid)
   if not inst_disks or disks is not None and not disks:
@@ -1449,22 +1526,43 @@ def WaitForSync(lu, instance, disks=None, oneshot=False):
   node_uuid = instance.primary_node
   node_name = lu.cfg.GetNodeName(node_uuid)
 
-  # TODO: Convert to utils.Retry
-
   retries = 0
-  degr_retries = 10 # in seconds, as we sleep 1 second each time
+  degr_deadline = None
+  # The synchronization percentages and states of the last successful
+  # query, None if the status has to be queried without waiting
+  sync_percents = None
+  sync_states = None
+  timeout = _SYNC_WAIT_TIMEOUT
+  long_poll = True
   while True:
-    max_time = 0
     done = True
     cumul_degraded = False
-    rstats = lu.rpc.call_blockdev_getmirrorstatus(node_uuid, (disks, instance))
+    max_time = 0
+    if sync_percents is None or not long_poll:
+      rstats = lu.rpc.call_blockdev_getmirrorstatus(node_uuid,
+                                                    (disks, instance))
+    else:
+      rstats = lu.rpc.call_blockdev_wait_sync_change(node_uuid,
+                                                     (disks, instance),
+                                                     sync_percents,
+                                                     sync_states,
+                                                     _SYNC_PERCENT_STEP,
+                                                     timeout)
     msg = rstats.fail_msg
+    if msg and long_poll and sync_percents is not None:
+      # polling from now on also keeps the successful queries of the
+      # mirror status from resetting the retries below
+      lu.LogWarning("Can't wait for sync changes on node %s, polling"
+                    " instead: %s", node_name, msg)
+      long_poll = False
+      continue
     if msg:
       lu.LogWarning("Can't get any data from node %s: %s", node_name, msg)
       retries += 1
       if retries >= 10:
         raise errors.RemoteError("Can't contact node %s for mirror data,"
                                  " aborting." % node_name)
+      sync_percents = None
       time.sleep(6)
       continue
     rstats = rstats.payload
@@ -1489,19 +1587,34 @@ def WaitForSync(lu, instance, disks=None, oneshot=False):
         lu.LogInfo("- device %s: %5.2f%% done, %s",
                    disks[i].iv_name, mstat.sync_percent, rem_time)
 
-    # if we're done but degraded, let's do a few small retries, to
-    # make sure we see a stable and not transient situation; therefore
-    # we force restart of the loop
-    if (done or oneshot) and cumul_degraded and degr_retries > 0:
-      logging.info("Degraded disks found, %d retries left", degr_retries)
-      degr_retries -= 1
-      time.sleep(1)
-      continue
+    sync_percents = [getattr(mstat, "sync_percent", None)
+                     for mstat in rstats]
+    sync_states = [(mstat.is_degraded, mstat.ldisk_status)
+                   if mstat is not None else None
+                   for mstat in rstats]
+    timeout = _SYNC_WAIT_TIMEOUT
+
+    # if we're done but degraded, let's wait a bit for changes, to make
+    # sure we see a stable and not transient situation; therefore we force
+    # restart of the loop
+    if (done or oneshot) and cumul_degraded:
+      now = _time_fn()
+      if degr_deadline is None:
+        degr_deadline = now + _SYNC_DEGRADED_TIMEOUT
+      if now < degr_deadline:
+        logging.info("Degraded disks found, waiting up to %.1f seconds",
+                     degr_deadline - now)
+        if long_poll:
+          timeout = degr_deadline - now
+        else:
+          time.sleep(1)
+        continue
 
     if done or oneshot:
       break
 
-    time.sleep(min(60, max_time))
+    if not long_poll:
+      time.sleep(min(60, max_time))
 
   if done:
     lu.LogInfo("Instance %s's disks are in sync", instance.name)
@@ -54,6 +54,7 @@ import time
 import threading
 import itertools
 
+from ganeti.config.index import ConfigIndex
 from ganeti.config.temporary_reservations import TemporaryReservationManager
 from ganeti.config.utils import ConfigSync, ConfigManager
 from ganeti.config.verify import (VerifyType, VerifyNic, VerifyIpolicy,
@@ -62,6 +63,7 @@ from ganeti.config.verify import (VerifyType, VerifyNic, VerifyIpolicy,
 from ganeti import errors
 from ganeti import utils
 from ganeti import constants
+from ganeti import metrics
 import ganeti.wconfd as wc
 from ganeti import objects
 from ganeti import serializer
@@ -122,12 +124,14 @@ def GetConfig(ec_id, livelock, **kwargs):
 # job id used for resource management at config upgrade time
 _UPGRADE_CONFIG_JID = "jid-cfg-upgrade"
 
+# containers of the configuration whose changes are sent to WConfd
+# incrementally; filters are only ever modified by WConfd itself
+_DELTA_CONTAINERS = ("nodes", "nodegroups", "instances", "networks", "disks")
 
-def _MatchNameComponentIgnoreCase(short_name, names):
-  """Wrapper around L{utils.text.MatchNameComponent}.
-
-  """
-  return utils.MatchNameComponent(short_name, names, case_sensitive=False)
+_CONFIG_DURATION = metrics.REGISTRY.Histogram(
+  "ganeti_config_duration_seconds",
+  "Time spent reading, locking and writing the configuration",
+  ["operation"])
 
 
 def _CheckInstanceDiskIvNames(disks):
@@ -157,6 +161,10 @@ class ConfigWriter(object):
   Each thread must construct a separate instance.
 
   @ivar _all_rms: a list of all temporary reservation managers
+  @ivar _config_serials: the serial numbers of the objects of the
+      configuration as last received from WConfd, by container and UUID
+  @ivar _index: the L{ConfigIndex} of the configuration data, built on
+      first use
 
   Currently the class fulfills 3 main functions:
     1. lock the configuration for access (monitor)
@@ -168,6 +176,9 @@ class ConfigWriter(object):
                accept_foreign=False, wconfdcontext=None, wconfd=None):
     self.write_count = 0
     self._config_data = None
+    self._config_outdated = False
+    self._config_serials = None
+    self._index = None
     self._SetConfigData(None)
     self._offline = offline
     if cfg_file is None:
@@ -194,10 +205,32 @@ class ConfigWriter(object):
     return self._config_data
 
   def OutDate(self):
-    self._config_data = None
+    # Keep the outdated copy, so that only the changes since need to be
+    # fetched from WConfd
+    self._config_outdated = True
 
   def _SetConfigData(self, cfg):
     self._config_data = cfg
+    self._index = None
+
+  def _Index(self):
+    """Returns the index of the configuration data, building it if needed.
+
+    @rtype: L{ConfigIndex}
+
+    """
+    if self._index is None:
+      self._index = ConfigIndex(self._ConfigData())
+    return self._index
+
+  def _UpdateIndex(self, key, uuid):
+    """Updates the index after an object was changed locally.
+
+    @see: L{ConfigIndex.Update}
+
+    """
+    if self._index is not None:
+      self._index.Update(key, uuid)
 
   def _GetWConfdContext(self):
     return self._wconfdcontext
@@ -328,14 +361,16 @@ class ConfigWriter(object):
       raise errors.ConfigurationError("Disk %s doesn't exist" % disk_uuid)
 
     # Disk must not be attached anywhere
-    for inst in self._ConfigData().instances.values():
-      if disk_uuid in inst.disks:
-        raise errors.ReservationError("Cannot remove disk %s. Disk is"
-                                      " attached to instance %s"
-                                      % (disk_uuid, inst.name))
+    inst_uuid = self._Index().GetDiskInstance(disk_uuid)
+    if inst_uuid is not None:
+      inst_name = self._UnlockedGetInstanceName(inst_uuid)
+      raise errors.ReservationError("Cannot remove disk %s. Disk is"
+                                    " attached to instance %s"
+                                    % (disk_uuid, inst_name))
 
     # Remove disk from config file
     del self._ConfigData().disks[disk_uuid]
+    self._UpdateIndex("disks", disk_uuid)
     self._ConfigData().cluster.serial_no += 1
 
   def RemoveInstanceDisk(self, inst_uuid, disk_uuid):
@@ -387,18 +422,14 @@ class ConfigWriter(object):
     @return: the disk object
 
     """
-    disk = None
-    count = 0
-    for d in self._ConfigData().disks.values():
-      if d.name == disk_name:
-        count += 1
-        disk = d
-
-    if count > 1:
+    disk_uuids = self._Index().LookupName("disks", disk_name)
+    if len(disk_uuids) > 1:
       raise errors.ConfigurationError("There are %s disks with this name: %s"
-                                      % (count, disk_name))
+                                      % (len(disk_uuids), disk_name))
 
-    return disk
+    if disk_uuids:
+      return self._ConfigData().disks[disk_uuids[0]]
+    return None
 
   @ConfigSync(shared=1)
   def GetDiskInfoByName(self, disk_name):
@@ -1456,6 +1487,7 @@ class ConfigWriter(object):
     group.UpgradeConfig()
 
     self._ConfigData().nodegroups[group.uuid] = group
+    self._UpdateIndex("nodegroups", group.uuid)
     self._ConfigData().cluster.serial_no += 1
 
   @ConfigSync()
@@ -1475,6 +1507,7 @@ class ConfigWriter(object):
             "Group '%s' is the only group, cannot be removed" % group_uuid
 
     del self._ConfigData().nodegroups[group_uuid]
+    self._UpdateIndex("nodegroups", group_uuid)
     self._ConfigData().cluster.serial_no += 1
 
   def _UnlockedLookupNodeGroup(self, target):
@@ -1495,9 +1528,9 @@ class ConfigWriter(object):
         return list(self._ConfigData().nodegroups)[0]
     if target in self._ConfigData().nodegroups:
       return target
-    for nodegroup in self._ConfigData().nodegroups.values():
-      if nodegroup.name == target:
-        return nodegroup.uuid
+    group_uuids = self._Index().LookupName("nodegroups", target)
+    if group_uuids:
+      return group_uuids[0]
     raise errors.OpPrereqError("Node group '%s' not found" % target,
                                errors.ECODE_NOENT)
 
@@ -1718,8 +1751,11 @@ class ConfigWriter(object):
     if inst_uuid not in self._ConfigData().instances:
       raise errors.ConfigurationError("Unknown instance '%s'" % inst_uuid)
 
+    now = time.time()
     inst = self._ConfigData().instances[inst_uuid]
     inst.name = new_name
+    inst.serial_no += 1
+    inst.mtime = now
 
     instance_disks = self._UnlockedGetInstanceDisks(inst_uuid)
     for (_, disk) in enumerate(instance_disks):
@@ -1729,6 +1765,9 @@ class ConfigWriter(object):
         disk.logical_id = (disk.logical_id[0],
                            utils.PathJoin(file_storage_dir, inst.name,
                                           os.path.basename(disk.logical_id[1])))
+        disk.serial_no += 1
+        disk.mtime = now
+    self._UpdateIndex("instances", inst_uuid)
 
     # Force update of ssconf files
     self._ConfigData().cluster.serial_no += 1
@@ -1792,19 +1831,29 @@ class ConfigWriter(object):
     """
     return self._UnlockedGetInstanceList()
 
+  @ConfigSync(shared=1)
   def ExpandInstanceName(self, short_name):
     """Attempt to expand an incomplete instance name.
 
     """
-    # Locking is done in L{ConfigWriter.GetAllInstancesInfo}
-    all_insts = self.GetAllInstancesInfo().values()
-    expanded_name = _MatchNameComponentIgnoreCase(
-                      short_name, [inst.name for inst in all_insts])
+    return self._UnlockedExpandName("instances", short_name)
+
+  def _UnlockedExpandName(self, key, short_name):
+    """Attempt to expand an incomplete instance or node name.
+
+    @type key: string
+    @param key: C{instances} or C{nodes}
+    @rtype: tuple; (string, string)
+    @return: the UUID and full name of the object, or C{(None, None)} if
+        there is no unique match
+
+    """
+    expanded_name = self._Index().ExpandName(key, short_name)
 
     if expanded_name is not None:
-      # there has to be exactly one instance with that name
-      inst = [n for n in all_insts if n.name == expanded_name][0]
-      return (inst.uuid, inst.name)
+      # there has to be exactly one object with that name
+      uuid = self._Index().LookupName(key, expanded_name)[0]
+      return (uuid, expanded_name)
     else:
       return (None, None)
 
@@ -1950,9 +1999,9 @@ class ConfigWriter(object):
     return self._UnlockedGetInstanceInfoByName(inst_name)
 
   def _UnlockedGetInstanceInfoByName(self, inst_name):
-    for inst in self._UnlockedGetAllInstancesInfo().values():
-      if inst.name == inst_name:
-        return inst
+    inst_uuids = self._Index().LookupName("instances", inst_name)
+    if inst_uuids:
+      return self._ConfigData().instances[inst_uuids[0]]
     return None
 
   def _UnlockedGetInstanceName(self, inst_uuid):
@@ -2008,7 +2057,11 @@ class ConfigWriter(object):
     @type nodes: list of node uuids
 
     """
-    self._UnlockedGetDiskInfo(disk_uuid).nodes = nodes
+    disk = self._UnlockedGetDiskInfo(disk_uuid)
+    disk.nodes = nodes
+    disk.serial_no += 1
+    disk.mtime = time.time()
+    self._UpdateIndex("disks", disk_uuid)
 
   @ConfigSync()
   def SetDiskLogicalID(self, disk_uuid, logical_id):
@@ -2031,6 +2084,9 @@ class ConfigWriter(object):
                                    logical_id)
 
     disk.logical_id = logical_id
+    disk.serial_no += 1
+    disk.mtime = time.time()
+    self._UpdateIndex("disks", disk_uuid)
 
   def _UnlockedGetInstanceNames(self, inst_uuids):
     return [self._UnlockedGetInstanceName(uuid) for uuid in inst_uuids]
@@ -2051,6 +2107,7 @@ class ConfigWriter(object):
     self._UnlockedAddNodeToGroup(node.uuid, node.group)
     assert node.uuid in self._ConfigData().nodegroups[node.group].members
     self._ConfigData().nodes[node.uuid] = node
+    self._UpdateIndex("nodes", node.uuid)
     self._ConfigData().cluster.serial_no += 1
 
   @ConfigSync()
@@ -2075,23 +2132,15 @@ class ConfigWriter(object):
 
     self._UnlockedRemoveNodeFromGroup(self._ConfigData().nodes[node_uuid])
     del self._ConfigData().nodes[node_uuid]
+    self._UpdateIndex("nodes", node_uuid)
     self._ConfigData().cluster.serial_no += 1
 
+  @ConfigSync(shared=1)
   def ExpandNodeName(self, short_name):
     """Attempt to expand an incomplete node name into a node UUID.
 
     """
-    # Locking is done in L{ConfigWriter.GetAllNodesInfo}
-    all_nodes = self.GetAllNodesInfo().values()
-    expanded_name = _MatchNameComponentIgnoreCase(
-                      short_name, [node.name for node in all_nodes])
-
-    if expanded_name is not None:
-      # there has to be exactly one node with that name
-      node = [n for n in all_nodes if n.name == expanded_name][0]
-      return (node.uuid, node.name)
-    else:
-      return (None, None)
+    return self._UnlockedExpandName("nodes", short_name)
 
   def _UnlockedGetNodeInfo(self, node_uuid):
     """Get the configuration of a node, as stored in the config.
@@ -2134,14 +2183,9 @@ class ConfigWriter(object):
     @return: a tuple with two lists: the primary and the secondary instances
 
     """
-    pri = []
-    sec = []
-    for inst in self._ConfigData().instances.values():
-      if inst.primary_node == node_uuid:
-        pri.append(inst.uuid)
-      if node_uuid in self._UnlockedGetInstanceSecondaryNodes(inst.uuid):
-        sec.append(inst.uuid)
-    return (pri, sec)
+    index = self._Index()
+    return (index.GetPrimaryInstances(node_uuid),
+            index.GetSecondaryInstances(node_uuid))
 
   @ConfigSync(shared=1)
   def GetNodeGroupInstances(self, uuid, primary_only=False):
@@ -2153,15 +2197,14 @@ class ConfigWriter(object):
     @return: List of instance UUIDs in node group
 
     """
-    if primary_only:
-      nodes_fn = lambda inst: [inst.primary_node]
-    else:
-      nodes_fn = lambda inst: self._UnlockedGetInstanceNodes(inst.uuid)
-
-    return frozenset(inst.uuid
-                     for inst in self._ConfigData().instances.values()
-                     for node_uuid in nodes_fn(inst)
-                     if self._UnlockedGetNodeInfo(node_uuid).group == uuid)
+    index = self._Index()
+    result = set()
+    for node in self._ConfigData().nodes.values():
+      if node.group == uuid:
+        result.update(index.GetPrimaryInstances(node.uuid))
+        if not primary_only:
+          result.update(index.GetSecondaryInstances(node.uuid))
+    return frozenset(result)
 
   def _UnlockedGetHvparamsString(self, hvname):
     """Return the string representation of the list of hyervisor parameters of
@@ -2283,9 +2326,9 @@ class ConfigWriter(object):
     return self._UnlockedGetAllNodesInfo()
 
   def _UnlockedGetNodeInfoByName(self, node_name):
-    for node in self._UnlockedGetAllNodesInfo().values():
-      if node.name == node_name:
-        return node
+    node_uuids = self._Index().LookupName("nodes", node_name)
+    if node_uuids:
+      return self._ConfigData().nodes[node_uuids[0]]
     return None
 
   @ConfigSync(shared=1)
@@ -2310,9 +2353,9 @@ class ConfigWriter(object):
           information is available
 
     """
-    for nodegroup in self._UnlockedGetAllNodeGroupsInfo().values():
-      if nodegroup.name == nodegroup_name:
-        return nodegroup
+    group_uuids = self._Index().LookupName("nodegroups", nodegroup_name)
+    if group_uuids:
+      return self._ConfigData().nodegroups[group_uuids[0]]
     return None
 
   def _UnlockedGetNodeName(self, node_spec):
@@ -2647,32 +2690,113 @@ class ConfigWriter(object):
       # Upgrade configuration if needed
       self._UpgradeConfig(saveafter=True)
     else:
+      if self._config_data is None:
+        serial = None
+      else:
+        serial = self._config_data.serial_no
+
       if shared and not force:
-        if self._config_data is None:
+        if serial is None:
           logging.debug("Requesting config, as I have no up-to-date copy")
-          dict_data = self._wconfd.ReadConfig()
+          with _CONFIG_DURATION.Time("read"):
+            update = {"full": self._wconfd.ReadConfig()}
           logging.debug("Configuration received")
+        elif self._config_outdated:
+          logging.debug("Requesting config changes since serial no %s",
+                        serial)
+          with _CONFIG_DURATION.Time("read"):
+            update = self._wconfd.ReadConfigSince(serial)
+          logging.debug("Configuration changes received")
         else:
-          dict_data = None
+          update = None
       else:
         # poll until we acquire the lock
+        start = time.time()
         while True:
           logging.debug("Receiving config from WConfd.LockConfig [shared=%s]",
                         bool(shared))
-          dict_data = \
-              self._wconfd.LockConfig(self._GetWConfdContext(), bool(shared))
-          if dict_data is not None:
+          if serial is None:
+            update = self._wconfd.LockConfig(self._GetWConfdContext(),
+                                             bool(shared))
+            if update is not None:
+              update = {"full": update}
+          else:
+            update = self._wconfd.LockConfigSince(self._GetWConfdContext(),
+                                                  bool(shared), serial)
+          if update is not None:
             logging.debug("Received config from WConfd.LockConfig")
             break
           time.sleep(random.random())
+        _CONFIG_DURATION.Observe(time.time() - start, "lock")
 
       try:
-        if dict_data is not None:
-          self._SetConfigData(objects.ConfigData.FromDict(dict_data))
-          self._UpgradeConfig()
+        if update is not None:
+          self._UpdateConfigData(update)
       except Exception as err:
         raise errors.ConfigurationError(err)
 
+  def _UpdateConfigData(self, update):
+    """Update the config data with data received from WConfd.
+
+    @type update: dict
+    @param update: either the full configuration under the key C{full}, or
+        the changes since the serial number of our copy under C{delta}
+
+    """
+    if "full" in update:
+      self._SetConfigData(objects.ConfigData.FromDict(update["full"]))
+    else:
+      self._ConfigData().ApplyDelta(update["delta"])
+      if self._index is not None:
+        self._index.ApplyDelta(update["delta"])
+    self._config_outdated = False
+    self._UpgradeConfig()
+    self._SnapshotConfigSerials()
+
+  def _SnapshotConfigSerials(self):
+    """Remember the serial numbers of all objects of the configuration.
+
+    This is used by L{_ComputeConfigDelta} to find the objects modified
+    since the configuration was received from WConfd.
+
+    """
+    data = self._ConfigData()
+    self._config_serials = dict(
+      (key, dict((uuid, obj.serial_no)
+                 for (uuid, obj) in getattr(data, key).items()))
+      for key in _DELTA_CONTAINERS)
+
+  def _ComputeConfigDelta(self):
+    """Compute the changes of the configuration since it was received.
+
+    An object is considered changed if it is new or its serial number
+    differs from the one it was received with.
+
+    @rtype: dict or None
+    @return: the changes in the form understood by WConfd, or C{None} if
+        the configuration wasn't received from WConfd
+
+    """
+    if self._config_serials is None:
+      return None
+
+    data = self._ConfigData()
+    delta = {
+      "serial_no": data.serial_no,
+      "cluster": data.cluster.ToDict(),
+      }
+    for key in _DELTA_CONTAINERS:
+      container = getattr(data, key)
+      serials = self._config_serials[key]
+      changes = dict((uuid, obj.ToDict())
+                     for (uuid, obj) in container.items()
+                     if serials.get(uuid) != obj.serial_no)
+      changes.update((uuid, None) for uuid in serials
+                     if uuid not in container)
+      delta[key] = changes
+
+    return delta
+
   def _CloseConfig(self, save):
     """Release resources relating the config data.
 
@@ -2748,6 +2872,8 @@ class ConfigWriter(object):
     """Write the configuration data to persistent storage.
 
     """
+    start = time.time()
+
     if destination is None:
       destination = self._cfg_file
 
@@ -2774,7 +2900,13 @@ class ConfigWriter(object):
         os.close(fd)
     else:
       try:
-        if releaselock:
+        delta = self._ComputeConfigDelta()
+        if (delta is not None and
+            self._wconfd.WriteConfigDelta(self._GetWConfdContext(), delta)):
+          self._SnapshotConfigSerials()
+          if releaselock:
+            self._wconfd.UnlockConfig(self._GetWConfdContext())
+        elif releaselock:
           res = self._wconfd.WriteConfigAndUnlock(self._GetWConfdContext(),
                                                   self._ConfigData().ToDict())
           if not res:
@@ -2789,6 +2921,7 @@ class ConfigWriter(object):
                                         " modified since the last write, cannot"
                                         " update")
 
+    _CONFIG_DURATION.Observe(time.time() - start, "write")
     self.write_count += 1
 
   def _GetAllHvparamsStrings(self, hypervisors):
@@ -3374,9 +3507,7 @@ class ConfigWriter(object):
     @rtype: string
     @return: uuid of instance the disk is attached to.
     """
-    for inst_uuid, inst_info in self._UnlockedGetAllInstancesInfo().items():
-      if disk_uuid in inst_info.disks:
-        return inst_uuid
+    return self._Index().GetDiskInstance(disk_uuid)
 
 
 class DetachedConfig(ConfigWriter):
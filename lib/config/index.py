@@ -0,0 +1,277 @@
+#
+#
+
+# Copyright (C) 2014 Google Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS
+# IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+# TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+# PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+"""Secondary indexes over the configuration data.
+
+Looking up objects by name, or the instances of a node, would otherwise
+require a scan over all instances of the cluster. The indexes are built
+from a L{objects.ConfigData} and must be told about every object changed
+afterwards using L{ConfigIndex.Update}.
+
+"""
+
+from ganeti import utils
+
+
+#: Containers of the configuration covered by the index
+INDEXED_CONTAINERS = frozenset(["instances", "nodes", "nodegroups", "disks"])
+
+
+def _Add(mapping, key, value):
+  """Adds a value to the ordered set stored under a key."""
+  mapping.setdefault(key, {})[value] = None
+
+
+def _Discard(mapping, key, value):
+  """Removes a value from the ordered set stored under a key."""
+  values = mapping.get(key)
+  if values is not None:
+    values.pop(value, None)
+    if not values:
+      del mapping[key]
+
+
+def _FirstLabel(name):
+  """Returns the lower-cased first component of a host name."""
+  return name.split(".", 1)[0].lower()
+
+
+class _NameIndex(object):
+  """Index from the names of objects to their UUIDs.
+
+  Names are not guaranteed to be unique, so each name maps to a set of
+  UUIDs.
+
+  """
+  def __init__(self):
+    self._uuids = {}
+    self._names = {}
+    self._labels = {}
+
+  def Set(self, uuid, name):
+    """Sets the name of an object.
+
+    """
+    self.Remove(uuid)
+    if name is None:
+      return
+    self._names[uuid] = name
+    if name not in self._uuids:
+      _Add(self._labels, _FirstLabel(name), name)
+    _Add(self._uuids, name, uuid)
+
+  def Remove(self, uuid):
+    """Removes an object.
+
+    """
+    name = self._names.pop(uuid, None)
+    if name is None:
+      return
+    _Discard(self._uuids, name, uuid)
+    if name not in self._uuids:
+      _Discard(self._labels, _FirstLabel(name), name)
+
+  def Lookup(self, name):
+    """Returns the UUIDs of the objects with the given name.
+
+    @rtype: list of strings
+
+    """
+    return list(self._uuids.get(name, []))
+
+  def Expand(self, short_name):
+    """Expands a possibly incomplete name.
+
+    This gives the same result as L{utils.MatchNameComponent} on all names
+    with case-insensitive matching, but only considers the names sharing
+    the first component with C{short_name}.
+
+    @rtype: string or None
+    @return: the full name or C{None} if there is no unique match
+
+    """
+    candidates = self._labels.get(_FirstLabel(short_name), {})
+    return utils.MatchNameComponent(short_name, candidates,
+                                    case_sensitive=False)
+
+
+class ConfigIndex(object):
+  """Secondary indexes over a configuration.
+
+  The index keeps track of the names of instances, nodes, node groups and
+  disks, of the instances using a node as primary or secondary node, and
+  of the instance each disk is attached to.
+
+  """
+  def __init__(self, data):
+    """Builds the index of a configuration.
+
+    @type data: L{objects.ConfigData}
+    @param data: the configuration to index
+
+    """
+    self._data = data
+    self._names = dict((key, _NameIndex()) for key in INDEXED_CONTAINERS)
+    # instance UUID -> (primary node, secondary nodes, disks)
+    self._instance_keys = {}
+    self._primary = {}
+    self._secondary = {}
+    self._disk_instance = {}
+
+    for key in ["nodegroups", "nodes", "disks"]:
+      for (uuid, obj) in getattr(data, key).items():
+        self._names[key].Set(uuid, obj.name)
+    for inst in data.instances.values():
+      self._SetInstance(inst)
+
+  def _InstanceNodes(self, inst):
+    """Computes the secondary nodes of an instance from its disks."""
+    nodes = set()
+    for disk_uuid in inst.disks:
+      disk = self._data.disks.get(disk_uuid)
+      if disk is not None:
+        nodes.update(disk.all_nodes)
+    nodes.discard(inst.primary_node)
+    return frozenset(nodes)
+
+  def _SetInstance(self, inst):
+    """Indexes an instance."""
+    self._RemoveInstance(inst.uuid)
+    keys = (inst.primary_node, self._InstanceNodes(inst), tuple(inst.disks))
+    self._instance_keys[inst.uuid] = keys
+    self._names["instances"].Set(inst.uuid, inst.name)
+    _Add(self._primary, keys[0], inst.uuid)
+    for node_uuid in keys[1]:
+      _Add(self._secondary, node_uuid, inst.uuid)
+    for disk_uuid in keys[2]:
+      self._disk_instance[disk_uuid] = inst.uuid
+
+  def _RemoveInstance(self, inst_uuid):
+    """Removes an instance from the index."""
+    keys = self._instance_keys.pop(inst_uuid, None)
+    if keys is None:
+      return
+    self._names["instances"].Remove(inst_uuid)
+    _Discard(self._primary, keys[0], inst_uuid)
+    for node_uuid in keys[1]:
+      _Discard(self._secondary, node_uuid, inst_uuid)
+    for disk_uuid in keys[2]:
+      if self._disk_instance.get(disk_uuid) == inst_uuid:
+        del self._disk_instance[disk_uuid]
+
+  def Update(self, key, uuid):
+    """Updates the index after an object was added, changed or removed.
+
+    The object is looked up in the configuration, so this must be called
+    after the change was made.
+
+    @type key: string
+    @param key: the container of the object, e.g. C{instances}
+    @type uuid: string
+    @param uuid: the UUID of the object
+
+    """
+    if key not in INDEXED_CONTAINERS:
+      return
+    obj = getattr(self._data, key).get(uuid)
+    if key == "instances":
+      if obj is None:
+        self._RemoveInstance(uuid)
+      else:
+        self._SetInstance(obj)
+      return
+
+    if obj is None:
+      self._names[key].Remove(uuid)
+    else:
+      self._names[key].Set(uuid, obj.name)
+
+    # The nodes of a disk are part of the nodes of its instance
+    if key == "disks":
+      inst = self._data.instances.get(self._disk_instance.get(uuid))
+      if inst is not None:
+        self._SetInstance(inst)
+
+  def ApplyDelta(self, delta):
+    """Updates the index after a delta was applied to the configuration.
+
+    @type delta: dict
+    @param delta: the changes, as passed to L{objects.ConfigData.ApplyDelta}
+
+    """
+    # Disks first, so that instances are indexed with their new disks
+    for key in ["disks", "nodes", "nodegroups", "instances"]:
+      for uuid in delta.get(key, {}):
+        self.Update(key, uuid)
+
+  def LookupName(self, key, name):
+    """Returns the UUIDs of the objects with a given name.
+
+    @type key: string
+    @param key: the container of the objects, e.g. C{nodes}
+    @rtype: list of strings
+
+    """
+    return self._names[key].Lookup(name)
+
+  def ExpandName(self, key, short_name):
+    """Expands a possibly incomplete name of an object.
+
+    @type key: string
+    @param key: the container of the objects, e.g. C{nodes}
+    @rtype: string or None
+    @return: the full name, or C{None} if there is no unique match
+
+    """
+    return self._names[key].Expand(short_name)
+
+  def GetPrimaryInstances(self, node_uuid):
+    """Returns the UUIDs of the instances with the given primary node.
+
+    @rtype: list of strings
+
+    """
+    return list(self._primary.get(node_uuid, []))
+
+  def GetSecondaryInstances(self, node_uuid):
+    """Returns the UUIDs of the instances with the given secondary node.
+
+    @rtype: list of strings
+
+    """
+    return list(self._secondary.get(node_uuid, []))
+
+  def GetDiskInstance(self, disk_uuid):
+    """Returns the UUID of the instance a disk is attached to.
+
+    @rtype: string or None
+
+    """
+    return self._disk_instance.get(disk_uuid)
@@ -36,9 +36,16 @@ from ganeti import constants
 from ganeti import errors
 from ganeti import utils
 from ganeti import compat
+from ganeti import metrics
 from ganeti import pathutils
 
 
+_HOOKS_DURATION = metrics.REGISTRY.Histogram(
+  "ganeti_hooks_duration_seconds",
+  "Time spent running hooks on nodes by hooks path and phase",
+  ["hooks_path", "phase"])
+
+
 def _RpcResultsToHooksResults(rpc_results):
   """Function to convert RPC results to the format expected by HooksMaster.
 
@@ -222,7 +229,8 @@ class HooksMaster(object):
       # even attempt to run, or this LU doesn't do hooks at all
       return
 
-    results = self._RunWrapper(node_names, self.hooks_path, phase, env)
+    with _HOOKS_DURATION.Time(self.hooks_path, phase):
+      results = self._RunWrapper(node_names, self.hooks_path, phase, env)
     if not results:
       msg = "Communication Failure"
       if phase == constants.HOOKS_PHASE_PRE:
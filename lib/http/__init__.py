@@ -36,6 +36,7 @@ import email
 import logging
 import select
 import socket
+import zlib
 
 from io import StringIO
 
@@ -62,6 +63,8 @@ HTTP_PUT = "PUT"
 HTTP_DELETE = "DELETE"
 
 HTTP_ETAG = "ETag"
+HTTP_IF_NONE_MATCH = "If-None-Match"
+HTTP_LAST_MODIFIED = "Last-Modified"
 HTTP_HOST = "Host"
 HTTP_SERVER = "Server"
 HTTP_DATE = "Date"
@@ -74,6 +77,33 @@ HTTP_WWW_AUTHENTICATE = "WWW-Authenticate"
 HTTP_AUTHORIZATION = "Authorization"
 HTTP_AUTHENTICATION_INFO = "Authentication-Info"
 HTTP_ALLOW = "Allow"
+HTTP_TRANSFER_ENCODING = "Transfer-Encoding"
+HTTP_CONTENT_ENCODING = "Content-Encoding"
+HTTP_ACCEPT_ENCODING = "Accept-Encoding"
+
+HTTP_CONNECTION_CLOSE = "close"
+HTTP_CONNECTION_KEEP_ALIVE = "keep-alive"
+
+HTTP_TRANSFER_ENCODING_CHUNKED = "chunked"
+
+HTTP_CONTENT_ENCODING_IDENTITY = "identity"
+HTTP_CONTENT_ENCODING_DEFLATE = "deflate"
+
+#: Compression level used for the "deflate" content coding; message bodies are
+#: compressed on the fly, hence speed is preferred over size
+_DEFLATE_LEVEL = 1
+
+#: Supported content codings (RFC2616, section 3.5), mapping to functions for
+#: encoding and decoding a message body
+_CONTENT_ENCODINGS = {
+  HTTP_CONTENT_ENCODING_DEFLATE: (
+    lambda data: zlib.compress(data, _DEFLATE_LEVEL),
+    zlib.decompress,
+    ),
+  }
+
+#: Names of the supported content codings
+CONTENT_ENCODINGS = frozenset(_CONTENT_ENCODINGS)
 
 HTTP_APP_OCTET_STREAM = "application/octet-stream"
 HTTP_APP_JSON = "application/json"
@@ -91,6 +121,9 @@ _SSL_SHUTDOWN_DURING_INIT = ('SSL routines', 'SSL_shutdown',
 # send/receive quantum
 SOCK_BUF_SIZE = 32768
 
+# Session ID context for resuming SSL sessions
+SSL_SESSION_ID_CONTEXT = b"ganeti"
+
 # OpenSSL.SSL.ConnectionType was deprecated in pyopenssl-19.1.0:
 try:
     SSL_CONN_TYPE = OpenSSL.SSL.Connection
@@ -350,6 +383,81 @@ def ParseHeaders(buf):
   return email.message_from_file(buf)
 
 
+def EncodeBody(encoding, data):
+  """Applies a content coding to a message body.
+
+  @type encoding: string
+  @param encoding: One of L{CONTENT_ENCODINGS}
+  @type data: bytes
+  @rtype: bytes
+
+  """
+  (encode_fn, _) = _CONTENT_ENCODINGS[encoding]
+  return encode_fn(data)
+
+
+def DecodeBody(encoding, data):
+  """Removes a content coding from a message body.
+
+  @type encoding: string or None
+  @param encoding: Value of the C{Content-Encoding} header
+  @type data: bytes
+  @rtype: bytes
+  @raise HttpUnsupportedMediaType: for unknown content codings
+  @raise HttpBadRequest: if the body can't be decoded
+
+  """
+  if not encoding:
+    return data
+
+  encoding = encoding.strip().lower()
+  if encoding == HTTP_CONTENT_ENCODING_IDENTITY:
+    return data
+
+  try:
+    (_, decode_fn) = _CONTENT_ENCODINGS[encoding]
+  except KeyError:
+    raise HttpUnsupportedMediaType(message=("Unsupported content coding '%s'" %
+                                            encoding))
+
+  try:
+    return decode_fn(data)
+  except zlib.error as err:
+    raise HttpBadRequest(message="Can't decode message body: %s" % err)
+
+
+def ParseAcceptEncoding(value):
+  """Parses the value of an C{Accept-Encoding} header.
+
+  Quality values are not taken into account except for excluding codings
+  with a quality of zero.
+
+  @type value: string or None
+  @rtype: frozenset
+  @return: Names of the acceptable content codings
+
+  """
+  result = set()
+
+  for item in (value or "").split(","):
+    parts = [i.strip() for i in item.split(";")]
+    if not parts[0]:
+      continue
+
+    for param in parts[1:]:
+      (name, _, qvalue) = param.partition("=")
+      if name.strip().lower() == "q":
+        try:
+          if float(qvalue) <= 0:
+            break
+        except ValueError:
+          break
+    else:
+      result.add(parts[0].lower())
+
+  return frozenset(result)
+
+
 def SocketOperation(sock, op, arg1, timeout):
   """Wrapper around socket functions.
 
@@ -393,8 +501,13 @@ def SocketOperation(sock, op, arg1, timeout):
   event_override = 0
 
   while True:
+    # Data already buffered by OpenSSL doesn't make the socket readable
+    if (op == SOCKOP_RECV and not event_override and
+        isinstance(sock, SSL_CONN_TYPE) and sock.pending()):
+      pass
+
     # Poll only for certain operations and when asked for by an override
-    if event_override or op in (SOCKOP_SEND, SOCKOP_RECV, SOCKOP_HANDSHAKE):
+    elif event_override or op in (SOCKOP_SEND, SOCKOP_RECV, SOCKOP_HANDSHAKE):
       if event_override:
         wait_for_event = event_override
       else:
@@ -419,7 +532,10 @@ def SocketOperation(sock, op, arg1, timeout):
         if op == SOCKOP_SEND:
           # Non-SSL sockets expect bytes
           if isinstance(sock, socket.socket):
-            data = arg1.encode("utf-8")
+            if isinstance(arg1, bytes):
+              data = arg1
+            else:
+              data = arg1.encode("utf-8")
             # Use sendall to avoid partial writes that could cause desync with
             # our caller, as len(data) != len(arg1) in the general case
             sock.sendall(data)
@@ -640,6 +756,10 @@ class HttpBase(object):
     ctx = OpenSSL.SSL.Context(OpenSSL.SSL.SSLv23_METHOD)
     ctx.set_options(OpenSSL.SSL.OP_NO_SSLv2)
 
+    # Required for clients to be able to resume sessions when client
+    # certificates are verified
+    ctx.set_session_id(SSL_SESSION_ID_CONTEXT)
+
     if self._ssl_chain:
         ctx.use_certificate_chain_file(self._ssl_chain)
 
@@ -701,6 +821,36 @@ class HttpMessage(object):
     self.body = None
 
 
+class HttpStreamingBody(object):
+  """Message body which is produced while it is being sent.
+
+  Used for large responses, which are then neither held in memory as a whole
+  nor need a C{Content-Length} header. HTTP/1.1 clients receive the body using
+  the chunked transfer coding (RFC2616, section 3.6.1), for older clients the
+  end of the body is signalled by closing the connection.
+
+  """
+  def __init__(self, chunks):
+    """Initializes this class.
+
+    @type chunks: iterable
+    @param chunks: Iterable producing the body as a sequence of bytes
+
+    """
+    self._chunks = chunks
+
+  def __iter__(self):
+    return iter(self._chunks)
+
+  def GetValue(self):
+    """Consumes the whole body and returns it.
+
+    @rtype: bytes
+
+    """
+    return b"".join(self)
+
+
 class HttpClientToServerStartLine(object):
   """Data structure for HTTP request start line.
 
@@ -727,6 +877,27 @@ class HttpServerToClientStartLine(object):
     return "%s %s %s" % (self.version, self.code, self.reason)
 
 
+def _SendBuffer(sock, buf, write_timeout):
+  """Sends a buffer to a socket.
+
+  @type buf: string
+  @param buf: Data to be sent
+
+  """
+  pos = 0
+  end = len(buf)
+  while pos < end:
+    # Send only SOCK_BUF_SIZE bytes at a time
+    data = buf[pos:(pos + SOCK_BUF_SIZE)]
+
+    sent = SocketOperation(sock, SOCKOP_SEND, data, write_timeout)
+
+    # Remove sent bytes
+    pos += sent
+
+  assert pos == end, "Message wasn't sent completely"
+
+
 class HttpMessageWriter(object):
   """Writes an HTTP message to a socket.
 
@@ -746,20 +917,31 @@ class HttpMessageWriter(object):
 
     self._PrepareMessage()
 
-    buf = self._FormatMessage()
+    _SendBuffer(sock, self._FormatMessage(), write_timeout)
+
+    if self._IsStreaming() and self.HasMessageBody():
+      chunked = (self._msg.headers.get(HTTP_TRANSFER_ENCODING) ==
+                 HTTP_TRANSFER_ENCODING_CHUNKED)
+
+      for chunk in self._msg.body:
+        if not chunk:
+          # An empty chunk would terminate the body
+          continue
+
+        if chunked:
+          chunk = b"%x\r\n%s\r\n" % (len(chunk), chunk)
 
-    pos = 0
-    end = len(buf)
-    while pos < end:
-      # Send only SOCK_BUF_SIZE bytes at a time
-      data = buf[pos:(pos + SOCK_BUF_SIZE)]
+        _SendBuffer(sock, chunk, write_timeout)
 
-      sent = SocketOperation(sock, SOCKOP_SEND, data, write_timeout)
+      if chunked:
+        # Last chunk and empty trailer
+        _SendBuffer(sock, b"0\r\n\r\n", write_timeout)
 
-      # Remove sent bytes
-      pos += sent
+  def _IsStreaming(self):
+    """Returns whether the message body is produced while being sent.
 
-    assert pos == end, "Message wasn't sent completely"
+    """
+    return isinstance(self._msg.body, HttpStreamingBody)
 
   def _PrepareMessage(self):
     """Prepares the HTTP message by setting mandatory headers.
@@ -768,11 +950,17 @@ class HttpMessageWriter(object):
     # RFC2616, section 4.3: "The presence of a message-body in a request is
     # signaled by the inclusion of a Content-Length or Transfer-Encoding header
     # field in the request's message-headers."
-    if self._msg.body:
+    if self._IsStreaming():
+      # The length isn't known in advance; subclasses decide about the
+      # transfer coding
+      pass
+    elif self._msg.body:
       self._msg.headers[HTTP_CONTENT_LENGTH] = len(self._msg.body)
 
   def _FormatMessage(self):
-    """Serializes the HTTP message into a string.
+    """Serializes the HTTP message.
+
+    @rtype: bytes
 
     """
     buf = StringIO()
@@ -788,14 +976,22 @@ class HttpMessageWriter(object):
 
     buf.write("\r\n")
 
-    # Add message body if needed
-    if self.HasMessageBody():
-      buf.write(self._msg.body.decode())
+    data = buf.getvalue().encode("utf-8")
+
+    # Add message body if needed; streaming bodies are sent separately
+    if self._IsStreaming():
+      pass
+
+    elif self.HasMessageBody():
+      body = self._msg.body
+      if not isinstance(body, bytes):
+        body = body.encode("utf-8")
+      data += body
 
     elif self._msg.body:
       logging.warning("Ignoring message body")
 
-    return buf.getvalue()
+    return data
 
   def HasMessageBody(self):
     """Checks whether the HTTP message contains a body.
@@ -849,7 +1045,8 @@ class HttpMessageReader(object):
       data = SocketOperation(sock, SOCKOP_RECV, SOCK_BUF_SIZE, read_timeout)
 
       if data:
-        buf += data.decode()
+        # Decoded byte by byte, the body is converted once it's complete
+        buf += data.decode("latin-1")
       else:
         eof = True
 
@@ -869,8 +1066,10 @@ class HttpMessageReader(object):
     assert self.parser_status == self.PS_COMPLETE
     assert not buf, "Parser didn't read full response"
 
-    # Body is complete
-    msg.body = self.body_buffer.getvalue()
+    # Body is complete; bodies with a content coding are passed on as bytes
+    msg.body = self.body_buffer.getvalue().encode("latin-1")
+    if not msg.headers or not msg.headers.get(HTTP_CONTENT_ENCODING):
+      msg.body = msg.body.decode("utf-8")
 
   def _ContinueParsing(self, buf, eof):
     """Main function for HTTP message state machine.
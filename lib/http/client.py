@@ -32,7 +32,9 @@
 """
 
 import logging
+import os
 import threading
+import time
 
 from io import BytesIO
 
@@ -47,7 +49,7 @@ from ganeti import locking
 class HttpClientRequest(object):
   def __init__(self, host, port, method, path, headers=None, post_data=None,
                read_timeout=None, curl_config_fn=None, nicename=None,
-               completion_cb=None):
+               completion_cb=None, accept_encoding=None):
     """Describes an HTTP request.
 
     @type host: string
@@ -73,6 +75,9 @@ class HttpClientRequest(object):
     @type completion_cb: callable accepting this request object as a single
                          parameter
     @param completion_cb: Callback for request completion
+    @type accept_encoding: string or None
+    @param accept_encoding: Content codings to accept for the response body,
+      e.g. C{"deflate"}; such responses are decoded by cURL
 
     """
     assert path.startswith("/"), "Path must start with slash (/)"
@@ -88,6 +93,7 @@ class HttpClientRequest(object):
     self.curl_config_fn = curl_config_fn
     self.nicename = nicename
     self.completion_cb = completion_cb
+    self.accept_encoding = accept_encoding
 
     if post_data is None:
       self.post_data = ""
@@ -109,6 +115,7 @@ class HttpClientRequest(object):
 
     # Response attributes
     self.resp_status_code = None
+    self.resp_headers = None
     self.resp_body = None
 
   def __repr__(self):
@@ -132,13 +139,214 @@ class HttpClientRequest(object):
     return "https://%s%s" % (address, self.path)
 
 
-def _StartRequest(curl, req):
+class HttpClientPool(object):
+  """Pool of reusable cURL handles.
+
+  Handles are kept per destination host and port. All handles created by a
+  pool share the DNS cache and, if supported by libcurl, the connection cache,
+  so that requests can reuse connections kept open by the server. Optionally
+  SSL sessions are cached as well, so that new connections can resume them
+  instead of doing a full handshake.
+
+  The pool is bound to the process which created it. After a fork, the child
+  process must use a new pool as the connections must not be shared.
+
+  """
+  def __init__(self, max_idle_per_host, max_idle, idle_timeout,
+               ssl_session_cache=False, _curl=pycurl.Curl,
+               _curl_share=pycurl.CurlShare, _time_fn=time.time):
+    """Initializes this class.
+
+    @type max_idle_per_host: int
+    @param max_idle_per_host: Maximum number of idle handles kept for a
+      single host
+    @type max_idle: int
+    @param max_idle: Maximum number of idle handles kept in total
+    @type idle_timeout: int
+    @param idle_timeout: Number of seconds after which idle handles and their
+      connections are closed
+    @type ssl_session_cache: bool
+    @param ssl_session_cache: Whether to cache SSL sessions; servers which
+      verify client certificates must have a session ID context set
+
+    """
+    assert max_idle_per_host > 0
+    assert max_idle >= max_idle_per_host
+    assert idle_timeout > 0
+
+    self._max_idle_per_host = max_idle_per_host
+    self._max_idle = max_idle
+    self._idle_timeout = idle_timeout
+    self.ssl_session_cache = ssl_session_cache
+    self._curl_fn = _curl
+    self._time_fn = _time_fn
+    self.pid = os.getpid()
+
+    self._lock = threading.Lock()
+
+    # Maps (host, port) to a list of (timestamp, handle) tuples, the most
+    # recently used handle being last
+    self._idle = {}
+
+    shared = ["LOCK_DATA_DNS", "LOCK_DATA_CONNECT"]
+    if ssl_session_cache:
+      shared.append("LOCK_DATA_SSL_SESSION")
+
+    self._share = _curl_share()
+    for name in shared:
+      # Not all of them are available in older versions of pycurl and libcurl
+      lock_data = getattr(pycurl, name, None)
+      if lock_data is not None:
+        try:
+          self._share.setopt(pycurl.SH_SHARE, lock_data)
+        except pycurl.error as err:
+          logging.debug("Can't share %s between cURL handles: %s", name, err)
+
+  def _NewHandle(self):
+    """Creates a new cURL handle.
+
+    """
+    curl = self._curl_fn()
+    curl.setopt(pycurl.SHARE, self._share)
+
+    # Don't let libcurl reuse connections which were idle for longer than the
+    # pool would keep the handle (pycurl >= 7.43.0.4)
+    if hasattr(pycurl, "MAXAGE_CONN"):
+      curl.setopt(pycurl.MAXAGE_CONN, self._idle_timeout)
+
+    return curl
+
+  def _EvictUnlocked(self, now):
+    """Closes handles which have been idle for too long.
+
+    """
+    for key, handles in list(self._idle.items()):
+      keep = [(ts, curl) for (ts, curl) in handles
+              if ts + self._idle_timeout > now]
+
+      for (ts, curl) in handles:
+        if ts + self._idle_timeout <= now:
+          curl.close()
+
+      if keep:
+        self._idle[key] = keep
+      else:
+        del self._idle[key]
+
+  def _CountIdleUnlocked(self):
+    return sum(len(handles) for handles in self._idle.values())
+
+  def GetHandle(self, host, port):
+    """Returns a handle for a request to the given destination.
+
+    Handles which were last used for the same destination are preferred, as
+    they are most likely to have an open connection.
+
+    """
+    assert self.pid == os.getpid(), "Pool can't be used after fork"
+
+    with self._lock:
+      self._EvictUnlocked(self._time_fn())
+
+      handles = self._idle.get((host, port))
+      if handles:
+        (_, curl) = handles.pop()
+        if not handles:
+          del self._idle[(host, port)]
+        return curl
+
+    return self._NewHandle()
+
+  def ReleaseHandle(self, host, port, curl, reusable=True):
+    """Returns a handle to the pool after a request has finished.
+
+    @type reusable: bool
+    @param reusable: Whether the handle can be used again; handles of failed
+      requests should not be reused
+
+    """
+    if not reusable:
+      curl.close()
+      return
+
+    now = self._time_fn()
+
+    with self._lock:
+      self._EvictUnlocked(now)
+
+      handles = self._idle.setdefault((host, port), [])
+      handles.append((now, curl))
+
+      # Close the oldest handles of this host if there are too many
+      while len(handles) > self._max_idle_per_host:
+        (_, old) = handles.pop(0)
+        old.close()
+
+      # Close the oldest handles overall if there are too many
+      while self._CountIdleUnlocked() > self._max_idle:
+        (_, key) = min((hdls[0][0], key) for (key, hdls) in self._idle.items())
+        (_, old) = self._idle[key].pop(0)
+        old.close()
+        if not self._idle[key]:
+          del self._idle[key]
+
+  def GetIdleCount(self):
+    """Returns the number of idle handles per destination.
+
+    @rtype: dict; (host, port) as key, number of handles as value
+
+    """
+    with self._lock:
+      return dict((key, len(handles)) for (key, handles) in self._idle.items())
+
+  def Close(self):
+    """Closes all idle handles.
+
+    """
+    with self._lock:
+      for handles in self._idle.values():
+        for (_, curl) in handles:
+          curl.close()
+      self._idle.clear()
+
+
+class _ResponseHeaders(object):
+  """Collects the headers of a response received by cURL.
+
+  """
+  def __init__(self):
+    """Initializes this class.
+
+    """
+    self.headers = {}
+
+  def Write(self, line):
+    """Processes a header line.
+
+    Header names are converted to lowercase.
+
+    @type line: bytes
+
+    """
+    line = line.decode("latin-1").strip()
+
+    if line.startswith("HTTP/"):
+      # Status line of a new response, e.g. after "100 Continue"
+      self.headers = {}
+    elif ":" in line:
+      (name, value) = line.split(":", 1)
+      self.headers[name.strip().lower()] = value.strip()
+
+
+def _StartRequest(curl, req, session_cache=False):
   """Starts a request on a cURL object.
 
   @type curl: pycurl.Curl
   @param curl: cURL object
   @type req: L{HttpClientRequest}
   @param req: HTTP request
+  @type session_cache: bool
+  @param session_cache: Whether to enable SSL session ID caching
 
   """
   logging.debug("Starting request %r", req)
@@ -148,8 +356,9 @@ def _StartRequest(curl, req):
   post_data = req.post_data
   headers = req.headers
 
-  # Buffer for response
+  # Buffers for response
   resp_buffer = BytesIO()
+  resp_headers = _ResponseHeaders()
 
   # Configure client for request
   curl.setopt(pycurl.VERBOSE, False)
@@ -160,27 +369,29 @@ def _StartRequest(curl, req):
   curl.setopt(pycurl.URL, url)
   curl.setopt(pycurl.POSTFIELDS, post_data)
   curl.setopt(pycurl.HTTPHEADER, headers)
+  curl.setopt(pycurl.ENCODING, req.accept_encoding)
 
   if req.read_timeout is None:
     curl.setopt(pycurl.TIMEOUT, 0)
   else:
     curl.setopt(pycurl.TIMEOUT, int(req.read_timeout))
 
-  # Disable SSL session ID caching (pycurl >= 7.16.0)
+  # Enable or disable SSL session ID caching (pycurl >= 7.16.0)
   if hasattr(pycurl, "SSL_SESSIONID_CACHE"):
-    curl.setopt(pycurl.SSL_SESSIONID_CACHE, False)
+    curl.setopt(pycurl.SSL_SESSIONID_CACHE, session_cache)
 
   curl.setopt(pycurl.WRITEFUNCTION, resp_buffer.write)
+  curl.setopt(pycurl.HEADERFUNCTION, resp_headers.Write)
 
   # Pass cURL object to external config function
   if req.curl_config_fn:
     req.curl_config_fn(curl)
 
-  return _PendingRequest(curl, req, resp_buffer.getvalue)
+  return _PendingRequest(curl, req, resp_buffer.getvalue, resp_headers)
 
 
 class _PendingRequest(object):
-  def __init__(self, curl, req, resp_buffer_read):
+  def __init__(self, curl, req, resp_buffer_read, resp_headers):
     """Initializes this class.
 
     @type curl: pycurl.Curl
@@ -189,6 +400,8 @@ class _PendingRequest(object):
     @param req: HTTP request
     @type resp_buffer_read: callable
     @param resp_buffer_read: Function to read response body
+    @type resp_headers: L{_ResponseHeaders}
+    @param resp_headers: Collector for response headers
 
     """
     assert req.success is None
@@ -196,6 +409,7 @@ class _PendingRequest(object):
     self._curl = curl
     self._req = req
     self._resp_buffer_read = resp_buffer_read
+    self._resp_headers = resp_headers
 
   def GetCurlHandle(self):
     """Returns the cURL object.
@@ -237,10 +451,12 @@ class _PendingRequest(object):
     # Get HTTP response code
     req.resp_status_code = curl.getinfo(pycurl.RESPONSE_CODE)
     req.resp_body = self._resp_buffer_read().decode("utf-8")
+    req.resp_headers = self._resp_headers.headers
 
     # Ensure no potentially large variables are referenced
     curl.setopt(pycurl.POSTFIELDS, "")
     curl.setopt(pycurl.WRITEFUNCTION, lambda _: None)
+    curl.setopt(pycurl.HEADERFUNCTION, lambda _: None)
 
     if req.completion_cb:
       req.completion_cb(req)
@@ -356,14 +572,17 @@ def _ProcessCurlRequests(multi, requests):
     multi.select(1.0)
 
 
-def ProcessRequests(requests, lock_monitor_cb=None, _curl=pycurl.Curl,
-                    _curl_multi=pycurl.CurlMulti,
+def ProcessRequests(requests, lock_monitor_cb=None, curl_pool=None,
+                    _curl=pycurl.Curl, _curl_multi=pycurl.CurlMulti,
                     _curl_process=_ProcessCurlRequests):
   """Processes any number of HTTP client requests.
 
   @type requests: list of L{HttpClientRequest}
   @param requests: List of all requests
   @param lock_monitor_cb: Callable for registering with lock monitor
+  @type curl_pool: L{HttpClientPool} or None
+  @param curl_pool: Pool to take cURL handles from; if not given, a new
+    handle is created for every request
 
   """
   assert compat.all((req.error is None and
@@ -373,9 +592,15 @@ def ProcessRequests(requests, lock_monitor_cb=None, _curl=pycurl.Curl,
                     for req in requests)
 
   # Prepare all requests
+  if curl_pool is None:
+    clients = [_StartRequest(_curl(), req) for req in requests]
+  else:
+    clients = [_StartRequest(curl_pool.GetHandle(req.host, req.port), req,
+                             session_cache=curl_pool.ssl_session_cache)
+               for req in requests]
+
   curl_to_client = \
-    dict((client.GetCurlHandle(), client)
-         for client in [_StartRequest(_curl(), req) for req in requests])
+    dict((client.GetCurlHandle(), client) for client in clients)
 
   assert len(curl_to_client) == len(requests)
 
@@ -390,10 +615,15 @@ def ProcessRequests(requests, lock_monitor_cb=None, _curl=pycurl.Curl,
   for (curl, msg) in _curl_process(_curl_multi(), list(curl_to_client)):
     monitor.acquire(shared=0)
     try:
-      curl_to_client.pop(curl).Done(msg)
+      client = curl_to_client.pop(curl)
+      client.Done(msg)
     finally:
       monitor.release()
 
+    if curl_pool is not None:
+      req = client.GetCurrentRequest()
+      curl_pool.ReleaseHandle(req.host, req.port, curl, reusable=not msg)
+
   assert not curl_to_client, "Not all requests were processed"
 
   # Don't try to read information anymore as all requests have been processed
@@ -31,9 +31,11 @@
 
 """
 
+import errno
 import html
 import logging
 import os
+import select
 import socket
 import time
 import signal
@@ -41,6 +43,8 @@ import asyncore
 
 from http.server import BaseHTTPRequestHandler
 
+import OpenSSL
+
 from ganeti import http
 from ganeti import utils
 from ganeti import netutils
@@ -96,6 +100,7 @@ class _HttpServerRequest(object):
     self.request_sock = sock
 
     # Response attributes
+    self.resp_code = http.HTTP_OK
     self.resp_headers = {}
 
     # Private data for request handler (useful in combination with
@@ -133,6 +138,17 @@ class _HttpServerToClientMessageWriter(http.HttpMessageWriter):
     self._response_msg = response_msg
     http.HttpMessageWriter.__init__(self, sock, response_msg, write_timeout)
 
+  def _PrepareMessage(self):
+    """Selects the transfer coding for streaming bodies.
+
+    """
+    http.HttpMessageWriter._PrepareMessage(self)
+
+    if (self._IsStreaming() and self.HasMessageBody() and
+        self._response_msg.start_line.version == http.HTTP_1_1):
+      self._response_msg.headers[http.HTTP_TRANSFER_ENCODING] = \
+        http.HTTP_TRANSFER_ENCODING_CHUNKED
+
   def HasMessageBody(self):
     """Logic to detect whether response should contain a message body.
 
@@ -226,6 +242,54 @@ class _HttpClientToServerMessageReader(http.HttpMessageReader):
     return http.HttpClientToServerStartLine(method, path, version)
 
 
+def _DecodeRequestBody(req_msg):
+  """Removes the content coding from a request body.
+
+  @rtype: string
+  @return: Request body
+
+  """
+  body = req_msg.body
+
+  if isinstance(body, bytes):
+    body = http.DecodeBody(req_msg.headers.get(http.HTTP_CONTENT_ENCODING),
+                           body)
+    try:
+      body = body.decode("utf-8")
+    except UnicodeDecodeError as err:
+      raise http.HttpBadRequest(message="Invalid request body: %s" % err)
+
+  return body
+
+
+def _EncodeResponseBody(handler, req_msg, headers, body):
+  """Compresses a response body if the handler and the client allow it.
+
+  @return: Response body, possibly compressed
+
+  """
+  min_size = handler.RESPONSE_COMPRESSION_MIN_SIZE
+
+  if (min_size is None or
+      not isinstance(body, (str, bytes)) or
+      len(body) < min_size or
+      http.HTTP_CONTENT_ENCODING in headers or
+      not req_msg.headers):
+    return body
+
+  accepted = \
+    http.ParseAcceptEncoding(req_msg.headers.get(http.HTTP_ACCEPT_ENCODING))
+  if http.HTTP_CONTENT_ENCODING_DEFLATE not in accepted:
+    return body
+
+  if not isinstance(body, bytes):
+    body = body.encode("utf-8")
+
+  headers[http.HTTP_CONTENT_ENCODING] = http.HTTP_CONTENT_ENCODING_DEFLATE
+
+  return http.EncodeBody(http.HTTP_CONTENT_ENCODING_DEFLATE, body)
+
+
 def _HandleServerRequestInner(handler, req_msg, reader):
   """Calls the handler function for the current request.
 
@@ -233,7 +297,7 @@ def _HandleServerRequestInner(handler, req_msg, reader):
   handler_context = _HttpServerRequest(req_msg.start_line.method,
                                        req_msg.start_line.path,
                                        req_msg.headers,
-                                       req_msg.body,
+                                       _DecodeRequestBody(req_msg),
                                        reader.sock)
 
   logging.debug("Handling request %r", handler_context)
@@ -255,10 +319,18 @@ def _HandleServerRequestInner(handler, req_msg, reader):
       logging.exception("Unknown exception")
       raise http.HttpInternalServerError(message="Unknown error")
 
-    if not isinstance(result, (str, bytes)):
+    if not isinstance(result, (str, bytes, http.HttpStreamingBody)):
       raise http.HttpError("Handler function didn't return string type")
 
-    return (http.HTTP_OK, handler_context.resp_headers, result)
+    headers = handler_context.resp_headers
+
+    # Advertise the content codings accepted for request bodies (RFC7694)
+    headers.setdefault(http.HTTP_ACCEPT_ENCODING,
+                       ", ".join(sorted(http.CONTENT_ENCODINGS)))
+
+    result = _EncodeResponseBody(handler, req_msg, headers, result)
+
+    return (handler_context.resp_code, headers, result)
   finally:
     # No reason to keep this any longer, even for exceptions
     handler_context.private = None
@@ -279,13 +351,16 @@ class HttpResponder(object):
     """
     self._handler = handler
 
-  def __call__(self, fn):
+  def __call__(self, fn, keep_alive=False):
     """Handles a request.
 
     @type fn: callable
     @param fn: Callback for retrieving HTTP request, must return a tuple
       containing request message (L{http.HttpMessage}) and C{None} or the
       message reader (L{_HttpClientToServerMessageReader})
+    @type keep_alive: bool
+    @param keep_alive: Whether the connection may be kept open for further
+      requests if the client doesn't ask for it to be closed
 
     """
     response_msg = http.HttpMessage()
@@ -315,12 +390,17 @@ class HttpResponder(object):
       self._SetError(self.responses, self._handler, response_msg, err)
       request_msg = http.HttpMessage()
       req_msg_reader = None
+      keep_alive = False
     else:
       # Only wait for client to close if we didn't have any exception.
       force_close = False
 
+      keep_alive = (keep_alive and
+                    not getattr(req_msg_reader, "peer_will_close", True))
+
     return (request_msg, req_msg_reader, force_close,
-            self._Finalize(self.responses, response_msg))
+            self._Finalize(self.responses, response_msg,
+                           keep_alive=keep_alive))
 
   @staticmethod
   def _SetError(responses, handler, response_msg, err):
@@ -360,15 +440,29 @@ class HttpResponder(object):
     response_msg.body = body
 
   @staticmethod
-  def _Finalize(responses, msg):
+  def _Finalize(responses, msg, keep_alive=False):
     assert msg.start_line.reason is None
 
     if not msg.headers:
       msg.headers = {}
 
+    if (isinstance(msg.body, http.HttpStreamingBody) and
+        msg.start_line.version != http.HTTP_1_1):
+      # Without the chunked transfer coding the end of the body is signalled
+      # by closing the connection
+      keep_alive = False
+
+    if keep_alive:
+      connection = http.HTTP_CONNECTION_KEEP_ALIVE
+      if not msg.body:
+        # Without a length the client could only detect the end of the body
+        # by the connection being closed
+        msg.headers[http.HTTP_CONTENT_LENGTH] = 0
+    else:
+      connection = http.HTTP_CONNECTION_CLOSE
+
     msg.headers.update({
-      # TODO: Keep-alive is not supported
-      http.HTTP_CONNECTION: "close",
+      http.HTTP_CONNECTION: connection,
       http.HTTP_DATE: _DateTimeHeader(),
       http.HTTP_SERVER: http.HTTP_GANETI_VERSION,
       })
@@ -392,7 +486,13 @@ class HttpServerRequestExecutor(object):
   This class implements the server side of HTTP. It's based on code of
   Python's BaseHTTPServer, from both version 2.4 and 3k. It does not
   support non-ASCII character encodings. Keep-alive connections are
-  not supported.
+  only supported if enabled on the server, see L{HttpServer}.
+
+  @type handshake_time: float
+  @ivar handshake_time: Seconds spent in the SSL handshake
+  @type handling_time: float
+  @ivar handling_time: Seconds spent reading, handling and answering the
+      request
 
   """
   # Timeouts in seconds for socket layer
@@ -404,6 +504,10 @@ class HttpServerRequestExecutor(object):
     """Initializes this class.
 
     """
+    self.handshake_time = 0.0
+    self.handling_time = 0.0
+
+    t_start = time.time()
     responder = HttpResponder(handler)
 
     # Disable Python's timeout
@@ -430,16 +534,46 @@ class HttpServerRequestExecutor(object):
             # Ignore rest
             return
 
-        (request_msg, request_msg_reader, force_close, response_msg) = \
-          responder(compat.partial(self._ReadRequest, sock, self.READ_TIMEOUT))
-        if response_msg:
-          # HttpMessage.start_line can be of different types
-          # Instance of 'HttpClientToServerStartLine' has no 'code' member
-          # pylint: disable=E1103,E1101
-          logging.info("%s:%s %s %s", client_addr[0], client_addr[1],
-                       request_msg.start_line, response_msg.start_line.code)
-          self._SendResponse(sock, request_msg, response_msg,
-                             self.WRITE_TIMEOUT)
+        t_handshake = time.time()
+        self.handshake_time = t_handshake - t_start
+
+        keep_alive_timeout = getattr(server, "keep_alive_timeout", 0)
+        keep_alive_max = getattr(server, "keep_alive_max_requests", None)
+
+        count = 0
+        while True:
+          count += 1
+          keep_alive = (keep_alive_timeout > 0 and
+                        (keep_alive_max is None or count < keep_alive_max))
+
+          (request_msg, request_msg_reader, force_close, response_msg) = \
+            responder(compat.partial(self._ReadRequest, sock,
+                                     self.READ_TIMEOUT),
+                      keep_alive=keep_alive)
+          if response_msg:
+            # HttpMessage.start_line can be of different types
+            # Instance of 'HttpClientToServerStartLine' has no 'code' member
+            # pylint: disable=E1103,E1101
+            logging.info("%s:%s %s %s", client_addr[0], client_addr[1],
+                         request_msg.start_line, response_msg.start_line.code)
+            self._SendResponse(sock, request_msg, response_msg,
+                               self.WRITE_TIMEOUT)
+
+          if not (response_msg and
+                  response_msg.headers.get(http.HTTP_CONNECTION) ==
+                    http.HTTP_CONNECTION_KEEP_ALIVE):
+            break
+
+          if not self._WaitForNextRequest(sock, keep_alive_timeout):
+            # Idle for too long or closed by the client, there's no need to
+            # wait for the client any longer
+            force_close = True
+            break
+
+          logging.debug("Reusing connection from %s:%s for request %s",
+                        client_addr[0], client_addr[1], count + 1)
+
+        self.handling_time = time.time() - t_handshake
       finally:
         http.ShutdownConnection(sock, self.CLOSE_TIMEOUT, self.WRITE_TIMEOUT,
                                 request_msg_reader, force_close)
@@ -448,6 +582,39 @@ class HttpServerRequestExecutor(object):
     finally:
       logging.debug("Disconnected %s:%s", client_addr[0], client_addr[1])
 
+  @staticmethod
+  def _WaitForNextRequest(sock, timeout):
+    """Waits for another request on a persistent connection.
+
+    @type timeout: float
+    @param timeout: How long to wait for the client to send data
+    @rtype: bool
+    @return: Whether the client sent data and didn't close the connection
+
+    """
+    # OpenSSL may have buffered data already
+    if isinstance(sock, http.SSL_CONN_TYPE) and sock.pending():
+      return True
+
+    running_timeout = utils.RunningTimeout(timeout, True)
+
+    while True:
+      remaining = running_timeout.Remaining()
+      if remaining <= 0:
+        return False
+
+      if not utils.SingleWaitForFdCondition(sock, select.POLLIN, remaining):
+        continue
+
+      # Check whether there's actual data or the connection was closed
+      try:
+        return bool(sock.recv(1, socket.MSG_PEEK))
+      except OpenSSL.SSL.WantReadError:
+        # Received data wasn't application data yet
+        continue
+      except (OpenSSL.SSL.Error, socket.error):
+        return False
+
   @staticmethod
   def _ReadRequest(sock, timeout):
     """Reads a request sent by client.
@@ -477,14 +644,32 @@ class HttpServerRequestExecutor(object):
       raise http.HttpError("Error sending response: %s" % err)
 
 
+class _WorkerShutdown(Exception):
+  """Internal exception to stop an idle worker process.
+
+  """
+
+
 class HttpServer(http.HttpBase, asyncore.dispatcher):
   """Generic HTTP server class
 
+  By default a new child process is forked for every incoming connection. If
+  a worker pool size is given, a fixed number of worker processes is forked
+  in advance instead. The workers accept connections on the shared listening
+  socket themselves and are replaced after handling a given number of
+  connections.
+
   """
+  # Interval in seconds after which an idle worker checks whether its parent
+  # process is still alive
+  WORKER_POLL_INTERVAL = 1.0
 
   def __init__(self, mainloop, local_address, port, max_clients, handler,
                ssl_params=None, ssl_verify_peer=False,
-               request_executor_class=None, ssl_verify_callback=None):
+               request_executor_class=None, ssl_verify_callback=None,
+               worker_pool_size=0, worker_max_requests=None,
+               keep_alive_timeout=0, keep_alive_max_requests=None,
+               log_request_timing=False):
     """Initializes the HTTP server
 
     @type mainloop: ganeti.daemon.Mainloop
@@ -506,8 +691,27 @@ class HttpServer(http.HttpBase, asyncore.dispatcher):
     @type request_executor_class: class
     @param request_executor_class: a class derived from the
         HttpServerRequestExecutor class
+    @type worker_pool_size: int
+    @param worker_pool_size: number of pre-forked worker processes; if zero,
+        a child process is forked for every connection
+    @type worker_max_requests: int or None
+    @param worker_max_requests: number of connections handled by a worker
+        process before it is replaced; C{None} for no limit
+    @type keep_alive_timeout: float
+    @param keep_alive_timeout: how long to wait for another request on a
+        persistent connection; if zero, connections are closed after the
+        first request
+    @type keep_alive_max_requests: int or None
+    @param keep_alive_max_requests: number of requests handled on a
+        persistent connection before it is closed; C{None} for no limit
+    @type log_request_timing: bool
+    @param log_request_timing: whether to log the time spent setting up and
+        handling every request at info level instead of debug level
 
     """
+    assert worker_pool_size >= 0
+    assert worker_max_requests is None or worker_max_requests > 0
+
     http.HttpBase.__init__(self)
     asyncore.dispatcher.__init__(self)
 
@@ -533,13 +737,41 @@ class HttpServer(http.HttpBase, asyncore.dispatcher):
     self.max_clients = max_clients
     mainloop.RegisterSignal(self)
 
+    self.keep_alive_timeout = keep_alive_timeout
+    self.keep_alive_max_requests = keep_alive_max_requests
+    self.log_request_timing = log_request_timing
+
+    self.worker_pool_size = worker_pool_size
+    self.worker_max_requests = worker_max_requests
+    self._workers = []
+    self._stopping = False
+
+    # State of the current process if it is a worker
+    self._worker_busy = False
+    self._worker_stop = False
+
   def Start(self):
     self.socket.bind((self.local_address, self.port))
     self.socket.listen(1024)
 
+    if self.worker_pool_size:
+      self._StartWorkers()
+
   def Stop(self):
+    self._stopping = True
+
+    for pid in self._workers:
+      try:
+        os.kill(pid, signal.SIGTERM)
+      except OSError:
+        pass
+
     self.socket.close()
 
+  def readable(self):
+    # With a worker pool, connections are only accepted by the workers
+    return not self.worker_pool_size
+
   def handle_accept(self):
     self._IncomingConnection()
 
@@ -547,6 +779,11 @@ class HttpServer(http.HttpBase, asyncore.dispatcher):
     if signum == signal.SIGCHLD:
       self._CollectChildren(True)
 
+      if self.worker_pool_size:
+        self._CollectWorkers()
+        if not self._stopping:
+          self._StartWorkers()
+
   def _CollectChildren(self, quick):
     """Checks whether any child processes are done
 
@@ -614,12 +851,8 @@ class HttpServer(http.HttpBase, asyncore.dispatcher):
         # In case the handler code uses temporary files
         utils.ResetTempfileModule()
 
-        t_setup = time.time()
-        self.request_executor(self, self.handler, connection, client_addr)
-        t_end = time.time()
-        logging.debug("Request from %s:%s executed in: %.4f [setup: %.4f] "
-                      "[workers: %d]", client_addr[0], client_addr[1],
-                      t_end - t_start, t_setup - t_start, len(self._children))
+        self._HandleConnection(connection, client_addr, t_start,
+                               len(self._children))
 
       except Exception: # pylint: disable=W0703
         logging.exception("Error while handling request from %s:%s",
@@ -629,6 +862,140 @@ class HttpServer(http.HttpBase, asyncore.dispatcher):
     else:
       self._children.append(pid)
 
+  def _HandleConnection(self, connection, client_addr, t_start, workers):
+    """Runs the request executor for a connection and logs its timing.
+
+    @type t_start: float
+    @param t_start: Time at which the connection was accepted
+    @type workers: int
+    @param workers: Number of busy or pre-forked worker processes
+
+    """
+    t_setup = time.time()
+    executor = self.request_executor(self, self.handler, connection,
+                                     client_addr)
+    t_end = time.time()
+
+    if self.log_request_timing:
+      level = logging.INFO
+    else:
+      level = logging.DEBUG
+
+    logging.log(level, "Request from %s:%s executed in: %.4f [setup: %.4f]"
+                " [handshake: %.4f] [handling: %.4f] [workers: %d]",
+                client_addr[0], client_addr[1], t_end - t_start,
+                t_setup - t_start,
+                getattr(executor, "handshake_time", 0.0),
+                getattr(executor, "handling_time", 0.0), workers)
+
+  def _CollectWorkers(self):
+    """Removes terminated worker processes from the pool.
+
+    """
+    for pid in self._workers[:]:
+      try:
+        (result, _) = os.waitpid(pid, os.WNOHANG)
+      except os.error:
+        result = pid
+      if result:
+        self._workers.remove(pid)
+
+  def _StartWorkers(self):
+    """Forks worker processes until the pool is complete.
+
+    """
+    while len(self._workers) < self.worker_pool_size:
+      try:
+        pid = os.fork()
+      except OSError:
+        logging.exception("Failed to fork worker process, %d of %d running",
+                          len(self._workers), self.worker_pool_size)
+        return
+
+      if pid == 0:
+        # Child process
+        try:
+          self._RunWorker()
+        except Exception: # pylint: disable=W0703
+          logging.exception("Error in worker process")
+          os._exit(1) # pylint: disable=W0212
+        os._exit(0) # pylint: disable=W0212
+
+      logging.debug("Started worker process %s", pid)
+      self._workers.append(pid)
+
+  def _WorkerSignal(self, signum, _):
+    """Signal handler for worker processes.
+
+    An idle worker stops immediately, a busy one finishes its current
+    connection first.
+
+    """
+    logging.debug("Worker process received signal %s", signum)
+    self._worker_stop = True
+    if not self._worker_busy:
+      raise _WorkerShutdown()
+
+  def _RunWorker(self):
+    """Main loop of a pre-forked worker process.
+
+    """
+    parent_pid = os.getppid()
+
+    # Signal handlers set up by the parent's mainloop don't apply here
+    signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+    signal.signal(signal.SIGTERM, self._WorkerSignal)
+    signal.signal(signal.SIGINT, self._WorkerSignal)
+
+    # In case the handler code uses temporary files
+    utils.ResetTempfileModule()
+
+    # The pool is managed by the parent process
+    self._workers = []
+    self._children = []
+
+    # All workers wait for the same socket, only one of them will succeed in
+    # accepting a new connection
+    self.socket.setblocking(0)
+
+    handled = 0
+    try:
+      while not (self._worker_stop or
+                 (self.worker_max_requests is not None and
+                  handled >= self.worker_max_requests)):
+        if not utils.SingleWaitForFdCondition(self.socket, select.POLLIN,
+                                              self.WORKER_POLL_INTERVAL):
+          if os.getppid() != parent_pid:
+            logging.info("Parent process %s is gone, stopping worker",
+                         parent_pid)
+            break
+          continue
+
+        try:
+          (connection, client_addr) = self.socket.accept()
+        except socket.error as err:
+          # Another worker was faster
+          if err.errno in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+            continue
+          raise
+
+        self._worker_busy = True
+        try:
+          t_start = time.time()
+          handled += 1
+          self._HandleConnection(connection, client_addr, t_start,
+                                 self.worker_pool_size)
+        except Exception: # pylint: disable=W0703
+          logging.exception("Error while handling request from %s:%s",
+                            client_addr[0], client_addr[1])
+        finally:
+          self._worker_busy = False
+    except _WorkerShutdown:
+      pass
+
+    logging.debug("Worker process %s exiting after %d requests",
+                  os.getpid(), handled)
+
 
 class HttpServerHandler(object):
   """Base class for handling HTTP server requests.
@@ -637,6 +1004,10 @@ class HttpServerHandler(object):
   function.
 
   """
+  #: Minimum size of response bodies compressed for clients accepting the
+  #: "deflate" content coding; C{None} to never compress responses
+  RESPONSE_COMPRESSION_MIN_SIZE = None
+
   def PreHandleRequest(self, req):
     """Called before handling a request.
 
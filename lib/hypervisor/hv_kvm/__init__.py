@@ -65,12 +65,14 @@ from ganeti import uidpool
 from ganeti import ssconf
 from ganeti import netutils
 from ganeti import pathutils
+from ganeti import workerpool
 from ganeti.hypervisor import hv_base
 from ganeti.utils import wrapper as utils_wrapper
 
 from ganeti.hypervisor.hv_kvm.monitor import QmpConnection, QmpMessage, \
                                              MonitorSocket
 from ganeti.hypervisor.hv_kvm.netdev import OpenTap
+from ganeti.hypervisor.hv_kvm.process import ProcessInfoCache
 
 from ganeti.hypervisor.hv_kvm.validation import check_boot_parameters, \
                                                 check_console_parameters, \
@@ -164,6 +166,43 @@ _MIGRATION_CAPS_DELIM = ":"
 # in future make dirty_sync_count configurable
 _POSTCOPY_SYNC_COUNT_THRESHOLD = 2 # Precopy passes before enabling postcopy
 
+# Timeout for QMP socket operations when querying instance information, so
+# that an unresponsive instance doesn't hold up the others for long
+_QMP_INFO_TIMEOUT = 2
+
+# Maximum number of instances queried concurrently by GetAllInstancesInfo
+_INSTANCE_INFO_WORKERS = 16
+
+
+def _CollectInstanceInfo(fn, name, results):
+  """Queries an instance and stores the result.
+
+  @type fn: callable
+  @param fn: function returning the information of an instance
+  @type name: string
+  @param name: the name of the instance
+  @type results: dict
+  @param results: dictionary receiving (success, result or exception) tuples,
+      indexed by instance name
+
+  """
+  try:
+    results[name] = (True, fn(name))
+  except Exception as err: # pylint: disable=W0703
+    results[name] = (False, err)
+
+
+class _InstanceInfoWorker(workerpool.BaseWorker):
+  """Worker querying the information of one instance.
+
+  """
+  def RunTask(self, *args):
+    """Runs L{_CollectInstanceInfo}.
+
+    """
+    _CollectInstanceInfo(*args)
+
+
 def _with_qmp(fn):
   """Wrapper used on hotplug related methods"""
   def wrapper(self, *args, **kwargs):
@@ -498,6 +537,9 @@ class KVMHypervisor(hv_base.BaseHypervisor):
   _DIRS = [_ROOT_DIR, _PIDS_DIR, _UIDS_DIR, _CTRL_DIR, _CONF_DIR, _NICS_DIR,
            _CHROOT_DIR, _CHROOT_QUARANTINE_DIR]
 
+  # Information parsed from the command lines of the KVM processes
+  _PROCESS_INFO = ProcessInfoCache()
+
   PARAMETERS = {
     constants.HV_KVM_PATH: hv_base.REQ_FILE_CHECK,
     constants.HV_KERNEL_PATH: hv_base.OPT_FILE_CHECK,
@@ -702,56 +744,31 @@ class KVMHypervisor(hv_base.BaseHypervisor):
     return utils.PathJoin(cls._UIDS_DIR, instance_name)
 
   @classmethod
-  def _InstancePidInfo(cls, pid):
+  def _InstancePidInfo(cls, pid, snapshot=None):
     """Check pid file for instance information.
 
     Check that a pid file is associated with an instance, and retrieve
     information from its command line.
 
-    @type pid: string or int
+    @type pid: int
     @param pid: process id of the instance to check
+    @type snapshot: L{process.ProcessSnapshot}
+    @param snapshot: snapshot of the running processes to use, if any
     @rtype: tuple
     @return: (instance_name, memory, vcpus)
     @raise errors.HypervisorError: when an instance cannot be found
 
     """
-    alive = utils.IsProcessAlive(pid)
-    if not alive:
-      raise errors.HypervisorError("Cannot get info for pid %s" % pid)
-
-    cmdline_file = utils.PathJoin("/proc", str(pid), "cmdline")
-    try:
-      cmdline = utils.ReadFile(cmdline_file)
-    except EnvironmentError as err:
-      raise errors.HypervisorError("Can't open cmdline file for pid %s: %s" %
-                                   (pid, err))
-
-    instance = None
-    memory = 0
-    vcpus = 0
-
-    arg_list = cmdline.split("\x00")
-    while arg_list:
-      arg = arg_list.pop(0)
-      if arg == "-name":
-        instance = arg_list.pop(0).split(",")[0]
-      elif arg == "-m":
-        memory = int(arg_list.pop(0))
-      elif arg == "-smp":
-        vcpus = int(arg_list.pop(0).split(",")[0])
-
-    if instance is None:
-      raise errors.HypervisorError("Pid %s doesn't contain a ganeti kvm"
-                                   " instance" % pid)
-
-    return (instance, memory, vcpus)
+    return cls._PROCESS_INFO.GetInfo(pid, snapshot=snapshot)
 
   @classmethod
-  def _InstancePidAlive(cls, instance_name):
+  def _InstancePidAlive(cls, instance_name, snapshot=None):
     """Returns the instance pidfile, pid, and liveness.
 
     @type instance_name: string
     @param instance_name: instance name
+    @type snapshot: L{process.ProcessSnapshot}
+    @param snapshot: snapshot of the running processes to use, if any
     @rtype: tuple
     @return: (pid file name, pid, liveness)
 
@@ -761,7 +778,7 @@ class KVMHypervisor(hv_base.BaseHypervisor):
 
     alive = False
     try:
-      cmd_instance = cls._InstancePidInfo(pid)[0]
+      cmd_instance = cls._InstancePidInfo(pid, snapshot=snapshot)[0]
       alive = (cmd_instance == instance_name)
     except errors.HypervisorError:
       pass
@@ -1056,9 +1073,10 @@ class KVMHypervisor(hv_base.BaseHypervisor):
     checking whether the associated kvm process is still alive.
 
     """
+    snapshot = self._PROCESS_INFO.Snapshot()
     result = []
     for name in os.listdir(self._PIDS_DIR):
-      if self._InstancePidAlive(name)[2]:
+      if self._InstancePidAlive(name, snapshot=snapshot)[2]:
         result.append(name)
     return result
 
@@ -1081,46 +1099,107 @@ class KVMHypervisor(hv_base.BaseHypervisor):
     @return: (name, id, memory, vcpus, stat, times)
 
     """
-    _, pid, alive = self._InstancePidAlive(instance_name)
+    return self._GetInstanceInfo(instance_name)
+
+  def _GetInstanceInfo(self, instance_name, snapshot=None):
+    """Get instance properties.
+
+    @type instance_name: string
+    @param instance_name: the instance name
+    @type snapshot: L{process.ProcessSnapshot}
+    @param snapshot: snapshot of the running processes to use, if any
+    @rtype: tuple of strings
+    @return: (name, id, memory, vcpus, stat, times)
+
+    """
+    _, pid, alive = self._InstancePidAlive(instance_name, snapshot=snapshot)
     if not alive:
       if self._IsUserShutdown(instance_name):
         return (instance_name, -1, 0, 0, hv_base.HvInstanceState.SHUTDOWN, 0)
       else:
         return None
 
-    _, memory, vcpus = self._InstancePidInfo(pid)
+    _, memory, vcpus = self._InstancePidInfo(pid, snapshot=snapshot)
     istat = hv_base.HvInstanceState.RUNNING
     times = 0
 
+    (memory, vcpus) = self._QmpInstanceResources(instance_name, memory, vcpus)
+
+    return (instance_name, pid, memory, vcpus, istat, times)
+
+  @classmethod
+  def _QmpInstanceResources(cls, instance_name, memory, vcpus):
+    """Queries the current memory and VCPUs of an instance via QMP.
+
+    Both queries are sent in one round-trip. The connection is closed right
+    afterwards, as the QMP socket of an instance only serves one client at a
+    time.
+
+    @type instance_name: string
+    @param instance_name: the instance name
+    @type memory: int
+    @param memory: memory size in MiB to use if it can't be queried
+    @type vcpus: int
+    @param vcpus: number of VCPUs to use if it can't be queried
+    @rtype: tuple
+    @return: (memory, vcpus)
+
+    """
     try:
-      qmp = QmpConnection(self._InstanceQmpMonitor(instance_name))
-      qmp.connect()
-      vcpus = len(qmp.Execute("query-cpus"))
-      # Will fail if ballooning is not enabled, but we can then just resort to
-      # the value above.
-      mem_bytes = qmp.Execute("query-balloon")[qmp.ACTUAL_KEY]
-      memory = mem_bytes // 1048576
+      with QmpConnection(cls._InstanceQmpMonitor(instance_name),
+                         timeout=_QMP_INFO_TIMEOUT) as qmp:
+        ((cpus_ok, cpus), (balloon_ok, balloon)) = \
+          qmp.ExecuteMany([("query-cpus", None), ("query-balloon", None)])
     except errors.HypervisorError:
-      pass
+      return (memory, vcpus)
 
-    return (instance_name, pid, memory, vcpus, istat, times)
+    if cpus_ok:
+      vcpus = len(cpus)
+    # Will fail if ballooning is not enabled, but we can then just resort to
+    # the value above.
+    if balloon_ok:
+      memory = balloon[QmpConnection.ACTUAL_KEY] // 1048576
+
+    return (memory, vcpus)
 
   def GetAllInstancesInfo(self, hvparams=None):
     """Get properties of all instances.
 
+    The instances are queried concurrently.
+
     @type hvparams: dict of strings
     @param hvparams: hypervisor parameters
     @return: list of tuples (name, id, memory, vcpus, stat, times)
 
     """
-    data = []
-    for entry in os.listdir(self._CONF_DIR):
-      name, _ = os.path.splitext(entry)
+    names = [os.path.splitext(entry)[0]
+             for entry in os.listdir(self._CONF_DIR)]
+
+    snapshot = self._PROCESS_INFO.Snapshot()
+    fn = lambda name: self._GetInstanceInfo(name, snapshot=snapshot)
+
+    results = {}
+    if len(names) > 1:
+      pool = workerpool.WorkerPool("KvmInstanceInfo",
+                                   min(len(names), _INSTANCE_INFO_WORKERS),
+                                   _InstanceInfoWorker)
       try:
-        info = self.GetInstanceInfo(name)
-      except errors.HypervisorError:
-        # Ignore exceptions due to instances being shut down
-        continue
+        pool.AddManyTasks([(fn, name, results) for name in names])
+        pool.Quiesce()
+      finally:
+        pool.TerminateWorkers()
+    else:
+      for name in names:
+        _CollectInstanceInfo(fn, name, results)
+
+    data = []
+    for name in names:
+      (success, info) = results[name]
+      if not success:
+        if isinstance(info, errors.HypervisorError):
+          # Ignore exceptions due to instances being shut down
+          continue
+        raise info
       if info:
         data.append(info)
     return data
@@ -2102,37 +2181,6 @@ class KVMHypervisor(hv_base.BaseHypervisor):
     self._SaveKVMRuntime(instance, kvm_runtime)
     self._ExecuteKVMRuntime(instance, kvm_runtime, kvmhelp)
 
-  @classmethod
-  def _CallMonitorCommand(cls, instance_name, command, timeout=None):
-    """Invoke a command on the instance monitor.
-
-    """
-    if timeout is not None:
-      timeout_cmd = "timeout %s" % (timeout, )
-    else:
-      timeout_cmd = ""
-
-    # TODO: Replace monitor calls with QMP once KVM >= 0.14 is the minimum
-    # version. The monitor protocol is designed for human consumption, whereas
-    # QMP is made for programmatic usage. In the worst case QMP can also
-    # execute monitor commands. As it is, all calls to socat take at least
-    # 500ms and likely more: socat can't detect the end of the reply and waits
-    # for 500ms of no data received before exiting (500 ms is the default for
-    # the "-t" parameter).
-    socat = ("echo %s | %s %s STDIO UNIX-CONNECT:%s" %
-             (utils.ShellQuote(command),
-              timeout_cmd,
-              constants.SOCAT_PATH,
-              utils.ShellQuote(cls._InstanceMonitor(instance_name))))
-    result = utils.RunCmd(socat)
-    if result.failed:
-      msg = ("Failed to send command '%s' to instance '%s', reason '%s',"
-             " output: %s" %
-             (command, instance_name, result.fail_reason, result.output))
-      raise errors.HypervisorError(msg)
-
-    return result
-
   @_with_qmp
   def VerifyHotplugSupport(self, instance, action, dev_type):
     """Verifies that hotplug is supported.
@@ -2298,14 +2346,15 @@ class KVMHypervisor(hv_base.BaseHypervisor):
           device_type)
         if up_hvp[constants.HV_DISK_DISCARD] != constants.HT_DISCARD_DEFAULT:
           cmd += ",discard=%s" % up_hvp[constants.HV_DISK_DISCARD]
-        self._CallMonitorCommand(instance.name, cmd)
+        self.qmp.HumanMonitorCommand(cmd)
 
       # This must be done indirectly due to the fact that we pass the drive's
       # file descriptor via QMP first, then we add the corresponding drive that
       # refers to this fd. Note that if the QMP connection terminates before
       # a drive which keeps a reference to the fd passed via the add-fd QMP
       # command has been created, then the fd gets closed and cannot be used
-      # later (e.g., via an drive_add HMP command).
+      # later (e.g., via an drive_add HMP command). Therefore the drive_add
+      # HMP command is run over the same QMP connection.
       self.qmp.HotAddDisk(device, kvm_devid, uri, drive_add_fn)
     elif dev_type == constants.HOTPLUG_TARGET_NIC:
       kvmpath = instance.hvparams[constants.HV_KVM_PATH]
@@ -2341,8 +2390,7 @@ class KVMHypervisor(hv_base.BaseHypervisor):
     if dev_type == constants.HOTPLUG_TARGET_DISK:
       self.qmp.HotDelDisk(kvm_devid)
       # drive_del is not implemented yet in qmp
-      command = "drive_del %s\n" % kvm_devid
-      self._CallMonitorCommand(instance.name, command)
+      self.qmp.HumanMonitorCommand("drive_del %s" % kvm_devid)
     elif dev_type == constants.HOTPLUG_TARGET_NIC:
       self.qmp.HotDelNic(kvm_devid)
       utils.RemoveFile(self._InstanceNICFile(instance.name, seq))
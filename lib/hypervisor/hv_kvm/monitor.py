@@ -130,15 +130,21 @@ class QmpMessage(object):
 class MonitorSocket(object):
   _SOCKET_TIMEOUT = 5
 
-  def __init__(self, monitor_filename):
+  def __init__(self, monitor_filename, timeout=None):
     """Instantiates the MonitorSocket object.
 
     @type monitor_filename: string
     @param monitor_filename: the filename of the UNIX raw socket on which the
                              monitor (QMP or simple one) is listening
+    @type timeout: number
+    @param timeout: timeout for socket operations, defaults to
+                    L{_SOCKET_TIMEOUT}
 
     """
     self.monitor_filename = monitor_filename
+    if timeout is None:
+      timeout = self._SOCKET_TIMEOUT
+    self.timeout = timeout
     self._connected = False
 
   def _check_socket(self):
@@ -193,7 +199,7 @@ class MonitorSocket(object):
       self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
       # We want to fail if the server doesn't send a complete message
       # in a reasonable amount of time
-      self.sock.settimeout(self._SOCKET_TIMEOUT)
+      self.sock.settimeout(self.timeout)
       self.sock.connect(self.monitor_filename)
     except EnvironmentError:
       raise errors.HypervisorError("Can't connect to qmp socket")
@@ -258,8 +264,8 @@ class QmpConnection(MonitorSocket):
     "driver", "id", "bus", "addr", "channel", "scsi-id", "lun"
     ]
 
-  def __init__(self, monitor_filename):
-    super(QmpConnection, self).__init__(monitor_filename)
+  def __init__(self, monitor_filename, timeout=None):
+    super(QmpConnection, self).__init__(monitor_filename, timeout=timeout)
     self.version = None
     self.package = None
     self._buf = b""
@@ -282,6 +288,10 @@ class QmpConnection(MonitorSocket):
     @raise errors.ProgrammerError: when there are data serialization errors
 
     """
+    if self.is_connected():
+      return
+
+    self._buf = b""
     super(QmpConnection, self).connect()
     # sometimes we receive asynchronous events instead of the intended greeting
     # message - we ignore these for now. However, only 5 times to not get stuck
@@ -371,12 +381,18 @@ class QmpConnection(MonitorSocket):
           return message
 
     except socket.timeout as err:
+      self.close()
       raise errors.HypervisorError("Timeout while receiving a QMP message: "
                                    "%s" % (err))
     except socket.error as err:
+      self.close()
       raise errors.HypervisorError("Unable to receive data from KVM using the"
                                    " QMP protocol: %s" % err)
 
+    # The connection can't be used any more after the other end closed it
+    self.close()
+    raise errors.HypervisorError("QMP connection closed by KVM")
+
   def _Send(self, message):
     """Encodes and sends a message to KVM using QMP.
 
@@ -390,9 +406,11 @@ class QmpConnection(MonitorSocket):
     try:
       self.sock.sendall(message.to_bytes())
     except socket.timeout as err:
+      self.close()
       raise errors.HypervisorError("Timeout while sending a QMP message: "
                                    "%s" % err)
     except socket.error as err:
+      self.close()
       raise errors.HypervisorError("Unable to send data from KVM using the"
                                    " QMP protocol: %s" % err)
 
@@ -436,6 +454,46 @@ class QmpConnection(MonitorSocket):
       logging.debug("QMP %s %s: %s\n", command, arguments, ret)
     return ret
 
+  def ExecuteMany(self, commands):
+    """Executes several QMP commands in a single round-trip.
+
+    All commands are sent before the first response is read. A failing
+    command doesn't prevent the following ones from being executed.
+
+    @type commands: list of tuples
+    @param commands: the commands to execute, as (command, arguments) tuples
+    @rtype: list of tuples
+    @return: for each command, a (success, result or error message) tuple
+    @raise errors.HypervisorError: when there are communication errors
+
+    """
+    self._check_connection()
+
+    result = [None] * len(commands)
+    pending = []
+    for (idx, (command, arguments)) in enumerate(commands):
+      if (self.supported_commands is not None and
+          command not in self.supported_commands):
+        result[idx] = (False, "Instance does not support the '%s' QMP"
+                       " command." % command)
+        continue
+
+      message = QmpMessage({self._EXECUTE_KEY: command})
+      if arguments:
+        message[self._ARGUMENTS_KEY] = arguments
+      self._Send(message)
+      pending.append((idx, command))
+
+    for (idx, command) in pending:
+      try:
+        result[idx] = (True, self._GetResponse(command))
+      except errors.HypervisorError as err:
+        if not self.is_connected():
+          raise
+        result[idx] = (False, str(err))
+
+    return result
+
   def _GetResponse(self, command):
     """Parse the QMP response
 
@@ -857,6 +915,21 @@ class QmpConnection(MonitorSocket):
 
     self.Execute("set_password", arguments)
 
+  @_ensure_connection
+  def HumanMonitorCommand(self, command):
+    """Run a command of the human monitor (HMP)
+
+    This is meant for the few operations that are only available through
+    the human monitor.
+
+    @type command: string
+    @param command: the command line to execute
+    @rtype: string
+    @return: the output of the command
+
+    """
+    return self.Execute("human-monitor-command", {"command-line": command})
+
   @_ensure_connection
   def SetBalloonMemory(self, memory):
     self.Execute("balloon", {"value": memory * 1048576})
@@ -0,0 +1,236 @@
+#
+#
+
+# Copyright (C) 2014 Google Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS
+# IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+# TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+# PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+"""KVM process information helpers
+
+"""
+
+import errno
+import os
+import threading
+
+from ganeti import errors
+from ganeti import utils
+
+
+PROC_DIR = "/proc"
+
+# Index of the start time among the fields of /proc/<pid>/stat following the
+# command name, see proc(5)
+_STAT_STARTTIME_INDEX = 19
+
+
+def ParseCmdline(cmdline):
+  """Extracts the instance information from a KVM command line.
+
+  @type cmdline: string
+  @param cmdline: the NUL-separated command line of the process
+  @rtype: tuple
+  @return: (instance_name, memory, vcpus); the instance name is C{None} if
+      the command line doesn't belong to a Ganeti instance
+
+  """
+  instance = None
+  memory = 0
+  vcpus = 0
+
+  args = iter(cmdline.split("\x00"))
+  for arg in args:
+    if arg == "-name":
+      instance = next(args, "").split(",")[0]
+    elif arg == "-m":
+      memory = int(next(args, 0))
+    elif arg == "-smp":
+      vcpus = int(next(args, "0").split(",")[0])
+
+  return (instance, memory, vcpus)
+
+
+def _ProcPath(proc_dir, pid, name):
+  """Returns the path of a file in the proc directory of a process.
+
+  Process IDs are integers, so the path needs no further checks.
+
+  """
+  return os.path.join(proc_dir, "%d" % pid, name)
+
+
+def _ReadStartTime(proc_dir, pid):
+  """Reads the start time of a process.
+
+  @rtype: int or None
+  @return: the start time in clock ticks since boot, or C{None} if the
+      process doesn't exist
+
+  """
+  try:
+    stat = utils.ReadFile(_ProcPath(proc_dir, pid, "stat"))
+  except EnvironmentError as err:
+    if err.errno in (errno.ENOENT, errno.ESRCH, errno.ENOTDIR):
+      return None
+    raise errors.HypervisorError("Can't read the status of pid %s: %s" %
+                                 (pid, err))
+
+  # The command name can contain spaces and parentheses, so the fields are
+  # counted from its end
+  fields = stat[stat.rfind(")") + 2:].split()
+  try:
+    return int(fields[_STAT_STARTTIME_INDEX])
+  except (IndexError, ValueError):
+    raise errors.HypervisorError("Invalid status of pid %s" % pid)
+
+
+class ProcessSnapshot(object):
+  """Snapshot of the processes running on the node.
+
+  The process directory is listed only once. The start times of the
+  processes are read when first needed and then remembered, so that
+  checking many instances costs one read per process.
+
+  """
+  def __init__(self, proc_dir=PROC_DIR):
+    """Initializes this class.
+
+    @type proc_dir: string
+    @param proc_dir: the directory of the proc filesystem
+
+    """
+    self.proc_dir = proc_dir
+    self.pids = frozenset(int(entry) for entry in os.listdir(proc_dir)
+                          if entry.isdigit())
+    self._start_times = {}
+
+  def GetStartTime(self, pid):
+    """Returns the start time of a process.
+
+    @type pid: int
+    @rtype: int or None
+    @return: the start time, or C{None} if the process doesn't exist
+
+    """
+    if pid not in self.pids:
+      return None
+
+    try:
+      return self._start_times[pid]
+    except KeyError:
+      start_time = _ReadStartTime(self.proc_dir, pid)
+      self._start_times[pid] = start_time
+      return start_time
+
+
+class ProcessInfoCache(object):
+  """Cache of the information parsed from KVM command lines.
+
+  Entries are keyed by process ID and start time, so a reused process ID is
+  never mistaken for the process it previously belonged to. The command line
+  of a KVM process doesn't change, so a process' entry stays valid as long
+  as the process runs.
+
+  This class is thread-safe.
+
+  """
+  def __init__(self, proc_dir=PROC_DIR):
+    """Initializes this class.
+
+    @type proc_dir: string
+    @param proc_dir: the directory of the proc filesystem
+
+    """
+    self._proc_dir = proc_dir
+    self._lock = threading.Lock()
+
+    # Maps (pid, start time) to (instance name, memory, vcpus)
+    self._info = {}
+
+  def Snapshot(self):
+    """Takes a snapshot of the running processes.
+
+    Entries of processes which aren't running any more are dropped.
+
+    @rtype: L{ProcessSnapshot}
+
+    """
+    snapshot = ProcessSnapshot(proc_dir=self._proc_dir)
+    with self._lock:
+      for key in list(self._info):
+        if key[0] not in snapshot.pids:
+          del self._info[key]
+    return snapshot
+
+  def GetInfo(self, pid, snapshot=None):
+    """Returns the instance information of a KVM process.
+
+    @type pid: int
+    @param pid: the process ID
+    @type snapshot: L{ProcessSnapshot}
+    @param snapshot: process snapshot to use instead of checking the process
+        directly
+    @rtype: tuple
+    @return: (instance_name, memory, vcpus)
+    @raise errors.HypervisorError: if the process doesn't exist or isn't a
+        Ganeti KVM instance
+
+    """
+    if pid <= 0:
+      start_time = None
+    elif snapshot is None:
+      start_time = _ReadStartTime(self._proc_dir, pid)
+    else:
+      start_time = snapshot.GetStartTime(pid)
+    if start_time is None:
+      raise errors.HypervisorError("Cannot get info for pid %s" % pid)
+
+    key = (pid, start_time)
+    with self._lock:
+      info = self._info.get(key)
+    if info is not None:
+      return info
+
+    cmdline_file = _ProcPath(self._proc_dir, pid, "cmdline")
+    try:
+      cmdline = utils.ReadFile(cmdline_file)
+    except EnvironmentError as err:
+      raise errors.HypervisorError("Can't open cmdline file for pid %s: %s" %
+                                   (pid, err))
+
+    info = ParseCmdline(cmdline)
+    if info[0] is None:
+      # Not cached, as the process could still be about to execute KVM
+      raise errors.HypervisorError("Pid %s doesn't contain a ganeti kvm"
+                                   " instance" % pid)
+
+    with self._lock:
+      # Drop the entry of an earlier process with the same ID
+      for old_key in [k for k in self._info if k[0] == pid]:
+        del self._info[old_key]
+      self._info[key] = info
+
+    return info
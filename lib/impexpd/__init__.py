@@ -97,6 +97,16 @@ if constants.SOCAT_USE_COMPRESS:
 
 SOCAT_OPTION_MAXLEN = 400
 
+#: Transports: a pipeline of dd(1), a compression utility and socat(1), or
+#: the daemon reading and writing the disk itself (see L{transfer})
+TRANSPORT_PIPE = "pipe"
+TRANSPORT_NATIVE = "native"
+
+TRANSPORT_ALL = compat.UniqueFrozenset([
+  TRANSPORT_PIPE,
+  TRANSPORT_NATIVE,
+  ])
+
 (PROG_OTHER,
  PROG_SOCAT,
  PROG_DD,
@@ -326,6 +336,12 @@ class CommandBuilder(object):
     socat_cmd = ("%s 2>&%d" %
                  (utils.ShellQuoteArgs(self._GetSocatCommand()),
                   self._socat_stderr_fd))
+
+    if self._opts.transport == TRANSPORT_NATIVE:
+      # The daemon itself reads or writes the disk, checks the magic value
+      # and takes care of compression, socat only handles the connection
+      return self.GetBashCommand(socat_cmd)
+
     dd_cmd = self._GetDdCommand()
 
     compr = self._opts.compress
@@ -596,6 +612,18 @@ class ChildIOProcessor(object):
     # Forward line
     return (True, False)
 
+  def ReportProgress(self, seconds, mbytes):
+    """Reports progress of a transfer not made by dd(1).
+
+    @type seconds: float
+    @param seconds: Timestamp of this update
+    @type mbytes: float
+    @param mbytes: Total number of MiB transferred so far
+
+    """
+    self._UpdateDdProgress(seconds, mbytes)
+    self._status_file.Update(True)
+
   def _UpdateDdProgress(self, seconds, mbytes):
     """Updates the internal status variables for dd(1) progress.
 
@@ -0,0 +1,696 @@
+#
+#
+
+# Copyright (C) 2014 Google Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS
+# IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+# TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+# PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+"""In-process disk transfer for the import/export daemon.
+
+Instead of running the data through dd(1) and a compression utility, the
+daemon reads and writes the disk itself and exchanges a stream of frames with
+socat(1), which still takes care of the TLS connection. Areas of the disk
+which are unallocated or only contain zeroes are sent as holes without any
+payload, all other data is compressed in parallel and protected by a
+checksum.
+
+"""
+
+import collections
+import errno
+import logging
+import lzma
+import mmap
+import os
+import stat
+import struct
+import threading
+import zlib
+
+from concurrent import futures
+
+from ganeti import constants
+from ganeti import errors
+from ganeti import serializer
+from ganeti.storage import devwriter
+
+
+#: Amount of data read, compressed and sent at once
+CHUNK_SIZE = 1024 * 1024
+
+#: Alignment of reads for direct I/O
+_ALIGNMENT = 4096
+
+#: Identifies a native transfer stream
+STREAM_MAGIC = b"GNTIEX1\n"
+
+#: Length of the stream header following the magic
+_HEADER_LEN = struct.Struct("!I")
+
+#: Frame: type, offset, length of the data, length of the payload, CRC32 of
+#: the (uncompressed) data
+_FRAME = struct.Struct("!BQQII")
+
+(FRAME_DATA,
+ FRAME_HOLE,
+ FRAME_END) = range(1, 4)
+
+#: Upper limit for the header and frame payload sizes accepted by the
+#: receiving side
+_MAX_HEADER_SIZE = 64 * 1024
+_MAX_FRAME_PAYLOAD = 64 * 1024 * 1024
+
+#: Number of threads used for compression by default
+DEFAULT_THREADS = min(8, os.cpu_count() or 1)
+
+_ZERO_CHUNK = bytes(CHUNK_SIZE)
+
+
+class Codec(object):
+  """Base class for compression codecs.
+
+  Both methods are called from multiple threads at the same time and must
+  not keep state between calls.
+
+  """
+  def Compress(self, data):
+    """Compresses a chunk of data.
+
+    @type data: bytes
+    @rtype: bytes
+
+    """
+    raise NotImplementedError()
+
+  def Decompress(self, data, size):
+    """Decompresses a chunk of data.
+
+    @type data: bytes
+    @type size: int
+    @param size: Expected size of the uncompressed data
+    @rtype: bytes
+
+    """
+    raise NotImplementedError()
+
+
+class NullCodec(Codec):
+  """Codec sending data as-is.
+
+  """
+  def Compress(self, data):
+    return data
+
+  def Decompress(self, data, size):
+    return data
+
+
+class ZlibCodec(Codec):
+  """Codec using zlib (the compression used by gzip).
+
+  """
+  def __init__(self, level):
+    """Initializes this class.
+
+    @type level: int
+    @param level: Compression level
+
+    """
+    Codec.__init__(self)
+    self._level = level
+
+  def Compress(self, data):
+    return zlib.compress(data, self._level)
+
+  def Decompress(self, data, size):
+    return zlib.decompress(data, bufsize=max(size, 1))
+
+
+class LzmaCodec(Codec):
+  """Codec using LZMA (the compression used by xz).
+
+  """
+  def __init__(self, preset):
+    """Initializes this class.
+
+    @type preset: int
+    @param preset: Compression preset
+
+    """
+    Codec.__init__(self)
+    self._preset = preset
+
+  def Compress(self, data):
+    # Every frame carries a checksum already
+    return lzma.compress(data, preset=self._preset, check=lzma.CHECK_NONE)
+
+  def Decompress(self, data, size):
+    return lzma.decompress(data)
+
+
+#: Codecs by compression method, mirroring the utilities used by the
+#: pipeline (see L{CommandBuilder._GetTransportCommand})
+_CODECS = {
+  constants.IEC_NONE: NullCodec,
+  constants.IEC_GZIP: lambda: ZlibCodec(1),
+  constants.IEC_GZIP_FAST: lambda: ZlibCodec(1),
+  constants.IEC_GZIP_SLOW: lambda: ZlibCodec(6),
+  "xz": lambda: LzmaCodec(6),
+  }
+
+
+def RegisterCodec(name, factory):
+  """Registers a codec for a compression method.
+
+  @type name: string
+  @param name: Compression method as given to the daemon
+  @type factory: callable
+  @param factory: Function returning a L{Codec} instance
+
+  """
+  _CODECS[name] = factory
+
+
+def IsCodecSupported(name):
+  """Returns whether a compression method can be used natively.
+
+  @type name: string
+
+  """
+  return name in _CODECS
+
+
+def GetCodec(name):
+  """Returns a codec for a compression method.
+
+  @type name: string
+  @rtype: L{Codec}
+
+  """
+  try:
+    factory = _CODECS[name]
+  except KeyError:
+    raise errors.GenericError("Compression method '%s' is not supported by"
+                              " the native transport" % name)
+
+  return factory()
+
+
+def _IsZero(data):
+  """Checks whether a chunk only contains zeroes.
+
+  """
+  if len(data) == CHUNK_SIZE:
+    return data == _ZERO_CHUNK
+
+  return data == bytes(len(data))
+
+
+def _OpenDirect(path, flags):
+  """Opens a file, using direct I/O if possible.
+
+  Not all file systems support direct I/O (e.g. tmpfs).
+
+  """
+  try:
+    return os.open(path, flags | getattr(os, "O_DIRECT", 0))
+  except EnvironmentError as err:
+    if err.errno != errno.EINVAL:
+      raise
+
+  return os.open(path, flags)
+
+
+def _GetDataExtents(fd, end):
+  """Returns the areas of a file which contain data.
+
+  Uses C{SEEK_DATA}/C{SEEK_HOLE}; if they're not supported, e.g. for block
+  devices, the whole file is considered to be data.
+
+  @type fd: int
+  @param fd: File descriptor
+  @type end: int
+  @param end: Size of the file
+  @return: List of tuples (offset, length)
+
+  """
+  seek_data = getattr(os, "SEEK_DATA", None)
+  seek_hole = getattr(os, "SEEK_HOLE", None)
+
+  if not (seek_data and end):
+    return [(0, end)]
+
+  result = []
+  offset = 0
+
+  while offset < end:
+    try:
+      start = os.lseek(fd, offset, seek_data)
+    except EnvironmentError as err:
+      if err.errno == errno.ENXIO:
+        # No more data
+        break
+      if err.errno in (errno.EINVAL, errno.EOPNOTSUPP) and offset == 0:
+        return [(0, end)]
+      raise
+
+    if start >= end:
+      break
+
+    offset = min(end, os.lseek(fd, start, seek_hole))
+    result.append((start, offset - start))
+
+  return result
+
+
+class DiskSource(object):
+  """Reads a disk or file in large aligned chunks.
+
+  """
+  def __init__(self, path, size=None):
+    """Opens the source.
+
+    @type path: string
+    @param path: Path to block device or file
+    @type size: int
+    @param size: Number of bytes to read at most
+
+    """
+    self._fd = _OpenDirect(path, os.O_RDONLY)
+    try:
+      self.size = os.lseek(self._fd, 0, os.SEEK_END)
+      if size is not None:
+        self.size = min(self.size, size)
+
+      # Anonymous mappings are page-aligned, as required for direct I/O
+      self._buf = mmap.mmap(-1, CHUNK_SIZE)
+    except:
+      os.close(self._fd)
+      raise
+
+  def Close(self):
+    """Closes the source.
+
+    """
+    self._buf.close()
+    os.close(self._fd)
+
+  def _Read(self, offset, length):
+    """Reads a chunk of data.
+
+    """
+    view = memoryview(self._buf)
+    try:
+      # Direct I/O needs the length to be aligned, too; the file is never
+      # read beyond the requested length
+      aligned = min(CHUNK_SIZE,
+                    (length + _ALIGNMENT - 1) // _ALIGNMENT * _ALIGNMENT)
+      count = os.preadv(self._fd, [view[:aligned]], offset)
+      if count < length:
+        raise errors.GenericError("Short read at offset %s (%s of %s bytes)" %
+                                  (offset, count, length))
+      return bytes(view[:length])
+    finally:
+      view.release()
+
+  def IterChunks(self):
+    """Yields the contents of the source.
+
+    @return: Generator of tuples (offset, length, data), C{data} being
+      C{None} for areas only containing zeroes
+
+    """
+    offset = 0
+
+    for (start, length) in _GetDataExtents(self._fd, self.size):
+      if start > offset:
+        yield (offset, start - offset, None)
+
+      end = start + length
+      offset = start
+
+      while offset < end:
+        count = min(CHUNK_SIZE - (offset % CHUNK_SIZE), end - offset)
+        data = self._Read(offset, count)
+        if _IsZero(data):
+          yield (offset, count, None)
+        else:
+          yield (offset, count, data)
+        offset += count
+
+    if offset < self.size:
+      yield (offset, self.size - offset, None)
+
+
+class DiskTarget(object):
+  """Writes a disk or file.
+
+  """
+  def __init__(self, path):
+    """Opens the target.
+
+    Block devices are written in place, regular files are (re-)created.
+
+    @type path: string
+    @param path: Path to block device or file
+
+    """
+    try:
+      is_blockdev = stat.S_ISBLK(os.stat(path).st_mode)
+    except EnvironmentError as err:
+      if err.errno != errno.ENOENT:
+        raise
+      is_blockdev = False
+
+    if not is_blockdev:
+      os.close(os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o666))
+
+    self._writer = devwriter.DeviceWriter(path)
+
+  def Close(self):
+    """Flushes the written data and closes the target.
+
+    """
+    self._writer.Close()
+
+  def Abort(self):
+    """Closes the target after a failure.
+
+    """
+    self._writer.Abort()
+
+  def Write(self, offset, data):
+    """Writes a chunk of data.
+
+    """
+    self._writer.BeginStream(offset, len(data))
+    self._writer.Feed(data)
+    self._writer.EndStream()
+
+  def Zero(self, offset, length):
+    """Fills an area with zeroes.
+
+    Block devices may contain old data and are zeroed, preferably by the
+    kernel; holes in regular files are punched or left sparse.
+
+    """
+    self._writer.Zero(offset, length)
+
+  def Finish(self, size):
+    """Finishes writing the target.
+
+    @type size: int
+    @param size: Total size of the transferred data
+
+    """
+    # Regular files may end with a hole
+    self._writer.Truncate(size)
+
+
+def _CompressChunk(codec, data):
+  """Compresses a chunk and calculates its checksum.
+
+  """
+  return (codec.Compress(data), zlib.crc32(data))
+
+
+def _DecompressChunk(codec, offset, length, payload, checksum):
+  """Decompresses a chunk and verifies its checksum.
+
+  """
+  data = codec.Decompress(payload, length)
+
+  if len(data) != length or zlib.crc32(data) != checksum:
+    raise errors.GenericError("Checksum mismatch for data at offset %s" %
+                              offset)
+
+  return data
+
+
+def _ReadExact(fh, length):
+  """Reads exactly C{length} bytes from the stream.
+
+  """
+  data = fh.read(length)
+  if len(data) != length:
+    raise errors.GenericError("Unexpected end of stream")
+  return data
+
+
+def _ProcessOrdered(pending, window, fn):
+  """Processes the results of queued futures in order.
+
+  @type pending: collections.deque
+  @param pending: Queue of tuples (future or None, args)
+  @type window: int
+  @param window: Number of entries to leave in the queue
+  @param fn: Function called with the result and arguments of every entry
+
+  """
+  while len(pending) > window:
+    (fut, args) = pending.popleft()
+    if fut is None:
+      fn(None, *args)
+    else:
+      fn(fut.result(), *args)
+
+
+class Transfer(object):
+  """Sends or receives a disk.
+
+  The progress can be queried from other threads while the transfer is
+  running.
+
+  """
+  def __init__(self, compress, magic, threads=DEFAULT_THREADS):
+    """Initializes this class.
+
+    @type compress: string
+    @param compress: Compression method
+    @type magic: string
+    @param magic: Magic value which must be the same on both sides
+    @type threads: int
+    @param threads: Number of threads for (de)compression
+
+    """
+    self._compress = compress
+    self._codec = GetCodec(compress)
+    self._magic = magic
+    self._threads = max(1, threads)
+    self._window = 2 * self._threads
+
+    #: Bytes of the disk processed so far
+    self.processed = 0
+    #: Bytes sent or received over the connection so far
+    self.transferred = 0
+
+  def _GetHeader(self):
+    """Returns the stream header.
+
+    """
+    return {
+      "compress": self._compress,
+      "magic": self._magic,
+      }
+
+  def Send(self, source, fh):
+    """Sends the contents of a source.
+
+    @type source: L{DiskSource}
+    @param fh: Writable file object
+
+    """
+    header = serializer.DumpJson(self._GetHeader())
+    fh.write(STREAM_MAGIC + _HEADER_LEN.pack(len(header)) + header)
+    self.transferred += len(STREAM_MAGIC) + _HEADER_LEN.size + len(header)
+
+    def _Write(result, offset, length):
+      if result is None:
+        fh.write(_FRAME.pack(FRAME_HOLE, offset, length, 0, 0))
+        self.transferred += _FRAME.size
+      else:
+        (payload, checksum) = result
+        fh.write(_FRAME.pack(FRAME_DATA, offset, length, len(payload),
+                             checksum))
+        fh.write(payload)
+        self.transferred += _FRAME.size + len(payload)
+      self.processed = offset + length
+
+    pending = collections.deque()
+
+    with futures.ThreadPoolExecutor(self._threads) as pool:
+      try:
+        for (offset, length, data) in source.IterChunks():
+          if data is None:
+            fut = None
+          else:
+            fut = pool.submit(_CompressChunk, self._codec, data)
+          pending.append((fut, (offset, length)))
+          _ProcessOrdered(pending, self._window, _Write)
+
+        _ProcessOrdered(pending, 0, _Write)
+      finally:
+        for (fut, _) in pending:
+          if fut:
+            fut.cancel()
+
+    fh.write(_FRAME.pack(FRAME_END, source.size, 0, 0, 0))
+    fh.flush()
+    self.transferred += _FRAME.size
+
+  def _CheckHeader(self, fh):
+    """Reads and verifies the stream header.
+
+    """
+    if _ReadExact(fh, len(STREAM_MAGIC)) != STREAM_MAGIC:
+      raise errors.GenericError("Peer didn't send a native transfer stream")
+
+    (length, ) = _HEADER_LEN.unpack(_ReadExact(fh, _HEADER_LEN.size))
+    if length > _MAX_HEADER_SIZE:
+      raise errors.GenericError("Stream header too long (%s bytes)" % length)
+
+    header = serializer.LoadJson(_ReadExact(fh, length))
+    self.transferred += len(STREAM_MAGIC) + _HEADER_LEN.size + length
+
+    if header.get("magic") != self._magic:
+      raise errors.GenericError("Magic value mismatch")
+
+    if header.get("compress") != self._compress:
+      raise errors.GenericError("Peer uses compression method '%s' instead"
+                                " of '%s'" % (header.get("compress"),
+                                              self._compress))
+
+  def Receive(self, fh, target):
+    """Receives data into a target.
+
+    @param fh: Readable file object
+    @type target: L{DiskTarget}
+
+    """
+    self._CheckHeader(fh)
+
+    def _Write(data, offset, length):
+      if data is None:
+        target.Zero(offset, length)
+      else:
+        target.Write(offset, data)
+      self.processed = offset + length
+
+    pending = collections.deque()
+
+    with futures.ThreadPoolExecutor(self._threads) as pool:
+      try:
+        while True:
+          (kind, offset, length, payload_len, checksum) = \
+            _FRAME.unpack(_ReadExact(fh, _FRAME.size))
+          self.transferred += _FRAME.size
+
+          if kind == FRAME_END:
+            break
+
+          if kind == FRAME_HOLE:
+            fut = None
+          elif kind == FRAME_DATA:
+            if max(length, payload_len) > _MAX_FRAME_PAYLOAD:
+              raise errors.GenericError("Frame at offset %s too large" %
+                                        offset)
+            payload = _ReadExact(fh, payload_len)
+            self.transferred += payload_len
+            fut = pool.submit(_DecompressChunk, self._codec, offset, length,
+                              payload, checksum)
+          else:
+            raise errors.GenericError("Unknown frame type %s" % kind)
+
+          pending.append((fut, (offset, length)))
+          _ProcessOrdered(pending, self._window, _Write)
+
+        _ProcessOrdered(pending, 0, _Write)
+      finally:
+        for (fut, _) in pending:
+          if fut:
+            fut.cancel()
+
+    # The end frame carries the total size
+    target.Finish(offset)
+    self.processed = offset
+
+    if fh.read(1):
+      raise errors.GenericError("Unexpected data after end of stream")
+
+
+class TransferThread(threading.Thread):
+  """Runs a native transfer in the background.
+
+  """
+  def __init__(self, mode, path, fd, transfer, size=None):
+    """Initializes this class.
+
+    @param mode: Import/export mode
+    @type path: string
+    @param path: Path to the disk or file to read or write
+    @type fd: int
+    @param fd: File descriptor to write the stream to (export) or read it
+      from (import); it is closed once the transfer is done
+    @type transfer: L{Transfer}
+    @type size: int
+    @param size: Number of bytes to export at most
+
+    """
+    threading.Thread.__init__(self, name="transfer")
+    self.daemon = True
+    self._mode = mode
+    self._path = path
+    self._fd = fd
+    self._size = size
+    self.transfer = transfer
+    self.error = None
+
+  def run(self):
+    try:
+      if self._mode == constants.IEM_EXPORT:
+        with os.fdopen(self._fd, "wb") as fh:
+          source = DiskSource(self._path, size=self._size)
+          try:
+            self.transfer.Send(source, fh)
+          finally:
+            source.Close()
+
+      elif self._mode == constants.IEM_IMPORT:
+        with os.fdopen(self._fd, "rb") as fh:
+          target = DiskTarget(self._path)
+          try:
+            self.transfer.Receive(fh, target)
+          except:
+            target.Abort()
+            raise
+          target.Close()
+
+      else:
+        raise errors.GenericError("Invalid mode '%s'" % self._mode)
+
+    except Exception as err: # pylint: disable=W0703
+      logging.exception("Native transfer failed")
+      self.error = err
@@ -68,11 +68,19 @@ from ganeti import qlang
 from ganeti import pathutils
 from ganeti import vcluster
 from ganeti.cmdlib import cluster
+from ganeti.jqueue import replication
 
 
 #: Retrieves "id" attribute
 _GetIdAttr = operator.attrgetter("id")
 
+#: Suffix of the file holding the log entries of a job added since its job
+#: file was last written
+_JOB_LOG_SUFFIX = ".log"
+
+#: Minimum number of seconds between synchronizing a job log to disk
+_JOB_LOG_SYNC_INTERVAL = 1.0
+
 
 class CancelJob(Exception):
   """Special exception to cancel a job.
@@ -98,6 +106,127 @@ def _CallJqUpdate(runner, names, file_name, content):
   return runner.call_jobqueue_update(names, virt_file_name, content)
 
 
+def _ParseJobLog(data):
+  """Parses the contents of a job log file.
+
+  Lines which can't be parsed, such as an incomplete last line written by a
+  process which died while appending to the file, are skipped.
+
+  @type data: string
+  @param data: the contents of the job log file
+  @rtype: list of tuples
+  @return: the log entries as C{(opcode index, log entry)}
+
+  """
+  entries = []
+
+  for line in data.splitlines():
+    try:
+      (op_idx, log_entry) = serializer.LoadJson(line)
+    except (ValueError, TypeError) as err:
+      logging.warning("Ignoring invalid job log line %r: %s", line, err)
+      continue
+    entries.append((op_idx, log_entry))
+
+  return entries
+
+
+class _JobLog(object):
+  """Append-only file holding new log entries of a job.
+
+  Writing the job file serializes the whole job including all its log
+  entries, which for jobs producing many log messages makes every message
+  more expensive than the previous one. New log entries are therefore
+  appended to a separate file, one JSON-encoded C{[opcode index, log
+  entry]} per line, until the job file is written the next time and
+  contains them.
+
+  To reduce the number of disk synchronizations, appended data is only
+  synchronized if the last synchronization is at least C{sync_interval}
+  seconds ago. Entries which weren't synchronized yet are only lost if the
+  node crashes, and only until the job file is written the next time.
+
+  """
+  def __init__(self, path, uid=-1, gid=-1,
+               sync_interval=_JOB_LOG_SYNC_INTERVAL, _time_fn=time.time):
+    """Initializes this class.
+
+    @type path: string
+    @param path: the path of the job log file
+    @param uid: the owner of the file
+    @param gid: the group of the file
+    @type sync_interval: float
+    @param sync_interval: minimum number of seconds between synchronizing
+      the file to disk
+
+    """
+    self._path = path
+    self._uid = uid
+    self._gid = gid
+    self._sync_interval = sync_interval
+    self._time_fn = _time_fn
+    self._file = None
+    self._size = None
+    self._last_sync = None
+
+  def _Sync(self):
+    """Synchronizes written data to disk.
+
+    """
+    os.fsync(self._file.fileno())
+    self._last_sync = self._time_fn()
+
+  def _Discard(self):
+    """Closes the file without synchronizing it.
+
+    """
+    if self._file is not None:
+      self._file.close()
+      self._file = None
+
+  def Reset(self):
+    """Empties the file, creating it if necessary.
+
+    """
+    if self._size == 0:
+      return
+
+    self._Discard()
+    utils.WriteFile(self._path, data=b"", uid=self._uid, gid=self._gid,
+                    mode=constants.JOB_QUEUE_FILES_PERMS)
+    self._size = 0
+
+  def Remove(self):
+    """Removes the file.
+
+    """
+    self._Discard()
+    utils.RemoveFile(self._path)
+    self._size = None
+
+  def Append(self, entries):
+    """Appends log entries to the file.
+
+    @type entries: list of tuples
+    @param entries: the log entries as C{(opcode index, log entry)}
+
+    """
+    if self._file is None:
+      if self._size is None:
+        self.Reset()
+      self._file = open(self._path, "ab")
+
+    data = b"".join(serializer.DumpJson([op_idx, log_entry])
+                    for (op_idx, log_entry) in entries)
+    self._file.write(data)
+    self._file.flush()
+    self._size += len(data)
+
+    if (self._last_sync is None or
+        self._time_fn() - self._last_sync >= self._sync_interval):
+      self._Sync()
+
+
 class _QueuedOpCode(object):
   """Encapsulates an opcode object.
 
@@ -270,7 +399,7 @@ class _QueuedJob(object):
     return "<%s at %#x>" % (" ".join(status), id(self))
 
   @classmethod
-  def Restore(cls, queue, state, writable, archived):
+  def Restore(cls, queue, state, writable, archived, log_entries=None):
     """Restore a _QueuedJob from serialized state:
 
     @type queue: L{JobQueue}
@@ -281,6 +410,9 @@ class _QueuedJob(object):
     @param writable: Whether job can be modified
     @type archived: bool
     @param archived: Whether job was already archived
+    @type log_entries: list of tuples
+    @param log_entries: log entries from the job log as C{(opcode index, log
+      entry)}; entries already contained in C{state} are skipped
     @rtype: _JobQueue
     @return: the restored _JobQueue instance
 
@@ -305,6 +437,15 @@ class _QueuedJob(object):
         obj.log_serial = max(obj.log_serial, log_entry[0])
       obj.ops.append(op)
 
+    if log_entries:
+      # The job log is emptied after the job file was written; if that
+      # didn't happen, some of its entries are in the job file already
+      last_serial = obj.log_serial
+      for (op_idx, log_entry) in log_entries:
+        if log_entry[0] > last_serial:
+          obj.ops[op_idx].log.append(log_entry)
+          obj.log_serial = max(obj.log_serial, log_entry[0])
+
     cls._InitInMemory(obj, writable)
 
     return obj
@@ -621,10 +762,14 @@ class _OpExecCallbacks(mcpu.OpExecCbBase):
     else:
       log_msgs = [log_msgs]
 
+    op_idx = self._job.ops.index(self._op)
+    entries = []
     for msg in log_msgs:
       self._job.log_serial += 1
-      self._op.log.append((self._job.log_serial, timestamp, log_type, msg))
-    self._queue.UpdateJobUnlocked(self._job, replicate=False)
+      log_entry = (self._job.log_serial, timestamp, log_type, msg)
+      self._op.log.append(log_entry)
+      entries.append((op_idx, log_entry))
+    self._queue.AppendJobLogUnlocked(self._job, entries)
 
   # TODO: Cleanup calling conventions, make them explicit
   def Feedback(self, *args):
@@ -1238,7 +1383,8 @@ class JobQueue(object):
   """Queue used to manage the jobs.
 
   """
-  def __init__(self, context, cfg):
+  def __init__(self, context, cfg,
+               replication_max_lag=replication.DEFAULT_MAX_LAG):
     """Constructor for JobQueue.
 
     The constructor will initialize the job queue object and then
@@ -1249,6 +1395,10 @@ class JobQueue(object):
     @type context: GanetiContext
     @param context: the context object for access to the configuration
         data and other ganeti objects
+    @type replication_max_lag: float or None
+    @param replication_max_lag: if C{None}, changes are replicated to the
+        master candidates before they're returned from; otherwise they're
+        replicated in the background, with the given maximum lag in seconds
 
     """
     self.context = context
@@ -1266,6 +1416,16 @@ class JobQueue(object):
     # Job dependencies
     self.depmgr = _JobDependencyManager(self._GetJobStatusForDependencies)
 
+    # Job logs of the jobs written by this process
+    self._job_logs = {}
+
+    if replication_max_lag is None or not self._nodes:
+      self._replicator = None
+    else:
+      self._replicator = replication.Replicator(self._nodes,
+                                                self._ReplicateFile,
+                                                max_lag=replication_max_lag)
+
   def _GetRpc(self, address_list):
     """Gets RPC runner with context.
 
@@ -1317,11 +1477,49 @@ class JobQueue(object):
     addr_list = [self._nodes[name] for name in name_list]
     return name_list, addr_list
 
+  def _ReplicateFile(self, name, address, file_name, data):
+    """Replicates a file to a single node.
+
+    @rtype: string or None
+    @return: the error message if the call failed
+
+    """
+    result = _CallJqUpdate(self._GetRpc([address]), [name], file_name, data)
+    return result[name].fail_msg
+
+  def FlushReplication(self, timeout=None):
+    """Waits for changes being replicated in the background.
+
+    @type timeout: float or None
+    @param timeout: maximum number of seconds to wait for each node
+    @rtype: bool
+    @return: whether all changes have been replicated
+
+    """
+    if self._replicator is None:
+      return True
+
+    return self._replicator.Flush(timeout=timeout)
+
+  def StopReplication(self):
+    """Finishes replicating changes in the background.
+
+    The replication statistics of all nodes are logged.
+
+    """
+    if self._replicator is not None:
+      self._replicator.Flush()
+      self._replicator.Stop()
+      self._replicator.LogStats()
+      self._replicator = None
+
   def _UpdateJobQueueFile(self, file_name, data, replicate):
     """Writes a file locally and then replicates it to all nodes.
 
     This function will replace the contents of a file on the local
-    node and then replicate it to all the other nodes we have.
+    node and then replicate it to all the other nodes we have. Unless
+    replication runs in the background, the function returns after all
+    nodes have been updated.
 
     @type file_name: str
     @param file_name: the path of the file to be replicated
@@ -1337,9 +1535,12 @@ class JobQueue(object):
                     mode=constants.JOB_QUEUE_FILES_PERMS)
 
     if replicate:
-      names, addrs = self._GetNodeIp()
-      result = _CallJqUpdate(self._GetRpc(addrs), names, file_name, data)
-      self._CheckRpcResult(result, self._nodes, "Updating %s" % file_name)
+      if self._replicator is not None:
+        self._replicator.Update(file_name, data)
+      else:
+        names, addrs = self._GetNodeIp()
+        result = _CallJqUpdate(self._GetRpc(addrs), names, file_name, data)
+        self._CheckRpcResult(result, self._nodes, "Updating %s" % file_name)
 
   def _RenameFilesUnlocked(self, rename):
     """Renames a file locally and then replicate the change.
@@ -1372,6 +1573,35 @@ class JobQueue(object):
     """
     return utils.PathJoin(pathutils.QUEUE_DIR, "job-%s" % job_id)
 
+  @classmethod
+  def _GetJobLogPath(cls, job_id):
+    """Returns the job log file for a given job id.
+
+    @type job_id: str
+    @param job_id: the job identifier
+    @rtype: str
+    @return: the path to the job log file
+
+    """
+    return cls._GetJobPath(job_id) + _JOB_LOG_SUFFIX
+
+  def _GetJobLog(self, job_id):
+    """Returns the job log of a job written by this process.
+
+    @type job_id: int
+    @param job_id: the job identifier
+    @rtype: L{_JobLog}
+
+    """
+    try:
+      return self._job_logs[job_id]
+    except KeyError:
+      getents = runtime.GetEnts()
+      job_log = _JobLog(self._GetJobLogPath(job_id), uid=getents.masterd_uid,
+                        gid=getents.daemons_gid)
+      self._job_logs[job_id] = job_log
+      return job_log
+
   @staticmethod
   def _GetArchivedJobPath(job_id):
     """Returns the archived job file for a give job id.
@@ -1509,12 +1739,26 @@ class JobQueue(object):
       logging.debug("No data available for job %s", job_id)
       return None
 
+    # Archived jobs are written as a single file
+    raw_log = None
+    if not archived:
+      try:
+        raw_log = utils.ReadFile(self._GetJobLogPath(job_id))
+      except EnvironmentError as err:
+        if err.errno != errno.ENOENT:
+          raise
+
     if writable is None:
       writable = not archived
 
     try:
       data = serializer.LoadJson(raw_data)
-      job = _QueuedJob.Restore(self, data, writable, archived)
+      if raw_log:
+        log_entries = _ParseJobLog(raw_log)
+      else:
+        log_entries = None
+      job = _QueuedJob.Restore(self, data, writable, archived,
+                               log_entries=log_entries)
     except Exception as err: # pylint: disable=W0703
       raise errors.JobFileCorrupted(err)
 
@@ -1624,6 +1868,40 @@ class JobQueue(object):
     logging.debug("Writing job %s to %s", job.id, filename)
     self._UpdateJobQueueFile(filename, data, replicate)
 
+    # The job file now contains all log entries
+    job_log = self._GetJobLog(job.id)
+    if job.CalcStatus() in constants.JOBS_FINALIZED:
+      # No more entries will be added, leaving a single file to archive
+      job_log.Remove()
+      del self._job_logs[job.id]
+      # The job can be archived as soon as its process has exited, by which
+      # time all master candidates must have its final state
+      if replicate:
+        self.FlushReplication()
+    else:
+      # Keep an empty job log while the job is running, so that waiting
+      # clients can watch it for new entries
+      job_log.Reset()
+
+  def AppendJobLogUnlocked(self, job, entries):
+    """Appends new log entries of a job to its job log.
+
+    Unlike L{UpdateJobUnlocked}, this only writes the new entries. They're
+    not replicated to other nodes, but will be part of the job file the next
+    time it is written.
+
+    @type job: L{_QueuedJob}
+    @param job: the job the entries were added to
+    @type entries: list of tuples
+    @param entries: the new log entries as C{(opcode index, log entry)}
+
+    """
+    assert job.writable, "Can't update read-only job"
+    assert not job.archived, "Can't update archived job"
+
+    logging.debug("Appending %s log entries of job %s", len(entries), job.id)
+    self._GetJobLog(job.id).Append(entries)
+
   def HasJobBeenFinalized(self, job_id):
     """Checks if a job has been finalized.
 
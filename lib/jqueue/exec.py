@@ -42,6 +42,7 @@ import sys
 import time
 
 from ganeti import mcpu
+from ganeti import metrics
 from ganeti.server import masterd
 from ganeti.rpc import transport
 from ganeti import serializer
@@ -109,6 +110,7 @@ def main():
 
   utils.SetupLogging(logname, "job-%s" % (job_id,), debug=debug)
 
+  context = None
   try:
     logging.debug("Preparing the context and the configuration")
     context = masterd.GanetiContext(llock)
@@ -181,6 +183,15 @@ def main():
     logging.exception("Exception when trying to run job %d", job_id)
   finally:
     logging.debug("Job %d finalized", job_id)
+    if context is not None:
+      try:
+        context.jobqueue.StopReplication()
+      except Exception: # pylint: disable=W0703
+        logging.exception("Failed to finish replicating job %d", job_id)
+    try:
+      metrics.SaveToFile(metrics.REGISTRY)
+    except Exception: # pylint: disable=W0703
+      logging.exception("Failed to save the metrics of job %d", job_id)
     logging.debug("Removing livelock file %s", llock.GetPath())
     os.remove(llock.GetPath())
 
@@ -0,0 +1,362 @@
+#
+#
+
+# Copyright (C) 2014 Google Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS
+# IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+# TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+# PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+"""Asynchronous replication of job queue files to master candidates.
+
+Job files are written to the local disk first and then replicated to all
+master candidates. Instead of waiting for all candidates on every change
+of a job, the changes are handed to one background sender per candidate.
+While a sender is busy, further changes to the same file are coalesced,
+so that only the latest version is sent. A slow candidate therefore
+neither delays the job nor the replication to other candidates.
+
+The lag of a candidate is the time since the oldest change not yet picked
+up by its sender. If it exceeds the configured maximum, writers wait for
+the sender to catch up.
+
+"""
+
+import logging
+import os
+import threading
+import time
+
+
+#: Default maximum replication lag in seconds
+DEFAULT_MAX_LAG = 5.0
+
+#: Environment variable overriding the maximum replication lag; job
+#: processes inherit it from luxid
+MAX_LAG_ENV = "GNT_JOB_REPLICATION_MAX_LAG"
+
+#: Value of L{MAX_LAG_ENV} selecting synchronous replication
+MAX_LAG_SYNC = "sync"
+
+
+def GetMaxLag(environ=None):
+  """Returns the maximum replication lag set in the environment.
+
+  @type environ: dict or None
+  @param environ: the environment to use, defaults to C{os.environ}
+  @rtype: float or None
+  @return: the maximum lag in seconds, or C{None} for synchronous
+    replication; invalid values are logged and the default is used
+
+  """
+  if environ is None:
+    environ = os.environ
+
+  value = environ.get(MAX_LAG_ENV, "").strip()
+  if not value:
+    return DEFAULT_MAX_LAG
+
+  if value.lower() == MAX_LAG_SYNC:
+    return None
+
+  try:
+    max_lag = float(value)
+  except ValueError:
+    max_lag = -1
+
+  if not max_lag >= 0:
+    logging.warning("Invalid value %r for %s, using the default of %s"
+                    " seconds", value, MAX_LAG_ENV, DEFAULT_MAX_LAG)
+    return DEFAULT_MAX_LAG
+
+  return max_lag
+
+
+class CandidateStats(object):
+  """Replication statistics of a master candidate.
+
+  @ivar sent: number of files sent successfully
+  @ivar failed: number of files which failed to be sent
+  @ivar coalesced: number of changes replaced by a later change before
+    they were sent
+  @ivar last_latency: duration of the last RPC call in seconds, or C{None}
+  @ivar max_latency: longest duration of an RPC call in seconds
+  @ivar total_latency: sum of the durations of all RPC calls in seconds
+
+  """
+  __slots__ = [
+    "sent",
+    "failed",
+    "coalesced",
+    "last_latency",
+    "max_latency",
+    "total_latency",
+    ]
+
+  def __init__(self):
+    """Initializes this class.
+
+    """
+    self.sent = 0
+    self.failed = 0
+    self.coalesced = 0
+    self.last_latency = None
+    self.max_latency = 0.0
+    self.total_latency = 0.0
+
+  def AverageLatency(self):
+    """Returns the average duration of an RPC call in seconds.
+
+    @rtype: float or None
+
+    """
+    calls = self.sent + self.failed
+    if calls:
+      return self.total_latency / calls
+    return None
+
+  def __repr__(self):
+    avg = self.AverageLatency()
+    return ("<%s sent=%s failed=%s coalesced=%s avg_latency=%s"
+            " max_latency=%.3f>" %
+            (self.__class__.__name__, self.sent, self.failed, self.coalesced,
+             avg is not None and "%.3f" % avg or None, self.max_latency))
+
+
+class _CandidateSender(object):
+  """Sends file updates to a single master candidate.
+
+  """
+  def __init__(self, name, address, update_fn, max_lag, time_fn):
+    """Initializes this class.
+
+    """
+    self.name = name
+    self.stats = CandidateStats()
+    self._address = address
+    self._update_fn = update_fn
+    self._max_lag = max_lag
+    self._time_fn = time_fn
+    self._cond = threading.Condition()
+    self._pending = {}
+    self._pending_since = None
+    self._busy = False
+    self._stopped = False
+    self._thread = threading.Thread(target=self._Run,
+                                    name="JobQueueReplication-%s" % name)
+    self._thread.daemon = True
+    self._thread.start()
+
+  def _Lag(self):
+    """Returns the current replication lag.
+
+    """
+    if self._pending_since is None:
+      return 0.0
+    return self._time_fn() - self._pending_since
+
+  def Update(self, file_name, data):
+    """Queues a file update.
+
+    If the candidate lags behind by more than the maximum lag, this waits
+    for the sender to pick up the pending updates.
+
+    """
+    with self._cond:
+      if file_name in self._pending:
+        self.stats.coalesced += 1
+      elif not self._pending:
+        self._pending_since = self._time_fn()
+      self._pending[file_name] = data
+      self._cond.notify_all()
+
+      while not self._stopped and self._Lag() > self._max_lag:
+        logging.debug("Replication to %s lags behind by %.1f seconds,"
+                      " waiting", self.name, self._Lag())
+        self._cond.wait()
+
+  def Flush(self, timeout):
+    """Waits until all queued updates have been sent.
+
+    @type timeout: float or None
+    @param timeout: maximum number of seconds to wait
+    @rtype: bool
+    @return: whether all updates have been sent
+
+    """
+    if timeout is None:
+      end = None
+    else:
+      end = self._time_fn() + timeout
+
+    with self._cond:
+      while self._pending or self._busy:
+        if end is None:
+          self._cond.wait()
+        else:
+          remaining = end - self._time_fn()
+          if remaining <= 0:
+            return False
+          self._cond.wait(remaining)
+
+    return True
+
+  def Stop(self):
+    """Stops the sender after the queued updates have been sent.
+
+    """
+    with self._cond:
+      self._stopped = True
+      self._cond.notify_all()
+
+  def _Send(self, file_name, data):
+    """Sends a single file update and records its latency.
+
+    """
+    start = self._time_fn()
+    try:
+      fail_msg = self._update_fn(self.name, self._address, file_name, data)
+    except Exception as err: # pylint: disable=W0703
+      fail_msg = str(err)
+    latency = self._time_fn() - start
+
+    stats = self.stats
+    stats.last_latency = latency
+    stats.max_latency = max(stats.max_latency, latency)
+    stats.total_latency += latency
+
+    if fail_msg:
+      stats.failed += 1
+      logging.error("Replicating %s to %s failed after %.3f seconds: %s",
+                    file_name, self.name, latency, fail_msg)
+    else:
+      stats.sent += 1
+      logging.debug("Replicated %s to %s in %.3f seconds", file_name,
+                    self.name, latency)
+
+  def _Run(self):
+    """Main loop of the sender thread.
+
+    """
+    while True:
+      with self._cond:
+        while not (self._pending or self._stopped):
+          self._cond.wait()
+
+        if not self._pending:
+          return
+
+        pending = self._pending
+        self._pending = {}
+        self._pending_since = None
+        self._busy = True
+        # Writers waiting for the lag to shrink can continue
+        self._cond.notify_all()
+
+      try:
+        for (file_name, data) in pending.items():
+          self._Send(file_name, data)
+      finally:
+        with self._cond:
+          self._busy = False
+          self._cond.notify_all()
+
+
+class Replicator(object):
+  """Replicates job queue files to master candidates in the background.
+
+  """
+  def __init__(self, nodes, update_fn, max_lag=DEFAULT_MAX_LAG,
+               _time_fn=time.time):
+    """Initializes this class.
+
+    @type nodes: dict
+    @param nodes: master candidates to replicate to, node name as key and
+      address as value
+    @type update_fn: callable
+    @param update_fn: function sending a file to a node, receiving the node
+      name and address, the file name and the contents; returns an error
+      message on failure
+    @type max_lag: float
+    @param max_lag: maximum number of seconds a change may wait before its
+      replication starts, before writers are slowed down
+
+    """
+    self._senders = [_CandidateSender(name, address, update_fn, max_lag,
+                                      _time_fn)
+                     for (name, address) in sorted(nodes.items())]
+
+  def Update(self, file_name, data):
+    """Replicates a file to all master candidates.
+
+    The file must have been written to the local disk already.
+
+    @type file_name: string
+    @param file_name: the path of the file
+    @type data: string
+    @param data: the new contents of the file
+
+    """
+    for sender in self._senders:
+      sender.Update(file_name, data)
+
+  def Flush(self, timeout=None):
+    """Waits until all changes have been replicated.
+
+    @type timeout: float or None
+    @param timeout: maximum number of seconds to wait for each candidate
+    @rtype: bool
+    @return: whether all changes have been replicated
+
+    """
+    result = True
+    for sender in self._senders:
+      if not sender.Flush(timeout):
+        logging.warning("Replication to %s did not finish within %s seconds",
+                        sender.name, timeout)
+        result = False
+    return result
+
+  def Stop(self):
+    """Stops replicating after the queued changes have been sent.
+
+    """
+    for sender in self._senders:
+      sender.Stop()
+
+  def GetStats(self):
+    """Returns the replication statistics of all master candidates.
+
+    @rtype: dict
+    @return: node name as key, L{CandidateStats} as value
+
+    """
+    return dict((sender.name, sender.stats) for sender in self._senders)
+
+  def LogStats(self):
+    """Logs the replication statistics of all master candidates.
+
+    """
+    for (name, stats) in sorted(self.GetStats().items()):
+      logging.info("Replication to %s: %s", name, stats)
@@ -73,6 +73,7 @@ REQ_QUERY_EXPORTS = constants.LUXI_REQ_QUERY_EXPORTS
 REQ_QUERY_CONFIG_VALUES = constants.LUXI_REQ_QUERY_CONFIG_VALUES
 REQ_QUERY_CLUSTER_INFO = constants.LUXI_REQ_QUERY_CLUSTER_INFO
 REQ_QUERY_TAGS = constants.LUXI_REQ_QUERY_TAGS
+REQ_QUERY_METRICS = constants.LUXI_REQ_QUERY_METRICS
 REQ_SET_DRAIN_FLAG = constants.LUXI_REQ_SET_DRAIN_FLAG
 REQ_SET_WATCHER_PAUSE = constants.LUXI_REQ_SET_WATCHER_PAUSE
 REQ_ALL = constants.LUXI_REQ_ALL
@@ -251,3 +252,6 @@ class Client(cl.AbstractClient):
 
   def QueryTags(self, kind, name):
     return self.CallMethod(REQ_QUERY_TAGS, (kind, name))
+
+  def QueryMetrics(self):
+    return self.CallMethod(REQ_QUERY_METRICS, ())
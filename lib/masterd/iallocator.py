@@ -500,7 +500,8 @@ class IAllocator(object):
     ginfo = cfg.GetAllNodeGroupsInfo()
     ninfo = cfg.GetAllNodesInfo()
     iinfo = cfg.GetAllInstancesInfo()
-    i_list = [(inst, cluster_info.FillBE(inst)) for inst in iinfo.values()]
+    i_list = [(inst, cluster_info.GetFilledBE(inst))
+              for inst in iinfo.values()]
 
     # node data
     node_list = [n.uuid for n in ninfo.values() if n.vm_capable]
@@ -775,7 +776,7 @@ class IAllocator(object):
     for iinfo, beinfo in i_list:
       nic_data = []
       for nic in iinfo.nics:
-        filled_params = cluster_info.SimpleFillNIC(nic.nicparams)
+        filled_params = cluster_info.GetFilledNIC(nic.nicparams)
         nic_dict = {
           "mac": nic.mac,
           "ip": nic.ip,
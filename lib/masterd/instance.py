@@ -45,6 +45,8 @@ from ganeti import utils
 from ganeti import objects
 from ganeti import netutils
 from ganeti import pathutils
+from ganeti import impexpd
+from ganeti.impexpd import transfer as ie_transfer
 
 
 class _ImportExportError(Exception):
@@ -1015,6 +1017,46 @@ def _GetInstDiskMagic(base, instance_name, index):
   return h.hexdigest()
 
 
+#: Disk types which the import/export daemon can read and write directly
+_NATIVE_TRANSPORT_DEV_TYPES = compat.UniqueFrozenset([
+  constants.DT_PLAIN,
+  constants.DT_DRBD8,
+  constants.DT_FILE,
+  constants.DT_SHARED_FILE,
+  ])
+
+
+def _GetDiskTransport(compress, transfer):
+  """Chooses how the data of a disk is transferred within the cluster.
+
+  The native transport is used if both sides are a disk file or a disk the
+  import/export daemon can access directly and the compression method is
+  supported natively. Otherwise the socat pipeline is used.
+
+  @type compress: string
+  @param compress: Compression tool to use
+  @type transfer: L{DiskTransfer}
+  @rtype: string or None
+  @return: Transport for L{objects.ImportExportOptions}
+
+  """
+  if not ie_transfer.IsCodecSupported(compress):
+    return None
+
+  for (io, ioargs) in [(transfer.src_io, transfer.src_ioargs),
+                       (transfer.dest_io, transfer.dest_ioargs)]:
+    if io == constants.IEIO_FILE:
+      continue
+
+    if (io == constants.IEIO_RAW_DISK and
+        ioargs[0].dev_type in _NATIVE_TRANSPORT_DEV_TYPES):
+      continue
+
+    return None
+
+  return impexpd.TRANSPORT_NATIVE
+
+
 def TransferInstanceData(lu, feedback_fn, src_node_uuid, dest_node_uuid,
                          dest_ip, compress, instance, all_transfers):
   """Transfers an instance's data from one node to another.
@@ -1064,7 +1106,9 @@ def TransferInstanceData(lu, feedback_fn, src_node_uuid, dest_node_uuid,
 
         magic = _GetInstDiskMagic(base_magic, instance.name, idx)
         opts = objects.ImportExportOptions(key_name=None, ca_pem=None,
-                                           compress=compress, magic=magic)
+                                           compress=compress, magic=magic,
+                                           transport=_GetDiskTransport(
+                                             compress, transfer))
 
         dtp = _DiskTransferPrivate(transfer, True, opts)
 
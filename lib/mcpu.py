@@ -51,6 +51,7 @@ from ganeti import errors
 from ganeti import hooksmaster
 from ganeti import cmdlib
 from ganeti import locking
+from ganeti import metrics
 from ganeti import utils
 from ganeti import wconfd
 
@@ -61,6 +62,12 @@ lusExecuting = [0]
 _OP_PREFIX = "Op"
 _LU_PREFIX = "LU"
 
+_LU_DURATION = metrics.REGISTRY.Histogram(
+  "ganeti_lu_duration_seconds",
+  "Time spent executing opcodes by phase (expand_names, lock, check_prereq,"
+  " exec, total)",
+  ["opcode", "phase"])
+
 
 class LockAcquireTimeout(Exception):
   """Exception to report timeouts on acquiring locks.
@@ -301,6 +308,8 @@ class Processor(object):
     """
     self._ec_id = ec_id
     self._cbs = None
+    self._lock_start = None
+    self._lock_time = None
     self.cfg = context.GetConfig(ec_id)
     self.rpc = context.GetRpc(self.cfg)
     self.hmclass = hooksmaster.HooksMaster
@@ -480,7 +489,8 @@ class Processor(object):
     """
     write_count = self.cfg.write_count
     lu.cfg.OutDate()
-    lu.CheckPrereq()
+    with _LU_DURATION.Time(lu.op.OP_ID, "check_prereq"):
+      lu.CheckPrereq()
 
     hm = self.BuildHooksManager(lu)
     h_results = hm.RunPhase(constants.HOOKS_PHASE_PRE)
@@ -502,7 +512,8 @@ class Processor(object):
 
     lusExecuting[0] += 1
     try:
-      result = _ProcessResult(submit_mj_fn, lu.op, lu.Exec(self.Log))
+      with _LU_DURATION.Time(lu.op.OP_ID, "exec"):
+        result = _ProcessResult(submit_mj_fn, lu.op, lu.Exec(self.Log))
       h_results = hm.RunPhase(constants.HOOKS_PHASE_POST)
       result = lu.HooksCallBack(constants.HOOKS_PHASE_POST, h_results,
                                 self.Log, result)
@@ -540,6 +551,12 @@ class Processor(object):
 
       logging.debug("Finished acquiring locks")
 
+      if self._lock_start is not None:
+        # Includes the time for acquiring the Big Ganeti Lock
+        _LU_DURATION.Observe(self._lock_time + time.time() - self._lock_start,
+                             lu.op.OP_ID, "lock")
+        self._lock_start = None
+
       if self._cbs:
         self._cbs.NotifyStart()
 
@@ -683,6 +700,7 @@ class Processor(object):
       calc_timeout = utils.RunningTimeout(timeout, False).Remaining
 
     self._cbs = cbs
+    start = time.time()
     try:
       if self._enable_locks:
         # Acquire the Big Ganeti Lock exclusively if this LU requires it,
@@ -694,23 +712,30 @@ class Processor(object):
         raise errors.ProgrammerError("Opcode '%s' requires BGL, but locks are"
                                      " disabled" % op.OP_ID)
 
+      bgl_time = time.time() - start
+
       lu = lu_class(self, op, self.cfg, self.rpc,
                     self._wconfdcontext, self.wconfd)
       lu.wconfdlocks = self.wconfd.Client().ListLocks(self._wconfdcontext)
       _CheckSecretParameters(op)
-      lu.ExpandNames()
+      with _LU_DURATION.Time(op.OP_ID, "expand_names"):
+        lu.ExpandNames()
       assert lu.needed_locks is not None, "needed_locks not set by LU"
 
+      self._lock_start = time.time()
+      self._lock_time = bgl_time
       try:
         result = self._LockAndExecLU(lu, locking.LEVEL_CLUSTER + 1,
                                      calc_timeout)
       finally:
+        self._lock_start = None
         if self._ec_id:
           self.cfg.DropECReservations(self._ec_id)
     finally:
       self.wconfd.Client().FreeLocksLevel(
         self._wconfdcontext, locking.LEVEL_NAMES[locking.LEVEL_CLUSTER])
       self._cbs = None
+      _LU_DURATION.Observe(time.time() - start, op.OP_ID, "total")
 
     self._CheckLUResult(op, result)
 
@@ -0,0 +1,564 @@
+#
+#
+
+# Copyright (C) 2014 Google Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS
+# IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+# TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+# PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+"""In-process metrics registry.
+
+Counters and histograms are kept in the memory of the process recording
+them, which makes recording a value cheap enough to always do it: it takes
+a dictionary lookup, a bisection of the histogram buckets and an
+uncontended lock.
+
+Jobs are executed in separate processes, therefore their metrics are merged
+into the metrics file of the master node (see L{SaveToFile}) when a job
+finishes. The metrics file can be queried via LUXI and is exported by the
+remote API in the Prometheus text exposition format (see L{FormatText}).
+
+"""
+
+import bisect
+import contextlib
+import errno
+import logging
+import math
+import threading
+import time
+
+from ganeti import compat
+from ganeti import pathutils
+from ganeti import serializer
+from ganeti import utils
+
+
+#: Default buckets for histograms of durations (in seconds)
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                    1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+#: Content type of the Prometheus text exposition format
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+COUNTER = "counter"
+HISTOGRAM = "histogram"
+
+#: Maximum time to wait for the lock of the metrics file (seconds)
+_LOCK_TIMEOUT = 10.0
+
+
+class _Metric(object):
+  """Base class for metrics.
+
+  Values are kept per combination of label values.
+
+  """
+  TYPE = None
+
+  def __init__(self, lock, name, description, labels):
+    """Initializes this class.
+
+    @type lock: C{threading.Lock}
+    @param lock: Lock protecting the values of the registry
+    @type name: string
+    @param name: Metric name
+    @type description: string
+    @param description: Help text
+    @type labels: tuple of strings
+    @param labels: Label names
+
+    """
+    self._lock = lock
+    self.name = name
+    self.description = description
+    self.labels = labels
+    self._values = {}
+
+  def _CheckLabels(self, values):
+    """Checks the number of label values.
+
+    """
+    assert len(values) == len(self.labels), \
+      ("Metric %s needs values for labels %s, got %r" %
+       (self.name, self.labels, values))
+
+  def IsCompatible(self, other):
+    """Checks whether values of another metric can be merged into this one.
+
+    """
+    return (self.TYPE == other.TYPE and self.labels == other.labels)
+
+  def Reset(self):
+    """Forgets all recorded values.
+
+    """
+    with self._lock:
+      self._values.clear()
+
+
+class Counter(_Metric):
+  """Monotonically increasing value.
+
+  """
+  TYPE = COUNTER
+
+  def Inc(self, *labels, amount=1):
+    """Increments the counter.
+
+    @param labels: Label values
+    @param amount: Increment
+
+    """
+    self._CheckLabels(labels)
+
+    with self._lock:
+      self._values[labels] = self._values.get(labels, 0) + amount
+
+  def GetValue(self, *labels):
+    """Returns the value for a combination of label values.
+
+    """
+    with self._lock:
+      return self._values.get(labels, 0)
+
+  def ToDict(self):
+    """Returns the serializable state of this counter.
+
+    """
+    with self._lock:
+      values = [[list(labels), value]
+                for (labels, value) in sorted(self._values.items())]
+
+    return {
+      "type": self.TYPE,
+      "help": self.description,
+      "labels": list(self.labels),
+      "values": values,
+      }
+
+  def Merge(self, data):
+    """Adds the values of a serialized counter.
+
+    """
+    with self._lock:
+      for (labels, value) in data["values"]:
+        labels = tuple(labels)
+        self._values[labels] = self._values.get(labels, 0) + value
+
+  def FormatText(self):
+    """Formats the values in the Prometheus text format.
+
+    @rtype: list of strings
+
+    """
+    with self._lock:
+      values = sorted(self._values.items())
+
+    return ["%s%s %s" % (self.name, _FormatLabels(self.labels, labels),
+                         _FormatNumber(value))
+            for (labels, value) in values]
+
+
+class Histogram(_Metric):
+  """Distribution of observed values.
+
+  For each combination of label values the number of observations per
+  bucket, their sum and their number are kept.
+
+  """
+  TYPE = HISTOGRAM
+
+  def __init__(self, lock, name, description, labels,
+               buckets=DURATION_BUCKETS):
+    """Initializes this class.
+
+    @type buckets: sequence of numbers
+    @param buckets: Upper bounds of the buckets, in increasing order; a
+      bucket for all values is added implicitly
+
+    """
+    _Metric.__init__(self, lock, name, description, labels)
+    assert list(buckets) == sorted(buckets)
+    self.buckets = tuple(buckets)
+
+  def IsCompatible(self, other):
+    """Checks whether values of another metric can be merged into this one.
+
+    """
+    return (_Metric.IsCompatible(self, other) and
+            self.buckets == other.buckets)
+
+  def Observe(self, value, *labels):
+    """Records a value.
+
+    @type value: number
+    @param value: Observed value, e.g. a duration in seconds
+    @param labels: Label values
+
+    """
+    self._CheckLabels(labels)
+    idx = bisect.bisect_left(self.buckets, value)
+
+    with self._lock:
+      try:
+        entry = self._values[labels]
+      except KeyError:
+        entry = self._values[labels] = [[0] * (len(self.buckets) + 1), 0, 0]
+
+      entry[0][idx] += 1
+      entry[1] += value
+      entry[2] += 1
+
+  @contextlib.contextmanager
+  def Time(self, *labels, _time_fn=time.time):
+    """Context manager recording the time spent in its block.
+
+    The time is recorded even if the block raises an exception.
+
+    @param labels: Label values
+
+    """
+    start = _time_fn()
+    try:
+      yield
+    finally:
+      self.Observe(_time_fn() - start, *labels)
+
+  def GetCount(self, *labels):
+    """Returns the number of observations for a combination of label values.
+
+    """
+    with self._lock:
+      entry = self._values.get(labels)
+      if entry is None:
+        return 0
+      return entry[2]
+
+  def ToDict(self):
+    """Returns the serializable state of this histogram.
+
+    """
+    with self._lock:
+      values = [[list(labels), list(counts), total, count]
+                for (labels, (counts, total, count)) in
+                  sorted(self._values.items())]
+
+    return {
+      "type": self.TYPE,
+      "help": self.description,
+      "labels": list(self.labels),
+      "buckets": list(self.buckets),
+      "values": values,
+      }
+
+  def Merge(self, data):
+    """Adds the values of a serialized histogram.
+
+    """
+    with self._lock:
+      for (labels, counts, total, count) in data["values"]:
+        labels = tuple(labels)
+        try:
+          entry = self._values[labels]
+        except KeyError:
+          entry = self._values[labels] = [[0] * (len(self.buckets) + 1), 0, 0]
+
+        entry[0] = [a + b for (a, b) in zip(entry[0], counts)]
+        entry[1] += total
+        entry[2] += count
+
+  def FormatText(self):
+    """Formats the values in the Prometheus text format.
+
+    Buckets are cumulative and labelled with their upper bound.
+
+    @rtype: list of strings
+
+    """
+    with self._lock:
+      values = [(labels, list(counts), total, count)
+                for (labels, (counts, total, count)) in
+                  sorted(self._values.items())]
+
+    bounds = [_FormatNumber(i) for i in self.buckets] + ["+Inf"]
+    labelnames = self.labels + ("le", )
+
+    result = []
+    for (labels, counts, total, count) in values:
+      cumulative = 0
+      for (bound, bucket_count) in zip(bounds, counts):
+        cumulative += bucket_count
+        result.append("%s_bucket%s %d" %
+                      (self.name, _FormatLabels(labelnames, labels + (bound, )),
+                       cumulative))
+
+      formatted_labels = _FormatLabels(self.labels, labels)
+      result.append("%s_sum%s %s" %
+                    (self.name, formatted_labels, _FormatNumber(total)))
+      result.append("%s_count%s %d" % (self.name, formatted_labels, count))
+
+    return result
+
+
+_METRIC_TYPES = {
+  COUNTER: Counter,
+  HISTOGRAM: Histogram,
+  }
+
+
+def _EscapeLabelValue(value):
+  """Escapes a label value for the Prometheus text format.
+
+  """
+  return (str(value).replace("\\", "\\\\").replace("\n", "\\n")
+          .replace("\"", "\\\""))
+
+
+def _FormatLabels(names, values):
+  """Formats a set of labels.
+
+  @rtype: string
+  @return: Labels in curly braces, or an empty string for no labels
+
+  """
+  if not names:
+    return ""
+
+  return "{%s}" % ",".join("%s=\"%s\"" % (name, _EscapeLabelValue(value))
+                           for (name, value) in zip(names, values))
+
+
+def _FormatNumber(value):
+  """Formats a number for the Prometheus text format.
+
+  """
+  if isinstance(value, float):
+    if math.isinf(value):
+      if value > 0:
+        return "+Inf"
+      return "-Inf"
+    return repr(value)
+
+  return str(value)
+
+
+class Registry(object):
+  """Collection of metrics.
+
+  Metrics are usually defined once at module level and are then shared by
+  all threads of a process.
+
+  """
+  def __init__(self):
+    """Initializes this class.
+
+    """
+    # One lock for all values; recording a value holds it only very briefly
+    self._lock = threading.Lock()
+    self._metrics = {}
+
+  def _Register(self, metric):
+    """Registers a metric, returning an existing compatible one.
+
+    """
+    with self._lock:
+      existing = self._metrics.get(metric.name)
+      if existing is None:
+        self._metrics[metric.name] = metric
+        return metric
+
+    if not existing.IsCompatible(metric):
+      raise ValueError("Metric %s is already registered with a different"
+                       " definition" % metric.name)
+
+    return existing
+
+  def Counter(self, name, description, labels=()):
+    """Returns a counter, registering it if necessary.
+
+    @type name: string
+    @param name: Metric name, should end in C{_total}
+    @type description: string
+    @param description: Help text
+    @type labels: sequence of strings
+    @param labels: Label names
+    @rtype: L{Counter}
+
+    """
+    return self._Register(Counter(self._lock, name, description,
+                                  tuple(labels)))
+
+  def Histogram(self, name, description, labels=(),
+                buckets=DURATION_BUCKETS):
+    """Returns a histogram, registering it if necessary.
+
+    @type name: string
+    @param name: Metric name, e.g. ending in C{_seconds}
+    @type description: string
+    @param description: Help text
+    @type labels: sequence of strings
+    @param labels: Label names
+    @type buckets: sequence of numbers
+    @param buckets: Upper bounds of the buckets
+    @rtype: L{Histogram}
+
+    """
+    return self._Register(Histogram(self._lock, name, description,
+                                    tuple(labels), buckets=buckets))
+
+  def Reset(self):
+    """Forgets the values of all metrics.
+
+    The metrics stay registered.
+
+    """
+    for metric in list(self._metrics.values()):
+      metric.Reset()
+
+  def ToDict(self):
+    """Returns the serializable state of all metrics.
+
+    @rtype: dict
+    @return: Metric name as key, metric state as value
+
+    """
+    return dict((name, metric.ToDict())
+                for (name, metric) in list(self._metrics.items()))
+
+  def Merge(self, data):
+    """Adds the values of serialized metrics.
+
+    Metrics unknown to this registry are registered. Values of a metric
+    whose definition differs from the registered one, e.g. after the
+    buckets of a histogram have been changed, are discarded.
+
+    @type data: dict
+    @param data: Metrics as returned by L{ToDict}
+
+    """
+    for (name, metric_data) in data.items():
+      try:
+        cls = _METRIC_TYPES[metric_data["type"]]
+      except KeyError:
+        logging.warning("Ignoring metric %s of unknown type", name)
+        continue
+
+      kwargs = {}
+      if cls is Histogram:
+        kwargs["buckets"] = tuple(metric_data["buckets"])
+
+      try:
+        metric = self._Register(cls(self._lock, name, metric_data["help"],
+                                    tuple(metric_data["labels"]), **kwargs))
+      except ValueError:
+        logging.warning("Definition of metric %s has changed, discarding"
+                        " its values", name)
+        continue
+
+      metric.Merge(metric_data)
+
+  def FormatText(self):
+    """Formats all metrics in the Prometheus text exposition format.
+
+    @rtype: string
+
+    """
+    lines = []
+
+    for (name, metric) in sorted(self._metrics.items()):
+      lines.append("# HELP %s %s" %
+                   (name, metric.description.replace("\\", "\\\\")
+                                            .replace("\n", "\\n")))
+      lines.append("# TYPE %s %s" % (name, metric.TYPE))
+      lines.extend(metric.FormatText())
+
+    return "".join("%s\n" % line for line in lines)
+
+
+def FormatText(data):
+  """Formats serialized metrics in the Prometheus text exposition format.
+
+  @type data: dict
+  @param data: Metrics as returned by L{Registry.ToDict}
+  @rtype: string
+
+  """
+  registry = Registry()
+  registry.Merge(data)
+  return registry.FormatText()
+
+
+def LoadFromFile(filename=pathutils.METRICS_FILE):
+  """Reads the metrics file.
+
+  @rtype: dict
+  @return: Metrics as returned by L{Registry.ToDict}; empty if the file
+    doesn't exist
+
+  """
+  try:
+    data = utils.ReadFile(filename)
+  except EnvironmentError as err:
+    if err.errno != errno.ENOENT:
+      raise
+    return {}
+
+  return serializer.LoadJson(data)
+
+
+def SaveToFile(registry, filename=pathutils.METRICS_FILE,
+               lockfile=pathutils.METRICS_LOCK_FILE):
+  """Adds the values of a registry to the metrics file.
+
+  The values of the registry are reset, so that they're not added again by
+  a later call.
+
+  @type registry: L{Registry}
+
+  """
+  data = registry.ToDict()
+  registry.Reset()
+
+  if not compat.any(metric["values"] for metric in data.values()):
+    # Nothing recorded
+    return
+
+  lock = utils.FileLock.Open(lockfile)
+  try:
+    lock.Exclusive(blocking=True, timeout=_LOCK_TIMEOUT)
+
+    merged = Registry()
+    merged.Merge(LoadFromFile(filename=filename))
+    merged.Merge(data)
+
+    utils.WriteFile(filename, data=serializer.DumpJson(merged.ToDict()),
+                    mode=0o640)
+  finally:
+    lock.Close()
+
+
+#: Registry of the current process
+REGISTRY = Registry()
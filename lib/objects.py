@@ -119,6 +119,132 @@ def FillDiskParams(default_dparams, custom_dparams, skip_keys=None):
               for dt in constants.DISK_TEMPLATES)
 
 
+#: Types of values which don't need to be copied
+_IMMUTABLE_TYPES = frozenset([str, int, float, bool, type(None)])
+
+
+class ReadOnlyDict(dict):
+  """A dictionary which can't be modified.
+
+  Used for filled parameters shared between all callers reading them.
+  Copying it, be it with C{copy.copy}, C{copy.deepcopy} or L{FillDict},
+  returns a normal dictionary which can be modified.
+
+  """
+  __slots__ = []
+
+  def _ReadOnly(self, *_, **__):
+    raise TypeError("Read-only dictionary can't be modified")
+
+  __setitem__ = _ReadOnly
+  __delitem__ = _ReadOnly
+  __ior__ = _ReadOnly
+  clear = _ReadOnly
+  pop = _ReadOnly
+  popitem = _ReadOnly
+  setdefault = _ReadOnly
+  update = _ReadOnly
+
+  def __copy__(self):
+    return dict(self)
+
+  def __deepcopy__(self, memo):
+    result = {}
+    for (key, value) in self.items():
+      if type(value) not in _IMMUTABLE_TYPES:
+        value = copy.deepcopy(value, memo)
+      result[key] = value
+    return result
+
+  def __reduce__(self):
+    return (dict, (dict(self), ))
+
+  def Copy(self):
+    """Returns a copy of this dictionary which can be modified.
+
+    @rtype: dict
+
+    """
+    return copy.deepcopy(self)
+
+
+def _FreezeParams(value):
+  """Converts a dictionary and the dictionaries in it to L{ReadOnlyDict}.
+
+  """
+  if type(value) is dict: # pylint: disable=C0123
+    return ReadOnlyDict((key, _FreezeParams(item))
+                        for (key, item) in value.items())
+  return value
+
+
+class _FilledParamsCache(object):
+  """Cache of filled parameters.
+
+  Each entry remembers the dictionaries it was computed from. It is only
+  used while they are unchanged: read-only dictionaries are compared by
+  identity, all others by their contents, so that changes made in place
+  are noticed too. All entries are dropped when the serial number of the
+  owning object changes.
+
+  """
+  #: Number of entries after which the cache is emptied
+  _MAX_ENTRIES = 100000
+
+  def __init__(self):
+    """Initializes this class.
+
+    """
+    self._serial = None
+    self._entries = {}
+
+  @staticmethod
+  def _Snapshot(source):
+    """Returns what is remembered of a source dictionary.
+
+    """
+    if isinstance(source, ReadOnlyDict):
+      return source
+    return copy.deepcopy(source)
+
+  @staticmethod
+  def _Unchanged(snapshots, sources):
+    """Checks whether the sources of an entry are unchanged.
+
+    """
+    for (snapshot, source) in zip(snapshots, sources):
+      if snapshot is source:
+        continue
+      if isinstance(snapshot, ReadOnlyDict) or snapshot != source:
+        return False
+    return True
+
+  def Get(self, serial, key, sources, fn):
+    """Returns a cached value, computing it if necessary.
+
+    @param serial: the serial number of the owning object
+    @type key: tuple
+    @param key: the key of the entry
+    @type sources: tuple of dict
+    @param sources: the dictionaries the value is computed from
+    @type fn: callable
+    @param fn: function computing the value
+    @rtype: L{ReadOnlyDict}
+
+    """
+    if serial != self._serial or len(self._entries) >= self._MAX_ENTRIES:
+      self._serial = serial
+      self._entries = {}
+
+    entry = self._entries.get(key)
+    if entry is not None and self._Unchanged(entry[0], sources):
+      return entry[1]
+
+    value = _FreezeParams(fn())
+    self._entries[key] = (tuple(self._Snapshot(s) for s in sources), value)
+    return value
+
+
 def UpgradeGroupedParams(target, defaults):
   """Update all groups for the target parameter.
 
@@ -203,7 +329,8 @@ class ConfigObject(outils.ValidatedSlots):
       as None instead of raising an error
 
   Classes derived from this must always declare __slots__ (we use many
-  config objects and the memory reduction is useful)
+  config objects and the memory reduction is useful). Slots whose name
+  starts with an underscore hold runtime state and are not serialized.
 
   """
   __slots__ = []
@@ -256,6 +383,9 @@ class ConfigObject(outils.ValidatedSlots):
     """
     result = {}
     for name in self.GetAllSlots():
+      if name.startswith("_"):
+        # Runtime state, e.g. caches
+        continue
       value = getattr(self, name, None)
       if value is not None:
         result[name] = value
@@ -449,6 +579,39 @@ class ConfigData(ConfigObject):
     obj.filters = outils.ContainerFromDicts(obj.filters, dict, Filter)
     return obj
 
+  def ApplyDelta(self, delta):
+    """Apply a set of changes to the configuration.
+
+    The changes are given in the form used by WConfd: the serial number
+    and cluster of the new configuration, and for each container the new
+    versions of the changed objects, or C{None} for removed ones, by UUID.
+
+    @type delta: dict
+    @param delta: the changes to apply
+
+    """
+    self.serial_no = delta["serial_no"]
+    self.cluster = Cluster.FromDict(delta["cluster"])
+    for (key, cls) in [("nodes", Node), ("instances", Instance),
+                       ("nodegroups", NodeGroup), ("networks", Network),
+                       ("disks", Disk), ("filters", Filter)]:
+      container = getattr(self, key)
+      for (uuid, value) in delta.get(key, {}).items():
+        if value is None:
+          container.pop(uuid, None)
+        else:
+          container[uuid] = cls.FromDict(value)
+
+    # The members of node groups aren't serialized, so they have to be
+    # recomputed from the nodes, which may have been added, moved to another
+    # group or removed
+    for nodegroup in self.nodegroups.values():
+      nodegroup.members = []
+    for node in self.nodes.values():
+      nodegroup = self.nodegroups.get(node.group)
+      if nodegroup is not None:
+        nodegroup.members.append(node.uuid)
+
   def DisksOfType(self, dev_type):
     """Check if in there is at disk of the given type in the configuration.
 
@@ -1675,6 +1838,7 @@ class Cluster(TaggableObject):
     "data_collectors",
     "ssh_key_type",
     "ssh_key_bits",
+    "_fill_cache",
     ] + _TIMESTAMPS + _UUID
 
   def UpgradeConfig(self):
@@ -1889,6 +2053,35 @@ class Cluster(TaggableObject):
     """
     return FillDiskParams(self.diskparams, diskparams)
 
+  def _GetFilledParams(self, key, sources, fn):
+    """Returns filled parameters from the cache.
+
+    @see: L{_FilledParamsCache.Get}
+
+    """
+    cache = self._fill_cache
+    if cache is None:
+      cache = self._fill_cache = _FilledParamsCache()
+    return cache.Get(self.serial_no, key, sources, fn)
+
+  def _GetHVDefaultsView(self, hypervisor, os_name, skip_keys):
+    """Returns the default hypervisor parameters as a read-only dict.
+
+    @see: L{GetHVDefaults}
+
+    """
+    skip_keys = frozenset(skip_keys or [])
+    hv_defaults = self.hvparams.get(hypervisor, {})
+    if os_name is None:
+      os_hvp = {}
+    else:
+      os_hvp = self.os_hvp.get(os_name, {}).get(hypervisor, {})
+
+    return self._GetFilledParams(
+      ("hv-defaults", hypervisor, os_name, skip_keys), (hv_defaults, os_hvp),
+      lambda: FillDict(FillDict({}, hv_defaults, skip_keys=skip_keys),
+                       os_hvp, skip_keys=skip_keys))
+
   def GetHVDefaults(self, hypervisor, os_name=None, skip_keys=None):
     """Get the default hypervisor parameters for the cluster.
 
@@ -1898,19 +2091,7 @@ class Cluster(TaggableObject):
     @return: the defaults dict
 
     """
-    if skip_keys is None:
-      skip_keys = []
-
-    fill_stack = [self.hvparams.get(hypervisor, {})]
-    if os_name is not None:
-      os_hvp = self.os_hvp.get(os_name, {}).get(hypervisor, {})
-      fill_stack.append(os_hvp)
-
-    ret_dict = {}
-    for o_dict in fill_stack:
-      ret_dict = FillDict(ret_dict, o_dict, skip_keys=skip_keys)
-
-    return ret_dict
+    return self._GetHVDefaultsView(hypervisor, os_name, skip_keys).Copy()
 
   def SimpleFillHV(self, hv_name, os_name, hvparams, skip_globals=False):
     """Fill a given hvparams dict with cluster defaults.
@@ -1932,9 +2113,36 @@ class Cluster(TaggableObject):
     else:
       skip_keys = []
 
-    def_dict = self.GetHVDefaults(hv_name, os_name, skip_keys=skip_keys)
+    def_dict = self._GetHVDefaultsView(hv_name, os_name, skip_keys)
     return FillDict(def_dict, hvparams, skip_keys=skip_keys)
 
+  def GetFilledHV(self, instance, skip_globals=False):
+    """Returns an instance's hvparams filled with cluster defaults.
+
+    The result is cached and shared between all callers, so it can't be
+    modified; use L{FillHV} to get a copy which can be.
+
+    @type instance: L{objects.Instance}
+    @param instance: the instance parameter to fill
+    @type skip_globals: boolean
+    @param skip_globals: if True, the global hypervisor parameters will
+        not be filled
+    @rtype: L{ReadOnlyDict}
+
+    """
+    if skip_globals:
+      skip_keys = constants.HVC_GLOBALS
+    else:
+      skip_keys = []
+
+    defaults = self._GetHVDefaultsView(instance.hypervisor, instance.os,
+                                       skip_keys)
+    hvparams = instance.hvparams
+    return self._GetFilledParams(
+      ("hv", instance.hypervisor, instance.os, skip_globals, id(hvparams)),
+      (defaults, hvparams),
+      lambda: FillDict(defaults, hvparams, skip_keys=skip_keys))
+
   def FillHV(self, instance, skip_globals=False):
     """Fill an instance's hvparams dict with cluster defaults.
 
@@ -1948,8 +2156,15 @@ class Cluster(TaggableObject):
         the cluster defaults
 
     """
-    return self.SimpleFillHV(instance.hypervisor, instance.os,
-                             instance.hvparams, skip_globals)
+    return self.GetFilledHV(instance, skip_globals=skip_globals).Copy()
+
+  def _GetBEDefaultsView(self):
+    """Returns the default backend parameters as a read-only dict.
+
+    """
+    defaults = self.beparams.get(constants.PP_DEFAULT, {})
+    return self._GetFilledParams(("be-defaults", ), (defaults, ),
+                                 lambda: FillDict(defaults, {}))
 
   def SimpleFillBE(self, beparams):
     """Fill a given beparams dict with cluster defaults.
@@ -1961,7 +2176,23 @@ class Cluster(TaggableObject):
         from the cluster defaults
 
     """
-    return FillDict(self.beparams.get(constants.PP_DEFAULT, {}), beparams)
+    return FillDict(self._GetBEDefaultsView(), beparams)
+
+  def GetFilledBE(self, instance):
+    """Returns an instance's beparams filled with cluster defaults.
+
+    The result is cached and shared between all callers, so it can't be
+    modified; use L{FillBE} to get a copy which can be.
+
+    @type instance: L{objects.Instance}
+    @param instance: the instance parameter to fill
+    @rtype: L{ReadOnlyDict}
+
+    """
+    defaults = self._GetBEDefaultsView()
+    beparams = instance.beparams
+    return self._GetFilledParams(("be", id(beparams)), (defaults, beparams),
+                                 lambda: FillDict(defaults, beparams))
 
   def FillBE(self, instance):
     """Fill an instance's beparams dict with cluster defaults.
@@ -1973,7 +2204,15 @@ class Cluster(TaggableObject):
         the cluster defaults
 
     """
-    return self.SimpleFillBE(instance.beparams)
+    return self.GetFilledBE(instance).Copy()
+
+  def _GetNICDefaultsView(self):
+    """Returns the default NIC parameters as a read-only dict.
+
+    """
+    defaults = self.nicparams.get(constants.PP_DEFAULT, {})
+    return self._GetFilledParams(("nic-defaults", ), (defaults, ),
+                                 lambda: FillDict(defaults, {}))
 
   def SimpleFillNIC(self, nicparams):
     """Fill a given nicparams dict with cluster defaults.
@@ -1985,7 +2224,58 @@ class Cluster(TaggableObject):
         from the cluster defaults
 
     """
-    return FillDict(self.nicparams.get(constants.PP_DEFAULT, {}), nicparams)
+    return FillDict(self._GetNICDefaultsView(), nicparams)
+
+  def GetFilledNIC(self, nicparams):
+    """Returns a NIC's nicparams filled with cluster defaults.
+
+    The result is cached and shared between all callers, so it can't be
+    modified; use L{SimpleFillNIC} to get a copy which can be.
+
+    @type nicparams: dict
+    @param nicparams: the dict to fill
+    @rtype: L{ReadOnlyDict}
+
+    """
+    defaults = self._GetNICDefaultsView()
+    return self._GetFilledParams(("nic", id(nicparams)),
+                                 (defaults, nicparams),
+                                 lambda: FillDict(defaults, nicparams))
+
+  def _GetOSDefaultsView(self, os_name):
+    """Returns the default public OS parameters as a read-only dict.
+
+    """
+    if os_name is None:
+      name_only = None
+    else:
+      name_only = OS.GetName(os_name)
+
+    defaults_base = self.osparams.get(name_only, {})
+    defaults_variant = self.osparams.get(os_name, {})
+    return self._GetFilledParams(("os-defaults", os_name),
+                                 (defaults_base, defaults_variant),
+                                 lambda: FillDict(defaults_base,
+                                                  defaults_variant))
+
+  def GetFilledOS(self, os_name, os_params):
+    """Returns public OS parameters filled with cluster defaults.
+
+    The result is cached and shared between all callers, so it can't be
+    modified; use L{SimpleFillOS} to get a copy which can be, or to fill
+    private and secret parameters.
+
+    @type os_name: string
+    @param os_name: the OS name to use
+    @type os_params: dict
+    @param os_params: the dict with public parameters to fill
+    @rtype: L{ReadOnlyDict}
+
+    """
+    defaults = self._GetOSDefaultsView(os_name)
+    return self._GetFilledParams(("os", os_name, id(os_params)),
+                                 (defaults, os_params),
+                                 lambda: FillDict(defaults, os_params))
 
   def SimpleFillOS(self, os_name,
                     os_params_public,
@@ -2020,10 +2310,8 @@ class Cluster(TaggableObject):
     else:
       name_only = OS.GetName(os_name)
 
-    defaults_base_public = self.osparams.get(name_only, {})
-    defaults_public = FillDict(defaults_base_public,
-                               self.osparams.get(os_name, {}))
-    params_public = FillDict(defaults_public, os_params_public)
+    params_public = FillDict(self._GetOSDefaultsView(os_name),
+                             os_params_public)
 
     if os_params_private is not None:
       defaults_base_private = self.osparams_private_cluster.get(name_only, {})
@@ -2087,6 +2375,50 @@ class Cluster(TaggableObject):
     """
     return FillDict(constants.DS_DEFAULTS, disk_state)
 
+  def _GetNDDefaultsView(self):
+    """Returns the default node parameters as a read-only dict.
+
+    """
+    defaults = self.ndparams
+    return self._GetFilledParams(("nd-defaults", ), (defaults, ),
+                                 lambda: FillDict(defaults, {}))
+
+  def GetFilledNDGroup(self, nodegroup):
+    """Returns a node group's ndparams filled with cluster defaults.
+
+    The result is cached and shared between all callers, so it can't be
+    modified; use L{FillNDGroup} to get a copy which can be.
+
+    @type nodegroup: L{objects.NodeGroup}
+    @param nodegroup: the node group to fill
+    @rtype: L{ReadOnlyDict}
+
+    """
+    defaults = self._GetNDDefaultsView()
+    ndparams = nodegroup.ndparams
+    return self._GetFilledParams(("nd-group", id(ndparams)),
+                                 (defaults, ndparams),
+                                 lambda: FillDict(defaults, ndparams))
+
+  def GetFilledND(self, node, nodegroup):
+    """Returns a node's ndparams filled with group and cluster defaults.
+
+    The result is cached and shared between all callers, so it can't be
+    modified; use L{FillND} to get a copy which can be.
+
+    @type node: L{objects.Node}
+    @param node: the node to fill
+    @type nodegroup: L{objects.NodeGroup}
+    @param nodegroup: the node group of the node
+    @rtype: L{ReadOnlyDict}
+
+    """
+    defaults = self.GetFilledNDGroup(nodegroup)
+    ndparams = node.ndparams
+    return self._GetFilledParams(("nd", id(nodegroup.ndparams), id(ndparams)),
+                                 (defaults, ndparams),
+                                 lambda: FillDict(defaults, ndparams))
+
   def FillND(self, node, nodegroup):
     """Return filled out ndparams for L{objects.NodeGroup} and L{objects.Node}
 
@@ -2097,7 +2429,7 @@ class Cluster(TaggableObject):
     @return a copy of the node's ndparams with defaults filled
 
     """
-    return self.SimpleFillND(nodegroup.FillND(node))
+    return self.GetFilledND(node, nodegroup).Copy()
 
   def FillNDGroup(self, nodegroup):
     """Return filled out ndparams for just L{objects.NodeGroup}
@@ -2107,7 +2439,7 @@ class Cluster(TaggableObject):
     @return a copy of the node group's ndparams with defaults filled
 
     """
-    return self.SimpleFillND(nodegroup.SimpleFillND({}))
+    return self.GetFilledNDGroup(nodegroup).Copy()
 
   def SimpleFillND(self, ndparams):
     """Fill a given ndparams dict with defaults.
@@ -2119,7 +2451,22 @@ class Cluster(TaggableObject):
         from the cluster defaults
 
     """
-    return FillDict(self.ndparams, ndparams)
+    return FillDict(self._GetNDDefaultsView(), ndparams)
+
+  def GetFilledIPolicy(self, ipolicy):
+    """Returns an instance policy filled with cluster defaults.
+
+    The result is cached and shared between all callers, so it can't be
+    modified; use L{SimpleFillIPolicy} to get a copy which can be.
+
+    @type ipolicy: dict
+    @param ipolicy: the dict to fill
+    @rtype: L{ReadOnlyDict}
+
+    """
+    return self._GetFilledParams(("ipolicy", id(ipolicy)),
+                                 (self.ipolicy, ipolicy),
+                                 lambda: FillIPolicy(self.ipolicy, ipolicy))
 
   def SimpleFillIPolicy(self, ipolicy):
     """ Fill instance policy dict with defaults.
@@ -2131,7 +2478,7 @@ class Cluster(TaggableObject):
       the cluster defaults
 
     """
-    return FillIPolicy(self.ipolicy, ipolicy)
+    return self.GetFilledIPolicy(ipolicy).Copy()
 
   def IsDiskTemplateEnabled(self, disk_template):
     """Checks if a particular disk template is enabled.
@@ -2182,6 +2529,25 @@ class ImportExportStatus(ConfigObject):
     ] + _TIMESTAMPS
 
 
+class DiskWipeStatus(ConfigObject):
+  """Config object representing the status of a background disk wipe.
+
+  @ivar disks: One dictionary per disk with the offset up to which the disk
+    has been wiped (C{offset}), its size (C{size}), both in MiB, the methods
+    used for wiping (C{methods}) and an error message (C{error})
+  @ivar running: Whether the wipe process is still running
+
+  """
+  __slots__ = [
+    "disks",
+    "progress_percent",
+    "progress_eta",
+    "running",
+    "exit_status",
+    "error_message",
+    ] + _TIMESTAMPS
+
+
 class ImportExportOptions(ConfigObject):
   """Options for import/export daemon
 
@@ -2191,6 +2557,8 @@ class ImportExportOptions(ConfigObject):
   @ivar magic: Used to ensure the connection goes to the right disk
   @ivar ipv6: Whether to use IPv6
   @ivar connect_timeout: Number of seconds for establishing connection
+  @ivar transport: How data is transferred (see L{impexpd.TRANSPORT_ALL}),
+    the socat pipeline if unset
 
   """
   __slots__ = [
@@ -2200,6 +2568,7 @@ class ImportExportOptions(ConfigObject):
     "magic",
     "ipv6",
     "connect_timeout",
+    "transport",
     ]
 
 
@@ -60,6 +60,7 @@ LOCALSTATEDIR = vcluster.AddNodePrefix(_constants.LOCALSTATEDIR)
 
 # Paths which don't change for a virtual cluster
 DAEMON_UTIL = _constants.PKGLIBDIR + "/daemon-util"
+DISK_WIPE = _constants.PKGLIBDIR + "/disk-wipe"
 IMPORT_EXPORT_DAEMON = _constants.PKGLIBDIR + "/import-export"
 KVM_CONSOLE_WRAPPER = _constants.PKGLIBDIR + "/tools/kvm-console-wrapper"
 KVM_IFUP = _constants.PKGLIBDIR + "/kvm-ifup"
@@ -95,6 +96,7 @@ DISK_LINKS_DIR = RUN_DIR + "/instance-disks"
 SOCKET_DIR = RUN_DIR + "/socket"
 CRYPTO_KEYS_DIR = RUN_DIR + "/crypto"
 IMPORT_EXPORT_DIR = RUN_DIR + "/import-export"
+DISK_WIPE_DIR = RUN_DIR + "/disk-wipe"
 INSTANCE_STATUS_FILE = RUN_DIR + "/instance-status"
 INSTANCE_REASON_DIR = RUN_DIR + "/instance-reason"
 #: User-id pool lock directory (used user IDs have a corresponding lock file in
@@ -150,6 +152,10 @@ WATCHER_GROUP_INSTANCE_STATUS_FILE = DATA_DIR + "/watcher.%s.instance-status"
 #: File containing Unix timestamp until which watcher should be paused
 WATCHER_PAUSEFILE = DATA_DIR + "/watcher.pause"
 
+#: Metrics recorded by jobs, see L{ganeti.metrics}
+METRICS_FILE = DATA_DIR + "/metrics.data"
+METRICS_LOCK_FILE = DATA_DIR + "/metrics.lock"
+
 #: User-provided master IP setup script
 EXTERNAL_MASTER_SETUP_SCRIPT = USER_SCRIPTS_DIR + "/master-ip-setup"
 
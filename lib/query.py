@@ -360,6 +360,40 @@ def _WrapNot(fn, lhs, rhs):
   return not fn(lhs, rhs)
 
 
+def _InSet(lhs, values):
+  """Checks whether a value is one of a set of values.
+
+  """
+  return lhs in values
+
+
+def _MatchHostnames(lhs, names):
+  """Checks whether a host name matches one of a set of names.
+
+  This is the same as checking each name with L{utils.MatchNameComponent}
+  ignoring case, as done for a single name by the equality check for
+  L{QFF_HOSTNAME} fields.
+
+  @type names: frozenset
+  @param names: lower-cased names or leading components of names
+
+  """
+  if not isinstance(lhs, str):
+    return False
+
+  lhs = lhs.lower()
+  if lhs in names:
+    return True
+
+  pos = lhs.find(".")
+  while pos != -1:
+    if lhs[:pos] in names:
+      return True
+    pos = lhs.find(".", pos + 1)
+
+  return False
+
+
 def _PrepareRegex(pattern):
   """Compiles a regular expression.
 
@@ -473,6 +507,15 @@ class _FilterCompilerHelper(object):
       ]),
     }
 
+  #: Kinds of fields whose values can be looked up in a set
+  _MERGEABLE_KINDS = compat.UniqueFrozenset([
+    QFT_TEXT,
+    QFT_BOOL,
+    QFT_NUMBER,
+    QFT_NUMBER_FLOAT,
+    QFT_UNIT,
+    ])
+
   def __init__(self, fields):
     """Initializes this class.
 
@@ -566,8 +609,83 @@ class _FilterCompilerHelper(object):
     if hints_fn:
       hints_fn(op)
 
-    return compat.partial(_WrapLogicOp, op_fn,
-                          [self._Compile(op, level + 1) for op in operands])
+    sentences = [self._Compile(op, level + 1) for op in operands]
+
+    if op == qlang.OP_OR:
+      sentences = self._MergeEqualities(operands, sentences)
+
+    return compat.partial(_WrapLogicOp, op_fn, sentences)
+
+  def _GetEqualityMatcher(self, operand):
+    """Checks whether an operand can be merged with others in a set lookup.
+
+    @return: C{None} or a tuple of field name and matching function; the
+      function receives the retrieved value and a frozenset of values
+
+    """
+    if not (isinstance(operand, (list, tuple)) and len(operand) == 3 and
+            operand[0] in (qlang.OP_EQUAL, qlang.OP_EQUAL_LEGACY)):
+      return None
+
+    (_, name, value) = operand
+    (fdef, _, field_flags, _) = self._LookupField(name)
+
+    if fdef.kind not in self._MERGEABLE_KINDS:
+      return None
+
+    try:
+      hash(value)
+    except TypeError:
+      return None
+
+    if field_flags & QFF_HOSTNAME:
+      return (name, _MatchHostnames)
+    elif field_flags & QFF_SPLIT_TIMESTAMP:
+      return None
+    else:
+      return (name, _InSet)
+
+  def _MergeEqualities(self, operands, sentences):
+    """Merges equality checks on the same field into one set lookup.
+
+    A filter such as C{["|", ["=", "name", "a"], ["=", "name", "b"]]} would
+    otherwise retrieve the field and compare it once per value.
+
+    @type operands: list
+    @param operands: Operands of an L{qlang.OP_OR} operator
+    @type sentences: list of callables
+    @param sentences: Compiled operands
+    @rtype: list of callables
+
+    """
+    groups = {}
+    for (idx, operand) in enumerate(operands):
+      matcher = self._GetEqualityMatcher(operand)
+      if matcher is not None:
+        groups.setdefault(matcher, []).append(idx)
+
+    merged = {}
+    for ((name, match_fn), indices) in groups.items():
+      if len(indices) < 2:
+        continue
+      values = [operands[idx][2] for idx in indices]
+      if match_fn is _MatchHostnames:
+        values = [value.lower() for value in values]
+      retrieval_fn = self._LookupField(name)[3]
+      merged[indices[0]] = compat.partial(_WrapBinaryOp, match_fn,
+                                          retrieval_fn, frozenset(values))
+      merged.update((idx, None) for idx in indices[1:])
+
+    if not merged:
+      return sentences
+
+    result = []
+    for (idx, fn) in enumerate(sentences):
+      fn = merged.get(idx, fn)
+      if fn is not None:
+        result.append(fn)
+
+    return result
 
   def _HandleUnaryOp(self, hints_fn, level, op, op_fn, operands):
     """Handles unary operators.
@@ -755,14 +873,16 @@ class Query(object):
 
     """
     sort = (self._name_fn and sort_by_name)
+    filter_fn = self._filter_fn
+    getters = [fn for (_, _, _, fn) in self._fields]
 
     result = []
 
     for idx, item in enumerate(ctx):
-      if not (self._filter_fn is None or self._filter_fn(ctx, item)):
+      if not (filter_fn is None or filter_fn(ctx, item)):
         continue
 
-      row = [_ProcessResult(fn(ctx, item)) for (_, _, _, fn) in self._fields]
+      row = [_ProcessResult(fn(ctx, item)) for fn in getters]
 
       # Verify result
       if __debug__:
@@ -1049,7 +1169,8 @@ def _ConvWrapInner(convert, fn, ctx, item):
   value = fn(ctx, item)
 
   # Is the value an abnormal status?
-  if compat.any(value is fs for fs in _FS_ALL):
+  if (value is _FS_UNAVAIL or value is _FS_NODATA or value is _FS_OFFLINE or
+      value is _FS_UNKNOWN):
     # Return right away
     return value
 
@@ -1102,7 +1223,47 @@ def _GetItemTimestampFields(datatype):
     ]
 
 
-class NodeQueryData(object):
+class _ItemDataContainer(object):
+  """Base class for data containers computing row data on demand.
+
+  Data derived from the current item, such as filled parameters, is only
+  computed when a field needs it, and only once per item. Items which are
+  excluded by the filter or for which no field needs the data don't cost
+  anything.
+
+  """
+  def __init__(self):
+    """Initializes this class.
+
+    """
+    self._item = None
+    self._item_data = {}
+
+  def _SetItem(self, item):
+    """Sets the item for which data is returned.
+
+    """
+    self._item = item
+    self._item_data = {}
+
+  def _GetItemData(self, key, fn):
+    """Returns data of the current item, computing it on first use.
+
+    @type key: string
+    @param key: Name of the data
+    @type fn: callable
+    @param fn: Function computing the data from the item
+
+    """
+    try:
+      return self._item_data[key]
+    except KeyError:
+      value = fn(self._item)
+      self._item_data[key] = value
+      return value
+
+
+class NodeQueryData(_ItemDataContainer):
   """Data container for node data queries.
 
   """
@@ -1112,6 +1273,7 @@ class NodeQueryData(object):
     """Initializes this class.
 
     """
+    _ItemDataContainer.__init__(self)
     self.nodes = nodes
     self.live_data = live_data
     self.master_uuid = master_uuid
@@ -1124,7 +1286,23 @@ class NodeQueryData(object):
 
     # Used for individual rows
     self.curlive_data = None
-    self.ndparams = None
+
+  def _FillND(self, node):
+    """Computes the filled node parameters of a node.
+
+    """
+    group = self.groups.get(node.group, None)
+    if group is None:
+      return None
+    else:
+      return self.cluster.GetFilledND(node, group)
+
+  @property
+  def ndparams(self):
+    """Filled node parameters of the current node.
+
+    """
+    return self._GetItemData("ndparams", self._FillND)
 
   def __iter__(self):
     """Iterate over all nodes.
@@ -1134,11 +1312,7 @@ class NodeQueryData(object):
 
     """
     for node in self.nodes:
-      group = self.groups.get(node.group, None)
-      if group is None:
-        self.ndparams = None
-      else:
-        self.ndparams = self.cluster.FillND(node, group)
+      self._SetItem(node)
       if self.live_data:
         self.curlive_data = self.live_data.get(node.uuid, None)
       else:
@@ -1421,7 +1595,7 @@ def _BuildNodeFields():
   return _PrepareFieldList(fields, [])
 
 
-class InstanceQueryData(object):
+class InstanceQueryData(_ItemDataContainer):
   """Data container for instance data queries.
 
   """
@@ -1456,6 +1630,7 @@ class InstanceQueryData(object):
     assert not (set(live_data.keys()) & set(bad_node_uuids)), \
            "Found live data for bad or offline nodes"
 
+    _ItemDataContainer.__init__(self)
     self.instances = instances
     self.cluster = cluster
     self.disk_usage = disk_usage
@@ -1468,11 +1643,40 @@ class InstanceQueryData(object):
     self.groups = groups
     self.networks = networks
 
-    # Used for individual rows
-    self.inst_hvparams = None
-    self.inst_beparams = None
-    self.inst_osparams = None
-    self.inst_nicparams = None
+  @property
+  def inst_hvparams(self):
+    """Filled hypervisor parameters of the current instance.
+
+    """
+    return self._GetItemData("hvparams",
+                             lambda inst: self.cluster.GetFilledHV(
+                               inst, skip_globals=True))
+
+  @property
+  def inst_beparams(self):
+    """Filled backend parameters of the current instance.
+
+    """
+    return self._GetItemData("beparams", self.cluster.GetFilledBE)
+
+  @property
+  def inst_osparams(self):
+    """Filled OS parameters of the current instance.
+
+    """
+    return self._GetItemData("osparams",
+                             lambda inst: self.cluster.GetFilledOS(
+                               inst.os, inst.osparams))
+
+  @property
+  def inst_nicparams(self):
+    """Filled parameters of the NICs of the current instance.
+
+    """
+    return self._GetItemData("nicparams",
+                             lambda inst: [self.cluster.GetFilledNIC(
+                                             nic.nicparams)
+                                           for nic in inst.nics])
 
   def __iter__(self):
     """Iterate over all instances.
@@ -1482,12 +1686,7 @@ class InstanceQueryData(object):
 
     """
     for inst in self.instances:
-      self.inst_hvparams = self.cluster.FillHV(inst, skip_globals=True)
-      self.inst_beparams = self.cluster.FillBE(inst)
-      self.inst_osparams = self.cluster.SimpleFillOS(inst.os, inst.osparams)
-      self.inst_nicparams = [self.cluster.SimpleFillNIC(nic.nicparams)
-                             for nic in inst.nics]
-
+      self._SetItem(inst)
       yield inst
 
 
@@ -1539,7 +1738,7 @@ def _GetInstLiveData(name):
 
 
 def _GetLiveInstStatus(ctx, instance, instance_state):
-  hvparams = ctx.cluster.FillHV(instance, skip_globals=True)
+  hvparams = ctx.inst_hvparams
 
   allow_userdown = \
       ctx.cluster.enabled_user_shutdown and \
@@ -2392,8 +2591,8 @@ class GroupQueryData(object):
 
     """
     for group in self.groups:
-      self.group_ipolicy = self.cluster.SimpleFillIPolicy(group.ipolicy)
-      self.ndparams = self.cluster.SimpleFillND(group.ndparams)
+      self.group_ipolicy = self.cluster.GetFilledIPolicy(group.ipolicy)
+      self.ndparams = self.cluster.GetFilledNDGroup(group)
       if self.want_diskparams:
         self.group_dp = self.cluster.SimpleFillDP(group.diskparams)
       else:
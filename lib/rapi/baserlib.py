@@ -293,6 +293,23 @@ def CheckParameter(data, name, default=_DEFAULT, exptype=_DEFAULT):
   return CheckType(value, exptype, "'%s' parameter" % name)
 
 
+class RawResponse(object):
+  """Response body sent as is instead of being serialized to JSON.
+
+  """
+  def __init__(self, content_type, body):
+    """Initializes this class.
+
+    @type content_type: string
+    @param content_type: Value of the C{Content-Type} header
+    @type body: string or bytes
+    @param body: Response body
+
+    """
+    self.content_type = content_type
+    self.body = body
+
+
 class ResourceBase(object):
   """Generic class for resources.
 
@@ -303,6 +320,10 @@ class ResourceBase(object):
   POST_ACCESS = [rapi.RAPI_ACCESS_WRITE]
   DELETE_ACCESS = [rapi.RAPI_ACCESS_WRITE]
 
+  #: Whether responses to unlocked GET requests may be served from the
+  #: response cache of the RAPI daemon
+  GET_CACHEABLE = False
+
   def __init__(self, items, queryargs, req, _client_cls=None):
     """Generic resource constructor.
 
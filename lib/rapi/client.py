@@ -42,11 +42,17 @@
 # No Ganeti-specific modules should be imported. The RAPI client is supposed to
 # be standalone.
 
+import codecs
 import logging
 import socket
 import threading
 import time
 
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
 try:
     from urllib import urlencode
 except ImportError:
@@ -65,8 +71,11 @@ HTTP_GET = "GET"
 HTTP_PUT = "PUT"
 HTTP_POST = "POST"
 HTTP_OK = 200
+HTTP_NOT_MODIFIED = 304
 HTTP_NOT_FOUND = 404
 HTTP_APP_JSON = "application/json"
+HTTP_ETAG = "ETag"
+HTTP_IF_NONE_MATCH = "If-None-Match"
 
 REPLACE_DISK_PRI = "replace_on_primary"
 REPLACE_DISK_SECONDARY = "replace_on_secondary"
@@ -109,6 +118,8 @@ JOB_STATUS_WAITLOCK = JOB_STATUS_WAITING
 
 # Internal constants
 _REQ_DATA_VERSION_FIELD = "__version__"
+_RESPONSE_CACHE_MAX_ENTRIES = 32
+_STREAM_QUEUE_SIZE = 64
 _QPARAM_DRY_RUN = "dry-run"
 _QPARAM_FORCE = "force"
 
@@ -382,6 +393,254 @@ def GenericCurlConfig(verbose=False, use_signal=False,
   return _ConfigCurl
 
 
+def _GetResponseHeader(lines, name):
+  """Returns the value of a response header.
+
+  @type lines: list
+  @param lines: Header lines as received by cURL's header function
+  @type name: string
+  @param name: Header name
+  @rtype: string or None
+
+  """
+  name = name.lower()
+  value = None
+
+  for line in lines:
+    if isinstance(line, bytes):
+      line = line.decode("iso-8859-1")
+
+    if line.startswith("HTTP/"):
+      # Headers of a new response (e.g. after "100 Continue")
+      value = None
+      continue
+
+    (key, sep, content) = line.partition(":")
+    if sep and key.strip().lower() == name:
+      value = content.strip()
+
+  return value
+
+
+def _ConvertCurlError(err):
+  """Converts a cURL error to an exception of this module.
+
+  @type err: pycurl.error
+
+  """
+  if err.args[0] in _CURL_SSL_CERT_ERRORS:
+    return CertificateError("SSL certificate error %s" % err,
+                            code=err.args[0])
+
+  return GanetiApiError(str(err), code=err.args[0])
+
+
+def _CheckResponseCode(http_code, response_content):
+  """Raises an exception if a request didn't succeed.
+
+  @type http_code: int
+  @param http_code: HTTP status code
+  @param response_content: Decoded response body
+
+  """
+  if http_code != HTTP_OK:
+    if isinstance(response_content, dict):
+      msg = ("%s %s: %s" %
+             (response_content["code"],
+              response_content["message"],
+              response_content["explain"]))
+    else:
+      msg = str(response_content)
+
+    raise GanetiApiError(msg, code=http_code)
+
+
+def _JoinChunks(chunks):
+  """Joins data received by cURL's write function.
+
+  """
+  if chunks and isinstance(chunks[0], bytes):
+    return b"".join(chunks)
+  return "".join(chunks)
+
+
+class _JsonListParser(object):
+  """Incremental parser for a JSON list.
+
+  Data is fed in arbitrary pieces, the list's elements are returned as soon as
+  they are complete. Optionally the list can be the value of a key in a
+  JSON object; the object's other values are then parsed and discarded.
+
+  """
+  # Parser states
+  _PS_START = "start"
+  _PS_OBJ_FIRST_KEY = "obj-first-key"
+  _PS_OBJ_KEY = "obj-key"
+  _PS_OBJ_COLON = "obj-colon"
+  _PS_OBJ_VALUE = "obj-value"
+  _PS_OBJ_DELIM = "obj-delim"
+  _PS_LIST_FIRST = "list-first"
+  _PS_LIST_VALUE = "list-value"
+  _PS_LIST_DELIM = "list-delim"
+  _PS_DONE = "done"
+
+  _WHITESPACE = " \t\r\n"
+
+  def __init__(self, key=None):
+    """Initializes this class.
+
+    @type key: string or None
+    @param key: Key of the list in a top-level JSON object; if C{None}, the
+      document must be a list
+
+    """
+    self._key = key
+    self._decoder = simplejson.JSONDecoder()
+    self._text_decoder = codecs.getincrementaldecoder("utf-8")()
+    self._buf = ""
+    self._pos = 0
+    self._state = self._PS_START
+    self._current_key = None
+
+  def _Error(self, msg):
+    return GanetiApiError("Invalid response (%s)" % msg)
+
+  def _SkipWhitespace(self):
+    pos = self._pos
+    while pos < len(self._buf) and self._buf[pos] in self._WHITESPACE:
+      pos += 1
+    self._pos = pos
+    return pos < len(self._buf)
+
+  def _DecodeValue(self):
+    """Decodes a complete JSON value at the current position.
+
+    @return: C{None} if more data is needed, otherwise a tuple containing the
+      value
+
+    """
+    try:
+      (value, end) = self._decoder.raw_decode(self._buf, self._pos)
+    except ValueError:
+      # Possibly incomplete, wait for more data
+      return None
+
+    # A value might have been cut off (e.g. "1." of "1.5"), so it's only
+    # complete if followed by a separator
+    nextpos = end
+    while nextpos < len(self._buf) and self._buf[nextpos] in self._WHITESPACE:
+      nextpos += 1
+    if nextpos >= len(self._buf) or self._buf[nextpos] not in ",]}:":
+      return None
+
+    self._pos = end
+
+    return (value, )
+
+  def Feed(self, data):
+    """Feeds data into the parser.
+
+    @type data: bytes or string
+    @param data: Next part of the document
+    @rtype: list
+    @return: List elements completed by this data
+
+    """
+    if isinstance(data, bytes):
+      data = self._text_decoder.decode(data)
+
+    self._buf = self._buf[self._pos:] + data
+    self._pos = 0
+
+    result = []
+
+    while self._SkipWhitespace():
+      char = self._buf[self._pos]
+      state = self._state
+
+      if state == self._PS_START:
+        if self._key is None and char == "[":
+          self._state = self._PS_LIST_FIRST
+        elif self._key is not None and char == "{":
+          self._state = self._PS_OBJ_FIRST_KEY
+        else:
+          raise self._Error("unexpected start of document")
+        self._pos += 1
+
+      elif state in (self._PS_LIST_FIRST, self._PS_LIST_DELIM) and char == "]":
+        self._pos += 1
+        if self._key is None:
+          self._state = self._PS_DONE
+        else:
+          self._state = self._PS_OBJ_DELIM
+
+      elif state == self._PS_LIST_DELIM:
+        if char != ",":
+          raise self._Error("expected list separator")
+        self._pos += 1
+        self._state = self._PS_LIST_VALUE
+
+      elif state in (self._PS_LIST_FIRST, self._PS_LIST_VALUE):
+        value = self._DecodeValue()
+        if value is None:
+          break
+        result.append(value[0])
+        self._state = self._PS_LIST_DELIM
+
+      elif state == self._PS_OBJ_FIRST_KEY and char == "}":
+        self._pos += 1
+        self._state = self._PS_DONE
+
+      elif state in (self._PS_OBJ_FIRST_KEY, self._PS_OBJ_KEY):
+        if char != "\"":
+          raise self._Error("expected object key")
+        value = self._DecodeValue()
+        if value is None:
+          break
+        self._current_key = value[0]
+        self._state = self._PS_OBJ_COLON
+
+      elif state == self._PS_OBJ_COLON:
+        if char != ":":
+          raise self._Error("expected key separator")
+        self._pos += 1
+        self._state = self._PS_OBJ_VALUE
+
+      elif state == self._PS_OBJ_VALUE:
+        if self._current_key == self._key and char == "[":
+          self._pos += 1
+          self._state = self._PS_LIST_FIRST
+        else:
+          # Other values are skipped
+          if self._DecodeValue() is None:
+            break
+          self._state = self._PS_OBJ_DELIM
+
+      elif state == self._PS_OBJ_DELIM:
+        if char == ",":
+          self._state = self._PS_OBJ_KEY
+        elif char == "}":
+          self._state = self._PS_DONE
+        else:
+          raise self._Error("expected object separator")
+        self._pos += 1
+
+      else:
+        assert state == self._PS_DONE
+        raise self._Error("unexpected data after end of document")
+
+    return result
+
+  def Close(self):
+    """Checks whether the document was complete.
+
+    """
+    self.Feed(self._text_decoder.decode(b"", final=True))
+
+    if self._state != self._PS_DONE:
+      raise self._Error("incomplete document")
+
+
 class _CompatIO(object):
   """ Stream that lazy-allocates its buffer based on the first write's type
 
@@ -421,7 +680,8 @@ class GanetiRapiClient(object): # pylint: disable=R0904
 
   def __init__(self, host, port=GANETI_RAPI_PORT,
                username=None, password=None, logger=logging,
-               curl_config_fn=None, curl_factory=None):
+               curl_config_fn=None, curl_factory=None,
+               conditional_requests=False):
     """Initializes this class.
 
     @type host: string
@@ -435,6 +695,10 @@ class GanetiRapiClient(object): # pylint: disable=R0904
     @type curl_config_fn: callable
     @param curl_config_fn: Function to configure C{pycurl.Curl} object
     @param logger: Logging object
+    @type conditional_requests: bool
+    @param conditional_requests: Whether to remember the entity tags of
+      responses to C{GET} requests and to send them with further requests
+      for the same URL; unchanged resources are then not transferred again
 
     """
     self._username = username
@@ -443,6 +707,12 @@ class GanetiRapiClient(object): # pylint: disable=R0904
     self._curl_config_fn = curl_config_fn
     self._curl_factory = curl_factory
 
+    if conditional_requests:
+      self._response_cache = {}
+    else:
+      self._response_cache = None
+    self._response_cache_lock = threading.Lock()
+
     try:
       socket.inet_pton(socket.AF_INET6, host)
       address = "[%s]:%s" % (host, port)
@@ -475,10 +745,7 @@ class GanetiRapiClient(object): # pylint: disable=R0904
     curl.setopt(pycurl.USERAGENT, self.USER_AGENT)
     curl.setopt(pycurl.SSL_VERIFYHOST, 0)
     curl.setopt(pycurl.SSL_VERIFYPEER, False)
-    curl.setopt(pycurl.HTTPHEADER, [
-      "Accept: %s" % HTTP_APP_JSON,
-      "Content-type: %s" % HTTP_APP_JSON,
-      ])
+    curl.setopt(pycurl.HTTPHEADER, self._GetHeaders())
 
     assert ((self._username is None and self._password is None) ^
             (self._username is not None and self._password is not None))
@@ -495,6 +762,46 @@ class GanetiRapiClient(object): # pylint: disable=R0904
 
     return curl
 
+  @staticmethod
+  def _GetHeaders(etag=None):
+    """Returns the headers sent with a request.
+
+    @type etag: string or None
+    @param etag: Entity tag of a previously received response
+
+    """
+    headers = [
+      "Accept: %s" % HTTP_APP_JSON,
+      "Content-type: %s" % HTTP_APP_JSON,
+      ]
+
+    if etag is not None:
+      headers.append("%s: %s" % (HTTP_IF_NONE_MATCH, etag))
+
+    return headers
+
+  def _GetCachedResponse(self, url):
+    """Returns the cached response for a URL.
+
+    @rtype: None or tuple; (string, bytes or string)
+    @return: Entity tag and encoded body of the response
+
+    """
+    with self._response_cache_lock:
+      return self._response_cache.get(url, None)
+
+  def _CacheResponse(self, url, etag, body):
+    """Remembers a response for a URL.
+
+    """
+    with self._response_cache_lock:
+      self._response_cache.pop(url, None)
+      self._response_cache[url] = (etag, body)
+
+      while len(self._response_cache) > _RESPONSE_CACHE_MAX_ENTRIES:
+        # Dictionaries keep the insertion order, drop the oldest entry
+        del self._response_cache[next(iter(self._response_cache))]
+
   @staticmethod
   def _EncodeQuery(query):
     """Encode query values for RAPI URL.
@@ -523,7 +830,7 @@ class GanetiRapiClient(object): # pylint: disable=R0904
 
     return result
 
-  def _SendRequest(self, method, path, query, content):
+  def _SendRequest(self, method, path, query, content, raw=False):
     """Sends an HTTP request.
 
     This constructs a full URL, encodes and decodes HTTP bodies, and
@@ -537,6 +844,9 @@ class GanetiRapiClient(object): # pylint: disable=R0904
     @param query: query arguments to pass to urlencode
     @type content: str or None
     @param content: HTTP body content
+    @type raw: bool
+    @param raw: Whether to return the body of a successful response as a
+      string instead of decoding it as JSON
 
     @rtype: str
     @return: JSON-Decoded response
@@ -545,9 +855,81 @@ class GanetiRapiClient(object): # pylint: disable=R0904
     @raises GanetiApiError: If an invalid response is returned
 
     """
-    assert path.startswith("/")
-
     curl = self._CreateCurl()
+    url = self._PrepareRequest(curl, method, path, query, content)
+
+    # Buffer for response
+    encoded_resp_body = _CompatIO()
+
+    curl.setopt(pycurl.WRITEFUNCTION, encoded_resp_body.write)
+
+    if self._response_cache is not None and method == HTTP_GET:
+      cached = self._GetCachedResponse(url)
+      resp_headers = []
+
+      if cached is not None:
+        curl.setopt(pycurl.HTTPHEADER, self._GetHeaders(etag=cached[0]))
+      curl.setopt(pycurl.HEADERFUNCTION, resp_headers.append)
+    else:
+      cached = None
+      resp_headers = None
+
+    try:
+      # Send request and wait for response
+      try:
+        curl.perform()
+      except pycurl.error as err:
+        raise _ConvertCurlError(err)
+    finally:
+      # Reset settings to not keep references to large objects in memory
+      # between requests
+      curl.setopt(pycurl.POSTFIELDS, "")
+      curl.setopt(pycurl.WRITEFUNCTION, lambda _: None)
+      if resp_headers is not None:
+        curl.setopt(pycurl.HEADERFUNCTION, lambda _: None)
+
+    # Get HTTP response code
+    http_code = curl.getinfo(pycurl.RESPONSE_CODE)
+
+    if http_code == HTTP_NOT_MODIFIED and cached is not None:
+      self._logger.debug("Resource %s not modified", url)
+      return simplejson.loads(cached[1])
+
+    # Was anything written to the response buffer?
+    if encoded_resp_body.tell():
+      encoded_resp_body.seek(0)
+      encoded_body = encoded_resp_body.read()
+      if raw and http_code == HTTP_OK:
+        # PycURL hands out bytes in Python 3
+        if isinstance(encoded_body, bytes):
+          response_content = encoded_body.decode("utf-8")
+        else:
+          response_content = encoded_body
+      else:
+        response_content = simplejson.loads(encoded_body)
+    else:
+      encoded_body = None
+      response_content = None
+
+    if http_code == HTTP_OK and resp_headers and encoded_body is not None:
+      etag = _GetResponseHeader(resp_headers, HTTP_ETAG)
+      if etag:
+        self._CacheResponse(url, etag, encoded_body)
+
+    _CheckResponseCode(http_code, response_content)
+
+    return response_content
+
+  def _PrepareRequest(self, curl, method, path, query, content):
+    """Configures a cURL object for a request.
+
+    @type curl: pycurl.Curl
+    @param curl: cURL object
+    @rtype: string
+    @return: Request URL
+
+    """
+    assert path.startswith("/")
 
     if content is not None:
       encoded_content = self._json_encoder.encode(content)
@@ -565,53 +947,110 @@ class GanetiRapiClient(object): # pylint: disable=R0904
     self._logger.debug("Sending request %s %s (content=%r)",
                        method, url, encoded_content)
 
-    # Buffer for response
-    encoded_resp_body = _CompatIO()
-
     # Configure cURL
     curl.setopt(pycurl.CUSTOMREQUEST, str(method))
     curl.setopt(pycurl.URL, str(url))
     curl.setopt(pycurl.POSTFIELDS, str(encoded_content))
-    curl.setopt(pycurl.WRITEFUNCTION, encoded_resp_body.write)
 
-    try:
-      # Send request and wait for response
+    return url
+
+  def _StreamRequest(self, method, path, query, content, key=None):
+    """Sends an HTTP request and yields the elements of the returned list.
+
+    The response is parsed while it is received, so that large lists don't
+    have to be held in memory as a whole. The transfer runs in a separate
+    thread; if the caller stops iterating, it is aborted.
+
+    @type key: string or None
+    @param key: If given, the response is expected to be a dictionary and the
+      elements of the list stored under this key are returned
+    @raises CertificateError: If an invalid SSL certificate is found
+    @raises GanetiApiError: If an invalid response is returned
+
+    """
+    curl = self._CreateCurl()
+    self._PrepareRequest(curl, method, path, query, content)
+
+    chunks = queue.Queue(_STREAM_QUEUE_SIZE)
+    stop = threading.Event()
+    status = []
+
+    def _WriteFn(data):
+      if stop.is_set():
+        # Returning a length different from the data's aborts the transfer
+        return 0
+      chunks.put(data)
+      return None
+
+    def _HeaderFn(line):
+      if isinstance(line, bytes):
+        line = line.decode("iso-8859-1")
+      if line.startswith("HTTP/"):
+        status.append(int(line.split()[1]))
+
+    def _Perform():
       try:
         curl.perform()
       except pycurl.error as err:
-        if err.args[0] in _CURL_SSL_CERT_ERRORS:
-          raise CertificateError("SSL certificate error %s" % err,
-                                 code=err.args[0])
-
-        raise GanetiApiError(str(err), code=err.args[0])
-    finally:
-      # Reset settings to not keep references to large objects in memory
-      # between requests
-      curl.setopt(pycurl.POSTFIELDS, "")
-      curl.setopt(pycurl.WRITEFUNCTION, lambda _: None)
+        chunks.put(_ConvertCurlError(err))
+      except Exception as err: # pylint: disable=W0703
+        chunks.put(err)
+      else:
+        chunks.put(None)
 
-    # Get HTTP response code
-    http_code = curl.getinfo(pycurl.RESPONSE_CODE)
+    curl.setopt(pycurl.WRITEFUNCTION, _WriteFn)
+    curl.setopt(pycurl.HEADERFUNCTION, _HeaderFn)
 
-    # Was anything written to the response buffer?
-    if encoded_resp_body.tell():
-      encoded_resp_body.seek(0)
-      response_content = simplejson.load(encoded_resp_body)
-    else:
-      response_content = None
+    thread = threading.Thread(target=_Perform, name="RapiStreamRequest")
+    thread.daemon = True
+    thread.start()
 
-    if http_code != HTTP_OK:
-      if isinstance(response_content, dict):
-        msg = ("%s %s: %s" %
-               (response_content["code"],
-                response_content["message"],
-                response_content["explain"]))
-      else:
-        msg = str(response_content)
+    parser = _JsonListParser(key=key)
+    pending = []
+    try:
+      while True:
+        data = chunks.get()
+        if data is None:
+          break
+        if isinstance(data, Exception):
+          raise data
+
+        if status and status[-1] == HTTP_OK:
+          for item in parser.Feed(data):
+            yield item
+        else:
+          # Status not yet known or an error, keep data until the end
+          pending.append(data)
+
+      thread.join()
+
+      http_code = curl.getinfo(pycurl.RESPONSE_CODE)
+
+      if http_code != HTTP_OK:
+        if pending:
+          response_content = simplejson.loads(_JoinChunks(pending))
+        else:
+          response_content = None
+        _CheckResponseCode(http_code, response_content)
+
+      for data in pending:
+        for item in parser.Feed(data):
+          yield item
+
+      parser.Close()
+    finally:
+      stop.set()
 
-      raise GanetiApiError(msg, code=http_code)
+      # Unblock the transfer thread
+      while thread.is_alive():
+        try:
+          chunks.get(timeout=0.1)
+        except queue.Empty:
+          pass
 
-    return response_content
+      curl.setopt(pycurl.POSTFIELDS, "")
+      curl.setopt(pycurl.WRITEFUNCTION, lambda _: None)
+      curl.setopt(pycurl.HEADERFUNCTION, lambda _: None)
 
   def GetVersion(self):
     """Gets the Remote API version running on the cluster.
@@ -639,6 +1078,16 @@ class GanetiRapiClient(object): # pylint: disable=R0904
 
       raise
 
+  def GetMetrics(self):
+    """Gets the metrics recorded by jobs.
+
+    @rtype: string
+    @return: Metrics in the Prometheus text exposition format
+
+    """
+    return self._SendRequest(HTTP_GET, "/%s/metrics" % GANETI_RAPI_VERSION,
+                             None, None, raw=True)
+
   def GetOperatingSystems(self, reason=None):
     """Gets the Operating Systems running in the Ganeti cluster.
 
@@ -780,6 +1229,33 @@ class GanetiRapiClient(object): # pylint: disable=R0904
     else:
       return [i["id"] for i in instances]
 
+  def IterInstances(self, bulk=False, reason=None):
+    """Iterates over the instances on the cluster.
+
+    Like L{GetInstances}, but the response is processed while it is received.
+    This is recommended for large clusters, especially with C{bulk}.
+
+    @type bulk: bool
+    @param bulk: whether to return all information about all instances
+    @type reason: string
+    @param reason: the reason for executing this operation
+
+    @rtype: iterator of dict or str
+    @return: if bulk is True, info about the instances, else instance names
+
+    """
+    query = []
+    _AppendIf(query, bulk, ("bulk", 1))
+    _AppendReason(query, reason)
+
+    for instance in self._StreamRequest(HTTP_GET,
+                                        "/%s/instances" % GANETI_RAPI_VERSION,
+                                        query, None):
+      if bulk:
+        yield instance
+      else:
+        yield instance["id"]
+
   def GetInstance(self, instance, reason=None):
     """Gets information about an instance.
 
@@ -1619,6 +2095,32 @@ class GanetiRapiClient(object): # pylint: disable=R0904
     else:
       return [n["id"] for n in nodes]
 
+  def IterNodes(self, bulk=False, reason=None):
+    """Iterates over the nodes in the cluster.
+
+    Like L{GetNodes}, but the response is processed while it is received.
+
+    @type bulk: bool
+    @param bulk: whether to return all information about all nodes
+    @type reason: string
+    @param reason: the reason for executing this operation
+
+    @rtype: iterator of dict or str
+    @return: if bulk is true, info about the nodes, else node names
+
+    """
+    query = []
+    _AppendIf(query, bulk, ("bulk", 1))
+    _AppendReason(query, reason)
+
+    for node in self._StreamRequest(HTTP_GET,
+                                    "/%s/nodes" % GANETI_RAPI_VERSION,
+                                    query, None):
+      if bulk:
+        yield node
+      else:
+        yield node["id"]
+
   def GetNode(self, node, reason=None):
     """Gets information about a node.
 
@@ -2274,6 +2776,32 @@ class GanetiRapiClient(object): # pylint: disable=R0904
     else:
       return [g["name"] for g in groups]
 
+  def IterGroups(self, bulk=False, reason=None):
+    """Iterates over the node groups in the cluster.
+
+    Like L{GetGroups}, but the response is processed while it is received.
+
+    @type bulk: bool
+    @param bulk: whether to return all information about the groups
+    @type reason: string
+    @param reason: the reason for executing this operation
+
+    @rtype: iterator of dict or str
+    @return: if bulk is true, info about the node groups, else their names
+
+    """
+    query = []
+    _AppendIf(query, bulk, ("bulk", 1))
+    _AppendReason(query, reason)
+
+    for group in self._StreamRequest(HTTP_GET,
+                                     "/%s/groups" % GANETI_RAPI_VERSION,
+                                     query, None):
+      if bulk:
+        yield group
+      else:
+        yield group["name"]
+
   def GetGroup(self, group, reason=None):
     """Gets information about a node group.
 
@@ -2513,6 +3041,41 @@ class GanetiRapiClient(object): # pylint: disable=R0904
                              ("/%s/query/%s" %
                               (GANETI_RAPI_VERSION, what)), query, body)
 
+  def IterQuery(self, what, fields, qfilter=None, reason=None):
+    """Iterates over the result rows of a query.
+
+    Like L{Query}, but only the rows of the result are returned, and they are
+    processed while the response is received.
+
+    @type what: string
+    @param what: Resource name, one of L{constants.QR_VIA_RAPI}
+    @type fields: list of string
+    @param fields: Requested fields
+    @type qfilter: None or list
+    @param qfilter: Query filter
+    @type reason: string
+    @param reason: the reason for executing this operation
+
+    @rtype: iterator of list
+    @return: Result rows, each containing a (status, value) pair per field
+
+    """
+    query = []
+    _AppendReason(query, reason)
+
+    body = {
+      "fields": fields,
+      }
+
+    _SetItemIf(body, qfilter is not None, "qfilter", qfilter)
+    # TODO: remove "filter" after 2.7
+    _SetItemIf(body, qfilter is not None, "filter", qfilter)
+
+    return self._StreamRequest(HTTP_PUT,
+                               ("/%s/query/%s" %
+                                (GANETI_RAPI_VERSION, what)), query, body,
+                               key="data")
+
   def QueryFields(self, what, fields=None, reason=None):
     """Retrieves available fields for a resource.
 
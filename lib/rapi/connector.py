@@ -274,6 +274,7 @@ def GetHandlers(node_name_pattern, instance_name_pattern,
     "/2/os": rlib2.R_2_os,
     "/2/redistribute-config": rlib2.R_2_redist_config,
     "/2/features": rlib2.R_2_features,
+    "/2/metrics": rlib2.R_2_metrics,
     "/2/modify": rlib2.R_2_cluster_modify,
 
     translate_fn("/2/query/", query_res):
@@ -76,6 +76,7 @@ from ganeti import cli
 from ganeti import rapi
 from ganeti import ht
 from ganeti import compat
+from ganeti import metrics
 from ganeti.rapi import baserlib
 
 
@@ -297,6 +298,23 @@ class R_2_features(baserlib.ResourceBase):
     return list(ALL_FEATURES)
 
 
+class R_2_metrics(baserlib.ResourceBase):
+  """/2/metrics resource.
+
+  """
+  GET_ACCESS = [rapi.RAPI_ACCESS_WRITE, rapi.RAPI_ACCESS_READ]
+
+  def GET(self):
+    """Returns the metrics recorded by jobs.
+
+    The metrics are returned in the Prometheus text exposition format.
+
+    """
+    client = self.GetClient()
+    return baserlib.RawResponse(metrics.PROMETHEUS_CONTENT_TYPE,
+                                metrics.FormatText(client.QueryMetrics()))
+
+
 class R_2_os(baserlib.OpcodeResource):
   """/2/os resource.
 
@@ -571,6 +589,7 @@ class R_2_nodes(baserlib.OpcodeResource):
   """/2/nodes resource.
 
   """
+  GET_CACHEABLE = True
 
   def GET(self):
     """Returns a list of all nodes.
@@ -969,6 +988,7 @@ class R_2_groups(baserlib.OpcodeResource):
   """/2/groups resource.
 
   """
+  GET_CACHEABLE = True
   POST_OPCODE = opcodes.OpGroupAdd
   POST_RENAME = {
     "name": "group_name",
@@ -1111,6 +1131,7 @@ class R_2_instances(baserlib.OpcodeResource):
   """/2/instances resource.
 
   """
+  GET_CACHEABLE = True
   POST_OPCODE = opcodes.OpInstanceCreate
   POST_RENAME = {
     "os": "os_type",
@@ -1649,6 +1670,7 @@ class R_2_query(baserlib.ResourceBase):
   PUT_ACCESS = GET_ACCESS
   GET_OPCODE = opcodes.OpQuery
   PUT_OPCODE = opcodes.OpQuery
+  GET_CACHEABLE = True
 
   def _Query(self, fields, qfilter):
     client = self.GetClient()
@@ -211,10 +211,18 @@ class FakeCurl(object):
                    base64.b64encode(userpwd).decode("ascii"))
 
     path = _GetPathFromUri(url)
-    (code, _, resp_body) = \
+    (code, resp_headers, resp_body) = \
       self._handler.FetchResponse(path, method, headers, request_body)
 
     self._info[pycurl.RESPONSE_CODE] = code
+
+    headerfn = self._opts.get(pycurl.HEADERFUNCTION)
+    if headerfn and isinstance(resp_headers, dict):
+      headerfn("%s %s\r\n" % (http.HTTP_1_1, code))
+      for (name, value) in resp_headers.items():
+        headerfn("%s: %s\r\n" % (name, value))
+      headerfn("\r\n")
+
     if isinstance(resp_body, bytes):
       resp_body = resp_body.decode("utf-8")
     if resp_body is not None:
@@ -225,16 +233,18 @@ class _RapiMock(object):
   """Mocking out the RAPI server parts.
 
   """
-  def __init__(self, user_fn, luxi_client, reqauth=False):
+  def __init__(self, user_fn, luxi_client, reqauth=False, cache=None):
     """Initialize this class.
 
     @type user_fn: callable
     @param user_fn: Function to authentication username
     @param luxi_client: A LUXI client implementation
+    @param cache: Response cache, see L{server.rapi.ResponseCache}
 
     """
     self.handler = \
-      server.rapi.RemoteApiHandler(user_fn, reqauth, _client_cls=luxi_client)
+      server.rapi.RemoteApiHandler(user_fn, reqauth, cache=cache,
+                                   _client_cls=luxi_client)
 
   def FetchResponse(self, path, method, headers, request_body):
     """This is a callback method used to fetch a response.
@@ -262,7 +272,12 @@ class _RapiMock(object):
     (_, _, _, resp_msg) = \
       http.server.HttpResponder(self.handler)(lambda: (req_msg, req_reader))
 
-    return (resp_msg.start_line.code, resp_msg.headers, resp_msg.body)
+    if isinstance(resp_msg.body, http.HttpStreamingBody):
+      resp_body = resp_msg.body.GetValue()
+    else:
+      resp_body = resp_msg.body
+
+    return (resp_msg.start_line.code, resp_msg.headers, resp_body)
 
 
 class _TestLuxiTransport(object):
@@ -44,6 +44,7 @@ import copy
 import logging
 import os
 import threading
+import time
 import zlib
 
 import pycurl
@@ -58,6 +59,7 @@ from ganeti import netutils
 from ganeti import ssconf
 from ganeti import runtime
 from ganeti import compat
+from ganeti import metrics
 from ganeti import rpc_defs
 from ganeti import pathutils
 from ganeti import vcluster
@@ -74,9 +76,61 @@ _RPC_CLIENT_HEADERS = [
   "Expect:",
   ]
 
+#: Content codings accepted for RPC responses
+_RPC_ACCEPT_ENCODING = http.HTTP_CONTENT_ENCODING_DEFLATE
+
 #: Special value to describe an offline host
 _OFFLINE = object()
 
+#: Per-process pool of cURL handles used for RPC requests
+_curl_pool = None
+
+#: Pools inherited from a parent process; they are never used or closed, as
+#: their connections belong to the parent process
+_inherited_curl_pools = []
+
+#: Addresses (IP and port) of node daemons which advertised accepting request
+#: bodies compressed with the "deflate" content coding
+_deflate_peers = set()
+
+_RPC_DURATION = metrics.REGISTRY.Histogram(
+  "ganeti_rpc_duration_seconds",
+  "Time spent in node RPC calls by procedure and phase (encode, prepare,"
+  " transfer, decode)",
+  ["procedure", "phase"])
+
+_RPC_NODE_DURATION = metrics.REGISTRY.Histogram(
+  "ganeti_rpc_node_duration_seconds",
+  "Time until the response of a node to an RPC request was received",
+  ["node"])
+
+_RPC_FAILURES = metrics.REGISTRY.Counter(
+  "ganeti_rpc_failures_total",
+  "Number of failed node RPC requests by procedure",
+  ["procedure"])
+
+
+def _GetCurlPool():
+  """Returns the cURL handle pool of the current process.
+
+  """
+  global _curl_pool # pylint: disable=W0603
+
+  if _curl_pool is not None and _curl_pool.pid != os.getpid():
+    _inherited_curl_pools.append(_curl_pool)
+    _curl_pool = None
+
+  if _curl_pool is None:
+    # SSL sessions are not cached as node daemons of older versions fail the
+    # handshake when a client tries to resume a session
+    _curl_pool = \
+      http.client.HttpClientPool(constants.RPC_POOL_MAX_IDLE_PER_NODE,
+                                 constants.RPC_POOL_MAX_IDLE,
+                                 constants.RPC_POOL_IDLE_TIMEOUT,
+                                 ssl_session_cache=False)
+
+  return _curl_pool
+
 
 def Init():
   """Initializes the module-global HTTP client manager.
@@ -103,6 +157,12 @@ def Shutdown():
   running.
 
   """
+  global _curl_pool # pylint: disable=W0603
+
+  if _curl_pool is not None and _curl_pool.pid == os.getpid():
+    _curl_pool.Close()
+  _curl_pool = None
+
   pycurl.global_cleanup()
 
 
@@ -167,6 +227,110 @@ def _Compress(_, data):
           base64.b64encode(zlib.compress(data, 3)))
 
 
+class _CompressibleData(object):
+  """Data to be compressed for transport over RPC.
+
+  Node daemons accepting compressed request bodies receive the data as is, as
+  the whole body is compressed on the HTTP level. Older node daemons receive
+  the data compressed by L{_Compress}, i.e. encoded in base64.
+
+  """
+  def __init__(self, data):
+    """Initializes this class.
+
+    @type data: bytes
+    @param data: Uncompressed data
+
+    """
+    self._data = data
+    self._compressed = None
+
+  def Encode(self, http_compression):
+    """Returns the data in the form to be serialized.
+
+    @type http_compression: bool
+    @param http_compression: Whether the request body is compressed by HTTP
+
+    """
+    if http_compression:
+      try:
+        return (constants.RPC_ENCODING_NONE, self._data.decode("utf-8"))
+      except UnicodeDecodeError:
+        # Can't be represented in JSON without an encoding
+        pass
+
+    if self._compressed is None:
+      self._compressed = _Compress(None, self._data)
+
+    return self._compressed
+
+
+def _PrepareCompressedData(_, data):
+  """Prepares data for compressed transport over RPC.
+
+  @type data: bytes
+  @param data: Data
+  @return: Data to be encoded, see L{_CompressibleData}
+
+  """
+  # Small amounts of data are not compressed
+  if len(data) < 512 or not isinstance(data, bytes):
+    return (constants.RPC_ENCODING_NONE, data)
+
+  return _CompressibleData(data)
+
+
+class _RequestBody(object):
+  """RPC request body in variants for older and newer node daemons.
+
+  """
+  def __init__(self, legacy, plain):
+    """Initializes this class.
+
+    @type legacy: bytes
+    @param legacy: Body with data compressed by L{_Compress}
+    @type plain: bytes or None
+    @param plain: Body for node daemons accepting compressed request bodies;
+      C{None} if it's the same as C{legacy}
+
+    """
+    self._legacy = legacy
+    self._plain = plain
+    self._deflated = None
+
+  def Get(self, http_compression):
+    """Returns the body to send.
+
+    Bodies are compressed at most once, even when shared among nodes.
+
+    @type http_compression: bool
+    @param http_compression: Whether the node daemon accepts request bodies
+      compressed with the "deflate" content coding
+    @rtype: tuple; (bytes, string or None)
+    @return: Body and its content coding
+
+    """
+    if not http_compression:
+      return (self._legacy, None)
+
+    if self._deflated is None:
+      if self._plain is None:
+        data = self._legacy
+      else:
+        data = self._plain
+
+      if len(data) < constants.RPC_COMPRESSION_MIN_SIZE:
+        self._deflated = (data, None)
+      else:
+        if not isinstance(data, bytes):
+          data = data.encode("utf-8")
+        self._deflated = \
+          (http.EncodeBody(http.HTTP_CONTENT_ENCODING_DEFLATE, data),
+           http.HTTP_CONTENT_ENCODING_DEFLATE)
+
+    return self._deflated
+
+
 class RpcResult(object):
   """RPC Result class.
 
@@ -270,7 +434,7 @@ class RpcResult(object):
 
 
 def _SsconfResolver(ssconf_ips, node_list, _,
-                    ssc=ssconf.SimpleStore,
+                    ssc=compat.partial(ssconf.SimpleStore, cached=True),
                     nslookup_fn=netutils.Hostname.GetIP):
   """Return addresses for given node names.
 
@@ -278,8 +442,9 @@ def _SsconfResolver(ssconf_ips, node_list, _,
   @param ssconf_ips: Use the ssconf IPs
   @type node_list: list
   @param node_list: List of node names
-  @type ssc: class
-  @param ssc: SimpleStore class that is used to obtain node->ip mappings
+  @type ssc: callable
+  @param ssc: function returning the SimpleStore used to obtain node->ip
+      mappings
   @type nslookup_fn: callable
   @param nslookup_fn: function use to do NS lookup
   @rtype: list of tuple; (string, string)
@@ -364,7 +529,8 @@ def _NodeConfigResolver(single_node_fn, all_nodes_fn, node_uuids, opts):
 
 
 class _RpcProcessor(object):
-  def __init__(self, resolver, port, lock_monitor_cb=None):
+  def __init__(self, resolver, port, lock_monitor_cb=None,
+               curl_pool_fn=_GetCurlPool, deflate_peers=_deflate_peers):
     """Initializes this class.
 
     @param resolver: callable accepting a list of node UUIDs or hostnames,
@@ -374,26 +540,44 @@ class _RpcProcessor(object):
     @type port: int
     @param port: TCP port
     @param lock_monitor_cb: Callable for registering with lock monitor
+    @type curl_pool_fn: callable or None
+    @param curl_pool_fn: Function returning the L{http.client.HttpClientPool}
+      to reuse connections from; C{None} to use a new connection for every
+      request
+    @type deflate_peers: set
+    @param deflate_peers: Addresses of node daemons accepting compressed
+      request bodies, updated from the responses
 
     """
     self._resolver = resolver
     self._port = port
     self._lock_monitor_cb = lock_monitor_cb
+    self._curl_pool_fn = curl_pool_fn
+    self._deflate_peers = deflate_peers
 
   @staticmethod
-  def _PrepareRequests(hosts, port, procedure, body, read_timeout):
+  def _PrepareRequests(hosts, port, procedure, body, read_timeout,
+                       deflate_peers=frozenset()):
     """Prepares requests by sorting offline hosts into separate list.
 
+    Request bodies for node daemons in C{deflate_peers} are compressed if
+    they're large enough.
+
     @type body: dict
     @param body: a dictionary with per-host body data
+    @type deflate_peers: set or frozenset
+    @param deflate_peers: Addresses of node daemons accepting compressed
+      request bodies
 
     """
     results = {}
     requests = {}
+    wrapped = {}
 
     assert isinstance(body, dict)
     assert len(body) == len(hosts)
-    assert compat.all(isinstance(v, (str, bytes)) for v in body.values())
+    assert compat.all(isinstance(v, (str, bytes, _RequestBody))
+                      for v in body.values())
     assert frozenset(h[2] for h in hosts) == frozenset(body), \
         "%s != %s" % (hosts, list(body))
 
@@ -404,17 +588,64 @@ class _RpcProcessor(object):
                                            offline=True,
                                            call=procedure)
       else:
+        host_body = body[original_name]
+        if not isinstance(host_body, _RequestBody):
+          # Bodies shared among nodes are wrapped, and compressed, only once
+          host_body = wrapped.setdefault(id(host_body),
+                                         _RequestBody(host_body, None))
+
+        (post_data, encoding) = \
+          host_body.Get((str(ip), port) in deflate_peers)
+
+        headers = _RPC_CLIENT_HEADERS
+        if encoding:
+          headers = headers + ["%s: %s" % (http.HTTP_CONTENT_ENCODING,
+                                           encoding)]
+
         requests[original_name] = \
           http.client.HttpClientRequest(str(ip), port,
                                         http.HTTP_POST, str("/%s" % procedure),
-                                        headers=_RPC_CLIENT_HEADERS,
-                                        post_data=body[original_name],
+                                        headers=headers,
+                                        post_data=post_data,
                                         read_timeout=read_timeout,
                                         nicename="%s/%s" % (name, procedure),
-                                        curl_config_fn=_ConfigRpcCurl)
+                                        curl_config_fn=_ConfigRpcCurl,
+                                        accept_encoding=_RPC_ACCEPT_ENCODING)
 
     return (results, requests)
 
+  @staticmethod
+  def _UpdateDeflatePeers(requests, deflate_peers):
+    """Records which node daemons accept compressed request bodies.
+
+    Node daemons advertise this using the C{Accept-Encoding} response header
+    (RFC7694); older versions don't send it. Only successful responses are
+    taken into account, as error responses may be sent without the header,
+    except for those rejecting the content coding of the request.
+
+    """
+    for req in requests.values():
+      if not req.success or req.resp_headers is None:
+        # No response received
+        continue
+
+      peer = (req.host, req.port)
+
+      if req.resp_status_code == http.HttpUnsupportedMediaType.code:
+        deflate_peers.discard(peer)
+        continue
+
+      if req.resp_status_code != http.HTTP_OK:
+        continue
+
+      accepted = \
+        http.ParseAcceptEncoding(req.resp_headers.get("accept-encoding"))
+
+      if http.HTTP_CONTENT_ENCODING_DEFLATE in accepted:
+        deflate_peers.add(peer)
+      else:
+        deflate_peers.discard(peer)
+
   @staticmethod
   def _CombineResults(results, requests, procedure):
     """Combines pre-computed results for offline hosts with actual call results.
@@ -432,6 +663,7 @@ class _RpcProcessor(object):
           msg = req.resp_body
 
         logging.error("RPC error in %s on node %s: %s", procedure, name, msg)
+        _RPC_FAILURES.Inc(procedure)
         host_result = RpcResult(data=msg, failed=True, node=name,
                                 call=procedure)
 
@@ -459,18 +691,42 @@ class _RpcProcessor(object):
       "Missing RPC read timeout for procedure '%s'" % procedure
 
     if _req_process_fn is None:
-      _req_process_fn = http.client.ProcessRequests
+      if self._curl_pool_fn is None:
+        _req_process_fn = http.client.ProcessRequests
+      else:
+        _req_process_fn = compat.partial(http.client.ProcessRequests,
+                                         curl_pool=self._curl_pool_fn())
+
+    with _RPC_DURATION.Time(procedure, "prepare"):
+      hosts = self._resolver(nodes, resolver_opts)
+      (results, requests) = \
+        self._PrepareRequests(hosts, self._port, procedure, body,
+                              read_timeout, deflate_peers=self._deflate_peers)
+
+    # Response times are recorded per node
+    start = time.time()
+    for (name, _, original_name) in hosts:
+      if original_name in requests:
+        requests[original_name].completion_cb = \
+          compat.partial(_ObserveNodeDuration, start, name)
 
-    (results, requests) = \
-      self._PrepareRequests(self._resolver(nodes, resolver_opts), self._port,
-                            procedure, body, read_timeout)
+    with _RPC_DURATION.Time(procedure, "transfer"):
+      _req_process_fn(list(requests.values()),
+                      lock_monitor_cb=self._lock_monitor_cb)
 
-    _req_process_fn(list(requests.values()),
-                    lock_monitor_cb=self._lock_monitor_cb)
+    self._UpdateDeflatePeers(requests, self._deflate_peers)
 
     assert not frozenset(results).intersection(requests)
 
-    return self._CombineResults(results, requests, procedure)
+    with _RPC_DURATION.Time(procedure, "decode"):
+      return self._CombineResults(results, requests, procedure)
+
+
+def _ObserveNodeDuration(start, name, _):
+  """Records the response time of a node, used as request completion callback.
+
+  """
+  _RPC_NODE_DURATION.Observe(time.time() - start, name)
 
 
 class _RpcClientBase(object):
@@ -496,6 +752,74 @@ class _RpcClientBase(object):
     else:
       return encoder_fn(argkind)(node, value)
 
+  def _EncodeBodies(self, argdefs, args, prep_fn, node_list):
+    """Encodes the request bodies for a call.
+
+    Arguments whose kind is not in L{rpc_defs.ED_NODE_DEPENDENT} are encoded
+    (and possibly compressed) only once, their encoders don't receive a node
+    name. Without node-dependent arguments all nodes share the same body,
+    otherwise the node-independent parts of the body are serialized once and
+    only the others per node. A custom body encoder (C{prep_fn}) always gets
+    all encoded arguments and its result is serialized per node.
+
+    Bodies containing data to be compressed (see L{_CompressibleData}) are
+    serialized for older and newer node daemons, see L{_RequestBody}.
+
+    @rtype: dict
+    @return: Request body per node
+
+    """
+    kinds = [argdef[1] for argdef in argdefs]
+    per_node = [kind in rpc_defs.ED_NODE_DEPENDENT for kind in kinds]
+    shared = [None if dep else self._encoder(None, (kind, value))
+              for (dep, kind, value) in zip(per_node, kinds, args)]
+
+    def _EncodeArgs(node):
+      return [self._encoder(node, (kind, value)) if dep else enc
+              for (dep, enc, kind, value) in zip(per_node, shared, kinds, args)]
+
+    if prep_fn is not None:
+      assert callable(prep_fn)
+      encoded = dict((node, prep_fn(node, _EncodeArgs(node)))
+                     for node in node_list)
+
+      def _Serialize(dumper):
+        return dict((node, dumper.Dump(value))
+                    for (node, value) in encoded.items())
+
+    elif not compat.any(per_node):
+      def _Serialize(dumper):
+        return dict.fromkeys(node_list, dumper.Dump(shared))
+
+    else:
+      encoded = dict((node, _EncodeArgs(node)) for node in node_list)
+
+      def _Serialize(dumper):
+        template = [None if dep else dumper.DumpPart(enc)
+                    for (dep, enc) in zip(per_node, shared)]
+
+        return dict((node,
+                     _JoinBodyParts([dumper.DumpPart(value) if part is None
+                                     else part
+                                     for (part, value) in
+                                       zip(template, encoded[node])]))
+                    for node in node_list)
+
+    legacy_dumper = _BodySerializer(False)
+    bodies = _Serialize(legacy_dumper)
+
+    if not legacy_dumper.compressible:
+      return bodies
+
+    plain_bodies = _Serialize(_BodySerializer(True))
+
+    # Keep bodies shared among nodes shared
+    wrapped = {}
+    return dict((node,
+                 wrapped.setdefault((id(body), id(plain_bodies[node])),
+                                    _RequestBody(body, plain_bodies[node])))
+                for (node, body) in bodies.items())
+
   def _Call(self, cdef, node_list, args):
     """Entry point for automatically generated RPC wrappers.
 
@@ -516,20 +840,11 @@ class _RpcClientBase(object):
     if len(args) != len(argdefs):
       raise errors.ProgrammerError("Number of passed arguments doesn't match")
 
-    if prep_fn is None:
-      prep_fn = lambda _, args: args
-    assert callable(prep_fn)
-
-    # encode the arguments for each node individually, pass them and the node
-    # name to the prep_fn, and serialise its return value
-    encode_args_fn = lambda node: [self._encoder(node, (argdef[1], val)) for
-                                      (argdef, val) in zip(argdefs, args)]
-    pnbody = dict(
-      (n,
-       serializer.DumpJson(prep_fn(n, encode_args_fn(n)),
-                           private_encoder=serializer.EncodeWithPrivateFields))
-      for n in node_list
-    )
+    if node_list:
+      with _RPC_DURATION.Time(procedure, "encode"):
+        pnbody = self._EncodeBodies(argdefs, args, prep_fn, node_list)
+    else:
+      pnbody = {}
 
     result = self._proc(node_list, procedure, pnbody, read_timeout,
                         req_resolver_opts)
@@ -540,6 +855,63 @@ class _RpcClientBase(object):
       return result
 
 
+class _BodySerializer(object):
+  """Serializes RPC request bodies.
+
+  """
+  def __init__(self, http_compression):
+    """Initializes this class.
+
+    @type http_compression: bool
+    @param http_compression: Whether the bodies are for node daemons accepting
+      compressed request bodies
+
+    """
+    self._http_compression = http_compression
+
+    #: Whether a serialized value contained a L{_CompressibleData} object
+    self.compressible = False
+
+  def _EncodeValue(self, value):
+    """Encodes values not natively supported by JSON.
+
+    """
+    if isinstance(value, _CompressibleData):
+      self.compressible = True
+      return value.Encode(self._http_compression)
+
+    return serializer.EncodeWithPrivateFields(value)
+
+  def Dump(self, value):
+    """Serializes an RPC request body.
+
+    @rtype: bytes
+
+    """
+    return serializer.DumpJson(value, private_encoder=self._EncodeValue)
+
+  def DumpPart(self, value):
+    """Serializes one argument of an RPC request body.
+
+    @rtype: bytes
+    @return: Serialized value without the trailing newline
+
+    """
+    return self.Dump(value)[:-1]
+
+
+def _JoinBodyParts(parts):
+  """Combines arguments serialized by L{_BodySerializer.DumpPart}.
+
+  The result is the same as L{_BodySerializer.Dump} on the list of arguments.
+
+  @type parts: list of bytes
+  @rtype: bytes
+
+  """
+  return b"[" + b", ".join(parts) + b"]\n"
+
+
 def _ObjectToDict(_, value):
   """Converts an object to a dictionary.
 
@@ -561,7 +933,8 @@ def _PrepareFileUpload(getents_fn, node, filename):
 
   """
   statcb = utils.FileStatHelper()
-  data = _Compress(node, utils.ReadBinaryFile(filename, preread=statcb))
+  data = _PrepareCompressedData(node,
+                                utils.ReadBinaryFile(filename, preread=statcb))
   st = statcb.st
 
   if getents_fn is None:
@@ -788,7 +1161,7 @@ def PrepareStorageUnitsForNodes(cfg, storage_units, node_uuids):
 _ENCODERS = {
   rpc_defs.ED_OBJECT_DICT: _ObjectToDict,
   rpc_defs.ED_OBJECT_DICT_LIST: _ObjectListToDict,
-  rpc_defs.ED_COMPRESS: _Compress,
+  rpc_defs.ED_COMPRESS: _PrepareCompressedData,
   rpc_defs.ED_FINALIZE_EXPORT_DISKS: _PrepareFinalizeExportDisks,
   rpc_defs.ED_BLOCKDEV_RENAME: _EncodeBlockdevRename,
   }
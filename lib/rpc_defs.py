@@ -84,6 +84,20 @@ ACCEPT_OFFLINE_NODE = object()
  ED_NIC_DICT,
  ED_DEVICE_DICT) = range(1, 17)
 
+#: Argument kinds whose encoding depends on the node a call is made to (disk
+#: parameters are annotated per node); arguments of all other kinds are
+#: encoded only once for all nodes of a call
+ED_NODE_DEPENDENT = frozenset([
+  ED_INST_DICT,
+  ED_INST_DICT_HVP_BEP_DP,
+  ED_NODE_TO_DISK_DICT_DP,
+  ED_INST_DICT_OSP_DP,
+  ED_IMPEXP_IO,
+  ED_DISKS_DICT_DP,
+  ED_MULTI_DISKS_DICT_DP,
+  ED_SINGLE_DISK_DICT_DP,
+  ])
+
 
 def _Prepare(calls):
   """Converts list of calls to dictionary.
@@ -176,6 +190,18 @@ def _ImpExpStatusPostProc(result):
   return result
 
 
+def _DiskWipeStatusPostProc(result):
+  """Post-processor for the status of a background disk wipe.
+
+  @rtype: Payload containing a L{objects.DiskWipeStatus} instance
+
+  """
+  if not result.fail_msg:
+    result.payload = objects.DiskWipeStatus.FromDict(result.payload)
+
+  return result
+
+
 def _TestDelayTimeout(duration):
   """Calculate timeout for "test_delay" RPC.
 
@@ -389,6 +415,19 @@ _BLOCKDEV_CALLS = [
     ("size", None, None),
     ], None, None,
     "Request wipe at given offset with given size of a block device"),
+  ("blockdev_wipe_start", SINGLE, None, constants.RPC_TMO_NORMAL, [
+    ("disks", ED_DISKS_DICT_DP, None),
+    ("offsets", None, "Offsets in MiB to start wiping at"),
+    ("parallel", None, "Maximum number of disks wiped at the same time per"
+     " volume group or file system"),
+    ("instance", ED_INST_DICT, None),
+    ], None, None, "Starts wiping block devices in the background"),
+  ("blockdev_wipe_status", SINGLE, None, constants.RPC_TMO_FAST, [
+    ("name", None, "Wipe name"),
+    ], None, _DiskWipeStatusPostProc, "Gets the status of a background wipe"),
+  ("blockdev_wipe_cleanup", SINGLE, None, constants.RPC_TMO_NORMAL, [
+    ("name", None, "Wipe name"),
+    ], None, None, "Stops a background wipe and cleans up after it"),
   ("blockdev_remove", SINGLE, None, constants.RPC_TMO_NORMAL, [
     ("bdev", ED_SINGLE_DISK_DICT_DP, None),
     ], None, None, "Request removal of a given block device"),
@@ -467,6 +506,15 @@ _BLOCKDEV_CALLS = [
     ("disks", ED_DISKS_DICT_DP, None),
     ], None, _BlockdevGetMirrorStatusPostProc,
     "Request status of a (mirroring) device"),
+  ("blockdev_wait_sync_change", SINGLE, None, constants.RPC_TMO_NORMAL, [
+    ("disks", ED_DISKS_DICT_DP, None),
+    ("sync_percents", None, "Last known synchronization percentages"),
+    ("sync_states", None,
+     "Last known (is_degraded, ldisk_status) of each disk"),
+    ("percent_step", None, "Size of a progress step in percent"),
+    ("timeout", None, "Maximum number of seconds to wait"),
+    ], None, _BlockdevGetMirrorStatusPostProc,
+    "Wait for a change of the status of (mirroring) devices"),
   ("blockdev_getmirrorstatus_multi", MULTI, None, constants.RPC_TMO_NORMAL, [
     ("node_disks", ED_NODE_TO_DISK_DICT_DP, None),
     ], _BlockdevGetMirrorStatusMultiPreProc,
@@ -77,6 +77,81 @@ def DumpJson(data, private_encoder=None):
   return txt.encode("utf-8")
 
 
+#: Approximate size of the chunks produced by L{DumpJsonChunks}
+JSON_CHUNK_SIZE = 64 * 1024
+
+
+def _IterJson(encoder, data, depth):
+  """Encodes an object, yielding the elements of lists one by one.
+
+  Lists and dictionaries down to C{depth} levels are split into their
+  elements, everything below is encoded in one go.
+
+  """
+  if depth > 0 and isinstance(data, list):
+    yield "["
+    for (idx, item) in enumerate(data):
+      if idx:
+        yield ", "
+      for part in _IterJson(encoder, item, depth - 1):
+        yield part
+    yield "]"
+
+  elif (depth > 0 and isinstance(data, dict) and
+        all(isinstance(key, str) for key in data)):
+    yield "{"
+    for (idx, (key, value)) in enumerate(data.items()):
+      if idx:
+        yield ", "
+      yield encoder.encode(key)
+      yield ": "
+      for part in _IterJson(encoder, value, depth - 1):
+        yield part
+    yield "}"
+
+  else:
+    yield encoder.encode(data)
+
+
+def DumpJsonChunks(data, private_encoder=None, chunk_size=JSON_CHUNK_SIZE,
+                   depth=2):
+  """Serialize a given object incrementally.
+
+  The concatenated output is the same as the one of L{DumpJson}, but only
+  about C{chunk_size} bytes are held in memory at a time. This is meant for
+  large lists, e.g. the rows of a query result.
+
+  @param data: the data to serialize
+  @param private_encoder: see L{DumpJson}
+  @type chunk_size: int
+  @param chunk_size: minimum size of the produced chunks (except the last)
+  @type depth: int
+  @param depth: how many levels of nested lists and dictionaries are encoded
+    element by element; values below are encoded at once
+  @return: iterator over chunks of bytes
+
+  """
+  if private_encoder is None:
+    private_encoder = EncodeWithoutPrivateFields
+  encoder = simplejson.JSONEncoder(default=private_encoder)
+
+  buf = []
+  size = 0
+
+  for part in _IterJson(encoder, data, depth):
+    buf.append(part)
+    size += len(part)
+    if size >= chunk_size:
+      yield "".join(buf).encode("utf-8")
+      buf = []
+      size = 0
+
+  # Without indentation there are no line breaks, hence no need to remove
+  # trailing whitespace like L{DumpJson} does
+  buf.append("\n")
+  yield "".join(buf).encode("utf-8")
+
+
 def LoadJson(data):
   """Unserialize data from bytes.
 
@@ -43,6 +43,7 @@ import logging
 from ganeti import config
 from ganeti import constants
 from ganeti import jqueue
+from ganeti.jqueue import replication
 from ganeti import utils
 import ganeti.rpc.node as rpc
 
@@ -81,7 +82,8 @@ class GanetiContext(object):
     # Job queue
     cfg = self.GetConfig(None)
     logging.debug("Creating the job queue")
-    self.jobqueue = jqueue.JobQueue(self, cfg)
+    self.jobqueue = jqueue.JobQueue(
+      self, cfg, replication_max_lag=replication.GetMaxLag())
 
     # setting this also locks the class against attribute modifications
     self.__class__._instance = self
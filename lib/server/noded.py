@@ -53,6 +53,7 @@ from ganeti import daemon
 from ganeti import http
 from ganeti import utils
 from ganeti.storage import container
+from ganeti.storage import lvmcache
 from ganeti import serializer
 from ganeti import netutils
 from ganeti import pathutils
@@ -63,6 +64,10 @@ import ganeti.http.server # pylint: disable=W0611
 
 queue_lock = None
 
+#: Seconds an idle connection is kept open by default when a pool of worker
+#: processes is used
+_DEFAULT_KEEP_ALIVE_TIMEOUT = 2.0
+
 
 def _extendReasonTrail(trail, source, reason=""):
   """Extend the reason trail with noded information
@@ -165,6 +170,8 @@ class NodeRequestHandler(http.server.HttpServerHandler):
   # too many public methods, and unused args - all methods get params
   # due to the API
   # pylint: disable=R0904,W0613
+  RESPONSE_COMPRESSION_MIN_SIZE = constants.RPC_COMPRESSION_MIN_SIZE
+
   def __init__(self):
     http.server.HttpServerHandler.__init__(self)
     self.noded_pid = os.getpid()
@@ -185,6 +192,10 @@ class NodeRequestHandler(http.server.HttpServerHandler):
     if method is None:
       raise http.HttpNotFound()
 
+    # Worker processes serve many requests, and LVM may have been changed by
+    # another process in the meantime; only reuse reports within a request
+    lvmcache.Invalidate()
+
     try:
       result = (True, method(serializer.LoadJson(req.request_body)))
 
@@ -258,6 +269,30 @@ class NodeRequestHandler(http.server.HttpServerHandler):
     bdev = objects.Disk.FromDict(bdev_s)
     return backend.BlockdevWipe(bdev, offset, size)
 
+  @staticmethod
+  def perspective_blockdev_wipe_start(params):
+    """Start wiping block devices in the background.
+
+    """
+    disks_s, offsets, parallel, instance_s = params
+    disks = [objects.Disk.FromDict(bdev_s) for bdev_s in disks_s]
+    instance = objects.Instance.FromDict(instance_s)
+    return backend.StartDiskWipe(disks, offsets, parallel, instance)
+
+  @staticmethod
+  def perspective_blockdev_wipe_status(params):
+    """Retrieves the status of a background wipe.
+
+    """
+    return backend.GetDiskWipeStatus(params[0])
+
+  @staticmethod
+  def perspective_blockdev_wipe_cleanup(params):
+    """Cleans up after a background wipe.
+
+    """
+    return backend.CleanupDiskWipe(params[0])
+
   @staticmethod
   def perspective_blockdev_remove(params):
     """Remove a block device.
@@ -338,6 +373,18 @@ class NodeRequestHandler(http.server.HttpServerHandler):
     return [status.ToDict()
             for status in backend.BlockdevGetmirrorstatus(disks)]
 
+  @staticmethod
+  def perspective_blockdev_wait_sync_change(params):
+    """Wait for a change of the mirror status of a list of disks.
+
+    """
+    (disks, sync_percents, sync_states, percent_step, timeout) = params
+    disks = [objects.Disk.FromDict(dsk_s) for dsk_s in disks]
+    result = backend.BlockdevWaitForSyncChange(disks, sync_percents,
+                                               sync_states, percent_step,
+                                               timeout)
+    return [status.ToDict() for status in result]
+
   @staticmethod
   def perspective_blockdev_getmirrorstatus_multi(params):
     """Return the mirror status for a list of disks.
@@ -1295,6 +1342,22 @@ def CheckNoded(options, args):
                           sys.argv[0], file=sys.stderr)
     sys.exit(constants.EXIT_FAILURE)
 
+  if options.worker_pool_size < 0:
+    print("%s --worker-pool-size argument must be >= 0" %
+                          sys.argv[0], file=sys.stderr)
+    sys.exit(constants.EXIT_FAILURE)
+
+  if options.worker_max_requests < 0:
+    print("%s --worker-max-requests argument must be >= 0" %
+                          sys.argv[0], file=sys.stderr)
+    sys.exit(constants.EXIT_FAILURE)
+
+  if (options.keep_alive_timeout is not None and
+      options.keep_alive_timeout < 0):
+    print("%s --keep-alive-timeout argument must be >= 0" %
+                          sys.argv[0], file=sys.stderr)
+    sys.exit(constants.EXIT_FAILURE)
+
 
 def SSLVerifyPeer(conn, cert, errnum, errdepth, ok):
   """Callback function to verify a peer against the candidate cert map.
@@ -1346,7 +1409,7 @@ def SSLVerifyPeer(conn, cert, errnum, errdepth, ok):
                     " certificate: %s.", cert_digest, server_digest)
     return match
   elif errdepth == 0:
-    sstore = ssconf.SimpleStore()
+    sstore = ssconf.SimpleStore(cached=True)
     try:
       candidate_certs = sstore.GetMasterCandidatesCertMap()
     except errors.ConfigurationError:
@@ -1399,12 +1462,26 @@ def PrepNoded(options, _):
 
   handler = NodeRequestHandler()
 
+  keep_alive_timeout = options.keep_alive_timeout
+  if keep_alive_timeout is None:
+    # Idle connections occupy a process; unlike forked children, workers
+    # are there anyway, so they can wait for further requests
+    if options.worker_pool_size:
+      keep_alive_timeout = _DEFAULT_KEEP_ALIVE_TIMEOUT
+    else:
+      keep_alive_timeout = 0
+
   mainloop = daemon.Mainloop()
   server = http.server.HttpServer(
       mainloop, options.bind_address, options.port, options.max_clients,
       handler, ssl_params=ssl_params, ssl_verify_peer=True,
       request_executor_class=request_executor_class,
-      ssl_verify_callback=SSLVerifyPeer)
+      ssl_verify_callback=SSLVerifyPeer,
+      worker_pool_size=options.worker_pool_size,
+      worker_max_requests=_DefaultAlternative(options.worker_max_requests,
+                                              None),
+      keep_alive_timeout=keep_alive_timeout,
+      log_request_timing=options.log_request_timing)
   server.Start()
 
   return (mainloop, server)
@@ -1437,6 +1514,27 @@ def Main():
                     default=20, type="int",
                     help="Number of simultaneous connections accepted"
                     " by noded")
+  parser.add_option("--worker-pool-size", dest="worker_pool_size",
+                    default=0, type="int",
+                    help="Number of pre-forked worker processes handling"
+                    " requests; by default a new process is forked for"
+                    " every connection")
+  parser.add_option("--worker-max-requests", dest="worker_max_requests",
+                    default=1000, type="int",
+                    help="Number of connections handled by a pre-forked"
+                    " worker process before it is replaced (0 for no"
+                    " limit)")
+  parser.add_option("--keep-alive-timeout", dest="keep_alive_timeout",
+                    default=None, type="float",
+                    help="Seconds to wait for another request on an idle"
+                    " connection before closing it (0 closes connections"
+                    " after one request); defaults to %s with"
+                    " --worker-pool-size and to 0 otherwise" %
+                    _DEFAULT_KEEP_ALIVE_TIMEOUT)
+  parser.add_option("--log-request-timing", dest="log_request_timing",
+                    default=False, action="store_true",
+                    help="Log the time spent setting up and handling every"
+                    " request at info level")
 
   daemon.GenericMain(constants.NODED, parser, CheckNoded, PrepNoded, ExecNoded,
                      default_ssl_cert=pathutils.NODED_CERT_FILE,
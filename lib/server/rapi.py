@@ -37,12 +37,16 @@
 
 from __future__ import print_function
 
+import collections
+import email.utils
+import hashlib
 import logging
 import optparse
 import sys
 import os
 import os.path
 import errno
+import time
 
 try:
   from pyinotify import pyinotify # pylint: disable=E0611
@@ -66,6 +70,22 @@ import ganeti.http.auth   # pylint: disable=W0611
 import ganeti.http.server # pylint: disable=W0611
 
 
+#: Configuration values whose change invalidates cached responses; if the
+#: master daemon doesn't know them, responses are never cached
+_CACHE_VALIDATOR_FIELDS = ["config_serial", "queue_serial"]
+
+#: Default maximum age of cached responses in seconds; caching is disabled
+#: by default, as it costs an additional LUXI call per cacheable request and
+#: runtime data can be returned up to the maximum age late
+DEFAULT_CACHE_MAX_AGE = 0
+
+#: Maximum number of responses kept in the cache
+_CACHE_MAX_ENTRIES = 32
+
+#: Minimum length of a list in a response for the response to be streamed
+_STREAMING_MIN_ITEMS = 500
+
+
 class RemoteApiRequestContext(object):
   """Data structure for Remote API requests.
 
@@ -75,6 +95,130 @@ class RemoteApiRequestContext(object):
     self.handler_fn = None
     self.handler_access = None
     self.body_data = None
+    self.username = None
+
+
+class ResponseCache(object):
+  """Cache for serialized responses of read-only resources.
+
+  Entity tags are computed from the request key, the configuration and job
+  queue serial numbers and the current time slot of C{max_age} seconds. They
+  can therefore be checked without running the actual query, even in a
+  process which has never seen the response before. Responses are kept in
+  memory until their tag changes or they are evicted.
+
+  """
+  def __init__(self, max_age, max_entries=_CACHE_MAX_ENTRIES,
+               _time_fn=time.time):
+    """Initializes this class.
+
+    @type max_age: number
+    @param max_age: Maximum age of a response in seconds; the configuration
+      serial number doesn't cover runtime data such as the instance status
+    @type max_entries: int
+    @param max_entries: Maximum number of cached responses; with zero only
+      entity tags are used, e.g. in processes handling a single connection
+
+    """
+    assert max_age > 0
+    assert max_entries >= 0
+
+    self._max_age = max_age
+    self._max_entries = max_entries
+    self._time_fn = _time_fn
+    self._entries = collections.OrderedDict()
+
+  def GetTag(self, key, validator):
+    """Computes the entity tag for a response.
+
+    @type key: tuple
+    @param key: Request key, consisting of the request path (including query
+      arguments) and the username
+    @type validator: tuple
+    @param validator: Configuration and job queue serial numbers
+    @rtype: string
+
+    """
+    timeslot = int(self._time_fn() // self._max_age)
+    data = serializer.DumpJson([list(key), list(validator), timeslot])
+    return "\"%s\"" % hashlib.sha1(data).hexdigest()
+
+  def StoresResponses(self):
+    """Returns whether responses are kept in memory.
+
+    """
+    return self._max_entries > 0
+
+  def Get(self, key, etag):
+    """Returns a cached response.
+
+    @type key: tuple
+    @param key: Request key
+    @type etag: string
+    @param etag: Current entity tag for the request
+    @rtype: None or tuple; (float, bytes)
+    @return: Modification time and serialized body of the response if it is
+      cached and still current
+
+    """
+    entry = self._entries.get(key, None)
+    if entry is None:
+      return None
+
+    (entry_etag, mtime, body) = entry
+    if entry_etag != etag:
+      del self._entries[key]
+      return None
+
+    self._entries.move_to_end(key)
+
+    return (mtime, body)
+
+  def Put(self, key, etag, mtime, body):
+    """Stores a response.
+
+    @type key: tuple
+    @param key: Request key
+    @type etag: string
+    @param etag: Entity tag of the response
+    @type mtime: float
+    @param mtime: Time at which the response was generated
+    @type body: bytes
+    @param body: Serialized response body
+
+    """
+    if not self._max_entries:
+      return
+
+    self._entries.pop(key, None)
+    self._entries[key] = (etag, mtime, body)
+
+    while len(self._entries) > self._max_entries:
+      self._entries.popitem(last=False)
+
+
+def _MatchETag(header, etag):
+  """Checks whether an C{If-None-Match} header matches an entity tag.
+
+  @type header: string or None
+  @param header: Value of the C{If-None-Match} request header
+  @type etag: string
+  @param etag: Current entity tag
+  @rtype: bool
+
+  """
+  if not header:
+    return False
+
+  for value in header.split(","):
+    value = value.strip()
+    if value.startswith("W/"):
+      # Weak comparison is used for GET requests
+      value = value[2:]
+    if value in ("*", etag):
+      return True
+
+  return False
 
 
 class RemoteApiHandler(http.auth.HttpServerRequestAuthentication,
@@ -84,7 +228,7 @@ class RemoteApiHandler(http.auth.HttpServerRequestAuthentication,
   """
   AUTH_REALM = "Ganeti Remote API"
 
-  def __init__(self, user_fn, reqauth, _client_cls=None):
+  def __init__(self, user_fn, reqauth, cache=None, _client_cls=None):
     """Initializes this class.
 
     @type user_fn: callable
@@ -92,6 +236,8 @@ class RemoteApiHandler(http.auth.HttpServerRequestAuthentication,
       L{http.auth.PasswordFileUser} or C{None} if user is not found
     @type reqauth: bool
     @param reqauth: Whether to require authentication
+    @type cache: L{ResponseCache} or None
+    @param cache: Cache for responses of read-only resources
 
     """
     # pylint: disable=W0233
@@ -102,6 +248,7 @@ class RemoteApiHandler(http.auth.HttpServerRequestAuthentication,
     self._resmap = connector.Mapper()
     self._user_fn = user_fn
     self._reqauth = reqauth
+    self._cache = cache
 
   @staticmethod
   def FormatErrorMessage(values):
@@ -175,6 +322,7 @@ class RemoteApiHandler(http.auth.HttpServerRequestAuthentication,
     if (not ctx.handler_access or
         set(user.options).intersection(ctx.handler_access)):
       # Allow access
+      ctx.username = username
       return True
 
     # Access forbidden
@@ -204,29 +352,130 @@ class RemoteApiHandler(http.auth.HttpServerRequestAuthentication,
     else:
       ctx.body_data = None
 
-    try:
-      result = ctx.handler_fn()
-    except rpcerr.TimeoutError:
-      raise http.HttpGatewayTimeout()
-    except rpcerr.ProtocolError as err:
-      raise http.HttpBadGateway(str(err))
-
     req.resp_headers[http.HTTP_CONTENT_TYPE] = http.HTTP_APP_JSON
 
-    return serializer.DumpJson(result)
+    if (self._cache is not None and
+        req.request_method.upper() == http.HTTP_GET and
+        ctx.handler.GET_CACHEABLE and not ctx.handler.useLocking()):
+      validator = _CallHandler(ctx.handler.GetClient().QueryConfigValues,
+                               _CACHE_VALIDATOR_FIELDS)
+      if None not in validator:
+        return self._HandleCacheableRequest(req, ctx, tuple(validator))
+
+    result = _CallHandler(ctx.handler_fn)
+
+    if isinstance(result, baserlib.RawResponse):
+      req.resp_headers[http.HTTP_CONTENT_TYPE] = result.content_type
+      return result.body
+
+    return _SerializeResult(result)
+
+  def _HandleCacheableRequest(self, req, ctx, validator):
+    """Handles a request whose response may be cached.
+
+    @type validator: tuple
+    @param validator: Current configuration and job queue serial numbers
+
+    """
+    key = (req.request_path, ctx.username)
+    etag = self._cache.GetTag(key, validator)
+
+    req.resp_headers[http.HTTP_ETAG] = etag
+
+    if _MatchETag(req.request_headers.get(http.HTTP_IF_NONE_MATCH), etag):
+      req.resp_code = http.HTTP_NOT_MODIFIED
+      return b""
+
+    cached = self._cache.Get(key, etag)
+    if cached is None:
+      body = _SerializeResult(_CallHandler(ctx.handler_fn))
+      mtime = time.time()
+      if not isinstance(body, http.HttpStreamingBody):
+        self._cache.Put(key, etag, mtime, body)
+      elif self._cache.StoresResponses():
+        body = http.HttpStreamingBody(
+          _StoreWhenComplete(body, compat.partial(self._cache.Put, key, etag,
+                                                  mtime)))
+    else:
+      (mtime, body) = cached
+
+    req.resp_headers[http.HTTP_LAST_MODIFIED] = \
+      email.utils.formatdate(mtime, usegmt=True)
+
+    return body
+
+
+def _SerializeResult(result):
+  """Serializes the result of a handler function.
+
+  Results containing long lists, e.g. bulk lists of instances or the rows of
+  a query, are encoded while being sent instead of at once.
+
+  @rtype: bytes or L{http.HttpStreamingBody}
+
+  """
+  if isinstance(result, dict):
+    values = result.values()
+  else:
+    values = [result]
+
+  if compat.any(isinstance(value, list) and
+                len(value) >= _STREAMING_MIN_ITEMS
+                for value in values):
+    return http.HttpStreamingBody(serializer.DumpJsonChunks(result))
+
+  return serializer.DumpJson(result)
+
+
+def _StoreWhenComplete(chunks, fn):
+  """Passes through chunks and calls a function with the complete body.
+
+  The function is not called if the chunks are not consumed completely,
+  e.g. because the connection was closed.
+
+  """
+  buf = []
+  for chunk in chunks:
+    buf.append(chunk)
+    yield chunk
+
+  fn(b"".join(buf))
+
+
+def _CallHandler(fn, *args):
+  """Calls a handler function, converting LUXI errors to HTTP errors.
+
+  """
+  try:
+    return fn(*args)
+  except rpcerr.TimeoutError:
+    raise http.HttpGatewayTimeout()
+  except rpcerr.ProtocolError as err:
+    raise http.HttpBadGateway(str(err))
 
 
 class RapiUsers(object):
-  def __init__(self):
+  def __init__(self, check_changes=False):
     """Initializes this class.
 
+    @type check_changes: bool
+    @param check_changes: Whether to check for changes of the users file on
+      every lookup; used by pre-forked worker processes, which don't receive
+      the inotify events of the parent process
+
     """
     self._users = None
+    self._check_changes = check_changes
+    self._filename = None
+    self._file_id = None
 
   def Get(self, username):
     """Checks whether a user exists.
 
     """
+    if self._check_changes and self._filename is not None:
+      self._ReloadIfChanged()
+
     if self._users:
       return self._users.get(username, None)
     else:
@@ -240,6 +489,8 @@ class RapiUsers(object):
 
     """
     logging.info("Reading users file at %s", filename)
+    self._filename = filename
+    self._file_id = _GetFileIdOrNone(filename)
     try:
       try:
         contents = utils.ReadFile(filename)
@@ -262,6 +513,23 @@ class RapiUsers(object):
 
     return True
 
+  def _ReloadIfChanged(self):
+    """Reloads the users file if it changed since it was last read.
+
+    """
+    if _GetFileIdOrNone(self._filename) != self._file_id:
+      self.Load(self._filename)
+
+
+def _GetFileIdOrNone(filename):
+  """Returns the file ID of a file or C{None} if it can't be accessed.
+
+  """
+  try:
+    return utils.GetFileID(path=filename)
+  except EnvironmentError:
+    return None
+
 
 class FileEventHandler(asyncnotifier.FileEventHandlerBase):
   def __init__(self, wm, path, cb):
@@ -325,6 +593,14 @@ def CheckRapi(options, args):
                           sys.argv[0], file=sys.stderr)
     sys.exit(constants.EXIT_FAILURE)
 
+  for (value, name) in [(options.worker_pool_size, "--worker-pool-size"),
+                        (options.worker_max_requests, "--worker-max-requests"),
+                        (options.cache_max_age, "--cache-max-age")]:
+    if value < 0:
+      print("%s %s argument must be >= 0" % (sys.argv[0], name),
+            file=sys.stderr)
+      sys.exit(constants.EXIT_FAILURE)
+
   ssconf.CheckMaster(options.debug)
 
   # Read SSL certificate (this is a little hackish to read the cert as root)
@@ -342,9 +618,18 @@ def PrepRapi(options, _):
   """
   mainloop = daemon.Mainloop()
 
-  users = RapiUsers()
+  users = RapiUsers(check_changes=bool(options.worker_pool_size))
+
+  if options.cache_max_age:
+    if options.worker_pool_size:
+      cache = ResponseCache(options.cache_max_age)
+    else:
+      # Every connection is handled in a new process, only entity tags help
+      cache = ResponseCache(options.cache_max_age, max_entries=0)
+  else:
+    cache = None
 
-  handler = RemoteApiHandler(users.Get, options.reqauth)
+  handler = RemoteApiHandler(users.Get, options.reqauth, cache=cache)
 
   # Setup file watcher (it'll be driven by asyncore)
   SetupFileWatcher(pathutils.RAPI_USERS_FILE,
@@ -354,7 +639,9 @@ def PrepRapi(options, _):
 
   server = http.server.HttpServer(
       mainloop, options.bind_address, options.port, options.max_clients,
-      handler, ssl_params=options.ssl_params, ssl_verify_peer=False)
+      handler, ssl_params=options.ssl_params, ssl_verify_peer=False,
+      worker_pool_size=options.worker_pool_size,
+      worker_max_requests=(options.worker_max_requests or None))
   server.Start()
 
   return (mainloop, server)
@@ -391,6 +678,21 @@ def Main():
   parser.add_option("--ssl-chain", dest="ssl_chain",
                     help="SSL Certificate chain path",
                     default=None, type="string")
+  parser.add_option("--worker-pool-size", dest="worker_pool_size",
+                    default=0, type="int",
+                    help="Number of pre-forked worker processes handling"
+                    " requests; by default a new process is forked for"
+                    " every connection")
+  parser.add_option("--worker-max-requests", dest="worker_max_requests",
+                    default=1000, type="int",
+                    help="Number of connections handled by a pre-forked"
+                    " worker process before it is replaced (0 for no"
+                    " limit)")
+  parser.add_option("--cache-max-age", dest="cache_max_age",
+                    default=DEFAULT_CACHE_MAX_AGE, type="int",
+                    help=("Maximum age in seconds of cached responses for"
+                          " read-only resources (default 0, which disables"
+                          " caching)"))
 
   daemon.GenericMain(constants.RAPI, parser, CheckRapi, PrepRapi, ExecRapi,
                      default_ssl_cert=pathutils.RAPI_CERT_FILE,
@@ -35,9 +35,13 @@ configuration data, which is mostly static and available to all nodes.
 
 """
 
+import os
 import sys
+import copy
+import time
 import errno
 import logging
+import threading
 
 from ganeti import errors
 from ganeti import constants
@@ -77,6 +81,202 @@ def ReadSsconfFile(filename):
   return data.rstrip("\n")
 
 
+def _ParseList(data):
+  """Parses the value of a list key.
+
+  """
+  return data.splitlines(False)
+
+
+def _ParseMap(data):
+  """Parses the value of a key with lines like key=value.
+
+  """
+  mapping = {}
+  for line in data.splitlines(False):
+    (key, value) = line.split("=")
+    mapping[key] = value
+  return mapping
+
+
+def _ParseSshPortMap(data):
+  """Parses the map of node names to SSH ports.
+
+  """
+  return dict((node_name, int(ssh_port))
+              for (node_name, ssh_port) in _ParseMap(data).items())
+
+
+def _ParseVmCapable(data):
+  """Parses the map of node UUIDs to vm capable values.
+
+  """
+  return dict((node_uuid, vm_capable == "True")
+              for (node_uuid, vm_capable) in _ParseMap(data).items())
+
+
+class _SsconfCache(object):
+  """Contents of the ssconf files of a directory.
+
+  All files are read in one pass and kept in memory until the directory
+  changes. As ssconf files are always replaced by renaming a new file into
+  the directory, the modification time of the directory changes with every
+  update; checking it costs a single C{stat} call per access. inotify is
+  not used, as the watch descriptor would be shared by forked processes,
+  such as the workers of the node daemon, which would then steal each
+  other's events.
+
+  """
+  #: Minimum age in seconds of the directory for its modification time to be
+  #: trusted; changes within the timestamp granularity can't be detected
+  _MIN_AGE = 1.0
+
+  def __init__(self, cfg_dir, _time_fn=time.time):
+    """Initializes this class.
+
+    @type cfg_dir: string
+    @param cfg_dir: the ssconf directory
+
+    """
+    self._cfg_dir = cfg_dir
+    self._time_fn = _time_fn
+    self._lock = threading.Lock()
+    self._stamp = None
+    self._values = None
+    self._parsed = {}
+    self._generation = 0
+
+  def _GetStamp(self):
+    """Returns the identity and modification time of the directory.
+
+    """
+    try:
+      st = os.stat(self._cfg_dir)
+    except EnvironmentError:
+      return None
+    return (st.st_dev, st.st_ino, st.st_mtime_ns)
+
+  def _Load(self):
+    """Reads all ssconf files of the directory.
+
+    Files which couldn't be read are left out and read again when they are
+    requested, so that the error is reported to the caller.
+
+    """
+    try:
+      names = frozenset(os.listdir(self._cfg_dir))
+    except EnvironmentError:
+      names = frozenset()
+
+    values = {}
+    for key in _VALID_KEYS:
+      filename = constants.SSCONF_FILEPREFIX + key
+      if filename not in names:
+        values[key] = None
+        continue
+      try:
+        values[key] = ReadSsconfFile(utils.PathJoin(self._cfg_dir, filename))
+      except (EnvironmentError, RuntimeError) as err:
+        logging.debug("Can't read ssconf file %s: %s", filename, err)
+    return values
+
+  def _Update(self):
+    """Reloads the files if the directory changed.
+
+    Must be called with the lock held.
+
+    """
+    stamp = self._GetStamp()
+    if (self._values is not None and stamp is not None and
+        stamp == self._stamp):
+      return
+
+    # Take the stamp before reading, so changes made while reading are
+    # noticed on the next access
+    values = self._Load()
+    if stamp is not None and \
+       self._time_fn() - stamp[2] / 1e9 < self._MIN_AGE:
+      stamp = None
+
+    self._stamp = stamp
+    self._values = values
+    self._parsed = {}
+    self._generation += 1
+
+  def Invalidate(self):
+    """Forces the files to be read again on the next access.
+
+    """
+    with self._lock:
+      self._values = None
+      self._stamp = None
+
+  def Get(self, key):
+    """Returns the value of a key.
+
+    @rtype: string
+    @raise EnvironmentError: if the file doesn't exist
+    @return: the value, or C{None} if the file couldn't be read
+
+    """
+    with self._lock:
+      self._Update()
+      try:
+        value = self._values[key]
+      except KeyError:
+        return None
+
+    if value is None:
+      raise EnvironmentError(errno.ENOENT, os.strerror(errno.ENOENT),
+                             self._cfg_dir + "/" +
+                             constants.SSCONF_FILEPREFIX + key)
+    return value
+
+  def GetParsed(self, key, parse_fn, read_fn):
+    """Returns the parsed value of a key.
+
+    @type parse_fn: callable
+    @param parse_fn: function parsing the value
+    @type read_fn: callable
+    @param read_fn: function reading the value of a key
+
+    """
+    memo_key = (key, parse_fn)
+    with self._lock:
+      self._Update()
+      try:
+        return self._parsed[memo_key]
+      except KeyError:
+        pass
+      generation = self._generation
+
+    value = parse_fn(read_fn(key))
+
+    with self._lock:
+      if generation == self._generation:
+        self._parsed[memo_key] = value
+    return value
+
+
+#: Caches of ssconf directories, shared by all cached L{SimpleStore}s
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def _GetCache(cfg_dir):
+  """Returns the cache of an ssconf directory.
+
+  @rtype: L{_SsconfCache}
+
+  """
+  with _caches_lock:
+    try:
+      return _caches[cfg_dir]
+    except KeyError:
+      cache = _caches[cfg_dir] = _SsconfCache(cfg_dir)
+      return cache
+
+
 class SimpleStore(object):
   """Interface to static cluster data.
 
@@ -87,8 +287,13 @@ class SimpleStore(object):
   Other particularities of the datastore:
     - keys are restricted to predefined values
 
+  With C{cached} set, all files are read at once and kept in memory, shared
+  by all cached stores of the same directory, until the directory changes.
+  This is meant for long-running processes reading ssconf values often.
+
   """
-  def __init__(self, cfg_location=None, _lockfile=pathutils.SSCONF_LOCK_FILE):
+  def __init__(self, cfg_location=None, _lockfile=pathutils.SSCONF_LOCK_FILE,
+               cached=False):
     if cfg_location is None:
       self._cfg_dir = pathutils.DATA_DIR
     else:
@@ -96,6 +301,11 @@ class SimpleStore(object):
 
     self._lockfile = _lockfile
 
+    if cached:
+      self._cache = _GetCache(self._cfg_dir)
+    else:
+      self._cache = None
+
   def KeyToFilename(self, key):
     """Convert a given key into filename.
 
@@ -116,6 +326,10 @@ class SimpleStore(object):
     """
     filename = self.KeyToFilename(key)
     try:
+      if self._cache is not None:
+        value = self._cache.Get(key)
+        if value is not None:
+          return value
       return ReadSsconfFile(filename)
     except EnvironmentError as err:
       if err.errno == errno.ENOENT and default is not None:
@@ -143,6 +357,17 @@ class SimpleStore(object):
 
     return dict(result)
 
+  def _GetParsed(self, key, parse_fn):
+    """Reads a key and parses its value.
+
+    With a cache, the value is only parsed once and a copy of the result is
+    returned.
+
+    """
+    if self._cache is None:
+      return parse_fn(self._ReadFile(key))
+    return copy.copy(self._cache.GetParsed(key, parse_fn, self._ReadFile))
+
   def WriteFiles(self, values, dry_run=False):
     """Writes ssconf files used by external scripts.
 
@@ -172,6 +397,8 @@ class SimpleStore(object):
                         mode=constants.SS_FILE_PERMS,
                         dry_run=dry_run)
     finally:
+      if self._cache is not None:
+        self._cache.Invalidate()
       ssconf_lock.Unlock()
 
   def GetFileList(self):
@@ -210,17 +437,13 @@ class SimpleStore(object):
     """Return the list of master candidates.
 
     """
-    data = self._ReadFile(constants.SS_MASTER_CANDIDATES)
-    nl = data.splitlines(False)
-    return nl
+    return self._GetParsed(constants.SS_MASTER_CANDIDATES, _ParseList)
 
   def GetMasterCandidatesIPList(self):
     """Return the list of master candidates' primary IP.
 
     """
-    data = self._ReadFile(constants.SS_MASTER_CANDIDATES_IPS)
-    nl = data.splitlines(False)
-    return nl
+    return self._GetParsed(constants.SS_MASTER_CANDIDATES_IPS, _ParseList)
 
   def _GetDictOfSsconfMap(self, ss_file_key):
     """Reads a file with lines like key=value and returns a dict.
@@ -235,13 +458,7 @@ class SimpleStore(object):
     @return: a dictionary mapping the keys to the values
 
     """
-    data = self._ReadFile(ss_file_key)
-    lines = data.splitlines(False)
-    mapping = {}
-    for line in lines:
-      (key, value) = line.split("=")
-      mapping[key] = value
-    return mapping
+    return self._GetParsed(ss_file_key, _ParseMap)
 
   def GetMasterCandidatesCertMap(self):
     """Returns the map of master candidate UUIDs to ssl cert.
@@ -260,9 +477,7 @@ class SimpleStore(object):
     @return: dictionary mapping the node names to their SSH port
 
     """
-    return dict([(node_name, int(ssh_port)) for
-                  node_name, ssh_port in
-                  self._GetDictOfSsconfMap(constants.SS_SSH_PORTS).items()])
+    return self._GetParsed(constants.SS_SSH_PORTS, _ParseSshPortMap)
 
   def GetMasterIP(self):
     """Get the IP of the master node for this cluster.
@@ -297,33 +512,25 @@ class SimpleStore(object):
     """Return the list of cluster nodes.
 
     """
-    data = self._ReadFile(constants.SS_NODE_LIST)
-    nl = data.splitlines(False)
-    return nl
+    return self._GetParsed(constants.SS_NODE_LIST, _ParseList)
 
   def GetOnlineNodeList(self):
     """Return the list of online cluster nodes.
 
     """
-    data = self._ReadFile(constants.SS_ONLINE_NODES)
-    nl = data.splitlines(False)
-    return nl
+    return self._GetParsed(constants.SS_ONLINE_NODES, _ParseList)
 
   def GetNodePrimaryIPList(self):
     """Return the list of cluster nodes' primary IP.
 
     """
-    data = self._ReadFile(constants.SS_NODE_PRIMARY_IPS)
-    nl = data.splitlines(False)
-    return nl
+    return self._GetParsed(constants.SS_NODE_PRIMARY_IPS, _ParseList)
 
   def GetNodeSecondaryIPList(self):
     """Return the list of cluster nodes' secondary IP.
 
     """
-    data = self._ReadFile(constants.SS_NODE_SECONDARY_IPS)
-    nl = data.splitlines(False)
-    return nl
+    return self._GetParsed(constants.SS_NODE_SECONDARY_IPS, _ParseList)
 
   def GetNodesVmCapable(self):
     """Return the cluster nodes' vm capable value.
@@ -332,44 +539,31 @@ class SimpleStore(object):
     @return: mapping of node names to vm capable values
 
     """
-    data = self._ReadFile(constants.SS_NODE_VM_CAPABLE)
-    vm_capable = {}
-    for line in data.splitlines(False):
-      (node_uuid, node_vm_capable) = line.split("=")
-      vm_capable[node_uuid] = node_vm_capable == "True"
-    return vm_capable
+    return self._GetParsed(constants.SS_NODE_VM_CAPABLE, _ParseVmCapable)
 
   def GetNodegroupList(self):
     """Return the list of nodegroups.
 
     """
-    data = self._ReadFile(constants.SS_NODEGROUPS)
-    nl = data.splitlines(False)
-    return nl
+    return self._GetParsed(constants.SS_NODEGROUPS, _ParseList)
 
   def GetNetworkList(self):
     """Return the list of networks.
 
     """
-    data = self._ReadFile(constants.SS_NETWORKS)
-    nl = data.splitlines(False)
-    return nl
+    return self._GetParsed(constants.SS_NETWORKS, _ParseList)
 
   def GetClusterTags(self):
     """Return the cluster tags.
 
     """
-    data = self._ReadFile(constants.SS_CLUSTER_TAGS)
-    nl = data.splitlines(False)
-    return nl
+    return self._GetParsed(constants.SS_CLUSTER_TAGS, _ParseList)
 
   def GetHypervisorList(self):
     """Return the list of enabled hypervisors.
 
     """
-    data = self._ReadFile(constants.SS_HYPERVISOR_LIST)
-    nl = data.splitlines(False)
-    return nl
+    return self._GetParsed(constants.SS_HYPERVISOR_LIST, _ParseList)
 
   def GetHvparamsForHypervisor(self, hvname):
     """Return the hypervisor parameters of the given hypervisor.
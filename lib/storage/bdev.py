@@ -46,6 +46,7 @@ from ganeti import compat
 from ganeti import serializer
 from ganeti.storage import base
 from ganeti.storage import drbd
+from ganeti.storage import lvmcache
 from ganeti.storage.filestorage import FileStorage
 from ganeti.storage.gluster import GlusterStorage
 from ganeti.storage.extstorage import ExtStorageDevice
@@ -219,49 +220,20 @@ class LogicalVolume(base.BlockDev):
     # `--yes` is specified) when an existing filesystem signature is
     # encountered while creating a new LV. Using `-Wn` disables this check.
     cmd = ["lvcreate", "-Wn", "-L%dm" % size, "-n%s" % lv_name]
-    for stripes_arg in range(stripes, 0, -1):
-      result = utils.RunCmd(cmd + ["-i%d" % stripes_arg] + [vg_name] + pvlist)
-      if not result.failed:
-        break
+    try:
+      for stripes_arg in range(stripes, 0, -1):
+        result = utils.RunCmd(cmd + ["-i%d" % stripes_arg] + [vg_name] +
+                              pvlist)
+        if not result.failed:
+          break
+    finally:
+      lvmcache.Invalidate()
     if result.failed:
       base.ThrowError("LV create failed (%s): %s",
                       result.fail_reason, result.output)
     return LogicalVolume(unique_id, children, size, params,
                          dyn_params, **kwargs)
 
-  @staticmethod
-  def _GetVolumeInfo(lvm_cmd, fields):
-    """Returns LVM Volume infos using lvm_cmd
-
-    @param lvm_cmd: Should be one of "pvs", "vgs" or "lvs"
-    @param fields: Fields to return
-    @return: A list of dicts each with the parsed fields
-
-    """
-    if not fields:
-      raise errors.ProgrammerError("No fields specified")
-
-    sep = "|"
-    cmd = [lvm_cmd, "--noheadings", "--nosuffix", "--units=m", "--unbuffered",
-           "--separator=%s" % sep, "-o%s" % ",".join(fields)]
-
-    result = utils.RunCmd(cmd)
-    if result.failed:
-      raise errors.CommandError("Can't get the volume information: %s - %s" %
-                                (result.fail_reason, result.output))
-
-    data = []
-    for line in result.stdout.splitlines():
-      splitted_fields = line.strip().split(sep)
-
-      if len(fields) != len(splitted_fields):
-        raise errors.CommandError("Can't parse %s output: line '%s'" %
-                                  (lvm_cmd, line))
-
-      data.append(splitted_fields)
-
-    return data
-
   @classmethod
   def GetPVInfo(cls, vg_names, filter_allocatable=True, include_lvs=False):
     """Get the free space info for PVs in a volume group.
@@ -274,28 +246,24 @@ class LogicalVolume(base.BlockDev):
     @return: list of objects.LvmPvInfo objects
 
     """
-    # We request "lv_name" field only if we care about LVs, so we don't get
-    # a long list of entries with many duplicates unless we really have to.
-    # The duplicate "pv_name" field will be ignored.
-    if include_lvs:
-      lvfield = "lv_name"
-    else:
-      lvfield = "pv_name"
     try:
-      info = cls._GetVolumeInfo("pvs", ["pv_name", "vg_name", "pv_free",
-                                        "pv_attr", "pv_size", lvfield])
+      info = lvmcache.GetReport(lvmcache.PVS)
     except errors.GenericError as err:
       logging.error("Can't get PV information: %s", err)
       return None
 
-    # When asked for LVs, "pvs" may return multiple entries for the same PV-LV
-    # pair. We sort entries by PV name and then LV name, so it's easy to weed
-    # out duplicates.
+    # "pvs" returns one entry per PV segment, so there may be multiple
+    # entries for the same PV-LV pair. When asked for LVs, entries are sorted
+    # by PV name and then LV name, so it's easy to weed out duplicates.
     if include_lvs:
-      info.sort(key=(lambda i: (i[0], i[5])))
+      info = sorted(info, key=(lambda i: (i["pv_name"], i["lv_name"])))
     data = []
-    lastpvi = None
-    for (pv_name, vg_name, pv_free, pv_attr, pv_size, lv_name) in info:
+    pvis = {}
+    for row in info:
+      pv_name = row["pv_name"]
+      vg_name = row["vg_name"]
+      pv_attr = row["pv_attr"]
+      lv_name = row["lv_name"]
       # (possibly) skip over pvs which are not allocatable
       if filter_allocatable and pv_attr[0] != "a":
         continue
@@ -303,19 +271,21 @@ class LogicalVolume(base.BlockDev):
       if vg_names and vg_name not in vg_names:
         continue
       # Beware of duplicates (check before inserting)
-      if lastpvi and lastpvi.name == pv_name:
+      pvi = pvis.get(pv_name)
+      if pvi:
         if include_lvs and lv_name:
-          if not lastpvi.lv_list or lastpvi.lv_list[-1] != lv_name:
-            lastpvi.lv_list.append(lv_name)
+          if not pvi.lv_list or pvi.lv_list[-1] != lv_name:
+            pvi.lv_list.append(lv_name)
       else:
         if include_lvs and lv_name:
           lvl = [lv_name]
         else:
           lvl = []
-        lastpvi = objects.LvmPvInfo(name=pv_name, vg_name=vg_name,
-                                    size=float(pv_size), free=float(pv_free),
-                                    attributes=pv_attr, lv_list=lvl)
-        data.append(lastpvi)
+        pvi = objects.LvmPvInfo(name=pv_name, vg_name=vg_name,
+                                size=row["pv_size"], free=row["pv_free"],
+                                attributes=pv_attr, lv_list=lvl)
+        pvis[pv_name] = pvi
+        data.append(pvi)
 
     return data
 
@@ -378,14 +348,17 @@ class LogicalVolume(base.BlockDev):
 
     """
     try:
-      info = cls._GetVolumeInfo("vgs", ["vg_name", "vg_free", "vg_attr",
-                                        "vg_size"])
+      info = lvmcache.GetReport(lvmcache.VGS)
     except errors.GenericError as err:
       logging.error("Can't get VG information: %s", err)
       return None
 
     data = []
-    for vg_name, vg_free, vg_attr, vg_size in info:
+    for row in info:
+      vg_name = row["vg_name"]
+      vg_free = row["vg_free"]
+      vg_attr = row["vg_attr"]
+      vg_size = row["vg_size"]
       # (possibly) skip over vgs which are not writable
       if filter_readonly and vg_attr[0] == "r":
         continue
@@ -397,7 +370,7 @@ class LogicalVolume(base.BlockDev):
         es_free = cls._GetExclusiveStorageVgFree(vg_name)
         assert es_free <= vg_free
         vg_free = es_free
-      data.append((float(vg_free), float(vg_size), vg_name))
+      data.append((vg_free, vg_size, vg_name))
 
     return data
 
@@ -424,6 +397,7 @@ class LogicalVolume(base.BlockDev):
       return
     result = utils.RunCmd(["lvremove", "-f", "%s/%s" %
                            (self._vg_name, self._lv_name)])
+    lvmcache.Invalidate()
     if result.failed:
       base.ThrowError("Can't lvremove: %s - %s",
                       result.fail_reason, result.output)
@@ -440,49 +414,39 @@ class LogicalVolume(base.BlockDev):
                                    " volume groups (from %s to to %s)" %
                                    (self._vg_name, new_vg))
     result = utils.RunCmd(["lvrename", new_vg, self._lv_name, new_name])
+    lvmcache.Invalidate()
     if result.failed:
       base.ThrowError("Failed to rename the logical volume: %s", result.output)
     self._lv_name = new_name
     self.dev_path = utils.PathJoin("/dev", self._vg_name, self._lv_name)
 
   @staticmethod
-  def _ParseLvInfoLine(line, sep):
-    """Parse one line of the lvs output used in L{GetLvGlobalInfo}.
+  def _ParseLvInfo(row):
+    """Parse one entry of the lvs report used in L{GetLvGlobalInfo}.
 
     """
-    elems = line.strip().split(sep)
-
-    # The previous iteration of code here assumed that LVM might put another
-    # separator to the right of the output. The PV info might be empty for
-    # thin volumes, so stripping off the separators might cut off the last
-    # empty element - do this instead.
-    if len(elems) == 9 and elems[-1] == "":
-      elems.pop()
-
-    if len(elems) != 8:
-      base.ThrowError("Can't parse LVS output, len(%s) != 8", str(elems))
-
-    (vg_name, lv_name, status, major, minor, pe_size, stripes, pvs) = elems
+    vg_name = row["vg_name"]
+    lv_name = row["lv_name"]
+    status = row["lv_attr"]
     path = os.path.join(os.environ.get('DM_DEV_DIR', '/dev'), vg_name, lv_name)
     if len(status) < 6:
       base.ThrowError("lvs lv_attr is not at least 6 characters (%s)", status)
 
     try:
-      major = int(major)
-      minor = int(minor)
+      major = int(row["lv_kernel_major"])
+      minor = int(row["lv_kernel_minor"])
     except (TypeError, ValueError) as err:
       base.ThrowError("lvs major/minor cannot be parsed: %s", str(err))
 
-    try:
-      pe_size = int(float(pe_size))
-    except (TypeError, ValueError) as err:
-      base.ThrowError("Can't parse vg extent size: %s", err)
+    # The extent size is reported in MiB, but used in KiB
+    pe_size = int(row["vg_extent_size"] * 1024)
 
     try:
-      stripes = int(stripes)
+      stripes = int(row["stripes"])
     except (TypeError, ValueError) as err:
       base.ThrowError("Can't parse the number of stripes: %s", err)
 
+    pvs = row["devices"]
     pv_names = []
     if pvs != "":
       for pv in pvs.split(","):
@@ -494,27 +458,25 @@ class LogicalVolume(base.BlockDev):
     return (path, (status, major, minor, pe_size, stripes, pv_names))
 
   @staticmethod
-  def GetLvGlobalInfo(_run_cmd=utils.RunCmd):
+  def GetLvGlobalInfo(_get_report_fn=None):
     """Obtain the current state of the existing LV disks.
 
     @return: a dict containing the state of each disk with the disk path as key
 
     """
-    sep = "|"
-    result = _run_cmd(["lvs", "--noheadings", "--separator=%s" % sep,
-                       "--units=k", "--nosuffix",
-                       "-ovg_name,lv_name,lv_attr,lv_kernel_major,"
-                       "lv_kernel_minor,vg_extent_size,stripes,devices"])
-    if result.failed:
+    if _get_report_fn is None:
+      _get_report_fn = lvmcache.GetReport
+    try:
+      rows = _get_report_fn(lvmcache.LVS)
+    except errors.CommandError as err:
       logging.warning("lvs command failed, the LV cache will be empty!")
-      logging.info("lvs failure: %r", result.stderr)
+      logging.info("lvs failure: %s", err)
       return {}
-    out = result.stdout.splitlines()
-    if not out:
+    if not rows:
       logging.warning("lvs command returned an empty output, the LV cache will"
                       "be empty!")
       return {}
-    return dict([LogicalVolume._ParseLvInfoLine(line, sep) for line in out])
+    return dict([LogicalVolume._ParseLvInfo(row) for row in rows])
 
   def Attach(self, lv_info=None, **kwargs):
     """Attach to an existing LV.
@@ -550,6 +512,7 @@ class LogicalVolume(base.BlockDev):
 
     """
     result = utils.RunCmd(["lvchange", "-ay", self.dev_path])
+    lvmcache.Invalidate()
     if result.failed:
       base.ThrowError("Can't activate lv %s: %s", self.dev_path, result.output)
 
@@ -640,8 +603,10 @@ class LogicalVolume(base.BlockDev):
       base.ThrowError("Not enough free space: required %s,"
                       " available %s", snap_size, free_size)
 
-    _CheckResult(utils.RunCmd(["lvcreate", "-L%dm" % snap_size, "-s",
-                               "-n%s" % snap_name, self.dev_path]))
+    result = utils.RunCmd(["lvcreate", "-L%dm" % snap_size, "-s",
+                           "-n%s" % snap_name, self.dev_path])
+    lvmcache.Invalidate()
+    _CheckResult(result)
 
     return (self._vg_name, snap_name)
 
@@ -726,11 +691,15 @@ class LogicalVolume(base.BlockDev):
     # space available in the right place, but later ones might (since
     # they have less constraints); also note that only recent LVM
     # supports 'cling'
-    for alloc_policy in "contiguous", "cling", "normal":
-      result = utils.RunCmd(cmd + ["--alloc", alloc_policy, self.dev_path] +
-                            pvlist)
-      if not result.failed:
-        return
+    try:
+      for alloc_policy in "contiguous", "cling", "normal":
+        result = utils.RunCmd(cmd + ["--alloc", alloc_policy, self.dev_path] +
+                              pvlist)
+        if not result.failed:
+          return
+    finally:
+      if not dryrun:
+        lvmcache.Invalidate()
     base.ThrowError("Can't grow LV %s: %s", self.dev_path, result.output)
 
   def GetActualSpindles(self):
@@ -46,6 +46,7 @@ import logging
 from ganeti import errors
 from ganeti import constants
 from ganeti import utils
+from ganeti.storage import lvmcache
 
 
 def _ParseSize(value):
@@ -181,9 +182,9 @@ class _LvmBase(_Base): # pylint: disable=W0223
       can be an empty list)
 
   """
-  LIST_SEP = "|"
   LIST_COMMAND = None
   LIST_FIELDS = None
+  NAME_FIELD = None
 
   def List(self, name, wanted_field_names):
     """Returns a list of all entities within the storage unit.
@@ -194,16 +195,16 @@ class _LvmBase(_Base): # pylint: disable=W0223
     # Get needed LVM fields
     lvm_fields = self._GetLvmFields(self.LIST_FIELDS, wanted_field_names)
 
-    # Build LVM command
-    cmd_args = self._BuildListCommand(self.LIST_COMMAND, self.LIST_SEP,
-                                      lvm_fields, name)
+    # Get the LVM report
+    try:
+      report = lvmcache.GetReport(self.LIST_COMMAND)
+    except errors.GenericError as err:
+      raise errors.StorageError("Failed to run %r: %s" %
+                                (self.LIST_COMMAND, err))
 
-    # Run LVM command
-    cmd_result = self._RunListCommand(cmd_args)
-
-    # Split and rearrange LVM command output
-    return self._BuildList(self._SplitList(cmd_result, self.LIST_SEP,
-                                           len(lvm_fields)),
+    # Select and rearrange LVM report entries
+    return self._BuildList(self._SelectRows(report, self.NAME_FIELD, name,
+                                            lvm_fields),
                            self.LIST_FIELDS,
                            wanted_field_names,
                            lvm_fields)
@@ -287,62 +288,35 @@ class _LvmBase(_Base): # pylint: disable=W0223
     return data
 
   @staticmethod
-  def _BuildListCommand(cmd, sep, options, name):
-    """Builds LVM command line.
-
-    @type cmd: string
-    @param cmd: Command name
-    @type sep: string
-    @param sep: Field separator character
-    @type options: list of strings
-    @param options: Wanted LVM fields
-    @type name: name or None
-    @param name: Name of requested entity
-
-    """
-    args = [cmd,
-            "--noheadings", "--units=m", "--nosuffix",
-            "--separator", sep,
-            "--options", ",".join(options)]
-
-    if name is not None:
-      args.append(name)
-
-    return args
-
-  @staticmethod
-  def _RunListCommand(args):
-    """Run LVM command.
-
-    """
-    result = utils.RunCmd(args)
-
-    if result.failed:
-      raise errors.StorageError("Failed to run %r, command output: %s" %
-                                (args[0], result.output))
-
-    return result.stdout
-
-  @staticmethod
-  def _SplitList(data, sep, fieldcount):
-    """Splits LVM command output into rows and fields.
+  def _SelectRows(report, name_field, name, lvm_fields):
+    """Selects the entries of an LVM report.
 
-    @type data: string
-    @param data: LVM command output
-    @type sep: string
-    @param sep: Field separator character
-    @type fieldcount: int
-    @param fieldcount: Expected number of fields
+    @type report: list of dicts
+    @param report: LVM report, see L{lvmcache.LvmCache.GetReport}
+    @type name_field: string
+    @param name_field: LVM field containing the name of the entities
+    @type name: string or None
+    @param name: Name of requested entity
+    @type lvm_fields: list of strings
+    @param lvm_fields: Wanted LVM fields
+    @rtype: list of lists
+    @return: the values of the wanted fields, once per entity
 
     """
-    for line in data.splitlines():
-      fields = line.strip().split(sep)
-
-      if len(fields) != fieldcount:
-        logging.warning("Invalid line returned from lvm command: %s", line)
+    seen = set()
+    rows = []
+    for entry in report:
+      entity = entry[name_field]
+      # Reports may contain multiple entries per entity (e.g. segments)
+      if entity in seen or (name is not None and entity != name):
         continue
+      seen.add(entity)
+      rows.append([entry[field] for field in lvm_fields])
 
-      yield fields
+    if name is not None and not rows:
+      raise errors.StorageError("LVM entity %r not found" % name)
+
+    return rows
 
 
 def _LvmPvGetAllocatable(attr):
@@ -362,7 +336,8 @@ class LvmPvStorage(_LvmBase): # pylint: disable=W0223
   """LVM Physical Volume storage unit.
 
   """
-  LIST_COMMAND = "pvs"
+  LIST_COMMAND = lvmcache.PVS
+  NAME_FIELD = "pv_name"
 
   # Make sure to update constants.VALID_STORAGE_FIELDS when changing field
   # definitions.
@@ -374,6 +349,7 @@ class LvmPvStorage(_LvmBase): # pylint: disable=W0223
     (constants.SF_ALLOCATABLE, ["pv_attr"], _LvmPvGetAllocatable),
     ]
 
+  @lvmcache.InvalidatesCache
   def _SetAllocatable(self, name, allocatable):
     """Sets the "allocatable" flag on a physical volume.
 
@@ -416,7 +392,8 @@ class LvmVgStorage(_LvmBase):
   """LVM Volume Group storage unit.
 
   """
-  LIST_COMMAND = "vgs"
+  LIST_COMMAND = lvmcache.VGS
+  NAME_FIELD = "vg_name"
   VGREDUCE_COMMAND = "vgreduce"
 
   # Make sure to update constants.VALID_STORAGE_FIELDS when changing field
@@ -430,6 +407,7 @@ class LvmVgStorage(_LvmBase):
     (constants.SF_ALLOCATABLE, [], True),
     ]
 
+  @lvmcache.InvalidatesCache
   def _RemoveMissing(self, name, _runcmd_fn=utils.RunCmd):
     """Runs "vgreduce --removemissing" on a volume group.
 
@@ -0,0 +1,518 @@
+#
+#
+
+# Copyright (C) 2014 Google Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS
+# IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+# TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+# PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+"""Writing data to block devices and disk files.
+
+This replaces spawning C{dd} for wiping and imaging devices. Data is
+written in large sequential chunks from a single page-aligned buffer using
+C{O_DIRECT}, and ranges which only need to be zeroed are handed to the
+kernel (C{BLKZEROOUT}, C{BLKDISCARD} or C{fallocate(2)}) whenever the
+target supports it.
+
+"""
+
+import errno
+import fcntl
+import io
+import logging
+import mmap
+import os
+import stat
+import struct
+import time
+
+try:
+  # pylint: disable=F0401
+  import ctypes
+except ImportError:
+  ctypes = None
+
+from ganeti.storage import base
+
+
+# Block device ioctls (from linux/fs.h)
+_BLKDISCARD = 0x1277
+_BLKDISCARDZEROES = 0x127c
+_BLKZEROOUT = 0x127f
+
+# Flags for fallocate(2) (from linux/falloc.h)
+_FALLOC_FL_KEEP_SIZE = 0x01
+_FALLOC_FL_PUNCH_HOLE = 0x02
+
+#: Errors signalling that a zeroing method is not supported by the target
+_UNSUPPORTED_ERRORS = frozenset([errno.EOPNOTSUPP, errno.ENOTTY, errno.EINVAL,
+                                 errno.ENOSYS])
+
+#: Alignment of offsets and lengths for C{O_DIRECT}
+DIRECT_ALIGNMENT = 4096
+
+#: Size of the transfer buffer
+CHUNK_SIZE = 8 * 1024 * 1024
+
+#: Maximum size of a range zeroed by the kernel in one call, so that
+#: progress can be reported while wiping large devices
+ZERO_CHUNK_SIZE = 1024 * 1024 * 1024
+
+#: Minimum number of seconds between two progress reports
+PROGRESS_INTERVAL = 10.0
+
+METHOD_WRITE = "write"
+METHOD_ZEROOUT = "zeroout"
+METHOD_DISCARD = "discard"
+METHOD_PUNCH_HOLE = "punch-hole"
+
+
+def _LoadFallocate(_ctypes=ctypes):
+  """Returns C{fallocate(3)} from the C library, if available.
+
+  """
+  if _ctypes is None:
+    return None
+
+  try:
+    libc = _ctypes.CDLL("libc.so.6", use_errno=True)
+    fn = libc.fallocate
+  except (EnvironmentError, AttributeError) as err:
+    logging.debug("Can't load fallocate from libc: %s", err)
+    return None
+
+  fn.argtypes = [_ctypes.c_int, _ctypes.c_int, _ctypes.c_int64,
+                 _ctypes.c_int64]
+  fn.restype = _ctypes.c_int
+  return fn
+
+
+def _PunchHole(fd, offset, length, _fallocate=[]): # pylint: disable=W0102
+  """Deallocates a range of a file, which then reads as zeroes.
+
+  @raise EnvironmentError: if the hole could not be punched
+
+  """
+  if not _fallocate:
+    _fallocate.append(_LoadFallocate())
+  fn = _fallocate[0]
+  if fn is None:
+    raise OSError(errno.ENOSYS, "fallocate(2) is not available")
+
+  if fn(fd, _FALLOC_FL_PUNCH_HOLE | _FALLOC_FL_KEEP_SIZE, offset, length):
+    err = ctypes.get_errno()
+    raise OSError(err, os.strerror(err))
+
+
+def _DiscardZeroesData(fd):
+  """Checks whether discarded blocks of a block device read as zeroes.
+
+  """
+  try:
+    result = fcntl.ioctl(fd, _BLKDISCARDZEROES, struct.pack("I", 0))
+  except EnvironmentError:
+    return False
+  return struct.unpack("I", result)[0] != 0
+
+
+class DeviceWriter(object):
+  """Writes data to a block device or a disk file.
+
+  All offsets and sizes are in bytes. The writer keeps a single
+  page-aligned buffer of L{CHUNK_SIZE} bytes, so the memory used doesn't
+  depend on the amount of data written.
+
+  """
+  def __init__(self, path, progress_fn=None, chunk_size=CHUNK_SIZE,
+               _time_fn=time.time):
+    """Opens the target for writing.
+
+    @type path: string
+    @param path: the block device or file to write to
+    @type progress_fn: callable or None
+    @param progress_fn: called with the number of bytes done and the
+      total number of bytes at most every L{PROGRESS_INTERVAL} seconds
+    @type chunk_size: int
+    @param chunk_size: size of the transfer buffer, a multiple of
+      L{DIRECT_ALIGNMENT}
+    @raise errors.BlockDeviceError: if the target can't be opened
+
+    """
+    assert chunk_size > 0 and chunk_size % DIRECT_ALIGNMENT == 0
+
+    self._path = path
+    self._progress_fn = progress_fn
+    self._time_fn = _time_fn
+    self._chunk_size = chunk_size
+    self._buf = None
+    self._dirty = False
+    self._methods = []
+    self._zero_methods = None
+    self._start = _time_fn()
+    self._last_progress = self._start
+    self._total = 0
+    self._stream_offset = 0
+    self._stream_limit = 0
+    self._stream_fill = 0
+    self.received = 0
+    self.written = 0
+
+    self._direct = True
+    try:
+      try:
+        self._fd = os.open(path, os.O_WRONLY | os.O_DIRECT)
+      except EnvironmentError as err:
+        if err.errno != errno.EINVAL:
+          raise
+        # The file system doesn't support direct I/O
+        self._direct = False
+        self._fd = os.open(path, os.O_WRONLY)
+    except EnvironmentError as err:
+      base.ThrowError("Can't open '%s' for writing: %s", path, err)
+
+    self._blockdev = stat.S_ISBLK(os.fstat(self._fd).st_mode)
+
+  def Close(self):
+    """Flushes the written data to disk and closes the target.
+
+    @rtype: tuple; (string, int, float)
+    @return: the methods used for writing, the number of bytes written and
+      the duration in seconds
+
+    """
+    if self._fd is None:
+      return self.GetResult()
+
+    try:
+      try:
+        os.fdatasync(self._fd)
+      finally:
+        os.close(self._fd)
+        self._fd = None
+        if self._buf is not None:
+          self._buf.close()
+          self._buf = None
+    except EnvironmentError as err:
+      base.ThrowError("Can't flush data to '%s': %s", self._path, err)
+
+    return self.GetResult()
+
+  def Abort(self):
+    """Closes the target after a failure, ignoring further errors.
+
+    """
+    if self._fd is not None:
+      try:
+        os.close(self._fd)
+      except EnvironmentError as err:
+        logging.debug("Error while closing '%s': %s", self._path, err)
+      self._fd = None
+
+  def GetResult(self):
+    """Returns a summary of the work done so far.
+
+    @see: L{Close}
+
+    """
+    return (",".join(self._methods) or METHOD_WRITE, self.written,
+            self._time_fn() - self._start)
+
+  def _UsedMethod(self, method):
+    """Records the use of a writing method.
+
+    """
+    if method not in self._methods:
+      self._methods.append(method)
+
+  def _Progress(self, length, force=False):
+    """Accounts for written data and reports progress if due.
+
+    """
+    self.written += length
+
+    if self._progress_fn is None:
+      return
+    now = self._time_fn()
+    if force or now - self._last_progress >= PROGRESS_INTERVAL:
+      self._last_progress = now
+      self._progress_fn(self.written, self._total)
+
+  def _GetBuffer(self):
+    """Returns the transfer buffer, allocating it when needed.
+
+    Anonymous memory maps are page-aligned, which satisfies the alignment
+    requirements of C{O_DIRECT}, and initially contain zeroes.
+
+    """
+    if self._buf is None:
+      self._buf = mmap.mmap(-1, self._chunk_size)
+      self._dirty = False
+    return self._buf
+
+  def _DisableDirect(self):
+    """Switches the target to buffered I/O.
+
+    Used for the final part of data which is not aligned, like C{dd} does.
+
+    """
+    if self._direct:
+      flags = fcntl.fcntl(self._fd, fcntl.F_GETFL)
+      fcntl.fcntl(self._fd, fcntl.F_SETFL, flags & ~os.O_DIRECT)
+      self._direct = False
+
+  def _WriteBuffer(self, offset, length):
+    """Writes the start of the transfer buffer to the target.
+
+    """
+    view = memoryview(self._GetBuffer())
+    try:
+      if length % DIRECT_ALIGNMENT or offset % DIRECT_ALIGNMENT:
+        self._DisableDirect()
+      done = 0
+      while done < length:
+        done += os.pwrite(self._fd, view[done:length], offset + done)
+    except EnvironmentError as err:
+      base.ThrowError("Can't write %d bytes at offset %d to '%s': %s",
+                      length, offset, self._path, err)
+    finally:
+      view.release()
+    self._UsedMethod(METHOD_WRITE)
+
+  def _GetZeroMethods(self):
+    """Returns the zeroing methods the target may support.
+
+    """
+    if self._zero_methods is None:
+      if self._blockdev:
+        self._zero_methods = [(METHOD_ZEROOUT, self._ZeroOut)]
+        if _DiscardZeroesData(self._fd):
+          self._zero_methods.append((METHOD_DISCARD, self._Discard))
+      else:
+        self._zero_methods = [(METHOD_PUNCH_HOLE, self._ZeroFileRange)]
+    return self._zero_methods
+
+  def _ZeroOut(self, offset, length):
+    fcntl.ioctl(self._fd, _BLKZEROOUT, struct.pack("QQ", offset, length))
+
+  def _Discard(self, offset, length):
+    fcntl.ioctl(self._fd, _BLKDISCARD, struct.pack("QQ", offset, length))
+
+  def _ZeroFileRange(self, offset, length):
+    """Zeroes a range of a file without writing data.
+
+    Existing data is deallocated and the file is extended as needed.
+
+    """
+    end = offset + length
+    size = os.fstat(self._fd).st_size
+    if offset < size:
+      _PunchHole(self._fd, offset, min(end, size) - offset)
+    if end > size:
+      os.ftruncate(self._fd, end)
+
+  def _ZeroRange(self, offset, length):
+    """Zeroes a range using the first method the target supports.
+
+    @rtype: bool
+    @return: whether the range was zeroed
+
+    """
+    methods = self._GetZeroMethods()
+    while methods:
+      (name, fn) = methods[0]
+      try:
+        fn(offset, length)
+      except EnvironmentError as err:
+        if err.errno not in _UNSUPPORTED_ERRORS:
+          base.ThrowError("Can't zero %d bytes at offset %d of '%s': %s",
+                          length, offset, self._path, err)
+        logging.debug("Zeroing '%s' using %s is not supported: %s",
+                      self._path, name, err)
+        methods.pop(0)
+      else:
+        self._UsedMethod(name)
+        return True
+    return False
+
+  def Truncate(self, size):
+    """Truncates a disk file, ignored for block devices.
+
+    """
+    if self._blockdev:
+      return
+    try:
+      os.ftruncate(self._fd, size)
+    except EnvironmentError as err:
+      base.ThrowError("Can't truncate '%s': %s", self._path, err)
+
+  def Zero(self, offset, length):
+    """Writes zeroes to a range of the target.
+
+    @type offset: int
+    @param offset: the start of the range
+    @type length: int
+    @param length: the length of the range
+
+    """
+    self._total += length
+    end = offset + length
+
+    while offset < end:
+      size = min(ZERO_CHUNK_SIZE, end - offset)
+      if offset % DIRECT_ALIGNMENT or not self._ZeroRange(offset, size):
+        break
+      offset += size
+      self._Progress(size)
+
+    buf = self._GetBuffer()
+    if self._dirty:
+      buf[:] = bytes(self._chunk_size)
+      self._dirty = False
+
+    while offset < end:
+      size = min(self._chunk_size, end - offset)
+      self._WriteBuffer(offset, size)
+      offset += size
+      self._Progress(size)
+
+    self._Progress(0, force=True)
+
+  def CopyFile(self, source_path, offset, length):
+    """Copies the start of a file to the target.
+
+    @type source_path: string
+    @param source_path: the file to copy from
+    @type offset: int
+    @param offset: the offset in the target
+    @type length: int
+    @param length: the maximum number of bytes to copy; the source may be
+      shorter
+    @rtype: int
+    @return: the number of bytes copied
+
+    """
+    self._total += length
+    end = offset + length
+    start = offset
+
+    buf = self._GetBuffer()
+    self._dirty = True
+    view = memoryview(buf)
+    try:
+      try:
+        source = io.FileIO(source_path, "r")
+      except EnvironmentError as err:
+        base.ThrowError("Can't open '%s': %s", source_path, err)
+      try:
+        while offset < end:
+          want = min(self._chunk_size, end - offset)
+          fill = 0
+          while fill < want:
+            count = source.readinto(view[fill:want])
+            if not count:
+              break
+            fill += count
+          if fill:
+            self._WriteBuffer(offset, fill)
+            offset += fill
+            self._Progress(fill)
+          if fill < want:
+            break
+      except EnvironmentError as err:
+        base.ThrowError("Can't read from '%s': %s", source_path, err)
+      finally:
+        source.close()
+    finally:
+      view.release()
+
+    self._Progress(0, force=True)
+    return offset - start
+
+  def BeginStream(self, offset, limit):
+    """Starts writing a stream of data chunks of arbitrary size.
+
+    Data passed to L{Feed} is collected in the transfer buffer and written
+    whenever the buffer is full, which keeps the memory usage bounded
+    independently of the size of the chunks.
+
+    @type offset: int
+    @param offset: the offset in the target where the stream starts
+    @type limit: int
+    @param limit: the maximum number of bytes accepted
+
+    """
+    self._GetBuffer()
+    self._dirty = True
+    self._total += limit
+    self._stream_offset = offset
+    self._stream_limit = limit
+    self._stream_fill = 0
+    self.received = 0
+
+  def Feed(self, data):
+    """Appends data to the current stream.
+
+    @type data: bytes
+    @param data: the data to write
+    @rtype: bool
+    @return: whether the data was accepted; C{False} if the stream would
+      exceed its limit, in which case nothing is written
+
+    """
+    if self.received + len(data) > self._stream_limit:
+      return False
+    self.received += len(data)
+
+    pos = 0
+    while pos < len(data):
+      count = min(len(data) - pos, self._chunk_size - self._stream_fill)
+      self._buf[self._stream_fill:self._stream_fill + count] = \
+        data[pos:pos + count]
+      self._stream_fill += count
+      pos += count
+      if self._stream_fill == self._chunk_size:
+        self._FlushStream()
+    return True
+
+  def _FlushStream(self):
+    """Writes the data collected for the current stream.
+
+    """
+    if self._stream_fill:
+      self._WriteBuffer(self._stream_offset, self._stream_fill)
+      self._stream_offset += self._stream_fill
+      self._Progress(self._stream_fill)
+      self._stream_fill = 0
+
+  def EndStream(self):
+    """Writes any remaining data of the current stream.
+
+    @rtype: int
+    @return: the number of bytes written for the stream
+
+    """
+    self._FlushStream()
+    self._Progress(0, force=True)
+    return self.received
@@ -163,6 +163,143 @@ class DRBD8(object):
                       minor, result.output)
 
 
+def _GetSyncState(stats):
+  """Returns the degradation and local disk status of a DRBD minor.
+
+  @type stats: L{drbd_info.DRBD8Status}
+  @param stats: the status of the minor
+  @rtype: tuple
+  @return: (is_degraded, ldisk_status) like in L{objects.BlockDevStatus}
+
+  """
+  is_degraded = not stats.is_connected or not stats.is_disk_uptodate
+
+  if stats.is_disk_uptodate:
+    ldisk_status = constants.LDS_OKAY
+  elif stats.is_diskless:
+    ldisk_status = constants.LDS_FAULTY
+  elif stats.is_in_resync:
+    ldisk_status = constants.LDS_SYNC
+  else:
+    ldisk_status = constants.LDS_UNKNOWN
+
+  return (is_degraded, ldisk_status)
+
+
+class DRBD8SyncWatcher(object):
+  """Waits for changes of the synchronization state of DRBD minors.
+
+  The status of all watched minors is taken from a single read of
+  C{/proc/drbd} per interval, so waiting for many devices costs as much as
+  waiting for one.
+
+  """
+  #: Seconds between two reads of /proc/drbd
+  INTERVAL = 0.5
+
+  def __init__(self, minors, _info_fn=DRBD8.GetProcInfo, _time_fn=time.time,
+               _sleep_fn=time.sleep):
+    """Initializes this class.
+
+    @type minors: list of int
+    @param minors: the minors to watch
+
+    """
+    self._minors = minors
+    self._info_fn = _info_fn
+    self._time_fn = _time_fn
+    self._sleep_fn = _sleep_fn
+
+  def Poll(self):
+    """Reads the current status of the watched minors.
+
+    @rtype: dict
+    @return: L{drbd_info.DRBD8Status} per minor; minors which can't be found
+      in C{/proc/drbd} are left out
+
+    """
+    info = self._info_fn()
+    return dict((minor, info.GetMinorStatus(minor))
+                for minor in self._minors
+                if info.HasMinorStatus(minor))
+
+  @staticmethod
+  def _GetProgressStep(sync_percent, percent_step):
+    """Returns the step of the synchronization progress.
+
+    @rtype: int or None
+    @return: C{None} if the minor is not being synchronized
+
+    """
+    if sync_percent is None:
+      return None
+    return int(sync_percent // percent_step)
+
+  def Wait(self, sync_percents, sync_states, percent_step, timeout):
+    """Waits until the synchronization state of any watched minor changes.
+
+    The state of a minor has changed if its degradation or local disk status
+    differs from the last known one, or if the progress of its
+    synchronization is in another step of C{percent_step} percent than the
+    last known one. The start and the end of a synchronization are changes,
+    too, and so is a minor disappearing from C{/proc/drbd}.
+
+    @type sync_percents: list
+    @param sync_percents: for each minor, the last known percentage of its
+      synchronization or C{None} if it wasn't being synchronized
+    @type sync_states: list
+    @param sync_states: for each minor, the last known (is_degraded,
+      ldisk_status) tuple or C{None} to only watch the synchronization
+      progress
+    @type percent_step: number
+    @param percent_step: the size of a progress step in percent
+    @type timeout: number
+    @param timeout: the maximum number of seconds to wait
+    @rtype: bool
+    @return: whether a change was seen before the timeout expired
+
+    """
+    assert len(sync_percents) == len(self._minors)
+    assert len(sync_states) == len(self._minors)
+    assert percent_step > 0
+
+    deadline = self._time_fn() + timeout
+
+    if not self._minors:
+      self._sleep_fn(timeout)
+      return False
+
+    expected = [self._GetProgressStep(percent, percent_step)
+                for percent in sync_percents]
+
+    current = self.Poll()
+
+    while True:
+      for (minor, step, state) in zip(self._minors, expected, sync_states):
+        status = current.get(minor)
+
+        if status is None:
+          logging.debug("DRBD minor %s disappeared", minor)
+          return True
+
+        if state is not None and _GetSyncState(status) != state:
+          logging.debug("State of DRBD minor %s changed from %s to %s",
+                        minor, state, _GetSyncState(status))
+          return True
+
+        if self._GetProgressStep(status.sync_percent, percent_step) != step:
+          logging.debug("Synchronization of DRBD minor %s is at %s%%",
+                        minor, status.sync_percent)
+          return True
+
+      remaining = deadline - self._time_fn()
+      if remaining <= 0:
+        return False
+
+      self._sleep_fn(min(self.INTERVAL, remaining))
+      current = self.Poll()
+
+
 class DRBD8Dev(base.BlockDev):
   """DRBD v8.x block device.
 
@@ -672,16 +809,7 @@ class DRBD8Dev(base.BlockDev):
       base.ThrowError("drbd%d: can't Attach() in GetSyncStatus", self._aminor)
 
     stats = self.GetProcStatus()
-    is_degraded = not stats.is_connected or not stats.is_disk_uptodate
-
-    if stats.is_disk_uptodate:
-      ldisk_status = constants.LDS_OKAY
-    elif stats.is_diskless:
-      ldisk_status = constants.LDS_FAULTY
-    elif stats.is_in_resync:
-      ldisk_status = constants.LDS_SYNC
-    else:
-      ldisk_status = constants.LDS_UNKNOWN
+    (is_degraded, ldisk_status) = _GetSyncState(stats)
 
     return objects.BlockDevStatus(dev_path=self.dev_path,
                                   major=self.major,
@@ -0,0 +1,227 @@
+#
+#
+
+# Copyright (C) 2014 Google Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS
+# IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+# TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+# PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+"""Cache for the state of LVM.
+
+Information about logical volumes, volume groups and physical volumes is
+needed by many node daemon requests. Instead of running C{lvs}, C{vgs} or
+C{pvs} with different options for each of them, a single report with all
+fields needed by any caller is run per command and kept for a short time.
+Any operation modifying LVM must call L{Invalidate}, or be decorated with
+L{InvalidatesCache}.
+
+Only the process modifying LVM invalidates its cache, so the node daemon
+also invalidates it at the start of every request. Reports are therefore
+only shared between the calls made while handling one request.
+
+"""
+
+import logging
+import threading
+import time
+
+from ganeti import errors
+from ganeti import utils
+from ganeti.storage import base
+
+
+LVS = "lvs"
+VGS = "vgs"
+PVS = "pvs"
+
+#: Fields reported for each command
+REPORT_FIELDS = {
+  LVS: ["vg_name", "lv_name", "lv_size", "lv_attr", "lv_kernel_major",
+        "lv_kernel_minor", "vg_extent_size", "stripes", "devices"],
+  VGS: ["vg_name", "vg_size", "vg_free", "vg_attr"],
+  PVS: ["pv_name", "vg_name", "pv_size", "pv_used", "pv_free", "pv_attr",
+        "lv_name"],
+  }
+
+#: Fields containing sizes, which are converted to MiB
+SIZE_FIELDS = frozenset([
+  "lv_size", "vg_extent_size", "vg_size", "vg_free", "pv_size", "pv_used",
+  "pv_free",
+  ])
+
+#: Number of seconds a report is used for
+DEFAULT_TTL = 10.0
+
+_SEP = "|"
+
+
+def _ParseReport(command, fields, output):
+  """Parses the output of an LVM report.
+
+  @rtype: list of dicts
+  @return: one dictionary per line, with sizes as floats in MiB
+  @raise errors.BlockDeviceError: if the output can't be parsed
+
+  """
+  rows = []
+  for line in output.splitlines():
+    values = line.strip().split(_SEP)
+
+    # Some LVM versions put another separator at the end of the line
+    if len(values) == len(fields) + 1 and values[-1] == "":
+      values.pop()
+
+    if len(values) != len(fields):
+      base.ThrowError("Can't parse %s output: line '%s'", command, line)
+
+    row = dict(zip(fields, values))
+    for name in SIZE_FIELDS.intersection(row):
+      try:
+        row[name] = float(row[name]) / (1024 * 1024)
+      except ValueError:
+        base.ThrowError("Can't parse %s output: invalid %s '%s'",
+                        command, name, row[name])
+    rows.append(row)
+
+  return rows
+
+
+class LvmCache(object):
+  """Cache for LVM reports.
+
+  Reports are run on demand and kept for a configurable time, unless
+  invalidated earlier.
+
+  """
+  def __init__(self, ttl=DEFAULT_TTL, _run_cmd_fn=None, _time_fn=time.time):
+    """Initializes this class.
+
+    @type ttl: float
+    @param ttl: number of seconds a report is used for
+
+    """
+    self._ttl = ttl
+    self._run_cmd_fn = _run_cmd_fn
+    self._time_fn = _time_fn
+    self._lock = threading.Lock()
+    self._generation = 0
+    self._reports = {}
+
+  def Invalidate(self):
+    """Discards all reports.
+
+    Reports which are being run while this is called are not stored either.
+
+    """
+    with self._lock:
+      self._generation += 1
+      self._reports.clear()
+
+  def _Run(self, command):
+    """Runs a report.
+
+    """
+    fields = REPORT_FIELDS[command]
+    cmd = [command, "--noheadings", "--nosuffix", "--units=b",
+           "--unbuffered", "--separator=%s" % _SEP,
+           "-o%s" % ",".join(fields)]
+
+    # Look up RunCmd at call time, so it can be replaced in tests
+    run_cmd_fn = self._run_cmd_fn or utils.RunCmd
+    result = run_cmd_fn(cmd)
+    if result.failed:
+      raise errors.CommandError("Can't get the volume information: %s - %s" %
+                                (result.fail_reason, result.output))
+
+    return _ParseReport(command, fields, result.stdout)
+
+  def GetReport(self, command):
+    """Returns the report of an LVM command.
+
+    @type command: string
+    @param command: one of L{LVS}, L{VGS} or L{PVS}
+    @rtype: list of dicts
+    @return: one dictionary per line of the report, containing the fields
+      listed in L{REPORT_FIELDS}; sizes are floats in MiB. The result is
+      shared between callers and must not be modified.
+    @raise errors.CommandError: if the command fails
+    @raise errors.BlockDeviceError: if the output of the command can't be
+      parsed
+
+    """
+    now = self._time_fn()
+    with self._lock:
+      cached = self._reports.get(command)
+      if cached is not None and now - cached[0] < self._ttl:
+        return cached[1]
+      generation = self._generation
+
+    rows = self._Run(command)
+
+    with self._lock:
+      if generation == self._generation:
+        self._reports[command] = (now, rows)
+      else:
+        logging.debug("LVM state changed while running %s, not caching the"
+                      " result", command)
+
+    return rows
+
+
+#: The cache used by this process
+_CACHE = LvmCache()
+
+
+def GetReport(command):
+  """Returns the report of an LVM command from the process-wide cache.
+
+  @see: L{LvmCache.GetReport}
+
+  """
+  return _CACHE.GetReport(command)
+
+
+def Invalidate():
+  """Invalidates the process-wide cache.
+
+  """
+  _CACHE.Invalidate()
+
+
+def InvalidatesCache(fn):
+  """Decorator for functions modifying the state of LVM.
+
+  The cache is invalidated after the function returns, whether it succeeds
+  or not.
+
+  """
+  def wrapper(*args, **kwargs):
+    try:
+      return fn(*args, **kwargs)
+    finally:
+      Invalidate()
+  wrapper.__name__ = fn.__name__
+  wrapper.__doc__ = fn.__doc__
+  return wrapper
@@ -35,7 +35,9 @@
 from __future__ import print_function
 
 import sys
+import csv
 import optparse
+import math
 import time
 import socket
 import urllib.request, urllib.parse, urllib.error
@@ -54,6 +56,7 @@ from ganeti import utils
 from ganeti import hypervisor
 from ganeti import compat
 from ganeti import pathutils
+from ganeti import serializer
 
 from ganeti.confd import client as confd_client
 from ganeti.runtime import (GetClient)
@@ -99,6 +102,23 @@ _IMPEXP_DISK_TEMPLATES = (_SUPPORTED_DISK_TEMPLATES - frozenset([
   ]))
 
 
+#: Phases of an opcode's execution recorded in benchmark mode
+_BENCHMARK_PHASES = ("queue", "lock", "exec", "total")
+
+#: Percentiles reported in benchmark mode
+_BENCHMARK_PERCENTILES = (50, 95, 99)
+
+#: Output formats for benchmark results
+_BENCHMARK_FORMATS = compat.UniqueFrozenset(["json", "csv"])
+
+#: Fields of a benchmark result
+_BENCHMARK_FIELDS = (["concurrency", "opcode", "phase", "count"] +
+                     ["p%s" % i for i in _BENCHMARK_PERCENTILES])
+
+#: Differences below this many seconds are never reported as regression
+_BENCHMARK_MIN_DIFF = 0.1
+
+
 class InstanceDown(Exception):
   """The checked instance was not up"""
 
@@ -140,6 +160,161 @@ def RandomString(size=8, chars=string.ascii_uppercase + string.digits):
   return ''.join(random.choice(chars) for x in range(size))
 
 
+def _Percentile(values, percent):
+  """Computes a percentile using the nearest-rank method.
+
+  @type values: list of numbers
+  @param values: Samples, must not be empty
+  @type percent: number
+  @param percent: Percentile (0-100)
+
+  """
+  assert values
+  values = sorted(values)
+  rank = int(math.ceil(percent / 100.0 * len(values)))
+  return values[max(rank, 1) - 1]
+
+
+class _BenchmarkRecorder(object):
+  """Collects the durations of the phases of executed opcodes.
+
+  """
+  def __init__(self):
+    """Initializes this class.
+
+    """
+    self._samples = {}
+
+  def AddJob(self, op_ids, received_ts, opstart, opexec, opend):
+    """Records the timestamps of a finished job.
+
+    The time an opcode spends in the queue is measured from the job's
+    submission (for the first opcode) or the end of the previous opcode,
+    the time spent waiting for locks from the opcode's start until its
+    execution begins.
+
+    @type op_ids: list of strings
+    @param op_ids: Opcode IDs of the job's opcodes
+    @param received_ts: Job's C{received_ts} field
+    @param opstart: Job's C{opstart} field
+    @param opexec: Job's C{opexec} field
+    @param opend: Job's C{opend} field
+
+    """
+    if received_ts is None:
+      return
+
+    previous = utils.MergeTime(received_ts)
+
+    for (op_id, start, execstart, end) in zip(op_ids, opstart, opexec, opend):
+      if start is None or execstart is None or end is None:
+        # Opcode didn't run
+        break
+
+      (start, execstart, end) = map(utils.MergeTime, (start, execstart, end))
+
+      for (phase, duration) in [("queue", start - previous),
+                                ("lock", execstart - start),
+                                ("exec", end - execstart),
+                                ("total", end - previous)]:
+        self._samples.setdefault((op_id, phase), []).append(duration)
+
+      previous = end
+
+  def GetStats(self, concurrency):
+    """Computes percentiles of the recorded durations.
+
+    @type concurrency: int or None
+    @param concurrency: Concurrency level the samples were recorded with
+    @rtype: list of dicts
+    @return: One entry per opcode and phase, see L{_BENCHMARK_FIELDS}
+
+    """
+    result = []
+
+    for ((op_id, phase), values) in \
+        sorted(self._samples.items(),
+               key=lambda item: (item[0][0],
+                                 _BENCHMARK_PHASES.index(item[0][1]))):
+      entry = {
+        "concurrency": concurrency,
+        "opcode": op_id,
+        "phase": phase,
+        "count": len(values),
+        }
+      for percent in _BENCHMARK_PERCENTILES:
+        entry["p%s" % percent] = round(_Percentile(values, percent), 6)
+      result.append(entry)
+
+    return result
+
+
+def _FormatBenchmarkResults(fmt, parameters, results):
+  """Formats benchmark results.
+
+  @type fmt: string
+  @param fmt: One of L{_BENCHMARK_FORMATS}
+  @type parameters: dict
+  @param parameters: Parameters the benchmark was run with
+  @type results: list of dicts
+  @param results: Results as returned by L{_BenchmarkRecorder.GetStats}
+  @rtype: string
+
+  """
+  if fmt == "json":
+    return serializer.DumpJson({
+      "parameters": parameters,
+      "results": results,
+      }).decode()
+
+  assert fmt == "csv"
+
+  buf = StringIO()
+  writer = csv.DictWriter(buf, _BENCHMARK_FIELDS, lineterminator="\n")
+  writer.writeheader()
+  for entry in results:
+    writer.writerow(entry)
+  return buf.getvalue()
+
+
+def _CompareBenchmarkResults(baseline, results, tolerance):
+  """Compares benchmark results with a baseline.
+
+  @type baseline: list of dicts
+  @param baseline: Results of an earlier run
+  @type results: list of dicts
+  @param results: Current results
+  @type tolerance: number
+  @param tolerance: By how many percent a percentile may exceed the baseline
+  @rtype: list of strings
+  @return: Descriptions of the regressions found
+
+  """
+  key_fn = lambda entry: (entry["concurrency"], entry["opcode"],
+                          entry["phase"])
+
+  previous = dict((key_fn(entry), entry) for entry in baseline)
+  regressions = []
+
+  for entry in results:
+    old = previous.get(key_fn(entry))
+    if old is None:
+      continue
+
+    for percent in _BENCHMARK_PERCENTILES:
+      name = "p%s" % percent
+      limit = old[name] * (100.0 + tolerance) / 100.0
+      if (entry[name] > limit and
+          entry[name] - old[name] >= _BENCHMARK_MIN_DIFF):
+        regressions.append("%s/%s (concurrency %s): %s increased from"
+                           " %.3fs to %.3fs" %
+                           (entry["opcode"], entry["phase"],
+                            entry["concurrency"], name, old[name],
+                            entry[name]))
+
+  return regressions
+
+
 class SimpleOpener(urllib.request.FancyURLopener):
   """A simple url opener"""
   # pylint: disable=W0221
@@ -282,6 +457,32 @@ OPTIONS = [
                  help=("Leave instances on the cluster after burnin,"
                        " for investigation in case of errors or simply"
                        " to use them")),
+  cli.cli_option("--benchmark", default=False, action="store_true",
+                 dest="benchmark",
+                 help=("Record how long each opcode spends queued, waiting"
+                       " for locks and executing, and report latency"
+                       " percentiles per opcode (implies --parallel)")),
+  cli.cli_option("--benchmark-concurrency", dest="benchmark_concurrency",
+                 default=None, type="string", metavar="<count,count,...>",
+                 help=("Repeat the burnin once per given number of jobs"
+                       " allowed to run at the same time (default: no"
+                       " limit)")),
+  cli.cli_option("--benchmark-format", dest="benchmark_format",
+                 choices=sorted(_BENCHMARK_FORMATS), default="json",
+                 help="Format of the benchmark results (json or csv)"),
+  cli.cli_option("--benchmark-output", dest="benchmark_output",
+                 default=None, metavar="<file>",
+                 help=("Write the benchmark results to this file instead"
+                       " of the standard output")),
+  cli.cli_option("--benchmark-baseline", dest="benchmark_baseline",
+                 default=None, metavar="<file>",
+                 help=("Compare the results with those of an earlier run"
+                       " (in JSON format) and fail on regressions")),
+  cli.cli_option("--benchmark-tolerance", dest="benchmark_tolerance",
+                 default=20, type="int", metavar="<percent>",
+                 help=("By how many percent a percentile may exceed the"
+                       " baseline before it's reported as regression"
+                       " (default 20)")),
   cli.REASON_OPT,
   ]
 
@@ -353,6 +554,31 @@ class JobHandler(FeedbackAccumulator):
   def __init__(self):
     self.cl = cli.GetClient()
 
+    #: Maximum number of jobs run at the same time, C{None} for no limit
+    self.concurrency = None
+
+    #: L{_BenchmarkRecorder} used in benchmark mode
+    self.recorder = None
+
+  def _RecordJobs(self, jobs):
+    """Records the durations of finished jobs in benchmark mode.
+
+    @type jobs: list of tuples
+    @param jobs: List of (job ID, list of opcodes)
+
+    """
+    if self.recorder is None or not jobs:
+      return
+
+    result = self.cl.QueryJobs([job_id for (job_id, _) in jobs],
+                               ["received_ts", "opstart", "opexec", "opend"])
+
+    for ((_, ops), data) in zip(jobs, result):
+      if data is None:
+        # Job has been archived already
+        continue
+      self.recorder.AddJob([op.OP_ID for op in ops], *data)
+
   def MaybeRetry(self, retry_count, msg, fn, *args):
     """Possibly retry a given function execution.
 
@@ -394,6 +620,7 @@ class JobHandler(FeedbackAccumulator):
     """
     job_id = cli.SendJob(ops, cl=self.cl)
     results = cli.PollJob(job_id, cl=self.cl, feedback_fn=self.Feedback)
+    self._RecordJobs([(job_id, ops)])
     if len(ops) == 1:
       return results[0]
     else:
@@ -455,18 +682,36 @@ class JobHandler(FeedbackAccumulator):
 
     The method will return the list of results, if all jobs are
     successful. Otherwise, OpExecError will be raised from within
-    cli.py.
+    cli.py. If the concurrency is limited, the jobs are submitted in
+    batches of that size.
 
     """
     self.ClearFeedbackBuf()
-    jex = cli.JobExecutor(cl=self.cl, feedback_fn=self.Feedback)
-    for ops, name, _ in jobs:
-      jex.QueueJob(name, *ops)
-    try:
-      results = jex.GetResults()
-    except Exception as err: # pylint: disable=W0703
-      Log("Jobs failed: %s", err)
-      raise BurninFailure()
+
+    if self.concurrency:
+      batch_size = self.concurrency
+    else:
+      batch_size = max(len(jobs), 1)
+
+    results = []
+    for start in range(0, len(jobs), batch_size):
+      batch = jobs[start:start + batch_size]
+      jex = cli.JobExecutor(cl=self.cl, feedback_fn=self.Feedback)
+      for ops, name, _ in batch:
+        jex.QueueJob(name, *ops)
+      try:
+        jex.SubmitPending()
+        job_ids = [job_id for (_, _, job_id, _) in jex.jobs]
+        batch_results = jex.GetResults()
+      except Exception as err: # pylint: disable=W0703
+        Log("Jobs failed: %s", err)
+        raise BurninFailure()
+
+      self._RecordJobs([(job_id, ops)
+                        for (job_id, (ops, _, _), (success, _)) in
+                          zip(job_ids, batch, batch_results)
+                        if success])
+      results.extend(batch_results)
 
     fail = False
     val = []
@@ -555,6 +800,26 @@ class Burner(JobHandler):
     if options.http_check and not options.name_check:
       Err("Can't enable HTTP checks without name checks")
 
+    if options.benchmark_concurrency:
+      try:
+        options.benchmark_concurrency = \
+          [int(v) for v in options.benchmark_concurrency.split(",")]
+      except ValueError:
+        Err("Invalid concurrency levels '%s'" % options.benchmark_concurrency)
+      if compat.any(v < 1 for v in options.benchmark_concurrency):
+        Err("Concurrency levels must be positive")
+    else:
+      options.benchmark_concurrency = [None]
+
+    if options.benchmark:
+      options.parallel = True
+      if options.keep_instances and len(options.benchmark_concurrency) > 1:
+        Err("Can't keep instances when benchmarking several concurrency"
+            " levels")
+    elif (options.benchmark_output or options.benchmark_baseline or
+          options.benchmark_concurrency != [None]):
+      Err("Benchmark options require --benchmark")
+
     self.opts = options
     self.instances = args
     self.bep = {
@@ -1267,6 +1532,66 @@ class Burner(JobHandler):
 
     return constants.EXIT_SUCCESS
 
+  def BenchmarkCluster(self):
+    """Runs the burnin once per concurrency level and reports timings.
+
+    """
+    opts = self.opts
+
+    baseline = None
+    if opts.benchmark_baseline:
+      try:
+        baseline = serializer.LoadJson(
+          utils.ReadFile(opts.benchmark_baseline))["results"]
+      except (EnvironmentError, ValueError, KeyError, TypeError) as err:
+        Err("Can't read benchmark baseline from %s: %s" %
+            (opts.benchmark_baseline, err))
+
+    results = []
+    for concurrency in opts.benchmark_concurrency:
+      if concurrency is None:
+        Log("Running benchmark")
+      else:
+        Log("Running benchmark with at most %s concurrent jobs", concurrency)
+
+      self.concurrency = concurrency
+      self.recorder = _BenchmarkRecorder()
+      try:
+        self.BurninCluster()
+        results.extend(self.recorder.GetStats(concurrency))
+      finally:
+        self.concurrency = None
+        self.recorder = None
+
+    parameters = {
+      "disk_template": opts.disk_template,
+      "hypervisor": self.hypervisor,
+      "instances": len(self.instances),
+      "nodes": len(self.nodes),
+      }
+
+    data = _FormatBenchmarkResults(opts.benchmark_format, parameters, results)
+    if opts.benchmark_output:
+      utils.WriteFile(opts.benchmark_output, data=data)
+    else:
+      sys.stdout.write(data)
+      sys.stdout.flush()
+
+    if baseline is not None:
+      regressions = _CompareBenchmarkResults(baseline, results,
+                                             opts.benchmark_tolerance)
+      if regressions:
+        Log("Performance regressions compared to %s:",
+            opts.benchmark_baseline)
+        for msg in regressions:
+          Log(msg, indent=1)
+        return constants.EXIT_FAILURE
+
+      Log("No performance regressions compared to %s",
+          opts.benchmark_baseline)
+
+    return constants.EXIT_SUCCESS
+
 
 def Main():
   """Main function.
@@ -1275,4 +1600,9 @@ def Main():
   utils.SetupLogging(pathutils.LOG_BURNIN, sys.argv[0],
                      debug=False, stderr_logging=True)
 
-  return Burner().BurninCluster()
+  burner = Burner()
+
+  if burner.opts.benchmark:
+    return burner.BenchmarkCluster()
+
+  return burner.BurninCluster()
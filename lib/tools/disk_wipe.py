@@ -0,0 +1,357 @@
+#
+#
+
+# Copyright (C) 2014 Google Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS
+# IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+# TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+# PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+"""Script to wipe the disks of an instance in the background.
+
+The node daemon starts this script when the master requests the disks of an
+instance to be wiped (see L{backend.StartDiskWipe}). All disks are wiped
+concurrently, except that at most a few disks on the same volume group or
+file system are wiped at the same time. Progress is reported to a status
+file, which the master polls; the offsets recorded there allow a wipe to be
+resumed by a new process.
+
+"""
+
+import logging
+import optparse
+import os
+import sys
+import threading
+import time
+
+from ganeti import cli
+from ganeti import constants
+from ganeti import errors
+from ganeti import ht
+from ganeti import objects
+from ganeti import serializer
+from ganeti import utils
+from ganeti.storage import devwriter
+
+
+#: Don't update the status file more than once every 5 seconds (unless forced)
+MIN_UPDATE_INTERVAL = 5.0
+
+#: Amount of data in MiB wiped before the offset of a disk is updated
+WIPE_STEP = constants.MAX_WIPE_CHUNK
+
+_TASK_CHECK = ht.TStrictDict(True, True, {
+  "parallel": ht.TPositiveInt,
+  "disks": ht.TListOf(ht.TStrictDict(True, True, {
+    "path": ht.TNonEmptyString,
+    "group": ht.TString,
+    "offset": ht.TNonNegativeInt,
+    "size": ht.TNonNegativeInt,
+    })),
+  })
+
+
+class StatusFile(object):
+  """Status file manager.
+
+  Disks are wiped by multiple threads, so all methods are thread-safe.
+
+  """
+  def __init__(self, path, disks, _time_fn=time.time):
+    """Initializes this class.
+
+    @type path: string
+    @param path: Path of the status file
+    @type disks: list of dict
+    @param disks: Disks as given in the task description
+
+    """
+    self._path = path
+    self._time_fn = _time_fn
+    self._lock = threading.Lock()
+    self._start_offsets = [disk["offset"] for disk in disks]
+    self._data = objects.DiskWipeStatus(ctime=_time_fn(), mtime=None,
+                                        disks=[{
+                                          "offset": disk["offset"],
+                                          "size": disk["size"],
+                                          "methods": None,
+                                          "error": None,
+                                          } for disk in disks])
+
+  def SetOffset(self, idx, offset):
+    """Sets the offset up to which a disk has been wiped.
+
+    @type offset: int
+    @param offset: Offset in MiB
+
+    """
+    with self._lock:
+      self._data.disks[idx]["offset"] = offset
+      self._UpdateProgress()
+
+  def SetDone(self, idx, methods):
+    """Marks a disk as completely wiped.
+
+    @type methods: string
+    @param methods: The methods used for wiping
+
+    """
+    with self._lock:
+      self._data.disks[idx]["methods"] = methods
+
+  def SetError(self, idx, error_message):
+    """Records an error while wiping a disk.
+
+    """
+    with self._lock:
+      self._data.disks[idx]["error"] = error_message
+
+  def SetExitStatus(self, exit_status, error_message):
+    """Sets the exit status and an error message.
+
+    """
+    # Require error message when status isn't 0
+    assert exit_status == 0 or error_message
+
+    with self._lock:
+      self._data.exit_status = exit_status
+      self._data.error_message = error_message
+
+  def _UpdateProgress(self):
+    """Calculates the progress of all disks and the expected remaining time.
+
+    """
+    done = 0
+    total = 0
+    for (start, disk) in zip(self._start_offsets, self._data.disks):
+      done += disk["offset"] - start
+      total += disk["size"] - start
+
+    if total:
+      self._data.progress_percent = 100.0 * done / total
+
+    if done:
+      elapsed = self._time_fn() - self._data.ctime
+      self._data.progress_eta = (total - done) * elapsed / done
+
+  def GetData(self):
+    """Returns a copy of the current status.
+
+    @rtype: L{objects.DiskWipeStatus}
+
+    """
+    with self._lock:
+      return self._data.Copy()
+
+  def Update(self, force):
+    """Updates the status file.
+
+    @type force: bool
+    @param force: Write status file in any case, not only when minimum interval
+                  is expired
+
+    """
+    with self._lock:
+      now = self._time_fn()
+
+      if not (force or
+              self._data.mtime is None or
+              now > (self._data.mtime + MIN_UPDATE_INTERVAL)):
+        return
+
+      logging.debug("Updating status file %s", self._path)
+
+      self._data.mtime = now
+      utils.WriteFile(self._path,
+                      data=serializer.DumpJson(self._data.ToDict()),
+                      mode=0o400)
+
+
+def _WipeDisk(path, offset, size, set_offset_fn, stop_event):
+  """Wipes a single disk.
+
+  @type path: string
+  @param path: Path of the disk
+  @type offset: int
+  @param offset: Offset in MiB to start at
+  @type size: int
+  @param size: Size of the disk in MiB
+  @type set_offset_fn: callable
+  @param set_offset_fn: Called with the new offset after every step
+  @type stop_event: C{threading.Event}
+  @param stop_event: Set when wiping should stop early
+  @rtype: string or None
+  @return: The methods used for wiping, C{None} if wiping was stopped
+
+  """
+  logging.info("Wiping %s from %s to %s", path, offset, size)
+
+  writer = devwriter.DeviceWriter(path)
+  try:
+    writer.Truncate(offset * constants.DD_BLOCK_SIZE)
+
+    while offset < size:
+      if stop_event.is_set():
+        writer.Abort()
+        return None
+
+      length = min(WIPE_STEP, size - offset)
+      writer.Zero(offset * constants.DD_BLOCK_SIZE,
+                  length * constants.DD_BLOCK_SIZE)
+      offset += length
+      set_offset_fn(offset)
+  except:
+    writer.Abort()
+    raise
+
+  (methods, written, duration) = writer.Close()
+  logging.info("Wiped %s (%s bytes written) in %.1f seconds using %s",
+               path, written, duration, methods)
+
+  return methods
+
+
+def WipeDisks(status, disks, parallel, _wipe_fn=_WipeDisk):
+  """Wipes disks concurrently.
+
+  Disks are grouped by their C{group} value, usually the volume group or file
+  system they're on. At most C{parallel} disks of the same group are wiped at
+  the same time. If wiping a disk fails, no further disks are started and the
+  disks being wiped are stopped after their current step.
+
+  @type status: L{StatusFile}
+  @type disks: list of dict
+  @param disks: Disks as given in the task description
+  @type parallel: int
+  @param parallel: Maximum number of disks per group wiped at the same time
+  @rtype: bool
+  @return: Whether all disks were wiped
+
+  """
+  groups = {}
+  for (idx, disk) in enumerate(disks):
+    groups.setdefault(disk["group"], []).append(idx)
+
+  lock = threading.Lock()
+  stop_event = threading.Event()
+
+  def _Worker(queue):
+    while not stop_event.is_set():
+      with lock:
+        if not queue:
+          return
+        idx = queue.pop(0)
+
+      disk = disks[idx]
+
+      def _SetOffset(offset, idx=idx):
+        status.SetOffset(idx, offset)
+        status.Update(False)
+
+      try:
+        methods = _wipe_fn(disk["path"], disk["offset"], disk["size"],
+                           _SetOffset, stop_event)
+      except Exception as err: # pylint: disable=W0703
+        logging.exception("Wiping disk %s (%s) failed", idx, disk["path"])
+        status.SetError(idx, str(err))
+        stop_event.set()
+      else:
+        if methods is not None:
+          status.SetDone(idx, methods)
+
+      status.Update(True)
+
+  threads = []
+  for (group, queue) in sorted(groups.items()):
+    count = min(parallel, len(queue))
+    logging.info("Wiping %s disk(s) of group '%s', %s at a time",
+                 len(queue), group, count)
+    for _ in range(count):
+      threads.append(threading.Thread(target=_Worker, args=(queue, )))
+
+  for thread in threads:
+    thread.start()
+
+  for thread in threads:
+    thread.join()
+
+  return not stop_event.is_set()
+
+
+def ParseOptions():
+  """Parses the options passed to the program.
+
+  @return: Options and arguments
+
+  """
+  program = os.path.basename(sys.argv[0])
+
+  parser = optparse.OptionParser(
+    usage="%prog [--verbose] [--debug] <task-file> <status-file>",
+    prog=program)
+  parser.add_option(cli.DEBUG_OPT)
+  parser.add_option(cli.VERBOSE_OPT)
+
+  (opts, args) = parser.parse_args()
+
+  if len(args) != 2:
+    parser.error("Expected exactly two arguments")
+
+  return (opts, args)
+
+
+def Main():
+  """Main routine.
+
+  """
+  (opts, (task_file, status_file)) = ParseOptions()
+
+  utils.SetupToolLogging(opts.debug, opts.verbose, threadname=True)
+
+  try:
+    task = serializer.LoadAndVerifyJson(utils.ReadFile(task_file),
+                                        _TASK_CHECK)
+  except (EnvironmentError, errors.ParseError) as err:
+    logging.error("Can't load task description from %s: %s", task_file, err)
+    return constants.EXIT_FAILURE
+
+  status = StatusFile(status_file, task["disks"])
+  status.Update(True)
+
+  try:
+    if WipeDisks(status, task["disks"], task["parallel"]):
+      status.SetExitStatus(0, None)
+    else:
+      status.SetExitStatus(constants.EXIT_FAILURE, "Wiping disks failed")
+  except Exception as err: # pylint: disable=W0703
+    logging.exception("Unhandled error while wiping disks")
+    status.SetExitStatus(constants.EXIT_FAILURE, str(err))
+
+  status.Update(True)
+
+  if status.GetData().exit_status:
+    return constants.EXIT_FAILURE
+
+  return constants.EXIT_SUCCESS
@@ -95,7 +95,8 @@ def EnsureQueueDir(path, mode, uid, gid):
 
   """
   for filename in utils.ListVisibleFiles(path):
-    if constants.JOB_FILE_RE.match(filename):
+    if (constants.JOB_FILE_RE.match(filename) or
+        constants.JOB_LOG_FILE_RE.match(filename)):
       utils.EnforcePermission(utils.PathJoin(path, filename), mode, uid=uid,
                               gid=gid)
 
@@ -175,6 +176,10 @@ def GetPaths():
      getent.masterd_uid, getent.masterd_gid, False),
     (pathutils.WATCHER_PAUSEFILE, FILE, 0o644,
      getent.masterd_uid, getent.masterd_gid, False),
+    (pathutils.METRICS_FILE, FILE, 0o640,
+     getent.masterd_uid, getent.masterd_gid, False),
+    (pathutils.METRICS_LOCK_FILE, FILE, 0o640,
+     getent.masterd_uid, getent.masterd_gid, False),
     ]
 
   ss = ssconf.SimpleStore()
@@ -215,6 +220,8 @@ def GetPaths():
      getent.noded_uid, getent.masterd_gid),
     (pathutils.IMPORT_EXPORT_DIR, DIR, 0o755,
      getent.noded_uid, getent.masterd_gid),
+    (pathutils.DISK_WIPE_DIR, DIR, 0o755,
+     getent.noded_uid, getent.masterd_gid),
     (pathutils.LOG_DIR, DIR, 0o770, getent.masterd_uid, getent.daemons_gid),
     (masterd_log, FILE, 0o600, getent.masterd_uid, getent.masterd_gid, False),
     (confd_log, FILE, 0o600, getent.confd_uid, getent.masterd_gid, False),
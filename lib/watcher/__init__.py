@@ -59,6 +59,7 @@ from ganeti import qlang
 from ganeti import ssconf
 from ganeti import ht
 from ganeti import pathutils
+from ganeti import workerpool
 
 import ganeti.rapi.client # pylint: disable=W0611
 from ganeti.rapi.client import UsesRapiClient
@@ -84,6 +85,16 @@ CHILD_PROCESS_DELAY = 1.0
 #: How many seconds to wait for instance status file lock
 INSTANCE_STATUS_LOCK_TIMEOUT = 10.0
 
+#: Maximum number of node groups checked at the same time by a watcher
+#: running in a single process
+GROUP_WATCHER_THREADS = 10
+
+#: Fields queried for instances and nodes, the last one being the node group
+_INSTANCE_FIELDS = ["name", "status", "admin_state", "admin_state_source",
+                    "disks_active", "snodes", "snodes.group.uuid",
+                    "disk_template", "pnode.group.uuid"]
+_NODE_FIELDS = ["name", "bootid", "offline", "group.uuid"]
+
 
 class NotMasterError(errors.GenericError):
   """Exception raised when this host is not the master."""
@@ -480,6 +491,11 @@ def ParseOptions():
                     help="Don't wait for child processes")
   parser.add_option("--no-verify-disks", dest="no_verify_disks", default=False,
                     action="store_true", help="Do not verify disk status")
+  parser.add_option("--single-process", dest="single_process", default=False,
+                    action="store_true",
+                    help=("Check all node groups from a single process"
+                          " instead of starting one child process per"
+                          " node group"))
   parser.add_option("--rapi-ip", dest="rapi_ip",
                     default=constants.IP4_ADDRESS_LOCALHOST,
                     help="Use this IP to talk to RAPI.")
@@ -687,7 +703,8 @@ def _CheckMaster(cl):
 def _GlobalWatcher(opts):
   """Main function for global watcher.
 
-  At the end child processes are spawned for every node group.
+  At the end child processes are spawned for every node group, unless all
+  groups are checked from this process (C{--single-process}).
 
   """
   StartNodeDaemons()
@@ -733,14 +750,17 @@ def _GlobalWatcher(opts):
   _CheckMaster(client)
   _ArchiveJobs(client, opts.job_age)
 
-  # Spawn child processes for all node groups
-  _StartGroupChildren(client, opts.wait_children)
+  if opts.single_process:
+    _WatchAllGroups(opts, client)
+  else:
+    # Spawn child processes for all node groups
+    _StartGroupChildren(client, opts.wait_children)
 
   return constants.EXIT_SUCCESS
 
 
-def _GetGroupData(qcl, uuid):
-  """Retrieves instances and nodes per node group.
+def _GetLockedInstances(qcl):
+  """Returns the names of all instances which are currently locked.
 
   """
   locks = qcl.Query(constants.QR_LOCK, ["name", "mode"], None)
@@ -754,14 +774,19 @@ def _GetGroupData(qcl, uuid):
     if name.startswith(prefix) and lock:
       locked_instances.add(name[prefix_len:])
 
+  return locked_instances
+
+
+def _QueryInstancesAndNodes(qcl, instance_filter, node_filter):
+  """Queries instances and nodes.
+
+  @return: tuple containing the rows of instances and nodes, see
+    L{_INSTANCE_FIELDS} and L{_NODE_FIELDS}
+
+  """
   queries = [
-      (constants.QR_INSTANCE,
-       ["name", "status", "admin_state", "admin_state_source", "disks_active",
-        "snodes", "pnode.group.uuid", "snodes.group.uuid", "disk_template"],
-       [qlang.OP_EQUAL, "pnode.group.uuid", uuid]),
-      (constants.QR_NODE,
-       ["name", "bootid", "offline"],
-       [qlang.OP_EQUAL, "group.uuid", uuid]),
+      (constants.QR_INSTANCE, _INSTANCE_FIELDS, instance_filter),
+      (constants.QR_NODE, _NODE_FIELDS, node_filter),
       ]
 
   results_data = [
@@ -774,16 +799,23 @@ def _GetGroupData(qcl, uuid):
       ht.TListOf(ht.TListOf(ht.TIsLength(2)))(d) for d in results_data)
 
   # Extract values ignoring result status
-  (raw_instances, raw_nodes) = [[[v[1] for v in values]
-                                 for values in res]
-                                for res in results_data]
+  return tuple([[v[1] for v in values]
+                for values in res]
+               for res in results_data)
 
+
+def _BuildGroupData(raw_instances, raw_nodes, locked_instances):
+  """Builds the instance and node objects of a node group.
+
+  @see: L{_GetGroupData}
+
+  """
   secondaries = {}
   instances = []
 
   # Load all instances
   for (name, status, config_state, config_state_source, disks_active, snodes,
-       pnode_group_uuid, snodes_group_uuid, disk_template) in raw_instances:
+       snodes_group_uuid, disk_template, pnode_group_uuid) in raw_instances:
     if snodes and set([pnode_group_uuid]) != set(snodes_group_uuid):
       logging.error("Ignoring split instance '%s', primary group %s, secondary"
                     " groups %s", name, pnode_group_uuid,
@@ -797,13 +829,58 @@ def _GetGroupData(qcl, uuid):
 
   # Load all nodes
   nodes = [Node(name, bootid, offline, secondaries.get(name, set()))
-           for (name, bootid, offline) in raw_nodes]
+           for (name, bootid, offline, _) in raw_nodes]
 
   return (dict((node.name, node) for node in nodes),
           dict((inst.name, inst) for inst in instances),
           locked_instances)
 
 
+def _GetGroupData(qcl, uuid):
+  """Retrieves instances and nodes per node group.
+
+  """
+  locked_instances = _GetLockedInstances(qcl)
+
+  (raw_instances, raw_nodes) = \
+    _QueryInstancesAndNodes(qcl, [qlang.OP_EQUAL, "pnode.group.uuid", uuid],
+                            [qlang.OP_EQUAL, "group.uuid", uuid])
+
+  return _BuildGroupData(raw_instances, raw_nodes, locked_instances)
+
+
+def _GetAllGroupData(qcl, groups):
+  """Retrieves instances and nodes of all node groups at once.
+
+  @type groups: list of strings
+  @param groups: UUIDs of the node groups
+  @rtype: dict
+  @return: the result of L{_GetGroupData} for every node group, indexed by
+    group UUID
+
+  """
+  locked_instances = _GetLockedInstances(qcl)
+
+  (raw_instances, raw_nodes) = _QueryInstancesAndNodes(qcl, None, None)
+
+  group_instances = dict((uuid, []) for uuid in groups)
+  group_nodes = dict((uuid, []) for uuid in groups)
+
+  for (rows, result) in [(raw_instances, group_instances),
+                         (raw_nodes, group_nodes)]:
+    for row in rows:
+      # The group is the last field
+      try:
+        result[row[-1]].append(row)
+      except KeyError:
+        logging.debug("Ignoring '%s' in unknown node group %s", row[0],
+                      row[-1])
+
+  return dict((uuid, _BuildGroupData(group_instances[uuid], group_nodes[uuid],
+                                     locked_instances))
+              for uuid in groups)
+
+
 def _LoadKnownGroups():
   """Returns a list of all node groups known by L{ssconf}.
 
@@ -819,6 +896,28 @@ def _LoadKnownGroups():
   return result
 
 
+def _CheckGroup(opts, cl, notepad, group_uuid, nodes, instances, locks):
+  """Checks the instances and disks of a node group.
+
+  """
+  started = _CheckInstances(cl, notepad, instances, locks)
+  _CheckDisks(cl, notepad, nodes, instances, started)
+
+  # Check if the nodegroup only has ext storage type
+  only_ext = compat.all(i.disk_template == constants.DT_EXT
+                        for i in instances.values())
+
+  # We skip current NodeGroup verification if there are only external storage
+  # devices. Currently we provide an interface for external storage provider
+  # for disk verification implementations, however current ExtStorageDevice
+  # does not provide an API for this yet.
+  #
+  # This check needs to be revisited if ES_ACTION_VERIFY on ExtStorageDevice
+  # is implemented.
+  if not opts.no_verify_disks and not only_ext:
+    _VerifyDisks(cl, group_uuid, nodes, instances)
+
+
 def _GroupWatcher(opts):
   """Main function for per-group watcher process.
 
@@ -867,22 +966,7 @@ def _GroupWatcher(opts):
                          pathutils.WATCHER_GROUP_INSTANCE_STATUS_FILE,
                          known_groups)
 
-    started = _CheckInstances(client, notepad, instances, locks)
-    _CheckDisks(client, notepad, nodes, instances, started)
-
-    # Check if the nodegroup only has ext storage type
-    only_ext = compat.all(i.disk_template == constants.DT_EXT
-                          for i in instances.values())
-
-    # We skip current NodeGroup verification if there are only external storage
-    # devices. Currently we provide an interface for external storage provider
-    # for disk verification implementations, however current ExtStorageDevice
-    # does not provide an API for this yet.
-    #
-    # This check needs to be revisited if ES_ACTION_VERIFY on ExtStorageDevice
-    # is implemented.
-    if not opts.no_verify_disks and not only_ext:
-      _VerifyDisks(client, group_uuid, nodes, instances)
+    _CheckGroup(opts, client, notepad, group_uuid, nodes, instances, locks)
   except Exception as err:
     logging.info("Not updating status file due to failure: %s", err)
     raise
@@ -893,6 +977,78 @@ def _GroupWatcher(opts):
   return constants.EXIT_SUCCESS
 
 
+def _WatchGroup(opts, group_uuid, group_data):
+  """Checks a node group in a thread of a single-process watcher.
+
+  @see: L{_GroupWatcher}
+
+  """
+  state_path = pathutils.WATCHER_GROUP_STATE_FILE % group_uuid
+
+  statefile = state.OpenStateFile(state_path) # pylint: disable=E0602
+  if not statefile:
+    return
+
+  notepad = state.WatcherState(statefile) # pylint: disable=E0602
+  try:
+    # LUXI clients can't be shared between threads
+    client = GetLuxiClient(False)
+
+    (nodes, instances, locks) = group_data
+    _CheckGroup(opts, client, notepad, group_uuid, nodes, instances, locks)
+  except Exception: # pylint: disable=W0703
+    logging.exception("Not updating status file for node group '%s' due to"
+                      " failure", group_uuid)
+  else:
+    # Save changes for next run
+    notepad.Save(state_path)
+
+
+class _GroupWatcherWorker(workerpool.BaseWorker):
+  """Worker checking one node group.
+
+  """
+  def RunTask(self, *args):
+    """Runs L{_WatchGroup}.
+
+    """
+    _WatchGroup(*args)
+
+
+def _WatchAllGroups(opts, cl):
+  """Checks all node groups from the current process.
+
+  Unlike L{_StartGroupChildren}, the instances and nodes of all groups are
+  retrieved with a single set of queries; the groups are then checked
+  concurrently by a limited number of threads.
+
+  """
+  known_groups = _LoadKnownGroups()
+
+  all_data = _GetAllGroupData(cl, known_groups)
+
+  for (group_uuid, (_, instances, _)) in all_data.items():
+    _UpdateInstanceStatus(pathutils.WATCHER_GROUP_INSTANCE_STATUS_FILE %
+                          group_uuid, list(instances.values()))
+
+  _MergeInstanceStatus(pathutils.INSTANCE_STATUS_FILE,
+                       pathutils.WATCHER_GROUP_INSTANCE_STATUS_FILE,
+                       known_groups)
+
+  if not all_data:
+    return
+
+  pool = workerpool.WorkerPool("Watcher",
+                               min(len(all_data), GROUP_WATCHER_THREADS),
+                               _GroupWatcherWorker)
+  try:
+    pool.AddManyTasks([(opts, group_uuid, group_data)
+                       for (group_uuid, group_data) in all_data.items()])
+    pool.Quiesce()
+  finally:
+    pool.TerminateWorkers()
+
+
 def Main():
   """Main function.
 
@@ -321,6 +321,11 @@ maxWipeChunk = 1024
 minWipeChunkPercent :: Int
 minWipeChunkPercent = 10
 
+-- | Maximum number of disks wiped in parallel on the same volume group
+-- or file system
+wipeMaxParallel :: Int
+wipeMaxParallel = 2
+
 -- * Directories
 
 runDirsMode :: Int
@@ -1408,6 +1413,23 @@ rpcTmo_1day = Types.rpcTimeoutToRaw OneDay
 rpcConnectTimeout :: Int
 rpcConnectTimeout = 5
 
+-- | Maximum number of idle connections kept open to a single node
+rpcPoolMaxIdlePerNode :: Int
+rpcPoolMaxIdlePerNode = 4
+
+-- | Maximum number of idle connections kept open to all nodes together
+rpcPoolMaxIdle :: Int
+rpcPoolMaxIdle = 1024
+
+-- | Time after which idle connections to nodes are closed (seconds)
+rpcPoolIdleTimeout :: Int
+rpcPoolIdleTimeout = 30
+
+-- | Minimum size of RPC request and response bodies compressed with the
+-- "deflate" content coding (bytes)
+rpcCompressionMinSize :: Int
+rpcCompressionMinSize = 4096
+
 -- OS
 
 osScriptCreate :: String
@@ -4421,6 +4443,11 @@ wconfdDefCtmo = 10
 wconfdDefRwto :: Int
 wconfdDefRwto = 60
 
+-- | Number of configuration modifications WConfD keeps track of, so that
+-- clients can fetch only the changes since their copy of the configuration.
+wconfdConfigHistorySize :: Int
+wconfdConfigHistorySize = 100
+
 -- | The prefix of the WConfD livelock file name.
 wconfLivelockPrefix :: String
 wconfLivelockPrefix = "wconf-daemon"
@@ -5146,6 +5173,9 @@ luxiReqQueryClusterInfo = "QueryClusterInfo"
 luxiReqQueryTags :: String
 luxiReqQueryTags = "QueryTags"
 
+luxiReqQueryMetrics :: String
+luxiReqQueryMetrics = "QueryMetrics"
+
 luxiReqSetDrainFlag :: String
 luxiReqSetDrainFlag = "SetDrainFlag"
 
@@ -5167,6 +5197,7 @@ luxiReqAll =
   , luxiReqQueryGroups
   , luxiReqQueryInstances
   , luxiReqQueryJobs
+  , luxiReqQueryMetrics
   , luxiReqQueryNodes
   , luxiReqQueryNetworks
   , luxiReqQueryTags
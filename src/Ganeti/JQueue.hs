@@ -56,11 +56,16 @@ module Ganeti.JQueue
     , calcJobPriority
     , jobFileName
     , liveJobFile
+    , liveJobLogFile
     , archivedJobFile
     , determineJobDirectories
     , getJobIDs
     , sortJobIDs
+    , JobLogEntry
+    , parseJobLog
+    , mergeJobLog
     , loadJobFromDisk
+    , compactJobFile
     , noSuchJob
     , readSerialFromDisk
     , allocateJobIds
@@ -320,6 +325,11 @@ parseJobFileId path =
 liveJobFile :: FilePath -> JobId -> FilePath
 liveJobFile rootdir jid = rootdir </> jobFileName jid
 
+-- | Computes the full path to the log of a live job, holding the log
+-- entries added since the job file was last written.
+liveJobLogFile :: FilePath -> JobId -> FilePath
+liveJobLogFile rootdir jid = liveJobFile rootdir jid ++ ".log"
+
 -- | Computes the full path to an archives job. BROKEN.
 archivedJobFile :: FilePath -> JobId -> FilePath
 archivedJobFile rootdir jid =
@@ -446,19 +456,75 @@ readJobDataFromDisk rootdir archived jid = do
 noSuchJob :: Result (QueuedJob, Bool)
 noSuchJob = Bad "Can't load job file"
 
--- | Loads a job from disk.
+-- | An entry of a job log, consisting of the index of the opcode and the
+-- log entry itself.
+type JobLogEntry = (Int, (Int, Timestamp, ELogType, JSValue))
+
+-- | Reads the log of a live job. A missing log is treated as empty.
+readJobLogFromDisk :: FilePath -> JobId -> IO String
+readJobLogFromDisk rootdir jid = do
+  let path = liveJobLogFile rootdir jid
+  contents <- readFile path `Control.Exception.catch`
+                ignoreIOError "" True ("Failed to read job log " ++ path)
+  -- read the whole file, so that it gets closed
+  return $! length contents `seq` contents
+
+-- | Parses a job log, one entry per line. Lines which can't be parsed,
+-- such as an incomplete last line of a job log being written, are
+-- ignored.
+parseJobLog :: String -> [JobLogEntry]
+parseJobLog = mapMaybe parseLine . lines
+  where parseLine line = case Text.JSON.decode line of
+                           Text.JSON.Ok entry -> Just entry
+                           Text.JSON.Error _ -> Nothing
+
+-- | Adds the entries of a job log to a job. Entries already contained in
+-- the job, as the job file was written after them, are skipped.
+mergeJobLog :: [JobLogEntry] -> QueuedJob -> QueuedJob
+mergeJobLog [] job = job
+mergeJobLog entries job =
+  let logSerial (s, _, _, _) = s
+      lastSerial = maximum . (0:) . map logSerial . concatMap qoLog $ qjOps job
+      new = filter ((> lastSerial) . logSerial . snd) entries
+      addEntries idx op =
+        op { qoLog = qoLog op ++ [ entry | (i, entry) <- new, i == idx ] }
+  in job { qjOps = zipWith addEntries [0..] $ qjOps job }
+
+-- | Loads a job from disk. For live jobs, the entries of the job log
+-- are added to the job.
 loadJobFromDisk :: FilePath -> Bool -> JobId -> IO (Result (QueuedJob, Bool))
 loadJobFromDisk rootdir archived jid = do
   raw <- readJobDataFromDisk rootdir archived jid
+  logEntries <- case raw of
+                  Just (_, False) ->
+                    liftM parseJobLog $ readJobLogFromDisk rootdir jid
+                  _ -> return []
   -- note: we need some stricness below, otherwise the wrapping in a
   -- Result will create too much lazyness, and not close the file
   -- descriptors for the individual jobs
   return $! case raw of
              Nothing -> noSuchJob
              Just (str, arch) ->
-               liftM (\qj -> (qj, arch)) .
+               liftM (\qj -> (mergeJobLog logEntries qj, arch)) .
                fromJResult "Parsing job file" $ Text.JSON.decode str
 
+-- | Compacts a live job and its job log into a single job file, so that
+-- it can be archived by renaming the job file. The job must have been
+-- loaded with 'loadJobFromDisk', so that it contains the entries of the
+-- job log.
+compactJobFile :: FilePath -> QueuedJob -> IO (Result ())
+compactJobFile rootdir job = do
+  let logfile = liveJobLogFile rootdir $ qjId job
+  haslog <- doesFileExist logfile
+  if not haslog
+    then return $ Ok ()
+    else do
+      written <- writeJobToDisk rootdir job
+      case written of
+        Bad s -> return $ Bad s
+        Ok () -> tryAndLogIOError (removeFile logfile)
+                   ("Failed to remove " ++ logfile) Ok
+
 -- | Write a job to disk.
 writeJobToDisk :: FilePath -> QueuedJob -> IO (Result ())
 writeJobToDisk rootdir job = do
@@ -723,8 +789,9 @@ archiveSomeJobsUntil replicateFn qDir endt cutt arch torepl (jid:jids) = do
             then do
               let live = liveJobFile qDir jid
                   archive = archivedJobFile qDir jid
-              renameResult <- safeRenameFile queueDirPermissions
-                                live archive
+              renameResult <- runResultT $ do
+                mkResultT $ compactJobFile qDir job
+                mkResultT $ safeRenameFile queueDirPermissions live archive
               case renameResult of
                 Bad s -> do
                   logWarning $ "Renaming " ++ live ++ " to " ++ archive
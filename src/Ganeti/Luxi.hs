@@ -145,6 +145,7 @@ $(genLuxiOp "LuxiOp"
      [ simpleField "fields" [t| [String] |] ]
     )
   , (luxiReqQueryClusterInfo, [])
+  , (luxiReqQueryMetrics, [])
   , (luxiReqQueryTags,
      [ pTagsObject
      , simpleField "name" [t| String |]
@@ -266,6 +267,8 @@ decodeLuxiCall method args = do
               return $ QueryGroups names fields locking
     ReqQueryClusterInfo ->
               return QueryClusterInfo
+    ReqQueryMetrics ->
+              return QueryMetrics
     ReqQueryNetworks -> do
               (names, fields, locking) <- fromJVal args
               return $ QueryNetworks names fields locking
@@ -48,6 +48,7 @@ module Ganeti.Path
   , lockStatusFile
   , tempResStatusFile
   , watcherPauseFile
+  , metricsFile
   , nodedCertFile
   , nodedClientCertFile
   , queueDir
@@ -148,6 +149,10 @@ tempResStatusFile  = dataDirP "tempres.data"
 watcherPauseFile :: IO FilePath
 watcherPauseFile = dataDirP "watcher.pause"
 
+-- | Path to the file with the metrics recorded by jobs.
+metricsFile :: IO FilePath
+metricsFile = dataDirP "metrics.data"
+
 -- | Path to the noded certificate.
 nodedCertFile :: IO FilePath
 nodedCertFile = dataDirP "server.pem"
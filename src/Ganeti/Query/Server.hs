@@ -89,7 +89,7 @@ import Ganeti.Query.Filter (makeSimpleFilter)
 import Ganeti.THH.HsRPC (runRpcClient, RpcClientMonad)
 import Ganeti.Types
 import qualified Ganeti.UDSServer as U (Handler(..), listener)
-import Ganeti.Utils ( lockFile, exitIfBad, exitUnless, watchFile
+import Ganeti.Utils ( lockFile, exitIfBad, exitUnless, watchFiles
                     , safeRenameFile, newUUID, isUUID )
 import Ganeti.Utils.Monad (orM)
 import Ganeti.Utils.MVarLock
@@ -280,6 +280,26 @@ handleCall _ _ cdata QueryClusterInfo =
     Ok _ -> return . Ok . J.makeObj $ obj
     Bad ex -> return $ Bad ex
 
+handleCall _ _ _ QueryMetrics = do
+  mfile <- Path.metricsFile
+  exists <- doesFileExist mfile
+  if not exists
+    then return . Ok $ J.makeObj ([] :: [(String, JSValue)])
+    else do
+      -- read the whole file, so that it gets closed before decoding
+      result <- try $ do
+                  contents <- readFile mfile
+                  _ <- evaluate $ length contents
+                  return contents
+      return $ case result of
+        Left e -> Bad . GenericError $ "Can't read metrics file: "
+                    ++ show (e :: IOException)
+        Right contents ->
+          case J.decode contents of
+            J.Ok metrics -> Ok metrics
+            J.Error msg -> Bad . GenericError $
+                             "Can't parse metrics file: " ++ msg
+
 handleCall _ _ cfg (QueryTags kind name) = do
   let tags = case kind of
                TagKindCluster  -> Ok . clusterTags $ configCluster cfg
@@ -388,6 +408,9 @@ handleCall _ _ cfg (QueryConfigValues fields) = do
                   return $ clusterProperty clusterModifySshSetup)
                , ("ssh_key_type", return $ clusterProperty clusterSshKeyType)
                , ("ssh_key_bits", return $ clusterProperty clusterSshKeyBits)
+               , ("config_serial", return . showJSON $ configSerial cfg)
+               , ("queue_serial", liftM (genericResult (const JSNull) showJSON)
+                                    readSerialFromDisk)
                ] :: [(String, IO JSValue)]
   let answer = map (fromMaybe (return JSNull) . flip lookup params) fields
   answerEval <- sequence answer
@@ -529,7 +552,9 @@ handleCall qlock qstat cfg (ArchiveJob jid) =
     withLock qlock $ do
       lift . withErrorT JobQueueError
            . annotateError "Archiving failed in an unexpected way"
-           . mkResultT $ safeRenameFile queueDirPermissions live archive
+           $ do
+               mkResultT $ compactJobFile qDir job
+               mkResultT $ safeRenameFile queueDirPermissions live archive
     _ <- liftIO . executeRpcCall mcs
                 $ RpcCallJobqueueRename [(live, archive)]
     return True
@@ -570,7 +595,12 @@ waitForJobChange jid prev_job tmout compute_fn = do
     Bad s -> return . Bad $ JobLost s
     Ok (job, _) | not (jobFinalized job) -> do
       let jobfile = liveJobFile qDir jid
-      answer <- watchFile jobfile (min tmout C.luxiWfjcTimeout)
+          logfile = liveJobLogFile qDir jid
+      -- new log entries are appended to the job log, which exists as soon
+      -- as the job has started
+      haslog <- doesFileExist logfile
+      answer <- watchFiles (jobfile : [ logfile | haslog ])
+                  (min tmout C.luxiWfjcTimeout)
                   (prev_job, JSArray []) compute_fn
       return . Ok $ showJSON answer
     _ -> liftM (Ok . showJSON) compute_fn
@@ -91,6 +91,8 @@ module Ganeti.Utils
   , needsReload
   , watchFile
   , watchFileBy
+  , watchFiles
+  , watchFilesBy
   , safeRenameFile
   , FilePermissions(..)
   , ensurePermissions
@@ -709,30 +711,39 @@ watchFileEx endtime base ref check read_fn = do
 -- | Within the given timeout (in seconds), wait for for the output
 -- of the given method to satisfy a given predicate and return the new value;
 -- make use of the promise that the method will only change its value, if
--- the given file changes on disk. If the file does not exist on disk, return
--- immediately.
-watchFileBy :: FilePath -> Int -> (a -> Bool) -> IO a -> IO a
-watchFileBy fpath timeout check read_fn = do
+-- one of the given files changes on disk. If a file does not exist on disk,
+-- return immediately.
+watchFilesBy :: [FilePath] -> Int -> (a -> Bool) -> IO a -> IO a
+watchFilesBy fpaths timeout check read_fn = do
   current <- getCurrentTimeUSec
   let endtime = current + fromIntegral timeout * 1000000
-  fstat <- getFStatSafe fpath
-  ref <- newIORef fstat
+  fstats <- mapM getFStatSafe fpaths
+  ref <- newIORef fstats
   bracket initINotify killINotify $ \inotify -> do
-    let do_watch e = do
+    let watch fpath = addWatch inotify [Modify, Delete] (toInotifyPath fpath)
+                        (do_watch fpath) >> return ()
+        do_watch fpath e = do
                        logDebug $ "Notified of change in " ++ fpath
                                     ++ "; event: " ++ show e
-                       when (e == Ignored)
-                         (addWatch inotify [Modify, Delete]
-                           (toInotifyPath fpath) do_watch >> return ())
-                       fstat' <- getFStatSafe fpath
-                       writeIORef ref fstat'
-    _ <- addWatch inotify [Modify, Delete] (toInotifyPath fpath) do_watch
+                       when (e == Ignored) (watch fpath)
+                       fstats' <- mapM getFStatSafe fpaths
+                       writeIORef ref fstats'
+    mapM_ watch fpaths
     newval <- read_fn
     if check newval
       then do
-        logDebug $ "File " ++ fpath ++ " changed during setup of inotify"
+        logDebug $ "Files " ++ commaJoin fpaths
+                   ++ " changed during setup of inotify"
         return newval
-      else watchFileEx endtime fstat ref check read_fn
+      else watchFileEx endtime fstats ref check read_fn
+
+-- | Within the given timeout (in seconds), wait for for the output
+-- of the given method to satisfy a given predicate and return the new value;
+-- make use of the promise that the method will only change its value, if
+-- the given file changes on disk. If the file does not exist on disk, return
+-- immediately.
+watchFileBy :: FilePath -> Int -> (a -> Bool) -> IO a -> IO a
+watchFileBy fpath = watchFilesBy [fpath]
 
 -- | Within the given timeout (in seconds), wait for for the output
 -- of the given method to change and return the new value; make use of
@@ -742,6 +753,13 @@ watchFileBy fpath timeout check read_fn = do
 watchFile :: Eq a => FilePath -> Int -> a -> IO a -> IO a
 watchFile fpath timeout old = watchFileBy fpath timeout (/= old)
 
+-- | Within the given timeout (in seconds), wait for for the output
+-- of the given method to change and return the new value; make use of
+-- the promise that the method will only change its value, if one of
+-- the given files changes on disk.
+watchFiles :: Eq a => [FilePath] -> Int -> a -> IO a -> IO a
+watchFiles fpaths timeout old = watchFilesBy fpaths timeout (/= old)
+
 -- | Type describing ownership and permissions of newly generated
 -- directories and files. All parameters are optional, with nothing
 -- meaning that the default value should be left untouched.
@@ -0,0 +1,224 @@
+{-| Incremental changes of the configuration.
+
+Instead of transferring the whole configuration between WConfD and its
+clients, only the objects that changed are sent. A 'ConfigDelta' contains
+the cluster object and the changed or removed objects of all the other
+containers of the configuration, together with a serial number. When
+sent to WConfD, the serial number is that of the configuration the changes
+are based on; when sent by WConfD, it is that of the resulting
+configuration.
+
+-}
+
+{-
+
+Copyright (C) 2014 Google Inc.
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are
+met:
+
+1. Redistributions of source code must retain the above copyright notice,
+this list of conditions and the following disclaimer.
+
+2. Redistributions in binary form must reproduce the above copyright
+notice, this list of conditions and the following disclaimer in the
+documentation and/or other materials provided with the distribution.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS
+IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+-}
+
+module Ganeti.WConfd.ConfigDelta
+  ( ConfigChanges
+  , noChanges
+  , unionChanges
+  , configChanges
+  , ConfigDelta(..)
+  , mkConfigDelta
+  , applyConfigDelta
+  , ConfigUpdate(..)
+  ) where
+
+import Control.Monad (liftM)
+import qualified Data.ByteString as BS
+import qualified Data.Map as M
+import qualified Data.Set as S
+import qualified Text.JSON as J
+
+import Ganeti.JSON
+import Ganeti.Objects
+import Ganeti.Types (SerialNoObject(..))
+
+-- * Changed objects
+
+-- | The UUIDs of the objects that changed in each of the containers
+-- of the configuration.
+data ConfigChanges = ConfigChanges
+  { ccNodes      :: S.Set BS.ByteString
+  , ccNodegroups :: S.Set BS.ByteString
+  , ccInstances  :: S.Set BS.ByteString
+  , ccNetworks   :: S.Set BS.ByteString
+  , ccDisks      :: S.Set BS.ByteString
+  , ccFilters    :: S.Set BS.ByteString
+  }
+  deriving (Eq, Show)
+
+-- | No changes at all.
+noChanges :: ConfigChanges
+noChanges = ConfigChanges S.empty S.empty S.empty S.empty S.empty S.empty
+
+-- | Combines the changes of two configuration modifications.
+unionChanges :: ConfigChanges -> ConfigChanges -> ConfigChanges
+unionChanges a b =
+  ConfigChanges { ccNodes      = on ccNodes
+                , ccNodegroups = on ccNodegroups
+                , ccInstances  = on ccInstances
+                , ccNetworks   = on ccNetworks
+                , ccDisks      = on ccDisks
+                , ccFilters    = on ccFilters
+                }
+  where
+    on f = S.union (f a) (f b)
+
+-- | Computes the keys of a container whose values were added, removed or
+-- modified.
+changedKeys :: (Eq a) => Container a -> Container a -> S.Set BS.ByteString
+changedKeys (GenericContainer old) (GenericContainer new) =
+  S.unions [ M.keysSet . M.filter id $ M.intersectionWith (/=) old new
+           , M.keysSet $ M.difference old new
+           , M.keysSet $ M.difference new old
+           ]
+
+-- | Computes the objects that differ between two versions of the
+-- configuration.
+configChanges :: ConfigData -> ConfigData -> ConfigChanges
+configChanges old new =
+  ConfigChanges { ccNodes      = diff configNodes
+                , ccNodegroups = diff configNodegroups
+                , ccInstances  = diff configInstances
+                , ccNetworks   = diff configNetworks
+                , ccDisks      = diff configDisks
+                , ccFilters    = diff configFilters
+                }
+  where
+    diff :: (Eq a) => (ConfigData -> Container a) -> S.Set BS.ByteString
+    diff f = changedKeys (f old) (f new)
+
+-- * Deltas
+
+-- | Changes of a container: the new version of each changed object,
+-- or 'Nothing' for removed objects.
+type ContainerDelta a = GenericContainer BS.ByteString (MaybeForJSON a)
+
+-- | A set of changes to the configuration.
+data ConfigDelta = ConfigDelta
+  { cdSerial     :: Int
+  , cdCluster    :: Cluster
+  , cdNodes      :: ContainerDelta Node
+  , cdNodegroups :: ContainerDelta NodeGroup
+  , cdInstances  :: ContainerDelta Instance
+  , cdNetworks   :: ContainerDelta Network
+  , cdDisks      :: ContainerDelta Disk
+  , cdFilters    :: ContainerDelta FilterRule
+  }
+  deriving (Eq, Show)
+
+instance J.JSON ConfigDelta where
+  showJSON cd = J.makeObj
+    [ ("serial_no",  J.showJSON $ cdSerial cd)
+    , ("cluster",    J.showJSON $ cdCluster cd)
+    , ("nodes",      J.showJSON $ cdNodes cd)
+    , ("nodegroups", J.showJSON $ cdNodegroups cd)
+    , ("instances",  J.showJSON $ cdInstances cd)
+    , ("networks",   J.showJSON $ cdNetworks cd)
+    , ("disks",      J.showJSON $ cdDisks cd)
+    , ("filters",    J.showJSON $ cdFilters cd)
+    ]
+  readJSON v = do
+    o <- liftM J.fromJSObject (asJSObject v)
+    let container k = fromObjWithDefault o k emptyContainer
+    ConfigDelta <$> fromObj o "serial_no"
+                <*> fromObj o "cluster"
+                <*> container "nodes"
+                <*> container "nodegroups"
+                <*> container "instances"
+                <*> container "networks"
+                <*> container "disks"
+                <*> container "filters"
+
+-- | Extracts the changes of a container from its current version.
+containerDelta :: S.Set BS.ByteString -> Container a -> ContainerDelta a
+containerDelta keys (GenericContainer m) =
+  GenericContainer $ M.fromSet (MaybeForJSON . flip M.lookup m) keys
+
+-- | Creates the delta containing the given changes of a configuration
+-- from its current version.
+mkConfigDelta :: ConfigData -> ConfigChanges -> ConfigDelta
+mkConfigDelta cfg cc =
+  ConfigDelta { cdSerial     = serialOf cfg
+              , cdCluster    = configCluster cfg
+              , cdNodes      = containerDelta (ccNodes cc) (configNodes cfg)
+              , cdNodegroups = containerDelta (ccNodegroups cc)
+                                              (configNodegroups cfg)
+              , cdInstances  = containerDelta (ccInstances cc)
+                                              (configInstances cfg)
+              , cdNetworks   = containerDelta (ccNetworks cc)
+                                              (configNetworks cfg)
+              , cdDisks      = containerDelta (ccDisks cc) (configDisks cfg)
+              , cdFilters    = containerDelta (ccFilters cc) (configFilters cfg)
+              }
+
+-- | Applies the changes of a container.
+applyContainerDelta :: ContainerDelta a -> Container a -> Container a
+applyContainerDelta (GenericContainer d) (GenericContainer m) =
+  GenericContainer $ M.foldrWithKey apply m d
+  where
+    apply k (MaybeForJSON (Just v)) = M.insert k v
+    apply k (MaybeForJSON Nothing) = M.delete k
+
+-- | Applies a delta to a configuration. The serial number of the
+-- configuration is left unchanged.
+applyConfigDelta :: ConfigDelta -> ConfigData -> ConfigData
+applyConfigDelta cd cfg =
+  cfg { configCluster    = cdCluster cd
+      , configNodes      = applyContainerDelta (cdNodes cd) (configNodes cfg)
+      , configNodegroups = applyContainerDelta (cdNodegroups cd)
+                                               (configNodegroups cfg)
+      , configInstances  = applyContainerDelta (cdInstances cd)
+                                               (configInstances cfg)
+      , configNetworks   = applyContainerDelta (cdNetworks cd)
+                                               (configNetworks cfg)
+      , configDisks      = applyContainerDelta (cdDisks cd) (configDisks cfg)
+      , configFilters    = applyContainerDelta (cdFilters cd)
+                                               (configFilters cfg)
+      }
+
+-- * Updates sent to clients
+
+-- | An update of a client's copy of the configuration, either the full
+-- configuration or the changes since the client's version.
+data ConfigUpdate = FullConfig ConfigData
+                  | DeltaConfig ConfigDelta
+                  deriving (Eq, Show)
+
+instance J.JSON ConfigUpdate where
+  showJSON (FullConfig cfg) = J.makeObj [("full", J.showJSON cfg)]
+  showJSON (DeltaConfig cd) = J.makeObj [("delta", J.showJSON cd)]
+  readJSON v = do
+    o <- liftM J.fromJSObject (asJSObject v)
+    case o of
+      [("full", cfg)] -> FullConfig <$> J.readJSON cfg
+      [("delta", cd)] -> DeltaConfig <$> J.readJSON cd
+      _ -> fail $ "Invalid configuration update " ++ show (map fst o)
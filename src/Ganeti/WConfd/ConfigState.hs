@@ -40,21 +40,31 @@ module Ganeti.WConfd.ConfigState
   , csConfigDataL
   , mkConfigState
   , bumpSerial
+  , recordChanges
+  , configUpdateSince
   , needsFullDist
   ) where
 
 import Data.Function (on)
 import System.Time (ClockTime(..))
 
+import qualified Ganeti.Constants as C
 import Ganeti.Config
 import Ganeti.Lens
 import Ganeti.Objects
 import Ganeti.Objects.Lens
+import Ganeti.Types (SerialNoObject(..))
+import Ganeti.WConfd.ConfigDelta
 
 -- | In future this data type will include the current configuration
 -- ('ConfigData') and the last 'FStat' of its file.
+--
+-- Additionally the objects changed by the recent modifications of the
+-- configuration are kept, newest first, by the serial number of the
+-- configuration they resulted in.
 data ConfigState = ConfigState
   { csConfigData :: ConfigData
+  , csHistory :: [(Int, ConfigChanges)]
   }
   deriving (Eq, Show)
 
@@ -63,11 +73,34 @@ $(makeCustomLenses ''ConfigState)
 -- | Creates a new configuration state.
 -- This method will expand as more fields are added to 'ConfigState'.
 mkConfigState :: ConfigData -> ConfigState
-mkConfigState = ConfigState
+mkConfigState cd = ConfigState cd []
 
 bumpSerial :: (SerialNoObjectL a, TimeStampObjectL a) => ClockTime -> a -> a
 bumpSerial now = set mTimeL now . over serialL succ
 
+-- | Given the previous and the new configuration state, record the objects
+-- changed in the new one.
+recordChanges :: ConfigState -> ConfigState -> ConfigState
+recordChanges cs cs' =
+  let cd' = csConfigData cs'
+      changes = configChanges (csConfigData cs) cd'
+  in set csHistoryL (take C.wconfdConfigHistorySize
+                       $ (serialOf cd', changes) : csHistory cs) cs'
+
+-- | Computes the update for a client's copy of the configuration with
+-- the given serial number. If the changes since that version are
+-- still known, only these are sent, otherwise the full configuration.
+configUpdateSince :: Int -> ConfigState -> ConfigUpdate
+configUpdateSince serial cs =
+  let cd = csConfigData cs
+      current = serialOf cd
+      recent = takeWhile ((> serial) . fst) $ csHistory cs
+  in if serial <= current
+          && map fst recent == [current, current - 1 .. serial + 1]
+       then DeltaConfig . mkConfigDelta cd
+              $ foldr (unionChanges . snd) noChanges recent
+       else FullConfig cd
+
 -- | Given two versions of the configuration, determine if its distribution
 -- needs to be fully committed before returning the corresponding call to
 -- WConfD.
@@ -53,6 +53,7 @@ import qualified Data.Set as Set
 import Ganeti.BasicTypes
 import Ganeti.Errors
 import Ganeti.Config
+import Ganeti.Lens (set)
 import Ganeti.Logging
 import Ganeti.Objects
 import Ganeti.Rpc
@@ -104,7 +105,7 @@ readConfig = csConfigData <$> readConfigState
 
 -- Replaces the current configuration state within the 'WConfdMonad'.
 writeConfig :: ConfigData -> WConfdMonad ()
-writeConfig cd = modifyConfigState $ const ((), mkConfigState cd)
+writeConfig cd = modifyConfigState $ (,) () . set csConfigDataL cd
 
 -- * Asynchronous tasks
 
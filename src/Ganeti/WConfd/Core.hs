@@ -43,7 +43,7 @@ module Ganeti.WConfd.Core where
 
 import Control.Arrow ((&&&))
 import Control.Concurrent (myThreadId)
-import Control.Lens.Setter (set)
+import Control.Lens.Setter (over, set)
 import Control.Monad (liftM, unless)
 import qualified Data.Map as M
 import qualified Data.Set as S
@@ -63,7 +63,11 @@ import Ganeti.Locking.Locks ( GanetiLocks(ConfigLock, BGL)
 import qualified Ganeti.Locking.Waiting as LW
 import Ganeti.Objects (ConfigData, DRBDSecret, LogicalVolume, Ip4Address)
 import Ganeti.Objects.Lens (configClusterL, clusterMasterNodeL)
-import Ganeti.WConfd.ConfigState (csConfigDataL)
+import Ganeti.Types (SerialNoObject(..))
+import Ganeti.WConfd.ConfigDelta (ConfigDelta(..), ConfigUpdate,
+                                  applyConfigDelta)
+import Ganeti.WConfd.ConfigState (csConfigData, csConfigDataL,
+                                  configUpdateSince)
 import qualified Ganeti.WConfd.ConfigVerify as V
 import Ganeti.WConfd.DeathDetection (cleanupLocks)
 import Ganeti.WConfd.Language
@@ -99,6 +103,24 @@ writeConfig ident cdata = do
   -- V.verifyConfigErr cdata
   CW.writeConfig cdata
 
+-- | Read the changes of the configuration since the given serial number,
+-- or the full configuration, if these changes are no longer known.
+readConfigSince :: Int -> WConfdMonad ConfigUpdate
+readConfigSince serial = liftM (configUpdateSince serial) readConfigState
+
+-- | Write changes to the configuration, checking that an exclusive lock
+-- is held. If not, the call fails. If the changes are based on a
+-- different version of the configuration, they are not applied and
+-- 'False' is returned; the caller has then to write the full
+-- configuration.
+writeConfigDelta :: ClientId -> ConfigDelta -> WConfdMonad Bool
+writeConfigDelta ident delta = do
+  checkConfigLock ident L.OwnExclusive
+  modifyConfigState $ \cs ->
+    if cdSerial delta == serialOf (csConfigData cs)
+      then (True, over csConfigDataL (applyConfigDelta delta) cs)
+      else (False, cs)
+
 -- | Explicitly run verification of the configuration.
 -- The caller doesn't need to hold the configuration lock.
 verifyConfig :: WConfdMonad ()
@@ -116,7 +138,25 @@ lockConfig
     :: ClientId
     -> Bool -- ^ set to 'True' if the lock should be shared
     -> WConfdMonad (J.MaybeForJSON ConfigData)
-lockConfig cid shared = do
+lockConfig = lockConfigWith CW.readConfig
+
+-- | Tries to acquire 'ConfigLock' for the client, like 'lockConfig'.
+--
+-- If the lock was successfully acquired, returns the changes of the
+-- configuration since the given serial number, as 'readConfigSince'.
+lockConfigSince
+    :: ClientId
+    -> Bool -- ^ set to 'True' if the lock should be shared
+    -> Int -- ^ the serial number of the client's configuration
+    -> WConfdMonad (J.MaybeForJSON ConfigUpdate)
+lockConfigSince cid shared serial =
+  lockConfigWith (readConfigSince serial) cid shared
+
+-- | Tries to acquire 'ConfigLock' for the client and, if successful,
+-- returns the result of the given action.
+lockConfigWith
+    :: WConfdMonad a -> ClientId -> Bool -> WConfdMonad (J.MaybeForJSON a)
+lockConfigWith readFn cid shared = do
   let (reqtype, owntype) = if shared
                              then (ReqShared, L.OwnShared)
                              else (ReqExclusive, L.OwnExclusive)
@@ -127,11 +167,11 @@ lockConfig cid shared = do
       -- on the locks
       logWarning $ "Client " ++ show cid ++ " asked to lock the config"
                    ++ " while owning the lock"
-      liftM (J.MaybeForJSON . Just) CW.readConfig
+      liftM (J.MaybeForJSON . Just) readFn
     else do
       waiting <- tryUpdateLocks cid [(ConfigLock, reqtype)]
       liftM J.MaybeForJSON $ case waiting of
-        []  -> liftM Just CW.readConfig
+        []  -> liftM Just readFn
         _   -> return Nothing
 
 -- | Release the config lock, if the client currently holds it.
@@ -389,9 +429,12 @@ exportedFunctions = [ 'echo
                     , 'prepareClusterDestruction
                     -- config
                     , 'readConfig
+                    , 'readConfigSince
                     , 'writeConfig
+                    , 'writeConfigDelta
                     , 'verifyConfig
                     , 'lockConfig
+                    , 'lockConfigSince
                     , 'unlockConfig
                     , 'writeConfigAndUnlock
                     , 'flushConfig
@@ -240,7 +240,8 @@ unpackConfigResult :: ClockTime -> ConfigState
                       -> (a, ConfigState) -> ((a, Bool, Bool), ConfigState)
 unpackConfigResult now cs (r, cs')
                      | cs /= cs' = ( (r, True, needsFullDist cs cs')
-                                   , over csConfigDataL (bumpSerial now) cs'
+                                   , recordChanges cs
+                                     $ over csConfigDataL (bumpSerial now) cs'
                                    )
                      | otherwise = ((r, False, False), cs')
 
@@ -217,6 +217,73 @@ prop_LoadJobs = monadicIO $ do
                       ]
   return ()
 
+-- | Generates a job with log entries, together with a base version of
+-- the job, which contains only a prefix of the entries, and a job log,
+-- which contains a suffix of them, overlapping with the base job.
+genJobWithLog :: Gen (QueuedJob, QueuedJob, [JobLogEntry])
+genJobWithLog = do
+  ops <- resize 5 (listOf1 genQueuedOpCode)
+  jid <- genJobId
+  count <- choose (0, 20)
+  idxs <- vectorOf count $ choose (0, length ops - 1)
+  entries <- mapM (\(serial, idx) -> do
+                     ts <- arbitrary
+                     logtype <- arbitrary
+                     msg <- genPrintableAsciiString
+                     return (idx, (serial, ts, logtype, showJSON msg)))
+             $ zip [1..] idxs
+  cut <- choose (0, count)
+  overlap <- choose (0, cut)
+  let mkJob es = QueuedJob jid (zipWith (withLog es) [0..] ops)
+                   justNoTs justNoTs justNoTs Nothing Nothing
+      withLog es idx op = op { qoLog = [ e | (i, e) <- es, i == idx ] }
+  return (mkJob $ take cut entries, mkJob entries, drop overlap entries)
+
+-- | Serialises a job log as it is written to disk, one entry per line.
+serialiseJobLog :: [JobLogEntry] -> String
+serialiseJobLog = unlines . map encode
+
+-- | Tests that merging the serialised job log into the base job gives
+-- the full job, also when the last line of the log is incomplete.
+prop_MergeJobLog :: Property
+prop_MergeJobLog =
+  forAll genJobWithLog $ \(base, job, entries) ->
+  let logstr = serialiseJobLog entries
+  in conjoin [ mergeJobLog (parseJobLog logstr) base ==? job
+             , counterexample "incomplete last line" $
+               mergeJobLog (parseJobLog $ logstr ++ "[0, [") base ==? job
+             , counterexample "merging into the full job" $
+               mergeJobLog (parseJobLog logstr) job ==? job
+             ]
+
+-- | Tests that compacting a job file with its job log preserves the
+-- state of the job and removes the job log.
+prop_CompactJobFile :: Property
+prop_CompactJobFile = monadicIO $ do
+  (base, job, entries) <- pick genJobWithLog
+  let jid = qjId job
+  (loaded, compacted, haslog, reloaded) <-
+    run . withSystemTempDirectory "jqueue-test-CompactJobFile." $ \tempdir -> do
+    let logfile = liveJobLogFile tempdir jid
+    _ <- writeJobToDisk tempdir base
+    writeFile logfile $ serialiseJobLog entries
+    loaded <- loadJobFromDisk tempdir False jid
+    compacted <- case loaded of
+                   Ganeti.BasicTypes.Ok (qj, _) -> compactJobFile tempdir qj
+                   Bad msg -> return $ Bad msg
+    haslog <- doesFileExist logfile
+    reloaded <- loadJobFromDisk tempdir False jid
+    return (loaded, compacted, haslog, reloaded)
+  _ <- stop $ conjoin [ counterexample "loading with job log" $
+                        loaded ==? Ganeti.BasicTypes.Ok (job, False)
+                      , counterexample "compacting" $
+                        compacted ==? Ganeti.BasicTypes.Ok ()
+                      , counterexample "job log removed" $ not haslog
+                      , counterexample "loading compacted job" $
+                        reloaded ==? Ganeti.BasicTypes.Ok (job, False)
+                      ]
+  return ()
+
 -- | Tests computing job directories. Creates random directories,
 -- files and stale symlinks in a directory, and checks that we return
 -- \"the right thing\".
@@ -286,6 +353,8 @@ testSuite "JQueue"
             , 'case_JobStatusPri_py_equiv
             , 'prop_ListJobIDs
             , 'prop_LoadJobs
+            , 'prop_MergeJobLog
+            , 'prop_CompactJobFile
             , 'prop_DetermineDirs
             , 'prop_InputOpCode
             , 'prop_extractOpSummary
@@ -86,6 +86,7 @@ instance Arbitrary Luxi.LuxiOp where
                               listOf genFQDN <*> arbitrary
       Luxi.ReqQueryConfigValues -> Luxi.QueryConfigValues <$> genFields
       Luxi.ReqQueryClusterInfo -> pure Luxi.QueryClusterInfo
+      Luxi.ReqQueryMetrics -> pure Luxi.QueryMetrics
       Luxi.ReqQueryTags -> do
         kind <- arbitrary
         Luxi.QueryTags kind <$> genLuxiTagName kind
@@ -113,6 +114,17 @@ prop_CallEncoding op =
   (US.parseCall (US.buildCall (Luxi.strOfOp op) (Luxi.opToArgs op))
     >>= uncurry Luxi.decodeLuxiCall) ==? Ok op
 
+-- | Checks that 'Luxi.QueryMetrics' round-trips, and that it is decoded
+-- from the call sent by the Python client.
+case_QueryMetricsEncoding :: Assertion
+case_QueryMetricsEncoding = do
+  let op = Luxi.QueryMetrics
+      decode s = US.parseCall s >>= uncurry Luxi.decodeLuxiCall
+  assertEqual "round-trip of the Haskell encoding" (Ok op)
+    (decode $ US.buildCall (Luxi.strOfOp op) (Luxi.opToArgs op))
+  assertEqual "decoding of the Python encoding" (Ok op)
+    (decode "{\"method\": \"QueryMetrics\", \"args\": []}")
+
 -- | Server ping-pong helper.
 luxiServerPong :: Luxi.Client -> IO ()
 luxiServerPong c = do
@@ -169,6 +181,7 @@ case_AllDefined = do
 
 testSuite "Luxi"
           [ 'prop_CallEncoding
+          , 'case_QueryMetricsEncoding
           , 'prop_ClientServer
           , 'case_AllDefined
           ]
@@ -0,0 +1,141 @@
+{-# LANGUAGE TemplateHaskell #-}
+
+{-| Unittests for incremental configuration changes
+
+-}
+
+{-
+
+Copyright (C) 2014 Google Inc.
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are
+met:
+
+1. Redistributions of source code must retain the above copyright notice,
+this list of conditions and the following disclaimer.
+
+2. Redistributions in binary form must reproduce the above copyright
+notice, this list of conditions and the following disclaimer in the
+documentation and/or other materials provided with the distribution.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS
+IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+-}
+
+module Test.Ganeti.WConfd.ConfigDelta (testWConfd_ConfigDelta) where
+
+import Test.QuickCheck
+
+import Data.List (foldl')
+import qualified Data.Map as M
+
+import Test.Ganeti.Objects (genConfigDataWithNetworks, genEmptyCluster)
+import Test.Ganeti.TestHelper
+import Test.Ganeti.TestCommon
+
+import qualified Ganeti.Constants as C
+import Ganeti.JSON (Container, GenericContainer(..))
+import Ganeti.Objects
+import Ganeti.WConfd.ConfigDelta
+import Ganeti.WConfd.ConfigState
+
+-- * Generators
+
+-- | Generates a small configuration with a few nodes and networks.
+genConfig :: Gen ConfigData
+genConfig =
+  choose (0, 5) >>= genEmptyCluster >>= genConfigDataWithNetworks
+
+-- | Replaces the first objects of a container by those of another one.
+mixContainer :: Int -> Container a -> Container a -> Container a
+mixContainer n (GenericContainer old) (GenericContainer new) =
+  GenericContainer . M.union new . M.fromList . drop n $ M.toList old
+
+-- | Generates two consecutive versions of a configuration. Some of the
+-- nodes, node groups and networks of the newer one are added, replaced
+-- or removed, and its cluster object is a different one.
+genConfigPair :: Gen (ConfigData, ConfigData)
+genConfigPair = do
+  serial <- choose (0, 1000)
+  old <- genConfig
+  other <- genConfig
+  n <- choose (0, 3)
+  let mix f = mixContainer n (f old) (f other)
+      old' = old { configSerial = serial }
+      new = old' { configCluster    = configCluster other
+                 , configNodes      = mix configNodes
+                 , configNodegroups = mix configNodegroups
+                 , configNetworks   = mix configNetworks
+                 , configSerial     = serial + 1
+                 }
+  return (old', new)
+
+-- | Builds the state of a configuration that was modified the given
+-- number of times, starting with serial number 0.
+modifiedState :: ConfigData -> Int -> ConfigState
+modifiedState cfg n =
+  foldl' modify (mkConfigState $ withSerial 0) [1..n]
+  where
+    withSerial s = cfg { configSerial = s }
+    modify cs = recordChanges cs . mkConfigState . withSerial
+
+isFullConfig :: ConfigUpdate -> Bool
+isFullConfig (FullConfig _) = True
+isFullConfig (DeltaConfig _) = False
+
+-- * Tests
+
+-- | Applying the delta between two configurations to the older one
+-- reproduces the newer one, except for the serial number.
+prop_applyConfigDelta :: Property
+prop_applyConfigDelta =
+  forAll genConfigPair $ \(old, new) ->
+    applyConfigDelta (mkConfigDelta new $ configChanges old new) old
+      ==? new { configSerial = configSerial old }
+
+-- | Checks that the serialisation of deltas is idempotent.
+prop_ConfigDelta_serialisation :: Property
+prop_ConfigDelta_serialisation =
+  forAll genConfigPair $ \(old, new) ->
+    testSerialisation . mkConfigDelta new $ configChanges old new
+
+-- | A client with the previous version of the configuration gets the
+-- changes, which turn its version into the current one.
+prop_configUpdateSince_delta :: Property
+prop_configUpdateSince_delta =
+  forAll genConfigPair $ \(old, new) ->
+    let cs = recordChanges (mkConfigState old) (mkConfigState new)
+    in case configUpdateSince (configSerial old) cs of
+         FullConfig _ -> failTest "Got the full configuration"
+         DeltaConfig cd ->
+           cdSerial cd ==? configSerial new .&&.
+           applyConfigDelta cd old ==? new { configSerial = configSerial old }
+
+-- | Clients whose configuration is older than the recorded history, or
+-- newer than the current one, get the full configuration.
+prop_configUpdateSince_history :: Property
+prop_configUpdateSince_history =
+  forAll genConfig $ \cfg ->
+  forAll (choose (0, 2 * C.wconfdConfigHistorySize)) $ \n ->
+  forAll (choose (0, n + 1)) $ \serial ->
+    isFullConfig (configUpdateSince serial $ modifiedState cfg n) ==?
+      (serial < n - C.wconfdConfigHistorySize || serial > n)
+
+testSuite "WConfd/ConfigDelta"
+  [ 'prop_applyConfigDelta
+  , 'prop_ConfigDelta_serialisation
+  , 'prop_configUpdateSince_delta
+  , 'prop_configUpdateSince_history
+  ]
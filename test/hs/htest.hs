@@ -96,6 +96,7 @@ import Test.Ganeti.Types
 import Test.Ganeti.Utils
 import Test.Ganeti.Utils.MultiMap
 import Test.Ganeti.Utils.Statistics
+import Test.Ganeti.WConfd.ConfigDelta
 import Test.Ganeti.WConfd.Ssconf
 import Test.Ganeti.WConfd.TempRes
 
@@ -170,6 +171,7 @@ allTests =
   , testUtils
   , testUtils_MultiMap
   , testUtils_Statistics
+  , testWConfd_ConfigDelta
   , testWConfd_Ssconf
   , testWConfd_TempRes
   ]
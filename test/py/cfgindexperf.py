@@ -0,0 +1,249 @@
+#!/usr/bin/python3
+#
+
+# Copyright (C) 2014 Google Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS
+# IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+# TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+# PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+"""Script for measuring configuration lookups by name and by node.
+
+For a configuration with a given number of DRBD instances, this compares
+the time of looking up objects through the indexes of the configuration
+with the time of the linear scans they replace.
+
+"""
+
+import time
+import optparse
+
+from ganeti import constants
+from ganeti import config
+from ganeti import objects
+from ganeti import utils
+
+
+def ParseOptions():
+  """Parses the command line options.
+
+  In case of command line errors, it will show the usage and exit the
+  program.
+
+  @return: the options in a tuple
+
+  """
+  parser = optparse.OptionParser()
+  parser.add_option("-i", dest="instance_counts", default="10000",
+                    help="Comma-separated numbers of instances",
+                    metavar="NUM[,NUM...]")
+  parser.add_option("-n", dest="node_count", default=100, type="int",
+                    help="Number of nodes", metavar="NUM")
+  parser.add_option("-r", dest="repetitions", default=100, type="int",
+                    help="Number of lookups to measure", metavar="NUM")
+
+  (opts, args) = parser.parse_args()
+
+  try:
+    opts.instance_counts = [int(i) for i in opts.instance_counts.split(",")]
+  except ValueError:
+    parser.error("Invalid number of instances")
+
+  if opts.node_count < 2:
+    parser.error("Number of nodes must be at least 2")
+  if opts.repetitions < 1:
+    parser.error("Number of lookups must be at least 1")
+
+  return (opts, args)
+
+
+def _BuildConfig(instance_count, node_count):
+  """Builds a configuration with the given number of instances.
+
+  Each instance has a DRBD disk, mirrored between consecutive nodes.
+
+  @rtype: L{objects.ConfigData}
+
+  """
+  now = time.time()
+  group = objects.NodeGroup(uuid=utils.NewUUID(), name="default",
+                            members=[], serial_no=1)
+  nodes = {}
+  for i in range(node_count):
+    node = objects.Node(uuid=utils.NewUUID(),
+                        name="node%d.example.com" % i,
+                        primary_ip="192.0.2.%d" % (i % 250 + 1),
+                        secondary_ip="198.51.100.%d" % (i % 250 + 1),
+                        group=group.uuid, serial_no=1,
+                        master_candidate=True, ctime=now, mtime=now)
+    nodes[node.uuid] = node
+    group.members.append(node.uuid)
+  node_uuids = list(nodes)
+  cluster = objects.Cluster(uuid=utils.NewUUID(), serial_no=1,
+                            cluster_name="cluster.example.com",
+                            master_node=node_uuids[0],
+                            master_ip="192.0.2.254",
+                            master_netdev=constants.DEFAULT_BRIDGE,
+                            enabled_hypervisors=[constants.HT_FAKE],
+                            tcpudp_port_pool=set(), uid_pool=[],
+                            highest_used_port=constants.FIRST_DRBD_PORT - 1,
+                            mac_prefix="aa:00:00", volume_group_name="xenvg",
+                            ctime=now, mtime=now)
+  instances = {}
+  disks = {}
+  for i in range(instance_count):
+    pnode = node_uuids[i % node_count]
+    snode = node_uuids[(i + 1) % node_count]
+    disk = objects.Disk(uuid=utils.NewUUID(), name="disk%d" % i,
+                        dev_type=constants.DT_DRBD8, size=1024,
+                        logical_id=(pnode, snode, 11000 + i, i, i, "secret"),
+                        iv_name="disk/0", serial_no=1, ctime=now, mtime=now)
+    disks[disk.uuid] = disk
+    inst = objects.Instance(uuid=utils.NewUUID(),
+                            name="inst%d.example.com" % i,
+                            primary_node=pnode, os="debian-image",
+                            hypervisor=constants.HT_FAKE,
+                            admin_state=constants.ADMINST_DOWN,
+                            admin_state_source=constants.ADMIN_SOURCE,
+                            disk_template=constants.DT_DRBD8,
+                            disks=[disk.uuid], nics=[], hvparams={},
+                            beparams={}, osparams={}, disks_active=False,
+                            serial_no=1, ctime=now, mtime=now)
+    instances[inst.uuid] = inst
+  return objects.ConfigData(version=constants.CONFIG_VERSION, cluster=cluster,
+                            nodes=nodes, nodegroups={group.uuid: group},
+                            instances=instances, networks={}, disks=disks,
+                            filters={}, serial_no=1, ctime=now, mtime=now)
+
+
+def _ScanInstanceByName(data, name):
+  """Looks up an instance by name without the index."""
+  for inst in data.instances.values():
+    if inst.name == name:
+      return inst
+  return None
+
+
+def _ScanExpandInstanceName(data, short_name):
+  """Expands an instance name without the index."""
+  all_insts = list(data.instances.values())
+  expanded_name = utils.MatchNameComponent(
+                    short_name, [inst.name for inst in all_insts],
+                    case_sensitive=False)
+  if expanded_name is None:
+    return (None, None)
+  inst = [i for i in all_insts if i.name == expanded_name][0]
+  return (inst.uuid, inst.name)
+
+
+def _ScanNodeInstances(data, node_uuid):
+  """Computes the instances of a node without the index."""
+  pri = []
+  sec = []
+  for inst in data.instances.values():
+    if inst.primary_node == node_uuid:
+      pri.append(inst.uuid)
+    nodes = set()
+    for disk_uuid in inst.disks:
+      nodes.update(data.disks[disk_uuid].all_nodes)
+    nodes.discard(inst.primary_node)
+    if node_uuid in nodes:
+      sec.append(inst.uuid)
+  return (pri, sec)
+
+
+def _ScanInstanceForDisk(data, disk_uuid):
+  """Looks up the instance of a disk without the index."""
+  for inst in data.instances.values():
+    if disk_uuid in inst.disks:
+      return inst.uuid
+  return None
+
+
+def _Measure(fn, args):
+  """Measures an operation.
+
+  @return: the average number of microseconds per call
+
+  """
+  start = time.time()
+  for arg in args:
+    fn(arg)
+  return 1e6 * (time.time() - start) / len(args)
+
+
+def _Run(instance_count, node_count, repetitions):
+  """Runs the measurements for one configuration size.
+
+  @return: list of (operation, scan time, indexed time)
+
+  """
+  data = _BuildConfig(instance_count, node_count)
+  cfg = config.DetachedConfig(data)
+
+  start = time.time()
+  cfg.GetInstanceInfoByName("")
+  build = 1e6 * (time.time() - start)
+
+  insts = list(data.instances.values())
+  step = max(len(insts) // repetitions, 1)
+  insts = insts[::step][:repetitions]
+  names = [inst.name for inst in insts]
+  short_names = [name.split(".")[0] for name in names]
+  disk_uuids = [inst.disks[0] for inst in insts]
+  node_uuids = [inst.primary_node for inst in insts]
+
+  return [
+    ("build index", None, build),
+    ("instance by name",
+     _Measure(lambda n: _ScanInstanceByName(data, n), names),
+     _Measure(cfg.GetInstanceInfoByName, names)),
+    ("expand name",
+     _Measure(lambda n: _ScanExpandInstanceName(data, n), short_names),
+     _Measure(cfg.ExpandInstanceName, short_names)),
+    ("node instances",
+     _Measure(lambda n: _ScanNodeInstances(data, n), node_uuids),
+     _Measure(cfg.GetNodeInstances, node_uuids)),
+    ("instance for disk",
+     _Measure(lambda d: _ScanInstanceForDisk(data, d), disk_uuids),
+     _Measure(cfg.GetInstanceForDisk, disk_uuids)),
+    ]
+
+
+def main():
+  (opts, _) = ParseOptions()
+
+  print("%9s %-18s %12s %12s %9s" %
+        ("Instances", "Operation", "Scan us/op", "Index us/op", "Speedup"))
+  for count in opts.instance_counts:
+    for (op, scan, indexed) in _Run(count, opts.node_count, opts.repetitions):
+      if scan is None:
+        print("%9d %-18s %12s %12.1f %9s" % (count, op, "-", indexed, "-"))
+      else:
+        print("%9d %-18s %12.1f %12.1f %8.0fx" %
+              (count, op, scan, indexed, scan / max(indexed, 1e-3)))
+
+
+if __name__ == "__main__":
+  main()
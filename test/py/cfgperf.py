@@ -0,0 +1,266 @@
+#!/usr/bin/python3
+#
+
+# Copyright (C) 2014 Google Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS
+# IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+# TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+# PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+"""Script for measuring the configuration traffic to WConfd.
+
+For a configuration with a given number of instances, this measures the
+number of bytes exchanged with WConfd and the time spent for marking an
+instance as up and reading the configuration afterwards, as well as for
+an exclusively locked modification of an instance. This is done once with
+full configuration transfers and once with incremental changes.
+
+"""
+
+import time
+import optparse
+
+from ganeti import constants
+from ganeti import config
+from ganeti import objects
+from ganeti import serializer
+from ganeti import utils
+
+
+def ParseOptions():
+  """Parses the command line options.
+
+  In case of command line errors, it will show the usage and exit the
+  program.
+
+  @return: the options in a tuple
+
+  """
+  parser = optparse.OptionParser()
+  parser.add_option("-i", dest="instance_counts", default="1000,5000,20000",
+                    help="Comma-separated numbers of instances",
+                    metavar="NUM[,NUM...]")
+  parser.add_option("-n", dest="repetitions", default=20, type="int",
+                    help="Number of operations to measure", metavar="NUM")
+
+  (opts, args) = parser.parse_args()
+
+  try:
+    opts.instance_counts = [int(i) for i in opts.instance_counts.split(",")]
+  except ValueError:
+    parser.error("Invalid number of instances")
+
+  if opts.repetitions < 1:
+    parser.error("Number of operations must be at least 1")
+
+  return (opts, args)
+
+
+def _BuildConfig(instance_count):
+  """Builds a configuration with the given number of instances.
+
+  @rtype: dict
+  @return: the serialized configuration
+
+  """
+  now = time.time()
+  node = objects.Node(uuid=utils.NewUUID(), name="node1.example.com",
+                      primary_ip="192.0.2.1", secondary_ip="192.0.2.1",
+                      serial_no=1, master_candidate=True, ctime=now,
+                      mtime=now)
+  group = objects.NodeGroup(uuid=utils.NewUUID(), name="default",
+                            members=[node.uuid], serial_no=1)
+  node.group = group.uuid
+  cluster = objects.Cluster(uuid=utils.NewUUID(), serial_no=1,
+                            cluster_name="cluster.example.com",
+                            master_node=node.uuid, master_ip="192.0.2.254",
+                            master_netdev=constants.DEFAULT_BRIDGE,
+                            enabled_hypervisors=[constants.HT_FAKE],
+                            tcpudp_port_pool=set(), uid_pool=[],
+                            highest_used_port=constants.FIRST_DRBD_PORT - 1,
+                            mac_prefix="aa:00:00", volume_group_name="xenvg",
+                            ctime=now, mtime=now)
+  instances = {}
+  for i in range(instance_count):
+    inst = objects.Instance(uuid=utils.NewUUID(),
+                            name="inst%d.example.com" % i,
+                            primary_node=node.uuid, os="debian-image",
+                            hypervisor=constants.HT_FAKE,
+                            admin_state=constants.ADMINST_DOWN,
+                            admin_state_source=constants.ADMIN_SOURCE,
+                            disk_template=constants.DT_DISKLESS,
+                            disks=[], nics=[], hvparams={}, beparams={},
+                            osparams={}, disks_active=False, serial_no=1,
+                            ctime=now, mtime=now)
+    instances[inst.uuid] = inst
+  cfg = objects.ConfigData(version=constants.CONFIG_VERSION, cluster=cluster,
+                           nodes={node.uuid: node},
+                           nodegroups={group.uuid: group},
+                           instances=instances, networks={}, disks={},
+                           filters={}, serial_no=1, ctime=now, mtime=now)
+  return cfg.ToDict()
+
+
+class FakeWConfd(object):
+  """In-process replacement for the WConfd RPC client.
+
+  Arguments and results are serialized like on the wire, counting the
+  number of bytes sent in both directions.
+
+  """
+  def __init__(self, data, deltas):
+    """Initializes this class.
+
+    @type data: dict
+    @param data: the serialized configuration
+    @type deltas: boolean
+    @param deltas: whether to answer with incremental changes
+
+    """
+    self._data = data
+    self._deltas = deltas
+    self._history = []
+    self.bytes = 0
+
+  def _Transfer(self, value):
+    """Serializes a value, counting its size."""
+    text = serializer.DumpJson(value)
+    self.bytes += len(text)
+    return serializer.LoadJson(text)
+
+  def _Changed(self, changes):
+    """Records the changes of a new configuration version."""
+    self._data["serial_no"] += 1
+    self._history.append((self._data["serial_no"], changes))
+
+  def _UpdateSince(self, serial):
+    """Computes the update of a client at the given serial number."""
+    if not self._deltas or serial is None:
+      return {"full": self._data}
+    changed = set()
+    for (version, uuids) in self._history:
+      if version > serial:
+        changed.update(uuids)
+    instances = self._data["instances"]
+    return {"delta": {"serial_no": self._data["serial_no"],
+                      "cluster": self._data["cluster"],
+                      "instances": dict((uuid, instances.get(uuid))
+                                        for uuid in changed)}}
+
+  def ReadConfig(self):
+    return self._Transfer(self._data)
+
+  def ReadConfigSince(self, serial):
+    return self._Transfer(self._UpdateSince(self._Transfer(serial)))
+
+  def LockConfig(self, cid, shared):
+    self._Transfer([cid, shared])
+    return self._Transfer(self._data)
+
+  def LockConfigSince(self, cid, shared, serial):
+    self._Transfer([cid, shared, serial])
+    return self._Transfer(self._UpdateSince(serial))
+
+  def UnlockConfig(self, cid):
+    self._Transfer(cid)
+
+  def WriteConfigDelta(self, cid, delta):
+    (_, delta) = self._Transfer([cid, delta])
+    if not self._deltas or delta["serial_no"] != self._data["serial_no"]:
+      return self._Transfer(False)
+    self._data["cluster"] = delta["cluster"]
+    self._data["instances"].update(delta["instances"])
+    self._Changed(list(delta["instances"]))
+    return self._Transfer(True)
+
+  def WriteConfigAndUnlock(self, cid, data):
+    (_, data) = self._Transfer([cid, data])
+    changed = [uuid for (uuid, inst) in data["instances"].items()
+               if inst != self._data["instances"].get(uuid)]
+    self._data = data
+    self._Changed(changed)
+    return self._Transfer(True)
+
+  def SetInstanceStatus(self, uuid, status, disks_active, source):
+    self._Transfer([uuid, status, disks_active, source])
+    inst = self._data["instances"][uuid]
+    inst["admin_state"] = status
+    inst["disks_active"] = disks_active
+    inst["admin_state_source"] = source
+    inst["serial_no"] += 1
+    self._Changed([uuid])
+    return self._Transfer(inst)
+
+
+def _Measure(fn, wconfd, repetitions):
+  """Measures an operation.
+
+  @return: the average number of bytes and milliseconds per operation
+
+  """
+  wconfd.bytes = 0
+  start = time.time()
+  for i in range(repetitions):
+    fn(i)
+  duration = time.time() - start
+  return (wconfd.bytes // repetitions, 1000.0 * duration / repetitions)
+
+
+def _Run(instance_count, deltas, repetitions):
+  """Runs the measurements for one configuration size and protocol.
+
+  """
+  data = _BuildConfig(instance_count)
+  wconfd = FakeWConfd(data, deltas)
+  cfg = config.ConfigWriter(wconfd=wconfd, wconfdcontext="cfgperf")
+  inst_uuids = cfg.GetInstanceList()[:repetitions]
+  if len(inst_uuids) < repetitions:
+    inst_uuids *= repetitions // max(len(inst_uuids), 1) + 1
+
+  def _MarkUp(i):
+    cfg.MarkInstanceUp(inst_uuids[i])
+    cfg.GetInstanceInfo(inst_uuids[i])
+
+  def _Rename(i):
+    cfg.RenameInstance(inst_uuids[i], "renamed%d.example.com" % i)
+
+  return [_Measure(_MarkUp, wconfd, repetitions),
+          _Measure(_Rename, wconfd, repetitions)]
+
+
+def main():
+  (opts, _) = ParseOptions()
+
+  print("%9s %-6s %-16s %12s %10s" %
+        ("Instances", "Mode", "Operation", "Bytes/op", "ms/op"))
+  for count in opts.instance_counts:
+    for (mode, deltas) in [("full", False), ("delta", True)]:
+      results = _Run(count, deltas, opts.repetitions)
+      for (op, (size, msecs)) in zip(["MarkInstanceUp", "RenameInstance"],
+                                     results):
+        print("%9d %-6s %-16s %12d %10.2f" % (count, mode, op, size, msecs))
+
+
+if __name__ == "__main__":
+  main()
@@ -194,6 +194,124 @@ class TestCheckComputeDisksInfo(unittest.TestCase):
       self.disks, constants.DT_EXT, self.default_vg, self.ext_params)
 
 
+class TestWaitForSync(unittest.TestCase):
+  """Tests for instance_storage.WaitForSync()
+
+  """
+  def setUp(self):
+    self.disks = [
+      objects.Disk(dev_type=constants.DT_DRBD8, size=1024, iv_name="disk/0",
+                   uuid="disk0"),
+      objects.Disk(dev_type=constants.DT_DRBD8, size=1024, iv_name="disk/1",
+                   uuid="disk1"),
+      ]
+    self.instance = objects.Instance(name="inst1.example.com", uuid="inst1",
+                                     primary_node="node1")
+
+    self.lu = mock.Mock()
+    self.lu.cfg.GetInstanceDisks.return_value = self.disks
+    self.lu.cfg.GetNodeName.return_value = "node1.example.com"
+
+    self.now = 0.0
+
+  def _Time(self):
+    return self.now
+
+  @staticmethod
+  def _Result(payload, fail_msg=None):
+    return mock.Mock(payload=payload, fail_msg=fail_msg)
+
+  @staticmethod
+  def _Status(sync_percent=None, is_degraded=False,
+              ldisk_status=constants.LDS_OKAY):
+    return objects.BlockDevStatus(sync_percent=sync_percent,
+                                  is_degraded=is_degraded,
+                                  ldisk_status=ldisk_status,
+                                  estimated_time=None)
+
+  def testInSync(self):
+    self.lu.rpc.call_blockdev_getmirrorstatus.return_value = \
+      self._Result([self._Status(), self._Status()])
+
+    self.assertTrue(instance_storage.WaitForSync(self.lu, self.instance))
+    self.assertFalse(self.lu.rpc.call_blockdev_wait_sync_change.called)
+
+  @mock.patch("time.sleep")
+  def testWaitsForChanges(self, sleep_fn):
+    self.lu.rpc.call_blockdev_getmirrorstatus.return_value = \
+      self._Result([self._Status(sync_percent=12.3, is_degraded=True,
+                                 ldisk_status=constants.LDS_SYNC),
+                    self._Status()])
+    self.lu.rpc.call_blockdev_wait_sync_change.side_effect = [
+      self._Result([self._Status(sync_percent=17.0, is_degraded=True,
+                                 ldisk_status=constants.LDS_SYNC),
+                    None]),
+      self._Result([self._Status(), self._Status()]),
+      ]
+
+    self.assertTrue(instance_storage.WaitForSync(self.lu, self.instance))
+
+    wait_fn = self.lu.rpc.call_blockdev_wait_sync_change
+    self.assertEqual(wait_fn.call_count, 2)
+    self.assertEqual(wait_fn.call_args_list[0][0][2], [12.3, None])
+    self.assertEqual(wait_fn.call_args_list[0][0][3],
+                     [(True, constants.LDS_SYNC), (False, constants.LDS_OKAY)])
+    self.assertEqual(wait_fn.call_args_list[1][0][2], [17.0, None])
+    self.assertEqual(wait_fn.call_args_list[1][0][3],
+                     [(True, constants.LDS_SYNC), None])
+    self.assertFalse(sleep_fn.called)
+
+  def testDegraded(self):
+    self.lu.rpc.call_blockdev_getmirrorstatus.return_value = \
+      self._Result([self._Status(is_degraded=True), self._Status()])
+
+    def _Wait(node, disks, sync_percents, sync_states, percent_step,
+              timeout):
+      self.now += timeout
+      return self._Result([self._Status(is_degraded=True), self._Status()])
+
+    self.lu.rpc.call_blockdev_wait_sync_change.side_effect = _Wait
+
+    self.assertFalse(instance_storage.WaitForSync(self.lu, self.instance,
+                                                  _time_fn=self._Time))
+    self.assertEqual(self.lu.rpc.call_blockdev_wait_sync_change.call_count, 1)
+    self.assertEqual(self.now, instance_storage._SYNC_DEGRADED_TIMEOUT)
+
+  @mock.patch("time.sleep")
+  def testNodeFailure(self, sleep_fn):
+    self.lu.rpc.call_blockdev_getmirrorstatus.side_effect = [
+      self._Result(None, fail_msg="Connection refused"),
+      self._Result([self._Status(), self._Status()]),
+      ]
+
+    self.assertTrue(instance_storage.WaitForSync(self.lu, self.instance))
+    self.assertEqual(self.lu.rpc.call_blockdev_getmirrorstatus.call_count, 2)
+    sleep_fn.assert_called_once_with(6)
+
+  @mock.patch("time.sleep")
+  def testNodeFailureAborts(self, sleep_fn):
+    self.lu.rpc.call_blockdev_getmirrorstatus.return_value = \
+      self._Result(None, fail_msg="Connection refused")
+
+    self.assertRaises(errors.RemoteError, instance_storage.WaitForSync,
+                      self.lu, self.instance)
+    self.assertEqual(self.lu.rpc.call_blockdev_getmirrorstatus.call_count, 10)
+
+  @mock.patch("time.sleep")
+  def testWaitUnsupported(self, sleep_fn):
+    self.lu.rpc.call_blockdev_getmirrorstatus.side_effect = \
+      [self._Result([self._Status(sync_percent=percent), self._Status()])
+       for percent in [10.0, 40.0, 70.0]] + \
+      [self._Result([self._Status(), self._Status()])]
+    self.lu.rpc.call_blockdev_wait_sync_change.return_value = \
+      self._Result(None, fail_msg="Unknown procedure")
+
+    self.assertTrue(instance_storage.WaitForSync(self.lu, self.instance))
+    self.assertEqual(self.lu.rpc.call_blockdev_wait_sync_change.call_count, 1)
+    self.assertEqual(self.lu.rpc.call_blockdev_getmirrorstatus.call_count, 4)
+    self.assertEqual(sleep_fn.call_args_list, [mock.call(5)] * 2)
+
+
 class TestLUInstanceReplaceDisks(CmdlibTestCase):
   """Tests for LUInstanceReplaceDisks."""
 
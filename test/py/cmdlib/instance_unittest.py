@@ -1571,40 +1571,105 @@ class _RpcForDiskWipe:
     assert node == self._exp_node
     return rpc.RpcResult(data=self._pause_cb(disks, pause))
 
-  def call_blockdev_wipe(self, node, bdev, offset, size):
+  def call_blockdev_wipe_start(self, node, disks_info, offsets, parallel,
+                               instance):
     assert node == self._exp_node
-    return rpc.RpcResult(data=self._wipe_cb(bdev, offset, size))
+    assert parallel == constants.WIPE_MAX_PARALLEL
+    (disks, disks_instance) = disks_info
+    assert disks_instance is instance
+    return rpc.RpcResult(data=self._wipe_cb.Start(disks, offsets))
+
+  def call_blockdev_wipe_status(self, node, name):
+    assert node == self._exp_node
+    result = rpc.RpcResult(data=self._wipe_cb.GetStatus(name))
+    if not result.fail_msg:
+      result.payload = objects.DiskWipeStatus.FromDict(result.payload)
+    return result
+
+  def call_blockdev_wipe_cleanup(self, node, name):
+    assert node == self._exp_node
+    return rpc.RpcResult(data=self._wipe_cb.Cleanup(name))
 
 
 class _DiskWipeProgressTracker:
-  def __init__(self, start_offset):
+  """Simulates background disk wipes on a node.
+
+  """
+  def __init__(self, start_offset, stop_at=None, fail_disk=None,
+               polls=0):
     self._start_offset = start_offset
+    self._stop_at = stop_at
+    self._fail_disk = fail_disk
+    self._polls = polls
+    self._wipes = {}
     self.progress = {}
+    self.started = []
+    self.cleaned_up = []
 
-  def __call__(self, disk_info, offset, size):
-    (disk, _) = disk_info
-    assert isinstance(offset, int)
-    assert isinstance(size, int)
+  def Start(self, disks, offsets):
+    assert len(disks) == len(offsets)
 
-    max_chunk_size = (disk.size / 100.0 * constants.MIN_WIPE_CHUNK_PERCENT)
+    for (disk, offset) in zip(disks, offsets):
+      assert isinstance(offset, int)
+      assert offset >= self._start_offset
+      assert offset <= disk.size
+      assert self.progress.get(disk.logical_id, offset) == offset
 
-    assert offset >= self._start_offset
-    assert (offset + size) <= disk.size
+    name = "wipe%s" % len(self.started)
+    self.started.append((name, [d.logical_id for d in disks], offsets))
+    self._wipes[name] = (disks, offsets, self._polls)
 
-    assert size > 0
-    assert size <= constants.MAX_WIPE_CHUNK
-    assert size <= max_chunk_size
+    return (True, name)
 
-    assert offset == self._start_offset or disk.logical_id in self.progress
+  def GetStatus(self, name):
+    (disks, offsets, polls) = self._wipes[name]
 
-    # Keep track of progress
-    cur_progress = self.progress.setdefault(disk.logical_id, self._start_offset)
+    if polls:
+      self._wipes[name] = (disks, offsets, polls - 1)
+      return (True, {
+        "running": True,
+        "progress_percent": 50.0,
+        "progress_eta": 10.0,
+        })
 
-    assert cur_progress == offset
+    exit_status = 0
+    error_message = None
+    disk_status = []
+
+    for (disk, offset) in zip(disks, offsets):
+      error = None
+
+      if disk.logical_id == self._fail_disk:
+        error = "Simulated failure"
+        exit_status = constants.EXIT_FAILURE
+        error_message = "Wiping disks failed"
+      elif self._stop_at is not None and offset < self._stop_at:
+        # Process stopped unexpectedly
+        offset = min(self._stop_at, disk.size)
+        exit_status = None
+      else:
+        offset = disk.size
+
+      self.progress[disk.logical_id] = offset
+      disk_status.append({
+        "offset": offset,
+        "size": disk.size,
+        "methods": "zeroout",
+        "error": error,
+        })
 
-    # Record progress
-    self.progress[disk.logical_id] += size
+    self._stop_at = None
 
+    return (True, {
+      "disks": disk_status,
+      "running": False,
+      "exit_status": exit_status,
+      "error_message": error_message,
+      })
+
+  def Cleanup(self, name):
+    assert name in self._wipes
+    self.cleaned_up.append(name)
     return (True, None)
 
 
@@ -1636,15 +1701,10 @@ class TestWipeDisks(unittest.TestCase):
 
     self.assertRaises(errors.OpExecError, instance_create.WipeDisks, lu, inst)
 
-  def _FailingWipeCb(self, disk_info, offset, size):
-    # This should only ever be called for the first disk
-    (disk, _) = disk_info
-    self.assertEqual(disk.logical_id, "disk0")
-    return (False, None)
-
   def testFailingWipe(self):
     node_uuid = "node13445-uuid"
     pt = _DiskPauseTracker()
+    wt = _DiskWipeProgressTracker(0, fail_disk="disk1")
 
     disks = [
       objects.Disk(dev_type=constants.DT_PLAIN, logical_id="disk0",
@@ -1655,7 +1715,7 @@ class TestWipeDisks(unittest.TestCase):
                    size=256, uuid="disk2"),
       ]
 
-    lu = _FakeLU(rpc=_RpcForDiskWipe(node_uuid, pt, self._FailingWipeCb),
+    lu = _FakeLU(rpc=_RpcForDiskWipe(node_uuid, pt, wt),
                  cfg=_ConfigForDiskWipe(node_uuid, disks))
 
     inst = objects.Instance(name="inst562",
@@ -1666,10 +1726,15 @@ class TestWipeDisks(unittest.TestCase):
     try:
       instance_create.WipeDisks(lu, inst)
     except errors.OpExecError as err:
-      self.assertTrue(str(err), "Could not wipe disk 0 at offset 0 ")
+      self.assertEqual(str(err), "Could not wipe disk 1 at offset 0:"
+                       " Simulated failure")
     else:
       self.fail("Did not raise exception")
 
+    # The failed wipe is not resumed, but cleaned up
+    self.assertEqual(len(wt.started), 1)
+    self.assertEqual(wt.cleaned_up, ["wipe0"])
+
     # Check if all disks were paused and resumed
     self.assertEqual(pt.history, [
       ("disk0", 100 * 1024, True),
@@ -1680,10 +1745,10 @@ class TestWipeDisks(unittest.TestCase):
       ("disk2", 256, False),
       ])
 
-  def _PrepareWipeTest(self, start_offset, disks):
+  def _PrepareWipeTest(self, start_offset, disks, **kwargs):
     node_name = "node-with-offset%s.example.com" % start_offset
     pauset = _DiskPauseTracker()
-    progresst = _DiskWipeProgressTracker(start_offset)
+    progresst = _DiskWipeProgressTracker(start_offset, **kwargs)
 
     lu = _FakeLU(rpc=_RpcForDiskWipe(node_name, pauset, progresst),
                  cfg=_ConfigForDiskWipe(node_name, disks))
@@ -1722,6 +1787,12 @@ class TestWipeDisks(unittest.TestCase):
       ("disk3", constants.MAX_WIPE_CHUNK, False),
       ])
 
+    # All disks are wiped by a single background task
+    self.assertEqual(progresst.started, [
+      ("wipe0", ["disk0", "disk1", "disk2", "disk3"], [0, 0, 0, 0]),
+      ])
+    self.assertEqual(progresst.cleaned_up, ["wipe0"])
+
     # Ensure the complete disk has been wiped
     self.assertEqual(progresst.progress,
                      dict((i.logical_id, i.size) for i in disks))
@@ -1747,10 +1818,50 @@ class TestWipeDisks(unittest.TestCase):
         ("disk1", start_offset + (100 * 1024), True),
         ("disk1", start_offset + (100 * 1024), False),
         ])
+      self.assertEqual(progresst.started, [
+        ("wipe0", ["disk1"], [start_offset]),
+        ])
       self.assertEqual(progresst.progress, {
         "disk1": disks[1].size,
         })
 
+  def testPolling(self):
+    disks = [
+      objects.Disk(dev_type=constants.DT_PLAIN, logical_id="disk0",
+                   size=1024, uuid="disk0"),
+      ]
+
+    (lu, inst, _, progresst) = self._PrepareWipeTest(0, disks, polls=3)
+
+    sleeps = []
+    instance_create.WipeDisks(lu, inst, _sleep_fn=sleeps.append)
+
+    self.assertEqual(len(sleeps), 3)
+    self.assertEqual(progresst.progress, {"disk0": 1024})
+
+  def testResume(self):
+    disks = [
+      objects.Disk(dev_type=constants.DT_PLAIN, logical_id="disk0",
+                   size=1024, uuid="disk0"),
+      objects.Disk(dev_type=constants.DT_PLAIN, logical_id="disk1",
+                   size=4096, uuid="disk1"),
+      ]
+
+    (lu, inst, _, progresst) = self._PrepareWipeTest(0, disks, stop_at=2048)
+
+    instance_create.WipeDisks(lu, inst)
+
+    # The second task continues where the first one stopped
+    self.assertEqual(progresst.started, [
+      ("wipe0", ["disk0", "disk1"], [0, 0]),
+      ("wipe1", ["disk0", "disk1"], [1024, 2048]),
+      ])
+    self.assertEqual(progresst.cleaned_up, ["wipe0", "wipe1"])
+    self.assertEqual(progresst.progress, {
+      "disk0": 1024,
+      "disk1": 4096,
+      })
+
 
 class TestCheckOpportunisticLocking(unittest.TestCase):
   class OpTest(opcodes.OpCode):
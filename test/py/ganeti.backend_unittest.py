@@ -687,6 +687,40 @@ class TestGetBlockDevSymlinkPath(unittest.TestCase):
       self._Test("inst1.example.com", idx)
 
 
+class TestGetDiskWipeGroup(unittest.TestCase):
+  def setUp(self):
+    self.tmpdir = tempfile.mkdtemp()
+
+  def tearDown(self):
+    shutil.rmtree(self.tmpdir)
+
+  def testPlain(self):
+    disk = objects.Disk(dev_type=constants.DT_PLAIN,
+                        logical_id=("xenvg", "disk0"))
+    self.assertEqual(backend._GetDiskWipeGroup(disk, "/dev/xenvg/disk0"),
+                     "vg:xenvg")
+
+  def testDrbd(self):
+    data = objects.Disk(dev_type=constants.DT_PLAIN,
+                        logical_id=("datavg", "disk0_data"))
+    meta = objects.Disk(dev_type=constants.DT_PLAIN,
+                        logical_id=("metavg", "disk0_meta"))
+    disk = objects.Disk(dev_type=constants.DT_DRBD8, children=[data, meta])
+    self.assertEqual(backend._GetDiskWipeGroup(disk, "/dev/drbd3"),
+                     "vg:datavg")
+
+  def testFile(self):
+    path = utils.PathJoin(self.tmpdir, "disk0")
+    disk = objects.Disk(dev_type=constants.DT_FILE)
+    self.assertEqual(backend._GetDiskWipeGroup(disk, path),
+                     "fs:%s" % os.stat(self.tmpdir).st_dev)
+
+  def testOther(self):
+    disk = objects.Disk(dev_type=constants.DT_RBD)
+    self.assertEqual(backend._GetDiskWipeGroup(disk, "/dev/rbd1"),
+                     "dev:/dev/rbd1")
+
+
 class TestGetInstanceList(unittest.TestCase):
 
   def setUp(self):
@@ -43,6 +43,7 @@ from ganeti import errors
 from ganeti import utils
 from ganeti import objects
 from ganeti import qlang
+import ganeti.rpc.errors as rpcerr
 from ganeti.errors import OpPrereqError, ParameterError
 
 
@@ -688,6 +689,244 @@ class TestGenericPollJob(testutils.GanetiTestCase):
                          job_id, cbs, cbs, cancel_fn=(lambda: False)))
     cbs.CheckEmpty()
 
+
+class _FakeMultiJobCb(cli.JobPollCbBase, cli.JobPollReportCbBase):
+  """Fake jobs changing their state in every round of L{GenericPollJobs}.
+
+  """
+  def __init__(self, tc, jobs):
+    self.tc = tc
+    self.jobs = jobs
+    self.round = -1
+    self.calls = []
+    self.log = []
+    self.now = 0.0
+
+  def _GetJob(self, job_id):
+    states = self.jobs[job_id]
+    return states[min(self.round, len(states) - 1)]
+
+  def QueryJobs(self, job_ids, fields):
+    self.calls.append(("QueryJobs", len(job_ids)))
+    if fields == ["status"]:
+      self.round += 1
+
+    result = []
+    for job_id in job_ids:
+      job = self._GetJob(job_id)
+      if job is None:
+        result.append(None)
+        continue
+      (status, oplog, opresult) = job
+      if status == constants.JOB_STATUS_SUCCESS:
+        opstatus = [constants.OP_STATUS_SUCCESS]
+      else:
+        opstatus = [constants.OP_STATUS_ERROR]
+      values = {
+        "status": status,
+        "oplog": [oplog],
+        "opstatus": opstatus,
+        "opresult": [opresult],
+        }
+      result.append([values[name] for name in fields])
+    return result
+
+  def WaitForJobChangeOnce(self, job_id, fields,
+                           prev_job_info, prev_log_serial,
+                           timeout=constants.DEFAULT_WFJC_TIMEOUT):
+    self.calls.append(("WaitForJobChangeOnce", job_id))
+    self.tc.assertEqual(fields, ["status"])
+    self.tc.assertEqual(prev_job_info, [self._GetJob(job_id)[0]])
+    self.tc.assertTrue(timeout > 0)
+    self.now += timeout
+    return constants.JOB_NOTCHANGED
+
+  def TimeFn(self):
+    return self.now
+
+  def SleepFn(self, delay):
+    self.tc.assertTrue(delay > 0)
+    self.now += delay
+
+  def ReportLogMessage(self, job_id, serial, timestamp, log_type, log_msg):
+    self.log.append((job_id, serial, log_msg))
+
+  def ReportNotChanged(self, job_id, status):
+    pass
+
+
+class TestGenericPollJobs(unittest.TestCase):
+  @staticmethod
+  def _Entry(serial, msg):
+    return (serial, utils.SplitTime(1273491611.0 + serial),
+            constants.ELOG_MESSAGE, msg)
+
+  def testCompletionOrder(self):
+    queued = (constants.JOB_STATUS_QUEUED, [], None)
+    running = (constants.JOB_STATUS_RUNNING, [self._Entry(1, "a1")], None)
+    cbs = _FakeMultiJobCb(self, {
+      1: [queued, running,
+          (constants.JOB_STATUS_SUCCESS,
+           [self._Entry(1, "a1"), self._Entry(2, "a2")], "result1")],
+      2: [(constants.JOB_STATUS_SUCCESS, [self._Entry(1, "b1")], "result2")],
+      3: [queued, queued, queued,
+          (constants.JOB_STATUS_ERROR, [], "failure")],
+      4: [queued, None],
+      })
+
+    results = list(cli.GenericPollJobs([1, 2, 3, 4], cbs, cbs,
+                                       _time_fn=cbs.TimeFn,
+                                       _sleep_fn=cbs.SleepFn))
+
+    self.assertEqual([job_id for (job_id, _, _) in results], [2, 4, 1, 3])
+    self.assertEqual(results[0], (2, None, ["result2"]))
+    self.assertTrue(isinstance(results[1][1], errors.JobLost))
+    self.assertEqual(results[2], (1, None, ["result1"]))
+    self.assertTrue(isinstance(results[3][1], errors.OpExecError))
+
+    self.assertEqual(cbs.log, [(2, 1, "b1"), (1, 1, "a1"), (1, 2, "a2")])
+
+    # At most three calls per round, and rounds are spaced out
+    self.assertEqual(cbs.round, 3)
+    self.assertTrue(len(cbs.calls) <= 3 * (cbs.round + 1))
+    self.assertTrue(cbs.now >= 3 * cli._MULTI_POLL_MIN_INTERVAL)
+
+  def testManyJobs(self):
+    jobs = dict((job_id, [(constants.JOB_STATUS_QUEUED, [], None),
+                          (constants.JOB_STATUS_SUCCESS, [], job_id)])
+                for job_id in range(1000))
+    cbs = _FakeMultiJobCb(self, jobs)
+
+    results = list(cli.GenericPollJobs(sorted(jobs), cbs, cbs,
+                                       _time_fn=cbs.TimeFn,
+                                       _sleep_fn=cbs.SleepFn))
+
+    self.assertEqual(sorted(results),
+                     [(job_id, None, [job_id]) for job_id in range(1000)])
+    self.assertEqual(cbs.calls, [
+      ("QueryJobs", 1000),
+      ("WaitForJobChangeOnce", 0),
+      ("QueryJobs", 1000),
+      ("QueryJobs", 1000),
+      ])
+
+  def testTransientErrors(self):
+    cbs = _FakeMultiJobCb(self, {
+      1: [(constants.JOB_STATUS_RUNNING, [], None),
+          (constants.JOB_STATUS_SUCCESS, [], "result1")],
+      2: [(constants.JOB_STATUS_RUNNING, [], None),
+          (constants.JOB_STATUS_RUNNING, [], None),
+          (constants.JOB_STATUS_SUCCESS, [], "result2")],
+      })
+    query_fn = cbs.QueryJobs
+    wait_fn = cbs.WaitForJobChangeOnce
+    failures = [rpcerr.ProtocolError("Connection reset"),
+                errors.GenericError("Error while querying")]
+
+    def _QueryJobs(job_ids, fields):
+      if fields == ["status"] and cbs.round == 0 and failures:
+        raise failures.pop(0)
+      return query_fn(job_ids, fields)
+
+    def _WaitForJobChangeOnce(*args, **kwargs):
+      wait_fn(*args, **kwargs)
+      raise rpcerr.TimeoutError("Timeout while waiting")
+
+    cbs.QueryJobs = _QueryJobs
+    cbs.WaitForJobChangeOnce = _WaitForJobChangeOnce
+
+    results = list(cli.GenericPollJobs([1, 2], cbs, cbs, max_errors=3,
+                                       _time_fn=cbs.TimeFn,
+                                       _sleep_fn=cbs.SleepFn))
+
+    self.assertEqual(results, [(1, None, ["result1"]), (2, None, ["result2"])])
+    self.assertFalse(failures)
+
+  def testPersistentErrors(self):
+    cbs = _FakeMultiJobCb(self, {
+      1: [(constants.JOB_STATUS_SUCCESS, [], "result1")],
+      2: [(constants.JOB_STATUS_RUNNING, [], None)],
+      3: [(constants.JOB_STATUS_QUEUED, [], None)],
+      })
+    query_fn = cbs.QueryJobs
+    err = rpcerr.ProtocolError("Master daemon is gone")
+
+    def _QueryJobs(job_ids, fields):
+      if cbs.round >= 0 and fields == ["status"]:
+        cbs.calls.append(("QueryJobs", len(job_ids)))
+        raise err
+      return query_fn(job_ids, fields)
+
+    cbs.QueryJobs = _QueryJobs
+
+    results = list(cli.GenericPollJobs([1, 2, 3], cbs, cbs, max_errors=3,
+                                       _time_fn=cbs.TimeFn,
+                                       _sleep_fn=cbs.SleepFn))
+
+    # Jobs which finished before the errors keep their results
+    self.assertEqual(results, [(1, None, ["result1"]), (2, err, None),
+                               (3, err, None)])
+    self.assertEqual([name for (name, _) in cbs.calls].count("QueryJobs"), 5)
+
+  def testInvalidIntervals(self):
+    self.assertRaises(errors.ParameterError, list,
+                      cli.GenericPollJobs([1], NotImplemented, NotImplemented,
+                                          min_interval=0))
+    self.assertRaises(errors.ParameterError, list,
+                      cli.GenericPollJobs([1], NotImplemented, NotImplemented,
+                                          min_interval=2, max_interval=1))
+
+
+class _FakeExecutorClient:
+  def __init__(self, tc):
+    self.tc = tc
+
+  def SubmitManyJobs(self, jobs):
+    return [(True, 30), (False, "queue full"), (True, 10), (True, 20)]
+
+  def QueryJobs(self, job_ids, fields):
+    self.tc.assertEqual(job_ids, [30, 10, 20])
+    if fields == ["status"]:
+      return [[constants.JOB_STATUS_SUCCESS]] * len(job_ids)
+
+    result = []
+    for job_id in job_ids:
+      if job_id == 10:
+        values = [constants.JOB_STATUS_ERROR, [[]],
+                  [constants.OP_STATUS_ERROR], ["failure"]]
+      else:
+        values = [constants.JOB_STATUS_SUCCESS, [[]],
+                  [constants.OP_STATUS_SUCCESS], [job_id]]
+      result.append(values)
+    return result
+
+
+class TestJobExecutor(unittest.TestCase):
+  def _Run(self, ordered):
+    je = cli.JobExecutor(cl=_FakeExecutorClient(self), verbose=False,
+                         feedback_fn=lambda _: None)
+    for name in ["a", "b", "c", "d"]:
+      je.QueueJob(name)
+    return je.GetResults(ordered=ordered)
+
+  def testOrdered(self):
+    self.assertEqual(self._Run(True), [
+      (True, [30]),
+      (False, "queue full"),
+      (False, "Failure: command execution error:\nfailure"),
+      (True, [20]),
+      ])
+
+  def testUnordered(self):
+    results = self._Run(False)
+    self.assertEqual(results[0], (False, "queue full"))
+    self.assertEqual(sorted(results[1:], key=str), [
+      (False, "Failure: command execution error:\nfailure"),
+      (True, [20]),
+      (True, [30]),
+      ])
+
+
 class TestFormatLogMessage(unittest.TestCase):
   def test(self):
     self.assertEqual(cli.FormatLogMessage(constants.ELOG_MESSAGE,
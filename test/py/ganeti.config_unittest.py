@@ -341,6 +341,213 @@ class TestConfigRunner(unittest.TestCase):
     newsaved = utils.ReadFile(self.cfg_file)
     self.assertEqual(oldsaved, newsaved)
 
+  def _get_object_wconfd(self):
+    """Returns a ConfigWriter talking to a mocked WConfd"""
+    data = serializer.Load(utils.ReadFile(self.cfg_file))
+    wconfd = mock.Mock()
+    wconfd.ReadConfig.return_value = data
+    wconfd.LockConfig.return_value = data
+    wconfd.WriteConfigDelta.return_value = True
+    cfg = config.ConfigWriter(cfg_file=self.cfg_file, wconfd=wconfd,
+                              wconfdcontext="ctx",
+                              _getents=_StubGetEntResolver)
+    return (cfg, wconfd, data)
+
+  def testWriteConfigDelta(self):
+    (cfg, wconfd, data) = self._get_object_wconfd()
+
+    cfg.SetVGName("othervg")
+    wconfd.LockConfig.assert_called_once_with("ctx", False)
+    (ctx, delta) = wconfd.WriteConfigDelta.call_args[0]
+    self.assertEqual(ctx, "ctx")
+    self.assertEqual(delta["serial_no"], data["serial_no"])
+    self.assertEqual(delta["cluster"]["volume_group_name"], "othervg")
+    for key in ["nodes", "nodegroups", "instances", "networks", "disks"]:
+      self.assertEqual(delta[key], {})
+    wconfd.UnlockConfig.assert_called_once_with("ctx")
+    self.assertFalse(wconfd.WriteConfigAndUnlock.called)
+
+    # Later locks only fetch the changes
+    wconfd.LockConfigSince.return_value = {
+      "delta": {"serial_no": data["serial_no"] + 1,
+                "cluster": delta["cluster"]},
+      }
+    group = objects.NodeGroup(name="group2", members=[])
+    cfg.AddNodeGroup(group, "my-job")
+    wconfd.LockConfigSince.assert_called_once_with("ctx", False,
+                                                   data["serial_no"])
+    self.assertEqual(wconfd.LockConfig.call_count, 1)
+    delta = wconfd.WriteConfigDelta.call_args[0][1]
+    self.assertEqual(delta["serial_no"], data["serial_no"] + 1)
+    self.assertEqual(list(delta["nodegroups"]), [group.uuid])
+    self.assertEqual(delta["nodegroups"][group.uuid]["name"], "group2")
+
+    cfg.RemoveNodeGroup(group.uuid)
+    delta = wconfd.WriteConfigDelta.call_args[0][1]
+    self.assertEqual(delta["nodegroups"], {group.uuid: None})
+
+  def testWriteConfigDeltaRejected(self):
+    (cfg, wconfd, _) = self._get_object_wconfd()
+    wconfd.WriteConfigDelta.return_value = False
+    wconfd.WriteConfigAndUnlock.return_value = True
+
+    cfg.SetVGName("othervg")
+    self.assertEqual(wconfd.WriteConfigDelta.call_count, 1)
+    (_, data) = wconfd.WriteConfigAndUnlock.call_args[0]
+    self.assertEqual(data["cluster"]["volume_group_name"], "othervg")
+    self.assertFalse(wconfd.UnlockConfig.called)
+
+  def testReadConfigSince(self):
+    (cfg, wconfd, data) = self._get_object_wconfd()
+
+    master_uuid = cfg.GetMasterNode()
+    self.assertEqual(wconfd.ReadConfig.call_count, 1)
+    cfg.GetMasterNode()
+    self.assertEqual(wconfd.ReadConfig.call_count, 1)
+    self.assertFalse(wconfd.ReadConfigSince.called)
+
+    node = dict(data["nodes"][master_uuid], offline=True, serial_no=2)
+    wconfd.ReadConfigSince.return_value = {
+      "delta": {"serial_no": data["serial_no"] + 1,
+                "cluster": data["cluster"],
+                "nodes": {master_uuid: node}},
+      }
+    cfg.OutDate()
+    self.assertTrue(cfg.GetNodeInfo(master_uuid).offline)
+    wconfd.ReadConfigSince.assert_called_once_with(data["serial_no"])
+    self.assertEqual(wconfd.ReadConfig.call_count, 1)
+
+    # A full configuration is used as is
+    wconfd.ReadConfigSince.return_value = {"full": data}
+    cfg.OutDate()
+    self.assertFalse(cfg.GetNodeInfo(master_uuid).offline)
+    wconfd.ReadConfigSince.assert_called_with(data["serial_no"] + 1)
+
+  def testReadConfigSinceGroupMembers(self):
+    (cfg, wconfd, data) = self._get_object_wconfd()
+
+    master_uuid = cfg.GetMasterNode()
+    group_uuid = cfg.GetNodeInfo(master_uuid).group
+    self.assertEqual(cfg.GetNodeGroup(group_uuid).members, [master_uuid])
+
+    # The master node was moved to a new group by another process
+    group2 = objects.NodeGroup(name="group2", uuid="group2-uuid", members=[],
+                               serial_no=1)
+    node = dict(data["nodes"][master_uuid], group=group2.uuid, serial_no=2)
+    wconfd.ReadConfigSince.return_value = {
+      "delta": {"serial_no": data["serial_no"] + 1,
+                "cluster": data["cluster"],
+                "nodes": {master_uuid: node},
+                "nodegroups": {group2.uuid: group2.ToDict()}},
+      }
+    cfg.OutDate()
+    self.assertEqual(cfg.GetNodeGroup(group_uuid).members, [])
+    self.assertEqual(cfg.GetNodeGroup(group2.uuid).members, [master_uuid])
+
+    # ... and then removed
+    wconfd.ReadConfigSince.return_value = {
+      "delta": {"serial_no": data["serial_no"] + 2,
+                "cluster": data["cluster"],
+                "nodes": {master_uuid: None}},
+      }
+    cfg.OutDate()
+    self.assertEqual(cfg.GetNodeGroup(group2.uuid).members, [])
+
+  def testIndexReadConfigSince(self):
+    (cfg, wconfd, data) = self._get_object_wconfd()
+
+    master_uuid = cfg.GetMasterNode()
+    master_name = cfg.GetMasterNodeName()
+    self.assertEqual(cfg.GetNodeInfoByName(master_name).uuid, master_uuid)
+
+    node = dict(data["nodes"][master_uuid], name="renamed.example.com",
+                serial_no=2)
+    wconfd.ReadConfigSince.return_value = {
+      "delta": {"serial_no": data["serial_no"] + 1,
+                "cluster": data["cluster"],
+                "nodes": {master_uuid: node}},
+      }
+    cfg.OutDate()
+    self.assertEqual(cfg.GetNodeInfoByName(master_name), None)
+    self.assertEqual(cfg.GetNodeInfoByName("renamed.example.com").uuid,
+                     master_uuid)
+    self.assertEqual(cfg.ExpandNodeName("RENAMED"),
+                     (master_uuid, "renamed.example.com"))
+
+  def testNameLookups(self):
+    cfg = self._get_object_mock()
+    group = cfg.AddNewNodeGroup(name="group1")
+    node = cfg.AddNewNode(name="node1.example.com", group=group)
+    inst = cfg.AddNewInstance(name="inst1.example.com", primary_node=node)
+    cfg.AddNewInstance(name="inst1.example.org", primary_node=node)
+    cfg.AddNewInstance(name="inst12.example.com", primary_node=node)
+
+    self.assertEqual(cfg.GetNodeInfoByName("node1.example.com"), node)
+    self.assertEqual(cfg.GetNodeGroupInfoByName("group1"), group)
+    self.assertEqual(cfg.LookupNodeGroup("group1"), group.uuid)
+    self.assertEqual(cfg.GetInstanceInfoByName("inst1.example.com"), inst)
+    self.assertEqual(cfg.GetInstanceInfoByName("inst1"), None)
+
+    self.assertEqual(cfg.ExpandNodeName("node1"),
+                     (node.uuid, "node1.example.com"))
+    self.assertEqual(cfg.ExpandInstanceName("inst1.example.com"),
+                     (inst.uuid, "inst1.example.com"))
+    self.assertEqual(cfg.ExpandInstanceName("INST1.example.com"),
+                     (inst.uuid, "inst1.example.com"))
+    self.assertEqual(cfg.ExpandInstanceName("inst1"), (None, None))
+    self.assertEqual(cfg.ExpandInstanceName("inst1.example"), (None, None))
+    self.assertEqual(cfg.ExpandInstanceName("inst12")[1], "inst12.example.com")
+    self.assertEqual(cfg.ExpandInstanceName("inst"), (None, None))
+
+    cfg.RenameInstance(inst.uuid, "inst2.example.com")
+    self.assertEqual(cfg.GetInstanceInfoByName("inst1.example.com"), None)
+    self.assertEqual(cfg.GetInstanceInfoByName("inst2.example.com"), inst)
+    self.assertEqual(cfg.ExpandInstanceName("inst1")[1], "inst1.example.org")
+
+    cfg.RemoveNode(node.uuid)
+    self.assertEqual(cfg.GetNodeInfoByName("node1.example.com"), None)
+    self.assertEqual(cfg.ExpandNodeName("node1"), (None, None))
+
+  def testNodeInstances(self):
+    cfg = self._get_object_mock()
+    group = cfg.AddNewNodeGroup()
+    node1 = cfg.AddNewNode()
+    node2 = cfg.AddNewNode(group=group)
+    node3 = cfg.AddNewNode(group=group)
+    inst1 = cfg.AddNewInstance(primary_node=node1, secondary_node=node2,
+                               disk_template=constants.DT_DRBD8)
+    inst2 = cfg.AddNewInstance(primary_node=node2,
+                               disk_template=constants.DT_DISKLESS)
+
+    self.assertEqual(cfg.GetNodeInstances(node1.uuid), ([inst1.uuid], []))
+    self.assertEqual(cfg.GetNodeInstances(node2.uuid),
+                     ([inst2.uuid], [inst1.uuid]))
+    self.assertEqual(cfg.GetNodeInstances(node3.uuid), ([], []))
+    self.assertEqual(cfg.GetNodeGroupInstances(group.uuid),
+                     frozenset([inst1.uuid, inst2.uuid]))
+    self.assertEqual(cfg.GetNodeGroupInstances(group.uuid, primary_only=True),
+                     frozenset([inst2.uuid]))
+
+    disk = cfg.GetInstanceDisks(inst1.uuid)[0]
+    self.assertEqual(cfg.GetInstanceForDisk(disk.uuid), inst1.uuid)
+    self.assertRaises(errors.ReservationError, cfg._UnlockedRemoveDisk,
+                      disk.uuid)
+
+    logical_id = (node1.uuid, node3.uuid) + disk.logical_id[2:]
+    cfg.SetDiskLogicalID(disk.uuid, logical_id)
+    self.assertEqual(cfg.GetNodeInstances(node2.uuid), ([inst2.uuid], []))
+    self.assertEqual(cfg.GetNodeInstances(node3.uuid), ([], [inst1.uuid]))
+
+    cfg.SetInstancePrimaryNode(inst2.uuid, node1.uuid)
+    self.assertEqual(cfg.GetNodeInstances(node1.uuid),
+                     ([inst1.uuid, inst2.uuid], []))
+    self.assertEqual(cfg.GetNodeGroupInstances(group.uuid, primary_only=True),
+                     frozenset())
+
+    cfg.RemoveInstanceDisk(inst1.uuid, disk.uuid)
+    self.assertEqual(cfg.GetInstanceForDisk(disk.uuid), None)
+    self.assertEqual(cfg.GetNodeInstances(node3.uuid), ([], []))
+
   def testNICParameterSyntaxCheck(self):
     """Test the NIC's CheckParameterSyntax function"""
     mode = constants.NIC_MODE
@@ -82,6 +82,10 @@ class TestConstants(unittest.TestCase):
     self.assertTrue(constants.SSL_CERT_EXPIRATION_ERROR <
                     constants.SSL_CERT_EXPIRATION_WARN)
 
+  def testWipeMaxParallel(self):
+    self.assertTrue(isinstance(constants.WIPE_MAX_PARALLEL, int))
+    self.assertTrue(constants.WIPE_MAX_PARALLEL >= 1)
+
   def testOpCodePriority(self):
     self.assertTrue(constants.OP_PRIO_LOWEST > constants.OP_PRIO_LOW)
     self.assertTrue(constants.OP_PRIO_LOW > constants.OP_PRIO_NORMAL)
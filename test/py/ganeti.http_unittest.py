@@ -32,12 +32,15 @@
 
 
 import os
+import signal
+import socket
 import unittest
 import time
 import tempfile
 import pycurl
 import itertools
 import threading
+import zlib
 from io import StringIO
 
 from ganeti import http
@@ -121,6 +124,365 @@ class TestMisc(unittest.TestCase):
                   "Digest realm=secure foo=\"x,y\""))
 
 
+class _FakeMainloop:
+  def RegisterSignal(self, owner):
+    pass
+
+
+class _PidHandler(http.server.HttpServerHandler):
+  def HandleRequest(self, req):
+    return str(os.getpid()).encode()
+
+
+class TestHttpServerWorkerPool(unittest.TestCase):
+  def setUp(self):
+    self.server = http.server.HttpServer(_FakeMainloop(), "127.0.0.1", 0, 20,
+                                         _PidHandler(), worker_pool_size=1,
+                                         worker_max_requests=2)
+
+  def tearDown(self):
+    self.server.Stop()
+    for pid in self.server._workers:
+      os.waitpid(pid, 0)
+
+  def _Request(self, port):
+    sock = socket.create_connection(("127.0.0.1", port), 10)
+    try:
+      sock.sendall(b"GET / HTTP/1.0\r\nContent-Length: 0\r\n\r\n")
+      data = b""
+      while True:
+        chunk = sock.recv(4096)
+        if not chunk:
+          break
+        data += chunk
+    finally:
+      sock.close()
+
+    (header, body) = data.split(b"\r\n\r\n", 1)
+    self.assertTrue(header.startswith(b"HTTP/1.0 200"))
+    return int(body)
+
+  def test(self):
+    server = self.server
+    self.assertFalse(server.readable())
+
+    server.Start()
+    port = server.socket.getsockname()[1]
+
+    self.assertEqual(len(server._workers), 1)
+    (first_worker, ) = server._workers
+
+    # The first worker handles two connections and exits
+    self.assertEqual(self._Request(port), first_worker)
+    self.assertEqual(self._Request(port), first_worker)
+    os.waitpid(first_worker, 0)
+
+    # A replacement is started once the parent notices
+    server._workers.remove(first_worker)
+    server.OnSignal(signal.SIGCHLD)
+    self.assertEqual(len(server._workers), 1)
+    (second_worker, ) = server._workers
+    self.assertNotEqual(first_worker, second_worker)
+    self.assertEqual(self._Request(port), second_worker)
+
+
+class _FakeRequestExecutor:
+  def __init__(self, server, handler, sock, client_addr):
+    self.handshake_time = 0.1
+    self.handling_time = 0.2
+
+
+class TestHttpServerRequestTiming(unittest.TestCase):
+  def _GetLogLevel(self, log_request_timing):
+    server = http.server.HttpServer(_FakeMainloop(), "127.0.0.1", 0, 20,
+                                    _PidHandler(),
+                                    request_executor_class=_FakeRequestExecutor,
+                                    log_request_timing=log_request_timing)
+    try:
+      with self.assertLogs(level="DEBUG") as logs:
+        server._HandleConnection(None, ("192.0.2.1", 1234), time.time(), 0)
+    finally:
+      server.Stop()
+
+    self.assertEqual(len(logs.records), 1)
+    self.assertTrue("[handshake: 0.1000]" in logs.records[0].getMessage())
+    return logs.records[0].levelname
+
+  def testDefault(self):
+    self.assertEqual(self._GetLogLevel(False), "DEBUG")
+
+  def testLogRequestTiming(self):
+    self.assertEqual(self._GetLogLevel(True), "INFO")
+
+
+class TestHttpServerKeepAlive(unittest.TestCase):
+  def setUp(self):
+    self.server = http.server.HttpServer(_FakeMainloop(), "127.0.0.1", 0, 20,
+                                         _PidHandler(), worker_pool_size=1,
+                                         keep_alive_timeout=5,
+                                         keep_alive_max_requests=3)
+    self.server.Start()
+    self.port = self.server.socket.getsockname()[1]
+
+  def tearDown(self):
+    self.server.Stop()
+    for pid in self.server._workers:
+      os.waitpid(pid, 0)
+
+  @staticmethod
+  def _ReadResponse(sock):
+    data = b""
+    while b"\r\n\r\n" not in data:
+      chunk = sock.recv(4096)
+      if not chunk:
+        break
+      data += chunk
+
+    (header, body) = data.split(b"\r\n\r\n", 1)
+    headers = dict(line.split(b": ", 1)
+                   for line in header.split(b"\r\n")[1:])
+    length = int(headers[b"Content-Length"])
+    while len(body) < length:
+      body += sock.recv(4096)
+
+    return (header.split(b"\r\n")[0], headers, body)
+
+  def test(self):
+    sock = socket.create_connection(("127.0.0.1", self.port), 10)
+    try:
+      pids = set()
+      for i in range(3):
+        sock.sendall(b"POST / HTTP/1.1\r\nHost: localhost\r\n"
+                     b"Content-Length: 0\r\n\r\n")
+        (start_line, headers, body) = self._ReadResponse(sock)
+        self.assertEqual(start_line, b"HTTP/1.1 200 OK")
+        pids.add(int(body))
+
+        # The connection is closed after the third request
+        if i < 2:
+          self.assertEqual(headers[b"Connection"], b"keep-alive")
+        else:
+          self.assertEqual(headers[b"Connection"], b"close")
+
+      self.assertEqual(pids, set(self.server._workers))
+    finally:
+      sock.close()
+
+  def testClientClose(self):
+    sock = socket.create_connection(("127.0.0.1", self.port), 10)
+    try:
+      sock.sendall(b"POST / HTTP/1.1\r\nHost: localhost\r\n"
+                   b"Connection: close\r\nContent-Length: 0\r\n\r\n")
+      (_, headers, _) = self._ReadResponse(sock)
+      self.assertEqual(headers[b"Connection"], b"close")
+    finally:
+      sock.close()
+
+  def testHttp10(self):
+    sock = socket.create_connection(("127.0.0.1", self.port), 10)
+    try:
+      sock.sendall(b"POST / HTTP/1.0\r\nContent-Length: 0\r\n\r\n")
+      (_, headers, _) = self._ReadResponse(sock)
+      self.assertEqual(headers[b"Connection"], b"close")
+    finally:
+      sock.close()
+
+
+class _StreamingHandler(http.server.HttpServerHandler):
+  def HandleRequest(self, req):
+    return http.HttpStreamingBody(b"%04d," % i for i in range(1000))
+
+
+class TestHttpServerStreaming(unittest.TestCase):
+  def setUp(self):
+    self.server = http.server.HttpServer(_FakeMainloop(), "127.0.0.1", 0, 20,
+                                         _StreamingHandler(),
+                                         worker_pool_size=1,
+                                         keep_alive_timeout=5)
+    self.server.Start()
+    self.port = self.server.socket.getsockname()[1]
+    self.body = b"".join(b"%04d," % i for i in range(1000))
+
+  def tearDown(self):
+    self.server.Stop()
+    for pid in self.server._workers:
+      os.waitpid(pid, 0)
+
+  @staticmethod
+  def _ReadHeader(sock):
+    data = b""
+    while b"\r\n\r\n" not in data:
+      chunk = sock.recv(4096)
+      if not chunk:
+        break
+      data += chunk
+
+    (header, rest) = data.split(b"\r\n\r\n", 1)
+    headers = dict(line.split(b": ", 1)
+                   for line in header.split(b"\r\n")[1:])
+    return (header.split(b"\r\n")[0], headers, rest)
+
+  @staticmethod
+  def _ReadChunked(sock, data):
+    body = b""
+    while True:
+      while b"\r\n" not in data:
+        data += sock.recv(4096)
+      (size, data) = data.split(b"\r\n", 1)
+      size = int(size, 16)
+      while len(data) < size + 2:
+        data += sock.recv(4096)
+      assert data[size:size + 2] == b"\r\n"
+      if size == 0:
+        return body
+      body += data[:size]
+      data = data[size + 2:]
+
+  def testChunked(self):
+    sock = socket.create_connection(("127.0.0.1", self.port), 10)
+    try:
+      # The connection can be reused after a chunked response
+      for _ in range(2):
+        sock.sendall(b"GET / HTTP/1.1\r\nHost: localhost\r\n"
+                     b"Content-Length: 0\r\n\r\n")
+        (start_line, headers, rest) = self._ReadHeader(sock)
+        self.assertEqual(start_line, b"HTTP/1.1 200 OK")
+        self.assertEqual(headers[b"Transfer-Encoding"], b"chunked")
+        self.assertEqual(headers[b"Connection"], b"keep-alive")
+        self.assertFalse(b"Content-Length" in headers)
+        self.assertEqual(self._ReadChunked(sock, rest), self.body)
+    finally:
+      sock.close()
+
+  def testHttp10(self):
+    sock = socket.create_connection(("127.0.0.1", self.port), 10)
+    try:
+      sock.sendall(b"GET / HTTP/1.0\r\nContent-Length: 0\r\n\r\n")
+      (start_line, headers, body) = self._ReadHeader(sock)
+      self.assertEqual(start_line, b"HTTP/1.0 200 OK")
+      self.assertEqual(headers[b"Connection"], b"close")
+      self.assertFalse(b"Transfer-Encoding" in headers)
+      self.assertFalse(b"Content-Length" in headers)
+
+      # The end of the body is signalled by closing the connection
+      while True:
+        chunk = sock.recv(4096)
+        if not chunk:
+          break
+        body += chunk
+      self.assertEqual(body, self.body)
+    finally:
+      sock.close()
+
+
+class _EchoHandler(http.server.HttpServerHandler):
+  RESPONSE_COMPRESSION_MIN_SIZE = 100
+
+  def HandleRequest(self, req):
+    return req.request_body
+
+
+class TestHttpServerCompression(unittest.TestCase):
+  def setUp(self):
+    self.server = http.server.HttpServer(_FakeMainloop(), "127.0.0.1", 0, 20,
+                                         _EchoHandler(),
+                                         worker_pool_size=1,
+                                         keep_alive_timeout=5)
+    self.server.Start()
+    self.port = self.server.socket.getsockname()[1]
+
+  def tearDown(self):
+    self.server.Stop()
+    for pid in self.server._workers:
+      os.waitpid(pid, 0)
+
+  def _Request(self, body, headers):
+    sock = socket.create_connection(("127.0.0.1", self.port), 10)
+    try:
+      sock.sendall(b"POST / HTTP/1.1\r\nHost: localhost\r\n"
+                   b"Connection: close\r\n" +
+                   b"".join(b"%s\r\n" % i for i in headers) +
+                   b"Content-Length: %d\r\n\r\n" % len(body) + body)
+      data = b""
+      while True:
+        chunk = sock.recv(4096)
+        if not chunk:
+          break
+        data += chunk
+    finally:
+      sock.close()
+
+    (header, body) = data.split(b"\r\n\r\n", 1)
+    lines = header.split(b"\r\n")
+    return (lines[0], dict(line.split(b": ", 1) for line in lines[1:]), body)
+
+  def testCompressed(self):
+    body = b"Hello World\n" * 100
+    (start_line, headers, resp_body) = \
+      self._Request(zlib.compress(body), [b"Content-Encoding: deflate",
+                                          b"Accept-Encoding: gzip, deflate"])
+    self.assertEqual(start_line, b"HTTP/1.1 200 OK")
+    self.assertEqual(headers[b"Accept-Encoding"], b"deflate")
+    self.assertEqual(headers[b"Content-Encoding"], b"deflate")
+    self.assertEqual(int(headers[b"Content-Length"]), len(resp_body))
+    self.assertEqual(zlib.decompress(resp_body), body)
+
+  def testPlain(self):
+    for body in [b"Hello World\n", b"Hello World\n" * 100]:
+      (start_line, headers, resp_body) = self._Request(body, [])
+      self.assertEqual(start_line, b"HTTP/1.1 200 OK")
+      self.assertEqual(headers[b"Accept-Encoding"], b"deflate")
+      self.assertFalse(b"Content-Encoding" in headers)
+      self.assertEqual(resp_body, body)
+
+  def testSmallResponse(self):
+    (_, headers, resp_body) = \
+      self._Request(b"Hello", [b"Accept-Encoding: deflate"])
+    self.assertFalse(b"Content-Encoding" in headers)
+    self.assertEqual(resp_body, b"Hello")
+
+  def testUnsupportedEncoding(self):
+    (start_line, _, _) = self._Request(b"data", [b"Content-Encoding: br"])
+    self.assertEqual(start_line, b"HTTP/1.1 415 Unsupported Media Type")
+
+  def testInvalidData(self):
+    (start_line, _, _) = \
+      self._Request(b"invalid data", [b"Content-Encoding: deflate"])
+    self.assertEqual(start_line, b"HTTP/1.1 400 Bad Request")
+
+
+class TestContentEncoding(unittest.TestCase):
+  def testRoundtrip(self):
+    for data in [b"", b"Hello World", 1000 * b"Hello World\n"]:
+      encoded = http.EncodeBody(http.HTTP_CONTENT_ENCODING_DEFLATE, data)
+      self.assertEqual(zlib.decompress(encoded), data)
+      self.assertEqual(http.DecodeBody("deflate", encoded), data)
+      self.assertEqual(http.DecodeBody(" Deflate ", encoded), data)
+
+  def testIdentity(self):
+    for encoding in [None, "", "identity"]:
+      self.assertEqual(http.DecodeBody(encoding, b"data"), b"data")
+
+  def testErrors(self):
+    self.assertRaises(http.HttpUnsupportedMediaType, http.DecodeBody,
+                      "x-unknown", b"data")
+    self.assertRaises(http.HttpBadRequest, http.DecodeBody,
+                      "deflate", b"invalid data")
+
+  def testParseAcceptEncoding(self):
+    for (value, expected) in [
+      (None, []),
+      ("", []),
+      ("deflate", ["deflate"]),
+      ("gzip, Deflate", ["gzip", "deflate"]),
+      ("gzip;q=1.0, deflate;q=0.5, br;q=0", ["gzip", "deflate"]),
+      ("deflate;q=0.000, identity", ["identity"]),
+      ("deflate;q=invalid", []),
+      (" , deflate ,", ["deflate"]),
+      ]:
+      self.assertEqual(http.ParseAcceptEncoding(value), frozenset(expected))
+
+
 class _FakeRequestAuth(http.auth.HttpServerRequestAuthentication):
   def __init__(self, realm, authreq, authenticate_fn):
     http.auth.HttpServerRequestAuthentication.__init__(self)
@@ -418,6 +780,108 @@ class _FakeCurl:
     return self.info.pop(info)
 
 
+class _FakeCurlShare:
+  def __init__(self):
+    self.shared = []
+
+  def setopt(self, opt, value):
+    assert opt == pycurl.SH_SHARE
+    self.shared.append(value)
+
+
+class _FakePooledCurl(_FakeCurl):
+  def __init__(self):
+    _FakeCurl.__init__(self)
+    self.closed = False
+
+  def close(self):
+    assert not self.closed
+    self.closed = True
+
+
+class TestHttpClientPool(unittest.TestCase):
+  def setUp(self):
+    self.now = 1000.0
+    self.pool = http.client.HttpClientPool(2, 3, 30,
+                                           _curl=_FakePooledCurl,
+                                           _curl_share=_FakeCurlShare,
+                                           _time_fn=lambda: self.now)
+
+  def testNewHandle(self):
+    curl = self.pool.GetHandle("node1", 1811)
+    self.assertTrue(isinstance(curl, _FakePooledCurl))
+    self.assertTrue(curl.opts[pycurl.SHARE] is self.pool._share)
+    self.assertTrue(pycurl.LOCK_DATA_DNS in self.pool._share.shared)
+    self.assertFalse(pycurl.LOCK_DATA_SSL_SESSION in self.pool._share.shared)
+    self.assertEqual(self.pool.GetIdleCount(), {})
+
+  def testSslSessionCache(self):
+    pool = http.client.HttpClientPool(2, 3, 30, ssl_session_cache=True,
+                                      _curl=_FakePooledCurl,
+                                      _curl_share=_FakeCurlShare)
+    self.assertTrue(pool.ssl_session_cache)
+    self.assertTrue(pycurl.LOCK_DATA_SSL_SESSION in pool._share.shared)
+
+  def testReuse(self):
+    curl = self.pool.GetHandle("node1", 1811)
+    self.pool.ReleaseHandle("node1", 1811, curl)
+    self.assertEqual(self.pool.GetIdleCount(), {("node1", 1811): 1, })
+
+    # Other destinations get their own handles
+    other = self.pool.GetHandle("node2", 1811)
+    self.assertFalse(other is curl)
+
+    self.assertTrue(self.pool.GetHandle("node1", 1811) is curl)
+    self.assertEqual(self.pool.GetIdleCount(), {})
+    self.assertFalse(curl.closed)
+
+  def testNotReusable(self):
+    curl = self.pool.GetHandle("node1", 1811)
+    self.pool.ReleaseHandle("node1", 1811, curl, reusable=False)
+    self.assertTrue(curl.closed)
+    self.assertEqual(self.pool.GetIdleCount(), {})
+
+  def testIdleTimeout(self):
+    curl = self.pool.GetHandle("node1", 1811)
+    self.pool.ReleaseHandle("node1", 1811, curl)
+    self.now += 29
+    self.assertEqual(self.pool.GetIdleCount(), {("node1", 1811): 1, })
+    self.now += 1
+    other = self.pool.GetHandle("node1", 1811)
+    self.assertFalse(other is curl)
+    self.assertTrue(curl.closed)
+    self.assertEqual(self.pool.GetIdleCount(), {})
+
+  def testLimits(self):
+    handles = [self.pool.GetHandle("node1", 1811) for _ in range(3)]
+    for curl in handles:
+      self.now += 1
+      self.pool.ReleaseHandle("node1", 1811, curl)
+
+    # Only two handles are kept per host, the oldest one is closed
+    self.assertEqual(self.pool.GetIdleCount(), {("node1", 1811): 2, })
+    self.assertEqual([curl.closed for curl in handles], [True, False, False])
+
+    for name in ["node2", "node3"]:
+      self.now += 1
+      self.pool.ReleaseHandle(name, 1811, self.pool.GetHandle(name, 1811))
+
+    # At most three handles are kept in total
+    self.assertEqual(self.pool.GetIdleCount(), {
+      ("node1", 1811): 1,
+      ("node2", 1811): 1,
+      ("node3", 1811): 1,
+      })
+    self.assertEqual([curl.closed for curl in handles], [True, True, False])
+
+  def testClose(self):
+    curl = self.pool.GetHandle("node1", 1811)
+    self.pool.ReleaseHandle("node1", 1811, curl)
+    self.pool.Close()
+    self.assertTrue(curl.closed)
+    self.assertEqual(self.pool.GetIdleCount(), {})
+
+
 class TestClientStartRequest(unittest.TestCase):
   @staticmethod
   def _TestCurlConfig(curl):
@@ -461,8 +925,11 @@ class TestClientStartRequest(unittest.TestCase):
           self.assertEqual(opts.pop(pycurl.PROXY), "")
           self.assertFalse(opts.pop(pycurl.POSTFIELDS))
           self.assertFalse(opts.pop(pycurl.HTTPHEADER))
+          self.assertEqual(opts.pop(pycurl.ENCODING), None)
           write_fn = opts.pop(pycurl.WRITEFUNCTION)
           self.assertTrue(callable(write_fn))
+          header_fn = opts.pop(pycurl.HEADERFUNCTION)
+          self.assertTrue(callable(header_fn))
           if hasattr(pycurl, "SSL_SESSIONID_CACHE"):
             self.assertFalse(opts.pop(pycurl.SSL_SESSIONID_CACHE))
           if curl_config_fn:
@@ -471,6 +938,12 @@ class TestClientStartRequest(unittest.TestCase):
             self.assertFalse(pycurl.SSLKEYTYPE in opts)
           self.assertFalse(opts)
 
+          header_fn(b"HTTP/1.1 100 Continue\r\n")
+          header_fn(b"X-Ignored: 1\r\n")
+          header_fn(b"HTTP/1.1 %d Status\r\n" % response_code)
+          header_fn(b"Accept-Encoding: deflate\r\n")
+          header_fn(b"\r\n")
+
           if response_body is not None:
             offset = 0
             while offset < len(response_body):
@@ -500,6 +973,7 @@ class TestClientStartRequest(unittest.TestCase):
             self.assertTrue(req.success)
           self.assertEqual(req.error, errmsg)
           self.assertEqual(req.resp_status_code, response_code)
+          self.assertEqual(req.resp_headers, {"accept-encoding": "deflate"})
           if response_body is None:
             self.assertEqual(req.resp_body, "")
           else:
@@ -510,6 +984,7 @@ class TestClientStartRequest(unittest.TestCase):
           opts = curl.opts
           self.assertFalse(opts.pop(pycurl.POSTFIELDS))
           self.assertTrue(callable(opts.pop(pycurl.WRITEFUNCTION)))
+          self.assertTrue(callable(opts.pop(pycurl.HEADERFUNCTION)))
           self.assertFalse(opts)
 
           self.assertFalse(curl.opts,
@@ -701,6 +1176,7 @@ class TestProcessRequests(unittest.TestCase):
         # Prepare for reset
         self.assertFalse(curl.opts.pop(pycurl.POSTFIELDS))
         self.assertTrue(callable(curl.opts.pop(pycurl.WRITEFUNCTION)))
+        self.assertTrue(callable(curl.opts.pop(pycurl.HEADERFUNCTION)))
 
         yield (curl, msg)
 
@@ -35,6 +35,7 @@ import tempfile
 import unittest
 import socket
 import os
+import shutil
 import struct
 import re
 
@@ -46,8 +47,10 @@ from ganeti import errors
 from ganeti import utils
 from ganeti import pathutils
 
+from ganeti.hypervisor import hv_base
 from ganeti.hypervisor import hv_kvm
 import ganeti.hypervisor.hv_kvm.netdev as netdev
+import ganeti.hypervisor.hv_kvm.process as process
 import ganeti.hypervisor.hv_kvm.monitor as monitor
 import ganeti.hypervisor.hv_kvm.validation as validation
 
@@ -84,6 +87,7 @@ class QmpStub(threading.Thread):
       {"name": "eject"},
       {"name": "query-status"},
       {"name": "query-name"},
+      {"name": "human-monitor-command"},
     ]
   }
 
@@ -719,6 +723,198 @@ class TestQmp(testutils.GanetiTestCase):
     finally:
       qmp_stub.shutdown()
 
+  def testExecuteMany(self):
+    socket_file = tempfile.NamedTemporaryFile()
+    os.remove(socket_file.name)
+    qmp_stub = QmpStub(socket_file.name, [
+      # Both responses are sent at once for the pipelined commands
+      '{"return": {"running": true}}\r\n'
+      '{"error": {"class": "GenericError", "desc": "no name"}}\r\n',
+      ])
+    qmp_stub.start()
+
+    try:
+      with hv_kvm.QmpConnection(socket_file.name) as qmp:
+        result = qmp.ExecuteMany([("query-status", None),
+                                  ("unsupported-command", None),
+                                  ("query-name", {"verbose": True})])
+        self.assertEqual(result[0], (True, {"running": True}))
+        self.assertFalse(result[1][0])
+        self.assertTrue("unsupported-command" in result[1][1])
+        self.assertFalse(result[2][0])
+        self.assertTrue("no name" in result[2][1])
+    finally:
+      qmp_stub.shutdown()
+
+  def testConnectionClosed(self):
+    socket_file = tempfile.NamedTemporaryFile()
+    os.remove(socket_file.name)
+    qmp_stub = QmpStub(socket_file.name, [])
+    qmp_stub.start()
+
+    try:
+      qmp = hv_kvm.QmpConnection(socket_file.name)
+      qmp.connect()
+      self.assertTrue(qmp.is_connected())
+      # The stub closes the connection after the first command
+      self.assertRaises(errors.HypervisorError, qmp.Execute, "query-status")
+      self.assertFalse(qmp.is_connected())
+    finally:
+      qmp_stub.shutdown()
+
+  def testHumanMonitorCommand(self):
+    socket_file = tempfile.NamedTemporaryFile()
+    os.remove(socket_file.name)
+    qmp_stub = QmpStub(socket_file.name, [
+      '{"return": "OK\\r\\n"}\r\n',
+      ])
+    qmp_stub.start()
+
+    try:
+      with hv_kvm.QmpConnection(socket_file.name) as qmp:
+        self.assertEqual(qmp.HumanMonitorCommand("drive_del hd1"), "OK\r\n")
+    finally:
+      qmp_stub.shutdown()
+
+  def testHumanMonitorCommandError(self):
+    socket_file = tempfile.NamedTemporaryFile()
+    os.remove(socket_file.name)
+    qmp_stub = QmpStub(socket_file.name, [])
+    qmp_stub.start()
+
+    try:
+      with hv_kvm.QmpConnection(socket_file.name) as qmp:
+        self.assertRaises(errors.HypervisorError, qmp.HumanMonitorCommand,
+                          "drive_del hd1")
+    finally:
+      qmp_stub.shutdown()
+
+
+def _WriteFakeProcess(proc_dir, pid, start_time, cmdline, comm="kvm"):
+  """Creates the entry of a process in a fake proc directory."""
+  pid_dir = utils.PathJoin(proc_dir, str(pid))
+  if not os.path.isdir(pid_dir):
+    os.mkdir(pid_dir)
+  fields = ["S", "1"] + ["0"] * 17 + [str(start_time)] + ["0"] * 30
+  utils.WriteFile(utils.PathJoin(pid_dir, "stat"),
+                  data="%s (%s) %s\n" % (pid, comm, " ".join(fields)))
+  utils.WriteFile(utils.PathJoin(pid_dir, "cmdline"),
+                  data="\x00".join(cmdline) + "\x00")
+
+
+class TestProcessInfo(unittest.TestCase):
+  CMDLINE = ["/usr/bin/kvm", "-name", "inst1.example.com,debug-threads=on",
+             "-m", "512", "-smp", "2,sockets=1", "-daemonize"]
+
+  def setUp(self):
+    self.proc_dir = tempfile.mkdtemp()
+    self.cache = process.ProcessInfoCache(proc_dir=self.proc_dir)
+
+  def tearDown(self):
+    shutil.rmtree(self.proc_dir)
+
+  def testParseCmdline(self):
+    self.assertEqual(process.ParseCmdline("\x00".join(self.CMDLINE)),
+                     ("inst1.example.com", 512, 2))
+    self.assertEqual(process.ParseCmdline("/bin/sh\x00-c\x00true"),
+                     (None, 0, 0))
+
+  def testGetInfo(self):
+    _WriteFakeProcess(self.proc_dir, 123, 1000, self.CMDLINE,
+                      comm="kvm (x) y")
+    self.assertEqual(self.cache.GetInfo(123), ("inst1.example.com", 512, 2))
+
+    # The command line is only parsed once
+    utils.WriteFile(utils.PathJoin(self.proc_dir, "123", "cmdline"),
+                    data="garbage")
+    self.assertEqual(self.cache.GetInfo(123), ("inst1.example.com", 512, 2))
+
+  def testPidReused(self):
+    _WriteFakeProcess(self.proc_dir, 123, 1000, self.CMDLINE)
+    self.cache.GetInfo(123)
+    _WriteFakeProcess(self.proc_dir, 123, 2000, ["/bin/sleep", "10"])
+    self.assertRaises(errors.HypervisorError, self.cache.GetInfo, 123)
+
+    cmdline = self.CMDLINE[:]
+    cmdline[2] = "inst2.example.com"
+    _WriteFakeProcess(self.proc_dir, 123, 3000, cmdline)
+    self.assertEqual(self.cache.GetInfo(123), ("inst2.example.com", 512, 2))
+
+  def testNotAnInstance(self):
+    _WriteFakeProcess(self.proc_dir, 123, 1000, ["/bin/sleep", "10"])
+    self.assertRaises(errors.HypervisorError, self.cache.GetInfo, 123)
+    # Negative results aren't cached
+    _WriteFakeProcess(self.proc_dir, 123, 1000, self.CMDLINE)
+    self.assertEqual(self.cache.GetInfo(123), ("inst1.example.com", 512, 2))
+
+  def testMissingProcess(self):
+    for pid in [0, -1, 123]:
+      self.assertRaises(errors.HypervisorError, self.cache.GetInfo, pid)
+
+  def testSnapshot(self):
+    _WriteFakeProcess(self.proc_dir, 123, 1000, self.CMDLINE)
+    _WriteFakeProcess(self.proc_dir, 456, 1500, self.CMDLINE)
+    os.mkdir(utils.PathJoin(self.proc_dir, "self"))
+
+    snapshot = self.cache.Snapshot()
+    self.assertEqual(snapshot.pids, frozenset([123, 456]))
+    self.assertEqual(snapshot.GetStartTime(456), 1500)
+    self.assertEqual(snapshot.GetStartTime(789), None)
+    self.assertEqual(self.cache.GetInfo(123, snapshot=snapshot),
+                     ("inst1.example.com", 512, 2))
+
+    # Processes started after the snapshot are not visible through it
+    _WriteFakeProcess(self.proc_dir, 789, 2000, self.CMDLINE)
+    self.assertRaises(errors.HypervisorError, self.cache.GetInfo, 789,
+                      snapshot=snapshot)
+    self.cache.GetInfo(789)
+
+    # Entries of processes which are gone are dropped by the next snapshot
+    shutil.rmtree(utils.PathJoin(self.proc_dir, "123"))
+    self.cache.Snapshot()
+    _WriteFakeProcess(self.proc_dir, 123, 1000, ["/bin/sleep", "10"])
+    self.assertRaises(errors.HypervisorError, self.cache.GetInfo, 123)
+
+
+class TestGetAllInstancesInfo(testutils.GanetiTestCase):
+  def setUp(self):
+    testutils.GanetiTestCase.setUp(self)
+    self.tmpdir = tempfile.mkdtemp()
+    for i in range(20):
+      utils.WriteFile(utils.PathJoin(self.tmpdir,
+                                     "inst%d.example.com.runtime" % i),
+                      data="")
+
+  def tearDown(self):
+    testutils.GanetiTestCase.tearDown(self)
+    shutil.rmtree(self.tmpdir)
+
+  def _GetInstanceInfo(self, name, snapshot=None):
+    if name == "inst3.example.com":
+      raise errors.HypervisorError("Instance is being shut down")
+    if name == "inst4.example.com":
+      return None
+    return (name, 1, 128, 1, hv_base.HvInstanceState.RUNNING, 0)
+
+  @mock.patch("ganeti.utils.EnsureDirs")
+  def test(self, _):
+    hv = hv_kvm.KVMHypervisor()
+    with mock.patch.object(hv, "_CONF_DIR", self.tmpdir):
+      with mock.patch.object(hv, "_GetInstanceInfo",
+                             side_effect=self._GetInstanceInfo):
+        data = hv.GetAllInstancesInfo()
+    self.assertEqual(sorted(info[0] for info in data),
+                     sorted("inst%d.example.com" % i
+                            for i in range(20) if i not in (3, 4)))
+
+  @mock.patch("ganeti.utils.EnsureDirs")
+  def testError(self, _):
+    hv = hv_kvm.KVMHypervisor()
+    with mock.patch.object(hv, "_CONF_DIR", self.tmpdir):
+      with mock.patch.object(hv, "_GetInstanceInfo",
+                             side_effect=errors.ProgrammerError):
+        self.assertRaises(errors.ProgrammerError, hv.GetAllInstancesInfo)
+
 
 class TestConsole(unittest.TestCase):
   def MakeConsole(self, instance, node, group, hvparams):
@@ -1050,7 +1246,6 @@ class TestKvmRuntime(testutils.GanetiTestCase):
     self.MockOut('pid_alive', mock.patch(kvm_class + '._InstancePidAlive',
                                          return_value=('file', -1, False)))
     self.MockOut(mock.patch(kvm_class + '._ExecuteCpuAffinity'))
-    self.MockOut(mock.patch(kvm_class + '._CallMonitorCommand'))
 
     self.cfg = ConfigMock()
     params = constants.HVC_DEFAULTS[constants.HT_KVM].copy()
@@ -0,0 +1,250 @@
+#!/usr/bin/python3
+#
+
+# Copyright (C) 2014 Google Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS
+# IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+# TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+# PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+"""Script for unittesting the ganeti.impexpd.transfer module"""
+
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+from ganeti import constants
+from ganeti import errors
+from ganeti.impexpd import transfer
+
+import testutils
+
+
+_CHUNK = transfer.CHUNK_SIZE
+
+
+class _ReverseCodec(transfer.Codec):
+  def Compress(self, data):
+    return data[::-1]
+
+  def Decompress(self, data, size):
+    return data[::-1]
+
+
+class TestCodecs(unittest.TestCase):
+  def test(self):
+    data = os.urandom(1000) + bytes(5000) + b"Hello World" * 100
+    for name in [constants.IEC_NONE, constants.IEC_GZIP,
+                 constants.IEC_GZIP_FAST, constants.IEC_GZIP_SLOW, "xz"]:
+      self.assertTrue(transfer.IsCodecSupported(name))
+      codec = transfer.GetCodec(name)
+      compressed = codec.Compress(data)
+      if name != constants.IEC_NONE:
+        self.assertTrue(len(compressed) < len(data))
+      self.assertEqual(codec.Decompress(compressed, len(data)), data)
+
+  def testUnsupported(self):
+    self.assertFalse(transfer.IsCodecSupported(constants.IEC_LZOP))
+    self.assertRaises(errors.GenericError, transfer.GetCodec,
+                      constants.IEC_LZOP)
+
+  def testRegister(self):
+    self.assertFalse(transfer.IsCodecSupported("reverse"))
+    transfer.RegisterCodec("reverse", _ReverseCodec)
+    try:
+      self.assertTrue(isinstance(transfer.GetCodec("reverse"), _ReverseCodec))
+    finally:
+      del transfer._CODECS["reverse"]
+
+
+class TestTransfer(unittest.TestCase):
+  def setUp(self):
+    self.tmpdir = tempfile.mkdtemp()
+    self.src = os.path.join(self.tmpdir, "src")
+    self.dest = os.path.join(self.tmpdir, "dest")
+
+  def tearDown(self):
+    shutil.rmtree(self.tmpdir)
+
+  def _WriteSource(self, chunks, tail=b""):
+    with open(self.src, "wb") as fh:
+      for chunk in chunks:
+        if chunk is None:
+          # Leave a hole
+          fh.seek(_CHUNK, os.SEEK_CUR)
+        else:
+          fh.write(chunk)
+      fh.write(tail)
+      fh.truncate()
+    with open(self.src, "rb") as fh:
+      return fh.read()
+
+  def _Send(self, compress="gzip", magic="magic", size=None):
+    source = transfer.DiskSource(self.src, size=size)
+    try:
+      sender = transfer.Transfer(compress, magic, threads=3)
+      buf = io.BytesIO()
+      sender.Send(source, buf)
+    finally:
+      source.Close()
+    self.assertEqual(sender.processed, source.size)
+    self.assertEqual(sender.transferred, len(buf.getvalue()))
+    return buf.getvalue()
+
+  def _Receive(self, stream, compress="gzip", magic="magic"):
+    target = transfer.DiskTarget(self.dest)
+    receiver = transfer.Transfer(compress, magic, threads=3)
+    try:
+      receiver.Receive(io.BytesIO(stream), target)
+    except:
+      target.Abort()
+      raise
+    target.Close()
+    self.assertEqual(receiver.transferred, len(stream))
+    return receiver
+
+  def _ReadDest(self):
+    with open(self.dest, "rb") as fh:
+      return fh.read()
+
+  def testRoundTrip(self):
+    random_data = os.urandom(_CHUNK)
+    text = (b"Hello World\n" * _CHUNK)[:_CHUNK]
+    for compress in [constants.IEC_NONE, constants.IEC_GZIP, "xz"]:
+      data = self._WriteSource([random_data, bytes(_CHUNK), text, None,
+                                random_data], tail=b"tail")
+      stream = self._Send(compress=compress)
+      receiver = self._Receive(stream, compress=compress)
+      self.assertEqual(receiver.processed, len(data))
+      self.assertEqual(self._ReadDest(), data)
+
+  def testZeroesSkipped(self):
+    data = self._WriteSource([bytes(_CHUNK), None, None, bytes(_CHUNK)],
+                             tail=b"x")
+    stream = self._Send(compress=constants.IEC_NONE)
+    self.assertTrue(len(stream) < 4096)
+    self._Receive(stream, compress=constants.IEC_NONE)
+    self.assertEqual(self._ReadDest(), data)
+
+  def testTrailingHole(self):
+    data = self._WriteSource([os.urandom(100), None, None])
+    self._Receive(self._Send())
+    self.assertEqual(self._ReadDest(), data)
+
+  def testEmpty(self):
+    self._WriteSource([])
+    self._Receive(self._Send())
+    self.assertEqual(self._ReadDest(), b"")
+
+  def testSizeLimit(self):
+    data = self._WriteSource([os.urandom(_CHUNK), os.urandom(_CHUNK)])
+    self._Receive(self._Send(size=_CHUNK + 1000))
+    self.assertEqual(self._ReadDest(), data[:_CHUNK + 1000])
+
+  def testExistingTarget(self):
+    data = self._WriteSource([bytes(_CHUNK), b"Hello"])
+    with open(self.dest, "wb") as fh:
+      fh.write(os.urandom(3 * _CHUNK))
+    self._Receive(self._Send())
+    self.assertEqual(self._ReadDest(), data)
+
+  def testMagicMismatch(self):
+    self._WriteSource([b"data"])
+    stream = self._Send(magic="foo")
+    self.assertRaises(errors.GenericError, self._Receive, stream, magic="bar")
+
+  def testCompressionMismatch(self):
+    self._WriteSource([b"data"])
+    stream = self._Send(compress=constants.IEC_GZIP)
+    self.assertRaises(errors.GenericError, self._Receive, stream,
+                      compress=constants.IEC_NONE)
+
+  def testNotNative(self):
+    self.assertRaises(errors.GenericError, self._Receive,
+                      b"M=magic" + bytes(1000))
+
+  def testTruncated(self):
+    self._WriteSource([os.urandom(_CHUNK), os.urandom(_CHUNK)])
+    stream = self._Send()
+    for length in [0, 5, len(stream) // 2, len(stream) - 1]:
+      self.assertRaises(errors.GenericError, self._Receive, stream[:length])
+
+  def testTrailingData(self):
+    self._WriteSource([b"data"])
+    self.assertRaises(errors.GenericError, self._Receive,
+                      self._Send() + b"x")
+
+  def testChecksumMismatch(self):
+    self._WriteSource([os.urandom(_CHUNK)])
+    stream = bytearray(self._Send(compress=constants.IEC_NONE))
+    stream[len(stream) // 2] ^= 0xff
+    self.assertRaises(errors.GenericError, self._Receive, bytes(stream),
+                      compress=constants.IEC_NONE)
+
+
+class TestTransferThread(unittest.TestCase):
+  def setUp(self):
+    self.tmpdir = tempfile.mkdtemp()
+
+  def tearDown(self):
+    shutil.rmtree(self.tmpdir)
+
+  def _Run(self, src, dest):
+    (read_fd, write_fd) = os.pipe()
+    threads = [
+      transfer.TransferThread(constants.IEM_EXPORT, src, write_fd,
+                              transfer.Transfer(constants.IEC_GZIP, "m")),
+      transfer.TransferThread(constants.IEM_IMPORT, dest, read_fd,
+                              transfer.Transfer(constants.IEC_GZIP, "m")),
+      ]
+    for thread in threads:
+      thread.start()
+    for thread in threads:
+      thread.join()
+    return threads
+
+  def test(self):
+    src = os.path.join(self.tmpdir, "src")
+    dest = os.path.join(self.tmpdir, "dest")
+    data = os.urandom(3 * _CHUNK + 10)
+    with open(src, "wb") as fh:
+      fh.write(data)
+
+    (sender, receiver) = self._Run(src, dest)
+    self.assertEqual(sender.error, None)
+    self.assertEqual(receiver.error, None)
+    with open(dest, "rb") as fh:
+      self.assertEqual(fh.read(), data)
+
+  def testMissingSource(self):
+    (sender, receiver) = self._Run(os.path.join(self.tmpdir, "missing"),
+                                   os.path.join(self.tmpdir, "dest"))
+    self.assertTrue(isinstance(sender.error, EnvironmentError))
+    self.assertTrue(isinstance(receiver.error, errors.GenericError))
+
+
+if __name__ == "__main__":
+  testutils.GanetiTestProgram()
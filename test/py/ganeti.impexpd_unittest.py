@@ -62,6 +62,7 @@ class CmdBuilderConfig(objects.ConfigObject):
     "connect_retries",
     "cmd_prefix",
     "cmd_suffix",
+    "transport",
     ]
 
 
@@ -207,6 +208,21 @@ class TestCommandBuilder(unittest.TestCase):
       builder = impexpd.CommandBuilder(constants.IEM_EXPORT, opts, 1, 2, 3)
       self.assertRaises(errors.GenericError, builder.GetCommand)
 
+  def testNativeTransport(self):
+    for mode in [constants.IEM_IMPORT, constants.IEM_EXPORT]:
+      for compress in constants.IEC_ALL:
+        opts = CmdBuilderConfig(host="localhost", port=1234, magic="magic",
+                                compress=compress,
+                                transport=impexpd.TRANSPORT_NATIVE)
+        builder = impexpd.CommandBuilder(mode, opts, 1, 2, 3)
+        cmd = builder.GetCommand()
+
+        self.assertTrue(compat.any(constants.SOCAT_PATH in i for i in cmd))
+        self.assertFalse(CheckCmdWord(cmd, "dd"))
+        self.assertFalse(compat.any("M=magic" in i for i in cmd))
+        if compress != constants.IEC_NONE:
+          self.assertFalse(CheckCmdWord(cmd, compress))
+
   def testModeError(self):
     mode = "foobarbaz"
 
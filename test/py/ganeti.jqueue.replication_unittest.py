@@ -0,0 +1,200 @@
+#!/usr/bin/python3
+#
+
+# Copyright (C) 2014 Google Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS
+# IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+# TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+# PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+"""Script for unittesting the ganeti.jqueue.replication module"""
+
+import threading
+import unittest
+
+from ganeti.jqueue import replication
+
+import testutils
+
+
+class _FakeNodes(object):
+  def __init__(self, fail=None):
+    self.calls = []
+    self.fail = fail or {}
+    self.lock = threading.Lock()
+    self.blocked = {}
+
+  def Block(self, name):
+    self.blocked[name] = threading.Event()
+
+  def Unblock(self, name):
+    self.blocked.pop(name).set()
+
+  def __call__(self, name, address, file_name, data):
+    event = self.blocked.get(name)
+    if event:
+      event.wait()
+    with self.lock:
+      self.calls.append((name, address, file_name, data))
+    return self.fail.get(name)
+
+  def GetCalls(self, name):
+    with self.lock:
+      return [(file_name, data)
+              for (node, _, file_name, data) in self.calls if node == name]
+
+
+class TestReplicator(unittest.TestCase):
+  def setUp(self):
+    self.nodes = {
+      "node1": "192.0.2.1",
+      "node2": "192.0.2.2",
+      }
+
+  def testReplicate(self):
+    fake = _FakeNodes()
+    repl = replication.Replicator(self.nodes, fake)
+    repl.Update("/queue/job-1", "one")
+    repl.Update("/queue/job-2", "two")
+    self.assertTrue(repl.Flush(timeout=10))
+    repl.Stop()
+
+    for name in self.nodes:
+      self.assertEqual(fake.GetCalls(name),
+                       [("/queue/job-1", "one"), ("/queue/job-2", "two")])
+      stats = repl.GetStats()[name]
+      self.assertEqual(stats.sent, 2)
+      self.assertEqual(stats.failed, 0)
+      self.assertTrue(stats.AverageLatency() is not None)
+    self.assertEqual(sorted(set((node, address)
+                                for (node, address, _, _) in fake.calls)),
+                     sorted(self.nodes.items()))
+
+  def testCoalesce(self):
+    fake = _FakeNodes()
+    fake.Block("node1")
+    repl = replication.Replicator(self.nodes, fake, max_lag=3600)
+
+    repl.Update("/queue/job-1", "first")
+    # Wait until the sender of the blocked node is busy with the first update
+    self.assertTrue(repl._senders[1].Flush(timeout=10))
+    while not repl._senders[0]._busy:
+      threading.Event().wait(0.01)
+
+    for i in range(10):
+      repl.Update("/queue/job-1", "update%s" % i)
+
+    # The other node isn't delayed by the blocked one
+    self.assertTrue(repl._senders[1].Flush(timeout=10))
+    self.assertFalse(repl.Flush(timeout=0.01))
+
+    fake.Unblock("node1")
+    self.assertTrue(repl.Flush(timeout=10))
+    repl.Stop()
+
+    self.assertEqual(fake.GetCalls("node1"),
+                     [("/queue/job-1", "first"), ("/queue/job-1", "update9")])
+    self.assertEqual(repl.GetStats()["node1"].coalesced, 9)
+    self.assertEqual(repl.GetStats()["node1"].sent, 2)
+
+  def testMaxLag(self):
+    now = [100.0]
+    fake = _FakeNodes()
+    fake.Block("node1")
+    repl = replication.Replicator({"node1": "192.0.2.1"}, fake, max_lag=5,
+                                  _time_fn=lambda: now[0])
+    sender = repl._senders[0]
+
+    repl.Update("/queue/job-1", "first")
+    while not sender._busy:
+      threading.Event().wait(0.01)
+
+    # Within the maximum lag, updates don't wait
+    repl.Update("/queue/job-1", "second")
+    now[0] += 10
+
+    # Beyond the maximum lag, updates wait for the sender to catch up
+    done = threading.Event()
+
+    def _Update():
+      repl.Update("/queue/job-1", "third")
+      done.set()
+    thread = threading.Thread(target=_Update)
+    thread.start()
+    self.assertFalse(done.wait(0.1))
+
+    fake.Unblock("node1")
+    self.assertTrue(done.wait(10))
+    thread.join()
+    self.assertTrue(repl.Flush(timeout=10))
+    repl.Stop()
+
+    self.assertEqual(fake.GetCalls("node1")[0], ("/queue/job-1", "first"))
+    self.assertEqual(fake.GetCalls("node1")[-1], ("/queue/job-1", "third"))
+
+  def testFailure(self):
+    fake = _FakeNodes(fail={"node2": "Connection refused"})
+    repl = replication.Replicator(self.nodes, fake)
+    repl.Update("/queue/job-1", "one")
+    self.assertTrue(repl.Flush(timeout=10))
+    repl.Stop()
+
+    stats = repl.GetStats()
+    self.assertEqual((stats["node1"].sent, stats["node1"].failed), (1, 0))
+    self.assertEqual((stats["node2"].sent, stats["node2"].failed), (0, 1))
+
+  def testException(self):
+    def _Fail(*_):
+      raise RuntimeError("unexpected")
+
+    repl = replication.Replicator(self.nodes, _Fail)
+    repl.Update("/queue/job-1", "one")
+    self.assertTrue(repl.Flush(timeout=10))
+    repl.Stop()
+    self.assertEqual(repl.GetStats()["node1"].failed, 1)
+
+
+class TestGetMaxLag(unittest.TestCase):
+  def _Get(self, value):
+    return replication.GetMaxLag({replication.MAX_LAG_ENV: value})
+
+  def testDefault(self):
+    self.assertEqual(replication.GetMaxLag({}), replication.DEFAULT_MAX_LAG)
+    self.assertEqual(self._Get(""), replication.DEFAULT_MAX_LAG)
+
+  def testValue(self):
+    self.assertEqual(self._Get("0"), 0.0)
+    self.assertEqual(self._Get(" 1.5 "), 1.5)
+
+  def testSync(self):
+    self.assertTrue(self._Get("sync") is None)
+    self.assertTrue(self._Get("SYNC") is None)
+
+  def testInvalid(self):
+    for value in ["-1", "nan", "soon"]:
+      self.assertEqual(self._Get(value), replication.DEFAULT_MAX_LAG)
+
+
+if __name__ == "__main__":
+  testutils.GanetiTestProgram()
@@ -185,6 +185,28 @@ class TestQueuedJob(unittest.TestCase):
     newjob2 = jqueue._QueuedJob.Restore(None, newjob.Serialize(), True, False)
     self.assertFalse(newjob2.archived)
 
+  def testRestoreLogEntries(self):
+    job = jqueue._QueuedJob(None, 1, [opcodes.OpTestDelay(),
+                                      opcodes.OpTestDelay()], True)
+    job.ops[0].log.append((1, (1, 0), constants.ELOG_MESSAGE, "first"))
+    job.log_serial = 1
+    state = job.Serialize()
+
+    log_entries = [
+      # Already contained in the job file
+      (0, [1, [1, 0], constants.ELOG_MESSAGE, "first"]),
+      (0, [2, [2, 0], constants.ELOG_MESSAGE, "second"]),
+      (1, [3, [3, 0], constants.ELOG_MESSAGE, "third"]),
+      ]
+
+    newjob = jqueue._QueuedJob.Restore(None, state, True, False,
+                                       log_entries=log_entries)
+    self.assertEqual(newjob.log_serial, 3)
+    self.assertEqual([entry[3] for entry in newjob.ops[0].log],
+                     ["first", "second"])
+    self.assertEqual([entry[3] for entry in newjob.ops[1].log], ["third"])
+    self.assertEqual([entry[0] for entry in newjob.GetLogEntries(1)], [2, 3])
+
   def testPriority(self):
     job_id = 4283
     ops = [
@@ -461,6 +483,71 @@ class TestQueuedJob(unittest.TestCase):
         self.assertEqual(job.CalcStatus(), status)
 
 
+class TestJobLog(unittest.TestCase):
+  def setUp(self):
+    self.tmpdir = tempfile.mkdtemp()
+    self.path = utils.PathJoin(self.tmpdir, "job-1.log")
+    self.now = 100.0
+
+  def tearDown(self):
+    shutil.rmtree(self.tmpdir)
+
+  def _Entry(self, serial, msg):
+    return [serial, [serial, 0], constants.ELOG_MESSAGE, msg]
+
+  def testAppend(self):
+    job_log = jqueue._JobLog(self.path, _time_fn=lambda: self.now)
+    self.assertFalse(os.path.exists(self.path))
+
+    job_log.Append([(0, self._Entry(1, "first"))])
+    job_log.Append([(0, self._Entry(2, "second")),
+                    (1, self._Entry(3, "multiple\nlines"))])
+
+    self.assertEqual(jqueue._ParseJobLog(utils.ReadFile(self.path)), [
+      (0, self._Entry(1, "first")),
+      (0, self._Entry(2, "second")),
+      (1, self._Entry(3, "multiple\nlines")),
+      ])
+
+  def testReset(self):
+    job_log = jqueue._JobLog(self.path)
+
+    job_log.Reset()
+    self.assertEqual(utils.ReadFile(self.path), "")
+
+    job_log.Append([(0, self._Entry(1, "first"))])
+    self.assertTrue(utils.ReadFile(self.path))
+    job_log.Reset()
+    self.assertEqual(utils.ReadFile(self.path), "")
+
+    job_log.Append([(0, self._Entry(2, "second"))])
+    self.assertEqual(jqueue._ParseJobLog(utils.ReadFile(self.path)),
+                     [(0, self._Entry(2, "second"))])
+
+    job_log.Remove()
+    self.assertFalse(os.path.exists(self.path))
+    job_log.Remove()
+
+  def testSync(self):
+    syncs = []
+    job_log = jqueue._JobLog(self.path, sync_interval=10,
+                             _time_fn=lambda: self.now)
+    job_log._Sync = lambda: syncs.append(self.now) or \
+                              setattr(job_log, "_last_sync", self.now)
+
+    for i in range(20):
+      job_log.Append([(0, self._Entry(i, "msg%s" % i))])
+      self.now += 1
+
+    self.assertEqual(syncs, [100.0, 110.0])
+
+  def testParseIncomplete(self):
+    data = ("[0, [1, [1, 0], \"message\", \"first\"]]\n"
+            "[0, [2, [2, 0], \"message\", \"sec")
+    self.assertEqual(jqueue._ParseJobLog(data),
+                     [(0, self._Entry(1, "first"))])
+
+
 class _FakeDependencyManager:
   def __init__(self):
     self._checks = []
@@ -516,6 +603,7 @@ class _DisabledFakeDependencyManager:
 class _FakeQueueForProc:
   def __init__(self, depmgr=None):
     self._updates = []
+    self._log_appends = []
     self._submitted = []
 
     self._submit_count = itertools.count(1000)
@@ -531,9 +619,15 @@ class _FakeQueueForProc:
   def GetNextSubmittedJob(self):
     return self._submitted.pop(0)
 
+  def GetNextLogAppend(self):
+    return self._log_appends.pop(0)
+
   def UpdateJobUnlocked(self, job, replicate=True):
     self._updates.append((job, bool(replicate)))
 
+  def AppendJobLogUnlocked(self, job, entries):
+    self._log_appends.append((job, entries))
+
   def SubmitManyJobs(self, jobs):
     job_ids = [next(self._submit_count) for _ in jobs]
     self._submitted.extend(zip(job_ids, jobs))
@@ -1040,9 +1134,17 @@ class TestJobProcessor(unittest.TestCase, _JobProcessorTestUtils):
           cbs.Feedback(log_type, msg)
         else:
           cbs.Feedback(msg)
-        # Check for job update without replication
-        self.assertEqual(queue.GetNextUpdate(), (job, False))
+        # Check that only the new entry was written
         self.assertRaises(IndexError, queue.GetNextUpdate)
+        (append_job, entries) = queue.GetNextLogAppend()
+        self.assertEqual(append_job, job)
+        self.assertEqual(len(entries), 1)
+        (op_idx, log_entry) = entries[0]
+        self.assertTrue(job.ops[op_idx].input is op)
+        self.assertEqual(log_entry, job.ops[op_idx].log[-1])
+        self.assertEqual(log_entry[0], job.log_serial)
+        self.assertEqual(log_entry[3], msg)
+        self.assertRaises(IndexError, queue.GetNextLogAppend)
 
     opexec = _FakeExecOpCodeForProc(queue, _BeforeStart, _AfterStart)
 
@@ -38,12 +38,14 @@ from ganeti import constants
 from ganeti import errors
 from ganeti import utils
 from ganeti import masterd
+from ganeti import objects
+from ganeti import impexpd
 
 from ganeti.masterd.instance import \
   ImportExportTimeouts, _DiskImportExportBase, \
   ComputeRemoteExportHandshake, CheckRemoteExportHandshake, \
   ComputeRemoteImportDiskInfo, CheckRemoteExportDiskInfo, \
-  FormatProgress
+  FormatProgress, DiskTransfer, _GetDiskTransport
 
 import testutils
 
@@ -166,5 +168,43 @@ class TestFormatProgress(unittest.TestCase):
                      "1.5G, 12.0 MiB/s, 30%")
 
 
+class TestGetDiskTransport(unittest.TestCase):
+  def _Transfer(self, src_dev_type, dest_dev_type):
+    def _IO(dev_type):
+      if dev_type is None:
+        return (constants.IEIO_FILE, ("/srv/ganeti/export/disk0", ))
+      return (constants.IEIO_RAW_DISK,
+              (objects.Disk(dev_type=dev_type), NotImplemented))
+
+    (src_io, src_ioargs) = _IO(src_dev_type)
+    (dest_io, dest_ioargs) = _IO(dest_dev_type)
+    return DiskTransfer("disk/0", src_io, src_ioargs, dest_io, dest_ioargs,
+                        None)
+
+  def testNative(self):
+    for (src, dest) in [(constants.DT_PLAIN, constants.DT_DRBD8),
+                        (constants.DT_DRBD8, None),
+                        (None, constants.DT_FILE)]:
+      for compress in [constants.IEC_NONE, constants.IEC_GZIP]:
+        self.assertEqual(_GetDiskTransport(compress,
+                                           self._Transfer(src, dest)),
+                         impexpd.TRANSPORT_NATIVE)
+
+  def testPipe(self):
+    transfer = self._Transfer(constants.DT_PLAIN, constants.DT_PLAIN)
+    self.assertEqual(_GetDiskTransport(constants.IEC_LZOP, transfer), None)
+
+    for (src, dest) in [(constants.DT_RBD, constants.DT_PLAIN),
+                        (constants.DT_PLAIN, constants.DT_BLOCK)]:
+      self.assertEqual(_GetDiskTransport(constants.IEC_GZIP,
+                                         self._Transfer(src, dest)), None)
+
+    transfer = DiskTransfer("disk/0", constants.IEIO_SCRIPT,
+                            ((objects.Disk(dev_type=constants.DT_PLAIN),
+                              NotImplemented), 0),
+                            constants.IEIO_FILE, ("/tmp/x", ), None)
+    self.assertEqual(_GetDiskTransport(constants.IEC_GZIP, transfer), None)
+
+
 if __name__ == "__main__":
   testutils.GanetiTestProgram()
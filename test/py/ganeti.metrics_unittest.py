@@ -0,0 +1,236 @@
+#!/usr/bin/python3
+#
+
+# Copyright (C) 2014 Google Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS
+# IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+# TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+# PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+"""Script for unittesting the metrics module"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from ganeti import metrics
+from ganeti import serializer
+from ganeti import utils
+
+import testutils
+
+
+class TestCounter(unittest.TestCase):
+  def test(self):
+    registry = metrics.Registry()
+    counter = registry.Counter("test_total", "Test", labels=["opcode"])
+
+    self.assertEqual(counter.GetValue("OP_A"), 0)
+    counter.Inc("OP_A")
+    counter.Inc("OP_A", amount=4)
+    counter.Inc("OP_B")
+    self.assertEqual(counter.GetValue("OP_A"), 5)
+    self.assertEqual(counter.GetValue("OP_B"), 1)
+
+    self.assertEqual(registry.FormatText(), "\n".join([
+      "# HELP test_total Test",
+      "# TYPE test_total counter",
+      "test_total{opcode=\"OP_A\"} 5",
+      "test_total{opcode=\"OP_B\"} 1",
+      "",
+      ]))
+
+  def testNoLabels(self):
+    registry = metrics.Registry()
+    registry.Counter("test_total", "Test").Inc()
+
+    self.assertEqual(registry.FormatText(), "\n".join([
+      "# HELP test_total Test",
+      "# TYPE test_total counter",
+      "test_total 1",
+      "",
+      ]))
+
+  def testEscape(self):
+    registry = metrics.Registry()
+    counter = registry.Counter("test_total", "Multi-line\nhelp",
+                               labels=["name"])
+    counter.Inc("a\"b\\c\nd")
+
+    self.assertEqual(registry.FormatText(), "\n".join([
+      "# HELP test_total Multi-line\\nhelp",
+      "# TYPE test_total counter",
+      "test_total{name=\"a\\\"b\\\\c\\nd\"} 1",
+      "",
+      ]))
+
+
+class TestHistogram(unittest.TestCase):
+  def test(self):
+    registry = metrics.Registry()
+    hist = registry.Histogram("test_seconds", "Test", labels=["phase"],
+                              buckets=[0.1, 1.0])
+
+    hist.Observe(0.05, "exec")
+    hist.Observe(0.1, "exec")
+    hist.Observe(0.5, "exec")
+    hist.Observe(20.0, "exec")
+    self.assertEqual(hist.GetCount("exec"), 4)
+    self.assertEqual(hist.GetCount("lock"), 0)
+
+    self.assertEqual(registry.FormatText(), "\n".join([
+      "# HELP test_seconds Test",
+      "# TYPE test_seconds histogram",
+      "test_seconds_bucket{phase=\"exec\",le=\"0.1\"} 2",
+      "test_seconds_bucket{phase=\"exec\",le=\"1.0\"} 3",
+      "test_seconds_bucket{phase=\"exec\",le=\"+Inf\"} 4",
+      "test_seconds_sum{phase=\"exec\"} 20.65",
+      "test_seconds_count{phase=\"exec\"} 4",
+      "",
+      ]))
+
+  def testTime(self):
+    registry = metrics.Registry()
+    hist = registry.Histogram("test_seconds", "Test", buckets=[1.0, 5.0])
+    now = [100.0]
+
+    with hist.Time(_time_fn=lambda: now[0]):
+      now[0] += 2.0
+
+    try:
+      with hist.Time(_time_fn=lambda: now[0]):
+        now[0] += 0.5
+        raise RuntimeError()
+    except RuntimeError:
+      pass
+    else:
+      self.fail("Exception was not passed on")
+
+    self.assertEqual(hist.GetCount(), 2)
+    self.assertEqual(hist.ToDict()["values"], [[[], [1, 1, 0], 2.5, 2]])
+
+
+class TestRegistry(unittest.TestCase):
+  def testRegisterTwice(self):
+    registry = metrics.Registry()
+    counter = registry.Counter("test_total", "Test", labels=["a"])
+    self.assertTrue(registry.Counter("test_total", "Test",
+                                     labels=["a"]) is counter)
+    self.assertRaises(ValueError, registry.Counter, "test_total", "Test",
+                      labels=["b"])
+    self.assertRaises(ValueError, registry.Histogram, "test_total", "Test",
+                      labels=["a"])
+
+  def testResetAndMerge(self):
+    registry = metrics.Registry()
+    registry.Counter("test_total", "Test", labels=["a"]).Inc("x", amount=2)
+    registry.Histogram("test_seconds", "Test",
+                       buckets=[1.0]).Observe(0.5)
+
+    data = serializer.LoadJson(serializer.DumpJson(registry.ToDict()))
+    registry.Reset()
+    self.assertEqual(registry.Counter("test_total", "Test",
+                                      labels=["a"]).GetValue("x"), 0)
+
+    other = metrics.Registry()
+    other.Counter("test_total", "Test", labels=["a"]).Inc("x")
+    other.Merge(data)
+    other.Merge(data)
+
+    self.assertEqual(other.Counter("test_total", "Test",
+                                   labels=["a"]).GetValue("x"), 5)
+    self.assertEqual(other.Histogram("test_seconds", "Test",
+                                     buckets=[1.0]).GetCount(), 2)
+
+  def testMergeIncompatible(self):
+    registry = metrics.Registry()
+    hist = registry.Histogram("test_seconds", "Test", buckets=[1.0, 2.0])
+
+    other = metrics.Registry()
+    other.Histogram("test_seconds", "Test", buckets=[1.0]).Observe(0.5)
+    data = other.ToDict()
+    data["unknown"] = {
+      "type": "summary",
+      "help": "Test",
+      "labels": [],
+      "values": [],
+      }
+
+    registry.Merge(data)
+    self.assertEqual(hist.GetCount(), 0)
+    self.assertEqual(list(registry.ToDict().keys()), ["test_seconds"])
+
+  def testFormatText(self):
+    registry = metrics.Registry()
+    registry.Counter("test_total", "Test").Inc(amount=3)
+    self.assertEqual(metrics.FormatText(registry.ToDict()),
+                     registry.FormatText())
+    self.assertEqual(metrics.FormatText({}), "")
+
+
+class TestMetricsFile(unittest.TestCase):
+  def setUp(self):
+    self.tmpdir = tempfile.mkdtemp()
+    self.filename = utils.PathJoin(self.tmpdir, "metrics.data")
+    self.lockfile = utils.PathJoin(self.tmpdir, "metrics.lock")
+
+  def tearDown(self):
+    shutil.rmtree(self.tmpdir)
+
+  def _Save(self, registry):
+    metrics.SaveToFile(registry, filename=self.filename,
+                       lockfile=self.lockfile)
+
+  def testNoFile(self):
+    self.assertEqual(metrics.LoadFromFile(filename=self.filename), {})
+
+  def testNothingRecorded(self):
+    registry = metrics.Registry()
+    registry.Counter("test_total", "Test")
+    self._Save(registry)
+    self.assertFalse(os.path.exists(self.filename))
+
+  def testSave(self):
+    registry = metrics.Registry()
+    counter = registry.Counter("test_total", "Test", labels=["a"])
+
+    counter.Inc("x")
+    self._Save(registry)
+    self.assertEqual(counter.GetValue("x"), 0)
+
+    counter.Inc("x", amount=2)
+    counter.Inc("y")
+    self._Save(registry)
+
+    other = metrics.Registry()
+    other.Merge(metrics.LoadFromFile(filename=self.filename))
+    self.assertEqual(other.Counter("test_total", "Test",
+                                   labels=["a"]).GetValue("x"), 3)
+    self.assertEqual(other.Counter("test_total", "Test",
+                                   labels=["a"]).GetValue("y"), 1)
+
+
+if __name__ == "__main__":
+  testutils.GanetiTestProgram()
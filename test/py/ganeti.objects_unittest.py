@@ -239,6 +239,72 @@ class TestClusterObject(unittest.TestCase):
     self.assertEqual(node_ndparams,
                      self.fake_cl.FillND(fake_node, fake_group))
 
+  def testGetFilledHvCached(self):
+    fake_inst = objects.Instance(name="foobar",
+                                 os="lenny-image",
+                                 hypervisor=constants.HT_FAKE,
+                                 hvparams={"blah": "blubb"})
+    filled = self.fake_cl.GetFilledHV(fake_inst)
+    self.assertEqual(filled, self.fake_cl.FillHV(fake_inst))
+    self.assertTrue(self.fake_cl.GetFilledHV(fake_inst) is filled)
+    self.assertRaises(TypeError, filled.__setitem__, "foo", "x")
+    self.assertRaises(TypeError, filled.update, {})
+    self.assertRaises(TypeError, filled.pop, "foo")
+
+    # Copies can be modified
+    copied = self.fake_cl.FillHV(fake_inst)
+    copied["foo"] = "x"
+    self.assertEqual(filled["foo"], "baz")
+    self.assertEqual(objects.FillDict(filled, {"foo": "x"})["foo"], "x")
+
+    # Changes made in place are noticed
+    fake_inst.hvparams["blah"] = "other"
+    self.assertEqual(self.fake_cl.GetFilledHV(fake_inst)["blah"], "other")
+    self.fake_cl.os_hvp["lenny-image"][constants.HT_FAKE]["foo"] = "new"
+    self.assertEqual(self.fake_cl.GetFilledHV(fake_inst)["foo"], "new")
+    self.assertEqual(self.fake_cl.FillHV(fake_inst)["foo"], "new")
+
+  def testGetFilledSerial(self):
+    fake_inst = objects.Instance(name="foobar",
+                                 os="ubuntu-hardy",
+                                 hypervisor=constants.HT_FAKE,
+                                 hvparams={}, beparams={})
+    self.fake_cl.serial_no = 1
+    filled = self.fake_cl.GetFilledBE(fake_inst)
+    self.assertTrue(self.fake_cl.GetFilledBE(fake_inst) is filled)
+    self.fake_cl.serial_no += 1
+    refilled = self.fake_cl.GetFilledBE(fake_inst)
+    self.assertFalse(refilled is filled)
+    self.assertEqual(refilled, filled)
+
+  def testGetFilledNd(self):
+    fake_node = objects.Node(name="test", ndparams={constants.ND_SSH_PORT: 2},
+                             group="testgroup")
+    fake_group = objects.NodeGroup(name="testgroup",
+                                   ndparams={constants.ND_SPINDLE_COUNT: 4})
+    filled = self.fake_cl.GetFilledND(fake_node, fake_group)
+    self.assertEqual(filled, self.fake_cl.FillND(fake_node, fake_group))
+    self.assertEqual(filled[constants.ND_SSH_PORT], 2)
+    self.assertEqual(filled[constants.ND_SPINDLE_COUNT], 4)
+
+    fake_group.ndparams[constants.ND_SPINDLE_COUNT] = 8
+    self.assertEqual(self.fake_cl.GetFilledNDGroup(fake_group),
+                     self.fake_cl.FillNDGroup(fake_group))
+    self.assertEqual(self.fake_cl.GetFilledND(fake_node, fake_group)
+                     [constants.ND_SPINDLE_COUNT], 8)
+
+  def testFillCacheNotSerialized(self):
+    fake_inst = objects.Instance(name="foobar",
+                                 os="ubuntu-hardy",
+                                 hypervisor=constants.HT_FAKE,
+                                 hvparams={})
+    self.fake_cl.GetFilledHV(fake_inst)
+    self.assertFalse([key for key in self.fake_cl.ToDict()
+                      if key.startswith("_")])
+    self.assertEqual(serializer.LoadJson(serializer.DumpJson(
+                       self.fake_cl.GetFilledHV(fake_inst))),
+                     self.fake_cl.FillHV(fake_inst))
+
   def testPrimaryHypervisor(self):
     assert self.fake_cl.enabled_hypervisors is None
     self.fake_cl.enabled_hypervisors = [constants.HT_XEN_HVM]
@@ -669,6 +669,51 @@ class TestInstanceQuery(unittest.TestCase):
        ["inst2", 512, None],
        ["inst3", 128, "192.0.2.99"]])
 
+  def testLazyParams(self):
+    cluster = objects.Cluster(cluster_name="testcluster",
+      hvparams=constants.HVC_DEFAULTS,
+      beparams={
+        constants.PP_DEFAULT: constants.BEC_DEFAULTS,
+        },
+      nicparams={
+        constants.PP_DEFAULT: constants.NICC_DEFAULTS,
+        },
+      os_hvp={},
+      osparams={})
+
+    instances = [
+      objects.Instance(name="inst%s" % i, hvparams={}, osparams={}, nics=[],
+                       os="deb1", hypervisor=constants.HT_FAKE,
+                       beparams={constants.BE_MAXMEM: 128 * (i + 1)})
+      for i in range(3)
+      ]
+
+    calls = []
+
+    class _FakeCluster(object):
+      def GetFilledBE(self, inst):
+        calls.append(inst.name)
+        return cluster.GetFilledBE(inst)
+
+    iqd = query.InstanceQueryData(instances, _FakeCluster(), None, [], [], {},
+                                  set(), {}, None, None, None)
+
+    # Parameters are not computed for fields not needing them
+    q = query.Query(query.INSTANCE_FIELDS, ["name", "os"])
+    self.assertEqual(len(q.Query(iqd)), 3)
+    self.assertEqual(calls, [])
+
+    # Parameters are computed once per item, and only for matching items
+    q = query.Query(query.INSTANCE_FIELDS,
+                    ["name", "be/maxmem", "be/minmem"],
+                    qfilter=["|", ["=", "name", "inst1"],
+                             ["=", "name", "inst2"]])
+    self.assertEqual(q.OldStyleQuery(iqd), [
+      ["inst1", 256, constants.BEC_DEFAULTS[constants.BE_MINMEM]],
+      ["inst2", 384, constants.BEC_DEFAULTS[constants.BE_MINMEM]],
+      ])
+    self.assertEqual(calls, ["inst1", "inst2"])
+
   def test(self):
     selected = list(query.INSTANCE_FIELDS)
     fieldidx = dict((field, idx) for idx, field in enumerate(selected))
@@ -1780,6 +1825,50 @@ class TestQueryFilter(unittest.TestCase):
       ["node2.example.net"],
       ])
 
+  def testFilterMergedEquality(self):
+    fielddefs = query._PrepareFieldList([
+      (query._MakeField("name", "Name", constants.QFT_TEXT, "Name"),
+       None, query.QFF_HOSTNAME, lambda ctx, item: item["name"]),
+      (query._MakeField("os", "OS", constants.QFT_TEXT, "OS"),
+       None, 0, lambda ctx, item: item["os"]),
+      (query._MakeField("mem", "Memory", constants.QFT_UNIT, "Memory"),
+       None, 0, lambda ctx, item: item["mem"]),
+      ], [])
+
+    data = [
+      { "name": "node1.example.com", "os": "debian", "mem": 128, },
+      { "name": "Node2.Example.com", "os": "ubuntu", "mem": 512, },
+      { "name": "node2.example.net", "os": "debian", "mem": 1024, },
+      { "name": "node20.example.com", "os": "centos", "mem": 512, },
+      ]
+
+    for (qfilter, expnames) in [
+      (["|", ["=", "name", "NODE1"], ["=", "name", "node2.example"]],
+       ["node1.example.com", "Node2.Example.com", "node2.example.net"]),
+      (["|", ["=", "name", "node2.example.com"], ["=", "name", "node1.ex"],
+        ["=", "name", "node3"]],
+       ["Node2.Example.com"]),
+      (["|", ["=", "name", "node1"], ["=", "os", "centos"],
+        ["==", "name", "node3"], ["=", "os", "ubuntu"]],
+       ["node1.example.com", "Node2.Example.com", "node20.example.com"]),
+      (["|", ["=", "mem", 128], ["=", "mem", 1024], ["=", "mem", 2048]],
+       ["node1.example.com", "node2.example.net"]),
+      ]:
+      q = query.Query(fielddefs, ["name"], qfilter=qfilter)
+      self.assertEqual(q.OldStyleQuery(data, sort_by_name=False),
+                       [[name] for name in expnames])
+
+      # Must match the result of checking each value on its own
+      for item in data:
+        single = [query.Query(fielddefs, ["name"], qfilter=op).Query([item])
+                  for op in qfilter[1:]]
+        self.assertEqual(bool(q.Query([item])), compat.any(single))
+
+    q = query.Query(fielddefs, ["name"],
+                    qfilter=["&", ["=", "os", "debian"],
+                             ["|", ["=", "mem", 512], ["=", "mem", 1024]]])
+    self.assertEqual(q.OldStyleQuery(data), [["node2.example.net"]])
+
   def testFilterBoolean(self):
     fielddefs = query._PrepareFieldList([
       (query._MakeField("name", "Name", constants.QFT_TEXT, "Name"),
@@ -46,6 +46,7 @@ from ganeti import rapi
 from ganeti import errors
 
 import ganeti.rapi.testutils
+import ganeti.server.rapi
 from ganeti.rapi import connector
 from ganeti.rapi import rlib2
 from ganeti.rapi import client
@@ -115,6 +116,9 @@ class TestConstants(unittest.TestCase):
     self.assertEqual(client.GANETI_RAPI_PORT, constants.DEFAULT_RAPI_PORT)
     self.assertEqual(client.GANETI_RAPI_VERSION, constants.RAPI_VERSION)
     self.assertEqual(client.HTTP_APP_JSON, http.HTTP_APP_JSON)
+    self.assertEqual(client.HTTP_NOT_MODIFIED, http.HTTP_NOT_MODIFIED)
+    self.assertEqual(client.HTTP_ETAG, http.HTTP_ETAG)
+    self.assertEqual(client.HTTP_IF_NONE_MATCH, http.HTTP_IF_NONE_MATCH)
     self.assertEqual(client._REQ_DATA_VERSION_FIELD, rlib2._REQ_DATA_VERSION)
     self.assertEqual(client.JOB_STATUS_QUEUED, constants.JOB_STATUS_QUEUED)
     self.assertEqual(client.JOB_STATUS_WAITING, constants.JOB_STATUS_WAITING)
@@ -170,6 +174,149 @@ class TestConstants(unittest.TestCase):
       self.assertTrue(value in errors.ECODE_ALL)
 
 
+class _FakeLuxiClientForCache(object):
+  def __init__(self):
+    self.serials = [1, 100]
+    self.instances = ["inst1"]
+    self.queries = 0
+
+  def __call__(self):
+    return self
+
+  def QueryConfigValues(self, _):
+    return self.serials
+
+  def QueryInstances(self, names, fields, use_locking):
+    self.queries += 1
+    return [[name] for name in self.instances]
+
+
+class TestConditionalRequests(unittest.TestCase):
+  def _GetClient(self, conditional_requests):
+    self.luxi = _FakeLuxiClientForCache()
+    cache = ganeti.server.rapi.ResponseCache(60, _time_fn=lambda: 1000.0)
+    handler = rapi.testutils._RapiMock(NotImplemented, self.luxi, cache=cache)
+    self.curl = rapi.testutils.FakeCurl(handler)
+    return client.GanetiRapiClient("master.example.com",
+                                   curl_factory=lambda: self.curl,
+                                   conditional_requests=conditional_requests)
+
+  def _GetRequestETag(self):
+    for header in self.curl.getopt(pycurl.HTTPHEADER):
+      if header.startswith("%s:" % http.HTTP_IF_NONE_MATCH):
+        return header.split(":", 1)[1].strip()
+    return None
+
+  def test(self):
+    cl = self._GetClient(True)
+
+    self.assertEqual(cl.GetInstances(), ["inst1"])
+    self.assertTrue(self._GetRequestETag() is None)
+    self.assertEqual(self.luxi.queries, 1)
+
+    for _ in range(3):
+      result = cl.GetInstances()
+      self.assertEqual(result, ["inst1"])
+      self.assertTrue(self._GetRequestETag())
+      self.assertEqual(self.luxi.queries, 1)
+
+    # Results must not share state with the cache
+    result.append("foo")
+    self.assertEqual(cl.GetInstances(), ["inst1"])
+
+    self.luxi.serials = [2, 100]
+    self.luxi.instances = ["inst1", "inst2"]
+    self.assertEqual(cl.GetInstances(), ["inst1", "inst2"])
+    self.assertEqual(self.luxi.queries, 2)
+    self.assertEqual(cl.GetInstances(), ["inst1", "inst2"])
+    self.assertEqual(self.luxi.queries, 2)
+
+  def testStreaming(self):
+    cl = self._GetClient(True)
+    self.luxi.instances = ["inst%05d" % i for i in range(2000)]
+
+    result = cl.IterInstances()
+    self.assertEqual(next(result), "inst00000")
+    self.assertEqual(list(result), self.luxi.instances[1:])
+    self.assertEqual(self.luxi.queries, 1)
+
+    # Streamed responses are kept in the server's cache, too
+    self.assertEqual(cl.GetInstances(), self.luxi.instances)
+    self.assertEqual(self.luxi.queries, 1)
+
+  def testDisabled(self):
+    cl = self._GetClient(False)
+
+    for _ in range(3):
+      self.assertEqual(cl.GetInstances(), ["inst1"])
+      self.assertTrue(self._GetRequestETag() is None)
+
+  def testGetResponseHeader(self):
+    fn = client._GetResponseHeader
+    lines = [
+      b"HTTP/1.1 100 Continue\r\n",
+      b"ETag: \"old\"\r\n",
+      b"\r\n",
+      b"HTTP/1.1 200 OK\r\n",
+      b"Content-Type: application/json\r\n",
+      b"etag: \"abc\"\r\n",
+      b"\r\n",
+      ]
+    self.assertEqual(fn(lines, "ETag"), "\"abc\"")
+    self.assertEqual(fn(lines, "content-type"), "application/json")
+    self.assertTrue(fn(lines, "Last-Modified") is None)
+    self.assertTrue(fn(lines[:3], "Content-Type") is None)
+
+
+class TestJsonListParser(unittest.TestCase):
+  def _Parse(self, data, piece_size, key=None):
+    parser = client._JsonListParser(key=key)
+    result = []
+    for pos in range(0, len(data), piece_size):
+      result.extend(parser.Feed(data[pos:pos + piece_size]))
+    parser.Close()
+    return result
+
+  def test(self):
+    for value in [
+      [],
+      [1, 22, 333, -1.5e3, 1e-7, True, False, None],
+      ["", "a,]}", "\"\\", "\u00e9\u20ac", {"a": [1, {"b": "c"}]}, []],
+      [[[constants.RS_NORMAL, "inst%s" % i]] for i in range(20)],
+      ]:
+      data = serializer.DumpJson(value)
+      for piece_size in list(range(1, 8)) + [len(data)]:
+        self.assertEqual(self._Parse(data, piece_size), value)
+
+  def testKey(self):
+    value = {
+      "fields": [{"name": "name", "kind": "text"}],
+      "data": [[[0, "node1"]], [[0, "node2"]]],
+      "other": {"data": [1, 2]},
+      }
+    data = serializer.DumpJson(value)
+    for piece_size in list(range(1, 8)) + [len(data)]:
+      self.assertEqual(self._Parse(data, piece_size, key="data"),
+                       value["data"])
+
+    self.assertEqual(self._Parse(b"{}", 1, key="data"), [])
+    self.assertEqual(self._Parse(b"{\"data\": null}", 1, key="data"), [])
+
+  def testInvalid(self):
+    for (data, key) in [
+      (b"", None),
+      (b"{}", None),
+      (b"[]", "data"),
+      (b"[1,", None),
+      (b"[1 2]", None),
+      (b"[1]]", None),
+      (b"[1] x", None),
+      (b"{\"data\" []}", "data"),
+      (b"{\"data\": [] x", "data"),
+      ]:
+      self.assertRaises(client.GanetiApiError, self._Parse, data, 3, key=key)
+
+
 class RapiMockTest(unittest.TestCase):
   def test404(self):
     (code, _, body) = RapiMock().FetchResponse("/foo", "GET", None, None)
@@ -459,6 +606,29 @@ class GanetiRapiClientTests(testutils.GanetiTestCase):
     self.rapi.AddResponse(None, code=404)
     self.assertEqual([], self.client.GetFeatures())
 
+  def testGetMetrics(self):
+    text = "# TYPE foo_total counter\nfoo_total 1\n"
+    self.rapi.AddResponse(text)
+    self.assertEqual(self.client.GetMetrics(), text)
+    self.assertHandler(rlib2.R_2_metrics)
+
+  def testGetMetricsBytes(self):
+    # Real PycURL passes the response body as bytes
+    setopt_fn = self.curl.setopt
+
+    def _SetOpt(opt, value):
+      if opt == pycurl.WRITEFUNCTION:
+        write_fn = value
+        value = lambda data: write_fn(data.encode("utf-8"))
+      setopt_fn(opt, value)
+
+    self.curl.setopt = _SetOpt
+
+    text = "# TYPE foo_total counter\nfoo_total 1\n"
+    self.rapi.AddResponse(text)
+    self.assertEqual(self.client.GetMetrics(), text)
+    self.assertHandler(rlib2.R_2_metrics)
+
   def testGetOperatingSystems(self):
     self.rapi.AddResponse("[\"beos\"]")
     self.assertEqual(["beos"], self.client.GetOperatingSystems())
@@ -496,6 +666,39 @@ class GanetiRapiClientTests(testutils.GanetiTestCase):
     self.assertHandler(rlib2.R_2_instances)
     self.assertBulk()
 
+  def testIterInstances(self):
+    for bulk in [False, True]:
+      self.rapi.AddResponse(serializer.DumpJson([
+        {"id": "inst1", "uri": "/2/instances/inst1"},
+        {"id": "inst2", "uri": "/2/instances/inst2"},
+        ]))
+      result = list(self.client.IterInstances(bulk=bulk))
+      self.assertHandler(rlib2.R_2_instances)
+      if bulk:
+        self.assertBulk()
+        self.assertEqual([i["uri"] for i in result],
+                         ["/2/instances/inst1", "/2/instances/inst2"])
+      else:
+        self.assertEqual(result, ["inst1", "inst2"])
+
+  def testIterInstancesError(self):
+    self.rapi.AddResponse(serializer.DumpJson({
+      "code": 502,
+      "message": "Bad Gateway",
+      "explain": "",
+      }), code=502)
+    try:
+      list(self.client.IterInstances())
+    except client.GanetiApiError as err:
+      self.assertEqual(err.code, 502)
+    else:
+      self.fail("Didn't raise exception")
+
+  def testIterInstancesInvalid(self):
+    self.rapi.AddResponse("[{}, ")
+    self.assertRaises(client.GanetiApiError, list,
+                      self.client.IterInstances(bulk=True))
+
   def testGetInstance(self):
     self.rapi.AddResponse("[]")
     self.assertEqual([], self.client.GetInstance("instance"))
@@ -1422,6 +1625,25 @@ class GanetiRapiClientTests(testutils.GanetiTestCase):
           self.assertEqual(data["qfilter"], qfilter)
         self.assertEqual(self.rapi.CountPending(), 0)
 
+  def testIterQuery(self):
+    result = objects.QueryResponse(fields=[
+      objects.QueryFieldDefinition(name="name", title="Name",
+                                   kind=constants.QFT_TEXT),
+      ], data=[
+      [[constants.RS_NORMAL, "node1"]],
+      [[constants.RS_NORMAL, "node2"]],
+      ])
+
+    self.rapi.AddResponse(serializer.DumpJson(result.ToDict()))
+    self.assertEqual(list(self.client.IterQuery(constants.QR_NODE, ["name"],
+                                                qfilter=["?", "name"])),
+                     result.data)
+    self.assertHandler(rlib2.R_2_query)
+    self.assertItems([constants.QR_NODE])
+    data = serializer.LoadJson(self.rapi.GetLastRequestData())
+    self.assertEqual(data["fields"], ["name"])
+    self.assertEqual(data["qfilter"], ["?", "name"])
+
   def testQueryFields(self):
     exp_result = objects.QueryFieldsResponse(fields=[
       objects.QueryFieldDefinition(name="pnode", title="PNode",
@@ -136,6 +136,9 @@ class TestInputTestClient(unittest.TestCase):
   def testGetInfo(self):
     self.assertTrue(self.cl.GetInfo() is NotImplemented)
 
+  def testGetMetrics(self):
+    self.assertTrue(self.cl.GetMetrics() is NotImplemented)
+
   def testPrepareExport(self):
     result = self.cl.PrepareExport("inst1.example.com",
                                    constants.EXPORT_MODE_LOCAL)
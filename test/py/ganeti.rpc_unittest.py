@@ -35,6 +35,7 @@ import sys
 import unittest
 import random
 import tempfile
+import zlib
 
 from ganeti import constants
 from ganeti import compat
@@ -341,6 +342,86 @@ class TestRpcProcessor(unittest.TestCase):
     lhresp.Raise("should not raise")
     self.assertEqual(http_proc.reqcount, 1)
 
+  def testDeflateNegotiation(self):
+    resolver = rpc._StaticResolver(["192.0.2.1", "192.0.2.2"])
+    nodes = ["node1", "node2"]
+    body = serializer.DumpJson(list(range(constants.RPC_COMPRESSION_MIN_SIZE)))
+    requests = {}
+
+    def _Response(req):
+      self.assertEqual(req.accept_encoding, "deflate")
+      requests[req.host] = req
+      req.success = True
+      req.resp_status_code = http.HTTP_OK
+      req.resp_body = serializer.DumpJson((True, None))
+      if req.host == "192.0.2.1":
+        req.resp_headers = {"accept-encoding": "deflate"}
+      else:
+        req.resp_headers = {}
+
+    deflate_peers = set()
+    proc = rpc._RpcProcessor(resolver, 1811, deflate_peers=deflate_peers)
+    http_proc = _FakeRequestProcessor(_Response)
+
+    for compressed in [False, True]:
+      requests.clear()
+      result = proc(nodes, "test", dict.fromkeys(nodes, body), 30,
+                    NotImplemented, _req_process_fn=http_proc)
+      self.assertFalse(compat.any(res.fail_msg for res in result.values()))
+      self.assertEqual(deflate_peers, set([("192.0.2.1", 1811)]))
+
+      plain_req = requests["192.0.2.2"]
+      self.assertEqual(plain_req.post_data, body)
+      self.assertFalse([i for i in plain_req.headers
+                        if i.startswith("Content-Encoding:")])
+
+      req = requests["192.0.2.1"]
+      if compressed:
+        self.assertTrue("Content-Encoding: deflate" in req.headers)
+        self.assertEqual(zlib.decompress(req.post_data), body)
+      else:
+        self.assertEqual(req.post_data, body)
+
+    # Small bodies are not compressed
+    requests.clear()
+    proc(nodes, "test", dict.fromkeys(nodes, b"[]"), 30,
+         NotImplemented, _req_process_fn=http_proc)
+    self.assertEqual(requests["192.0.2.1"].post_data, b"[]")
+
+    proc = rpc._RpcProcessor(rpc._StaticResolver(["192.0.2.1"]), 1811,
+                             deflate_peers=deflate_peers)
+
+    # Error responses without the header don't change anything
+    def _ErrorResponse(req):
+      _Response(req)
+      req.resp_status_code = http.HttpInternalServerError.code
+      req.resp_headers = {}
+
+    proc(["node1"], "test", {"node1": body}, 30, NotImplemented,
+         _req_process_fn=_FakeRequestProcessor(_ErrorResponse))
+    self.assertEqual(deflate_peers, set([("192.0.2.1", 1811)]))
+
+    # Node daemon rejecting the compressed body
+    def _RejectedResponse(req):
+      _Response(req)
+      req.resp_status_code = http.HttpUnsupportedMediaType.code
+      req.resp_headers = {"accept-encoding": "identity"}
+
+    proc(["node1"], "test", {"node1": body}, 30, NotImplemented,
+         _req_process_fn=_FakeRequestProcessor(_RejectedResponse))
+    self.assertFalse(deflate_peers)
+
+    # Node daemon no longer accepting compressed bodies
+    deflate_peers.add(("192.0.2.1", 1811))
+
+    def _OldResponse(req):
+      _Response(req)
+      req.resp_headers = {}
+
+    proc(["node1"], "test", {"node1": body}, 30, NotImplemented,
+         _req_process_fn=_FakeRequestProcessor(_OldResponse))
+    self.assertFalse(deflate_peers)
+
 
 class TestSsconfResolver(unittest.TestCase):
   def testSsconfLookup(self):
@@ -604,6 +685,126 @@ class TestRpcClientBase(unittest.TestCase):
         self.assertEqual(serializer.LoadJson(res.payload),
                          ["foo", hex(num), hash("Hello%s" % num)])
 
+  def testSharedBodies(self):
+    calls = []
+
+    def _Encode(kind, node, value):
+      calls.append((kind, node))
+      return [kind, node, value]
+
+    encoders = dict((kind, compat.partial(_Encode, kind))
+                    for kind in [rpc_defs.ED_COMPRESS,
+                                 rpc_defs.ED_OBJECT_DICT,
+                                 rpc_defs.ED_DISKS_DICT_DP,
+                                 rpc_defs.ED_INST_DICT])
+
+    nodes = ["node%s.example.com" % i for i in range(10)]
+    resolver = rpc._StaticResolver(["192.0.2.%s" % i
+                                    for i in range(len(nodes))])
+
+    bodies = {}
+
+    def _VerifyRequest(req):
+      bodies[req.nicename.split("/")[0]] = req.post_data
+      req.success = True
+      req.resp_status_code = http.HTTP_OK
+      req.resp_body = serializer.DumpJson((True, None))
+
+    http_proc = _FakeRequestProcessor(_VerifyRequest)
+    client = rpc._RpcClientBase(resolver, encoders.get,
+                                _req_process_fn=http_proc)
+
+    # Only node-independent arguments
+    cdef = ("test_call", NotImplemented, None, constants.RPC_TMO_NORMAL, [
+      ("arg0", None, NotImplemented),
+      ("arg1", rpc_defs.ED_COMPRESS, NotImplemented),
+      ("arg2", rpc_defs.ED_OBJECT_DICT, NotImplemented),
+      ], None, None, NotImplemented)
+
+    result = client._Call(cdef, nodes, ["foo", "data", {"a": 1}])
+    self.assertEqual(len(result), len(nodes))
+    self.assertEqual(sorted(calls), [
+      (rpc_defs.ED_OBJECT_DICT, None),
+      (rpc_defs.ED_COMPRESS, None),
+      ])
+    self.assertEqual(len(set(map(id, bodies.values()))), 1)
+    self.assertEqual(serializer.LoadJson(bodies[nodes[0]]),
+                     ["foo", [rpc_defs.ED_COMPRESS, None, "data"],
+                      [rpc_defs.ED_OBJECT_DICT, None, {"a": 1}]])
+
+    # Node-independent and node-dependent arguments
+    del calls[:]
+    bodies.clear()
+
+    cdef = ("test_call", NotImplemented, None, constants.RPC_TMO_NORMAL, [
+      ("arg0", rpc_defs.ED_DISKS_DICT_DP, NotImplemented),
+      ("arg1", rpc_defs.ED_COMPRESS, NotImplemented),
+      ("arg2", None, NotImplemented),
+      ("arg3", rpc_defs.ED_INST_DICT, NotImplemented),
+      ], None, None, NotImplemented)
+
+    result = client._Call(cdef, nodes, ["disks", "data", 123, "inst"])
+    self.assertEqual(len(result), len(nodes))
+    self.assertEqual(calls.count((rpc_defs.ED_COMPRESS, None)), 1)
+    self.assertEqual(len(calls), 1 + 2 * len(nodes))
+
+    for node in nodes:
+      args = [[rpc_defs.ED_DISKS_DICT_DP, node, "disks"],
+              [rpc_defs.ED_COMPRESS, None, "data"],
+              123,
+              [rpc_defs.ED_INST_DICT, node, "inst"]]
+      encoder = serializer.EncodeWithPrivateFields
+      self.assertEqual(bodies[node],
+                       serializer.DumpJson(args, private_encoder=encoder))
+
+  def testCompressibleData(self):
+    nodes = ["node1.example.com", "node2.example.com"]
+    resolver = rpc._StaticResolver(["192.0.2.1", "192.0.2.2"])
+    data = 1000 * b"Hello World\n"
+    requests = {}
+
+    def _Response(req):
+      requests[req.host] = req
+      req.success = True
+      req.resp_status_code = http.HTTP_OK
+      req.resp_body = serializer.DumpJson((True, None))
+      if req.host == "192.0.2.1":
+        req.resp_headers = {"accept-encoding": "deflate"}
+
+    client = rpc._RpcClientBase(resolver, {
+      rpc_defs.ED_COMPRESS: rpc._PrepareCompressedData,
+      }.get, _req_process_fn=_FakeRequestProcessor(_Response))
+
+    cdef = ("test_call", NotImplemented, None, constants.RPC_TMO_NORMAL, [
+      ("arg0", rpc_defs.ED_COMPRESS, NotImplemented),
+      ], None, None, NotImplemented)
+
+    try:
+      for compressed in [False, True]:
+        requests.clear()
+        result = client._Call(cdef, nodes, [data])
+        self.assertFalse(compat.any(res.fail_msg for res in result.values()))
+
+        legacy = serializer.LoadJson(requests["192.0.2.2"].post_data)
+        self.assertEqual(legacy[0][0], constants.RPC_ENCODING_ZLIB_BASE64)
+        self.assertEqual(backend._Decompress(legacy[0]), data)
+
+        post_data = requests["192.0.2.1"].post_data
+        if compressed:
+          self.assertTrue("Content-Encoding: deflate" in
+                          requests["192.0.2.1"].headers)
+          self.assertEqual(serializer.LoadJson(zlib.decompress(post_data)),
+                           [[constants.RPC_ENCODING_NONE,
+                             data.decode("utf-8")]])
+        else:
+          self.assertEqual(post_data, requests["192.0.2.2"].post_data)
+    finally:
+      rpc._deflate_peers.clear()
+
+    # Binary data can't be sent without an encoding
+    self.assertEqual(rpc._CompressibleData(b"\xff" * 1000).Encode(True),
+                     rpc._Compress(None, b"\xff" * 1000))
+
   def testPostProc(self):
     def _VerifyRequest(nums, req):
       req.success = True
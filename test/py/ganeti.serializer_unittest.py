@@ -34,6 +34,7 @@
 import doctest
 import unittest
 
+from ganeti import compat
 from ganeti import errors
 from ganeti import ht
 from ganeti import objects
@@ -128,6 +129,31 @@ class TestSerializer(testutils.GanetiTestCase):
                       serializer.DumpJson(tdata), "mykey")
 
 
+class TestDumpJsonChunks(unittest.TestCase):
+  def test(self):
+    for data in TestSerializer._TESTDATA + [
+      [],
+      {},
+      list(range(1000)),
+      {"fields": ["name"], "data": [[[0, "node%s" % i]] for i in range(100)]},
+      {1: [1, 2], "a": {"b": [3, 4]}},
+      ]:
+      for chunk_size in [1, 10, 1024]:
+        chunks = list(serializer.DumpJsonChunks(
+          data, private_encoder=serializer.EncodeWithPrivateFields,
+          chunk_size=chunk_size))
+        self.assertTrue(compat.all(isinstance(chunk, bytes)
+                                   for chunk in chunks))
+        self.assertEqual(b"".join(chunks), serializer.DumpJson(
+          data, private_encoder=serializer.EncodeWithPrivateFields))
+
+  def testChunkSize(self):
+    chunks = list(serializer.DumpJsonChunks(list(range(10000)),
+                                            chunk_size=1024))
+    self.assertTrue(len(chunks) > 10)
+    self.assertTrue(compat.all(len(chunk) < 2048 for chunk in chunks))
+
+
 class TestLoadAndVerifyJson(unittest.TestCase):
   def testNoJson(self):
     self.assertRaises(errors.ParseError, serializer.LoadAndVerifyJson,
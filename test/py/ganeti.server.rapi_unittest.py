@@ -30,6 +30,7 @@
 
 """Script for testing ganeti.server.rapi"""
 
+import os
 import re
 import unittest
 import random
@@ -42,6 +43,7 @@ from ganeti import errors
 from ganeti import serializer
 from ganeti import rapi
 from ganeti import http
+from ganeti import metrics
 from ganeti import objects
 
 import ganeti.rapi.baserlib
@@ -244,6 +246,37 @@ class TestRemoteApiHandler(unittest.TestCase):
           self.assertEqual(code, http.HTTP_OK)
           self.assertTrue(objects.QueryResponse.FromDict(data))
 
+  def testMetrics(self):
+    username = "admin"
+    password = "2046920054"
+
+    def _LookupUserRead(name):
+      if name == username:
+        return http.auth.PasswordFileUser(name, password,
+                                          [rapi.RAPI_ACCESS_READ])
+      else:
+        return None
+
+    # No authorization
+    (code, _, _) = self._Test(http.HTTP_GET, "/2/metrics", "", "")
+    self.assertEqual(code, http.HttpUnauthorized.code)
+
+    rm = rapi.testutils._RapiMock(_LookupUserRead,
+                                  _FakeLuxiClientForMetrics)
+    headers = self._MakeAuthHeaders(username, password, True)
+    (code, resp_headers, resp_body) = \
+      rm.FetchResponse("/2/metrics", http.HTTP_GET,
+                       http.ParseHeaders(StringIO(headers)), "")
+    self.assertEqual(code, http.HTTP_OK)
+    self.assertEqual(resp_headers[http.HTTP_CONTENT_TYPE],
+                     metrics.PROMETHEUS_CONTENT_TYPE)
+    self.assertEqual(resp_body, "\n".join([
+      "# HELP ganeti_test_total Test counter",
+      "# TYPE ganeti_test_total counter",
+      "ganeti_test_total{opcode=\"OP_TEST\"} 3",
+      "",
+      ]))
+
   def testConsole(self):
     path = "/2/instances/inst1.example.com/console"
 
@@ -266,5 +299,197 @@ class _FakeLuxiClientForQuery:
     return objects.QueryResponse(fields=[])
 
 
+class _FakeLuxiClientForMetrics:
+  def __init__(self, *args, **kwargs):
+    pass
+
+  def QueryMetrics(self):
+    registry = metrics.Registry()
+    registry.Counter("ganeti_test_total", "Test counter",
+                     labels=["opcode"]).Inc("OP_TEST", amount=3)
+    return registry.ToDict()
+
+
+class _FakeLuxiClientForCache(object):
+  def __init__(self):
+    self.serials = [1, 100]
+    self.queries = 0
+
+  def __call__(self):
+    return self
+
+  def QueryConfigValues(self, fields):
+    self.fields = fields
+    return self.serials
+
+  def QueryInstances(self, names, fields, use_locking):
+    self.queries += 1
+    return [["inst%s" % i] for i in range(3)]
+
+
+class TestResponseCache(unittest.TestCase):
+  def testTags(self):
+    now = [1000.0]
+    cache = ganeti.server.rapi.ResponseCache(10, _time_fn=lambda: now[0])
+
+    tag = cache.GetTag(("/2/instances", None), (1, 100))
+    self.assertTrue(tag.startswith("\"") and tag.endswith("\""))
+    self.assertEqual(tag, cache.GetTag(("/2/instances", None), (1, 100)))
+
+    for (key, validator) in [
+      (("/2/instances?bulk=1", None), (1, 100)),
+      (("/2/instances", "user"), (1, 100)),
+      (("/2/instances", None), (2, 100)),
+      (("/2/instances", None), (1, 101)),
+      ]:
+      self.assertNotEqual(tag, cache.GetTag(key, validator))
+
+    now[0] = 1009.9
+    self.assertEqual(tag, cache.GetTag(("/2/instances", None), (1, 100)))
+    now[0] = 1010.0
+    self.assertNotEqual(tag, cache.GetTag(("/2/instances", None), (1, 100)))
+
+  def testEntries(self):
+    cache = ganeti.server.rapi.ResponseCache(10, max_entries=2)
+
+    self.assertTrue(cache.Get("a", "tag1") is None)
+    cache.Put("a", "tag1", 1.0, b"body a")
+    cache.Put("b", "tag2", 2.0, b"body b")
+    self.assertEqual(cache.Get("a", "tag1"), (1.0, b"body a"))
+
+    # Least recently used entry is evicted
+    cache.Put("c", "tag3", 3.0, b"body c")
+    self.assertTrue(cache.Get("b", "tag2") is None)
+    self.assertEqual(cache.Get("a", "tag1"), (1.0, b"body a"))
+
+    # Outdated entries are dropped
+    self.assertTrue(cache.Get("a", "tag4") is None)
+    self.assertTrue(cache.Get("a", "tag1") is None)
+    self.assertEqual(cache.Get("c", "tag3"), (3.0, b"body c"))
+
+  def testMatchETag(self):
+    fn = ganeti.server.rapi._MatchETag
+    self.assertFalse(fn(None, "\"abc\""))
+    self.assertFalse(fn("", "\"abc\""))
+    self.assertFalse(fn("\"def\"", "\"abc\""))
+    self.assertTrue(fn("\"abc\"", "\"abc\""))
+    self.assertTrue(fn("\"def\", \"abc\"", "\"abc\""))
+    self.assertTrue(fn("W/\"abc\"", "\"abc\""))
+    self.assertTrue(fn("*", "\"abc\""))
+
+
+class TestSerializeResult(unittest.TestCase):
+  def test(self):
+    fn = ganeti.server.rapi._SerializeResult
+    limit = ganeti.server.rapi._STREAMING_MIN_ITEMS
+
+    for result in [None, "x", list(range(limit - 1)),
+                   {"data": list(range(limit - 1)), "fields": []}]:
+      self.assertEqual(fn(result), serializer.DumpJson(result))
+
+    for result in [list(range(limit)),
+                   {"data": list(range(limit)), "fields": []}]:
+      body = fn(result)
+      self.assertTrue(isinstance(body, http.HttpStreamingBody))
+      self.assertEqual(body.GetValue(), serializer.DumpJson(result))
+
+
+class TestCachedRequests(unittest.TestCase):
+  def setUp(self):
+    self.luxi = _FakeLuxiClientForCache()
+    cache = ganeti.server.rapi.ResponseCache(60, _time_fn=lambda: 1000.0)
+    self.rm = rapi.testutils._RapiMock(NotImplemented, self.luxi, cache=cache)
+
+  def _Get(self, path, etag=None):
+    if etag is None:
+      headers = ""
+    else:
+      headers = rapi.testutils._FormatHeaders([
+        "%s: %s" % (http.HTTP_IF_NONE_MATCH, etag),
+        ])
+
+    return self.rm.FetchResponse(path, http.HTTP_GET,
+                                 http.ParseHeaders(StringIO(headers)), None)
+
+  def test(self):
+    (code, headers, body) = self._Get("/2/instances")
+    self.assertEqual(code, http.HTTP_OK)
+    self.assertEqual(self.luxi.queries, 1)
+    self.assertEqual(self.luxi.fields,
+                     ganeti.server.rapi._CACHE_VALIDATOR_FIELDS)
+    self.assertEqual([i["id"] for i in serializer.LoadJson(body)],
+                     ["inst0", "inst1", "inst2"])
+    etag = headers[http.HTTP_ETAG]
+    self.assertTrue(headers[http.HTTP_LAST_MODIFIED])
+
+    # Unchanged resource
+    (code, headers, body304) = self._Get("/2/instances", etag=etag)
+    self.assertEqual(code, http.HTTP_NOT_MODIFIED)
+    self.assertEqual(headers[http.HTTP_ETAG], etag)
+    self.assertFalse(body304)
+    self.assertEqual(self.luxi.queries, 1)
+
+    # Served from cache
+    (code, headers, body2) = self._Get("/2/instances")
+    self.assertEqual(code, http.HTTP_OK)
+    self.assertEqual(body2, body)
+    self.assertEqual(self.luxi.queries, 1)
+
+    # Different query arguments
+    (code, headers, _) = self._Get("/2/instances?reason=foo", etag=etag)
+    self.assertEqual(code, http.HTTP_OK)
+    self.assertNotEqual(headers[http.HTTP_ETAG], etag)
+    self.assertEqual(self.luxi.queries, 2)
+
+    # Job submitted in the meantime
+    self.luxi.serials = [1, 101]
+    (code, headers, _) = self._Get("/2/instances", etag=etag)
+    self.assertEqual(code, http.HTTP_OK)
+    self.assertNotEqual(headers[http.HTTP_ETAG], etag)
+    self.assertEqual(self.luxi.queries, 3)
+
+  def testLocking(self):
+    for _ in range(2):
+      (code, headers, _) = self._Get("/2/instances?lock=1")
+      self.assertEqual(code, http.HTTP_OK)
+      self.assertFalse(http.HTTP_ETAG in headers)
+    self.assertEqual(self.luxi.queries, 2)
+
+  def testUnknownSerials(self):
+    self.luxi.serials = [None, None]
+    for _ in range(2):
+      (code, headers, _) = self._Get("/2/instances")
+      self.assertEqual(code, http.HTTP_OK)
+      self.assertFalse(http.HTTP_ETAG in headers)
+    self.assertEqual(self.luxi.queries, 2)
+
+  def testNotCacheable(self):
+    self.assertFalse(rapi.rlib2.R_2_instances_name.GET_CACHEABLE)
+    self.assertTrue(rapi.rlib2.R_2_instances.GET_CACHEABLE)
+
+
+class TestRapiUsers(testutils.GanetiTestCase):
+  def _Write(self, filename, users):
+    utils.WriteFile(filename, data="".join("%s secret\n" % name
+                                           for name in users))
+
+  def test(self):
+    filename = self._CreateTempFile()
+
+    for check_changes in [False, True]:
+      self._Write(filename, ["user1"])
+      users = ganeti.server.rapi.RapiUsers(check_changes=check_changes)
+      self.assertTrue(users.Load(filename))
+      self.assertTrue(users.Get("user1"))
+      self.assertFalse(users.Get("user2"))
+
+      # Make sure the modification time differs
+      self._Write(filename, ["user2"])
+      os.utime(filename, (0, 0))
+
+      self.assertEqual(bool(users.Get("user1")), not check_changes)
+      self.assertEqual(bool(users.Get("user2")), check_changes)
+
+
 if __name__ == "__main__":
   testutils.GanetiTestProgram()
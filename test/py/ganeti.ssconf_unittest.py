@@ -267,6 +267,86 @@ class TestSimpleStore(unittest.TestCase):
       self.assertEqual(value, result[key])
 
 
+class TestCachedSimpleStore(unittest.TestCase):
+  def setUp(self):
+    self._tmpdir = tempfile.mkdtemp()
+    self.ssdir = utils.PathJoin(self._tmpdir, "files")
+    self.lockfile = utils.PathJoin(self._tmpdir, "lock")
+
+    os.mkdir(self.ssdir)
+
+    self.sstore = self._NewStore()
+    self.reads = []
+    self._orig_read_fn = ssconf.ReadSsconfFile
+    ssconf.ReadSsconfFile = self._CountingRead
+
+  def tearDown(self):
+    ssconf.ReadSsconfFile = self._orig_read_fn
+    shutil.rmtree(self._tmpdir)
+
+  def _NewStore(self):
+    return ssconf.SimpleStore(cfg_location=self.ssdir,
+                              _lockfile=self.lockfile, cached=True)
+
+  def _CountingRead(self, filename):
+    self.reads.append(os.path.basename(filename))
+    return self._orig_read_fn(filename)
+
+  def _WriteFile(self, key, data):
+    utils.WriteFile(utils.PathJoin(self.ssdir, "ssconf_%s" % key), data=data)
+    # Make the change old enough for the modification time to be trusted
+    mtime = os.stat(self.ssdir).st_mtime - 10
+    os.utime(self.ssdir, (mtime, mtime))
+
+  def testReadOnce(self):
+    self._WriteFile(constants.SS_CLUSTER_NAME, "cluster.example.com\n")
+    self._WriteFile(constants.SS_NODE_LIST, "node1\nnode2\n")
+
+    for _ in range(3):
+      self.assertEqual(self.sstore.GetClusterName(), "cluster.example.com")
+      self.assertEqual(self._NewStore().GetNodeList(), ["node1", "node2"])
+    self.assertEqual(sorted(self.reads), ["ssconf_cluster_name",
+                                          "ssconf_node_list"])
+
+  def testChangeDetected(self):
+    self._WriteFile(constants.SS_CLUSTER_NAME, "cluster.example.com\n")
+    self.assertEqual(self.sstore.GetClusterName(), "cluster.example.com")
+    self.assertRaises(errors.ConfigurationError, self.sstore.GetMasterNode)
+
+    self._WriteFile(constants.SS_MASTER_NODE, "node1.example.com\n")
+    self.assertEqual(self.sstore.GetMasterNode(), "node1.example.com")
+
+  def testRecentChange(self):
+    utils.WriteFile(self.sstore.KeyToFilename(constants.SS_CLUSTER_NAME),
+                    data="cluster.example.com")
+    self.assertEqual(self.sstore.GetClusterName(), "cluster.example.com")
+    self.assertEqual(self.sstore.GetClusterName(), "cluster.example.com")
+    # The directory changed too recently to rely on its modification time
+    self.assertEqual(self.reads, ["ssconf_cluster_name"] * 2)
+
+  def testWriteFiles(self):
+    self._WriteFile(constants.SS_CLUSTER_TAGS, "a\nb\n")
+    self.assertEqual(self.sstore.GetClusterTags(), ["a", "b"])
+
+    self.sstore.WriteFiles({
+      constants.SS_CLUSTER_TAGS: ["c"],
+      })
+    self.assertEqual(self.sstore.GetClusterTags(), ["c"])
+
+  def testParsedCopies(self):
+    self._WriteFile(constants.SS_SSH_PORTS, "node1=22\nnode2=222\n")
+    ports = self.sstore.GetSshPortMap()
+    self.assertEqual(ports, {"node1": 22, "node2": 222})
+    ports["node3"] = 1
+    self.assertEqual(self.sstore.GetSshPortMap(), {"node1": 22, "node2": 222})
+
+  def testMissingFile(self):
+    self.assertRaises(errors.ConfigurationError, self.sstore.GetClusterName)
+    self.assertEqual(self.sstore.GetPrimaryIPFamily(),
+                     ssconf.netutils.IP4Address.family)
+    self.assertEqual(self.reads, [])
+
+
 class TestVerifyClusterName(unittest.TestCase):
   def setUp(self):
     self.tmpdir = tempfile.mkdtemp()
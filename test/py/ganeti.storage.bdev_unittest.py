@@ -41,6 +41,7 @@ from ganeti import errors
 from ganeti import objects
 from ganeti import utils
 from ganeti.storage import bdev
+from ganeti.storage import lvmcache
 
 import testutils
 
@@ -339,79 +340,89 @@ class TestLogicalVolume(testutils.GanetiTestCase):
                                                attributes="wz--n-", lv_list=[])]
 
 
-  def testParseLvInfoLine(self):
-    """Tests for LogicalVolume._ParseLvInfoLine."""
+  @staticmethod
+  def _ParseLvsLine(line, sep):
+    fields = lvmcache.REPORT_FIELDS[lvmcache.LVS]
+    output = line.replace(sep, "|")
+    (row, ) = lvmcache._ParseReport(lvmcache.LVS, fields, output)
+    return bdev.LogicalVolume._ParseLvInfo(row)
+
+  def testParseLvInfo(self):
+    """Tests for LogicalVolume._ParseLvInfo."""
     broken_lines = [
-      "  toomuch#vg#lv#-wi-ao#253#3#4096.00#2#/dev/abc(20)",
-      "  vg#lv#-wi-ao#253#3#4096.00#/dev/abc(20)",
-      "  vg#lv#-wi-a#253#3#4096.00#2#/dev/abc(20)",
-      "  vg#lv#-wi-ao#25.3#3#4096.00#2#/dev/abc(20)",
-      "  vg#lv#-wi-ao#twenty#3#4096.00#2#/dev/abc(20)",
-      "  vg#lv#-wi-ao#253#3.1#4096.00#2#/dev/abc(20)",
-      "  vg#lv#-wi-ao#253#three#4096.00#2#/dev/abc(20)",
-      "  vg#lv#-wi-ao#253#3#four#2#/dev/abc(20)",
-      "  vg#lv#-wi-ao#253#3#4096..00#2#/dev/abc(20)",
-      "  vg#lv#-wi-ao#253#3#4096.00#2.0#/dev/abc(20)",
-      "  vg#lv#-wi-ao#253#3#4096.00#two#/dev/abc(20)",
-      "  vg#lv#-wi-ao#253#3#4096.00#2#/dev/abc20",
+      "  toomuch#vg#lv#1048576#-wi-ao#253#3#4194304#2#/dev/abc(20)",
+      "  vg#lv#1048576#-wi-ao#253#3#4194304#/dev/abc(20)",
+      "  vg#lv#1048576#-wi-a#253#3#4194304#2#/dev/abc(20)",
+      "  vg#lv#1048576#-wi-ao#25.3#3#4194304#2#/dev/abc(20)",
+      "  vg#lv#1048576#-wi-ao#twenty#3#4194304#2#/dev/abc(20)",
+      "  vg#lv#1048576#-wi-ao#253#3.1#4194304#2#/dev/abc(20)",
+      "  vg#lv#1048576#-wi-ao#253#three#4194304#2#/dev/abc(20)",
+      "  vg#lv#1048576#-wi-ao#253#3#four#2#/dev/abc(20)",
+      "  vg#lv#1048576#-wi-ao#253#3#4194304..00#2#/dev/abc(20)",
+      "  vg#lv#1048576#-wi-ao#253#3#4194304#2.0#/dev/abc(20)",
+      "  vg#lv#1048576#-wi-ao#253#3#4194304#two#/dev/abc(20)",
+      "  vg#lv#1048576#-wi-ao#253#3#4194304#2#/dev/abc20",
       ]
     for broken in broken_lines:
-      self.assertRaises(errors.BlockDeviceError,
-                        bdev.LogicalVolume._ParseLvInfoLine, broken, "#")
+      self.assertRaises(errors.BlockDeviceError, self._ParseLvsLine,
+                        broken, "#")
 
     # Examples of good lines from "lvs":
     #
-    #   /dev/something|-wi-ao|253|3|4096.00|2|/dev/sdb(144),/dev/sdc(0)
-    #   /dev/somethingelse|-wi-a-|253|4|4096.00|1|/dev/sdb(208)
+    #   vg|lv|1073741824|-wi-ao|253|3|4194304|2|/dev/sdb(144),/dev/sdc(0)
+    #   vg|lv2|1073741824|-wi-a-|253|4|4194304|1|/dev/sdb(208)
     true_out = [
-        (("vg", "lv"), ("-wi-ao", 253, 3, 4096.00, 2, ["/dev/abc"])),
-        (("vg", "lv"), ("-wi-a-", 253, 7, 4096.00, 4, ["/dev/abc"])),
-        (("vg", "lv"), ("-ri-a-", 253, 4, 4.00, 5, ["/dev/abc", "/dev/def"])),
-        (("vg", "lv"), ("-wc-ao", 15, 18, 4096.00, 32,
+        (("vg", "lv"), ("-wi-ao", 253, 3, 4096, 2, ["/dev/abc"])),
+        (("vg", "lv"), ("-wi-a-", 253, 7, 4096, 4, ["/dev/abc"])),
+        (("vg", "lv"), ("-ri-a-", 253, 4, 4, 5, ["/dev/abc", "/dev/def"])),
+        (("vg", "lv"), ("-wc-ao", 15, 18, 4096, 32,
                        ["/dev/abc", "/dev/def", "/dev/ghi0"])),
         # Physical devices might be missing with thin volumes
-        (("vg", "lv"), ("twc-ao", 15, 18, 4096.00, 32, [])),
+        (("vg", "lv"), ("twc-ao", 15, 18, 4096, 32, [])),
     ]
     for exp in true_out:
       for sep in "#;|":
         # NB We get lvs to return vg_name and lv_name separately, but
-        # _ParseLvInfoLine returns a pathname built from these, so we
+        # _ParseLvInfo returns a pathname built from these, so we
         # need to do some extra munging to round-trip this properly.
         vg_name, lv_name = exp[0]
         dev = os.environ.get('DM_DEV_DIR', '/dev')
         devpath = os.path.join(dev, vg_name, lv_name)
-        lvs = exp[1]
-        pvs = ",".join("%s(%s)" % (d, i * 12) for (i, d) in enumerate(lvs[-1]))
-        fmt_str = sep.join(("  %s", "%s", "%s", "%d", "%d", "%.2f", "%d", "%s"))
-        lvs_line = fmt_str % ((vg_name, lv_name) + lvs[0:-1] + (pvs,))
-        parsed = bdev.LogicalVolume._ParseLvInfoLine(lvs_line, sep)
+        (status, major, minor, pe_size, stripes, pv_names) = exp[1]
+        pvs = ",".join("%s(%s)" % (d, i * 12) for (i, d) in enumerate(pv_names))
+        fmt_str = sep.join(("  %s", "%s", "%d", "%s", "%d", "%d", "%d", "%d",
+                            "%s"))
+        lvs_line = fmt_str % (vg_name, lv_name, 1024 ** 3, status, major,
+                              minor, pe_size * 1024, stripes, pvs)
+        parsed = self._ParseLvsLine(lvs_line, sep)
         self.assertEqual(parsed, (devpath,) + exp[1:])
 
-
   def testGetLvGlobalInfo(self):
     """Tests for LogicalVolume.GetLvGlobalInfo."""
 
-    good_lines="vg|1|-wi-ao|253|3|4096.00|2|/dev/sda(20)\n" \
-        "vg|2|-wi-ao|253|3|4096.00|2|/dev/sda(21)\n"
+    good_lines="vg|1|1048576|-wi-ao|253|3|4194304|2|/dev/sda(20)\n" \
+        "vg|2|1048576|-wi-ao|253|3|4194304|2|/dev/sda(21)\n"
     expected_output = {"/dev/vg/1": ("-wi-ao", 253, 3, 4096, 2, ["/dev/sda"]),
                        "/dev/vg/2": ("-wi-ao", 253, 3, 4096, 2, ["/dev/sda"])}
 
+    def _Report(success, stdout):
+      cache = lvmcache.LvmCache(_run_cmd_fn=lambda cmd: _FakeRunCmd(success,
+                                                                    stdout,
+                                                                    cmd))
+      return cache.GetReport
+
     self.assertEqual({},
                      bdev.LogicalVolume.GetLvGlobalInfo(
-                         _run_cmd=lambda cmd: _FakeRunCmd(False,
-                                                          "Fake error msg",
-                                                          cmd)))
+                         _get_report_fn=_Report(False, "Fake error msg")))
     self.assertEqual({},
                      bdev.LogicalVolume.GetLvGlobalInfo(
-                         _run_cmd=lambda cmd: _FakeRunCmd(True,
-                                                          "",
-                                                          cmd)))
+                         _get_report_fn=_Report(True, "")))
     self.assertRaises(errors.BlockDeviceError,
                       bdev.LogicalVolume.GetLvGlobalInfo,
-                      _run_cmd=lambda cmd: _FakeRunCmd(True, "BadStdOut", cmd))
+                      _get_report_fn=_Report(True, "BadStdOut"))
 
-    fake_cmd = lambda cmd: _FakeRunCmd(True, good_lines, cmd)
-    good_res = bdev.LogicalVolume.GetLvGlobalInfo(_run_cmd=fake_cmd)
+    good_res = bdev.LogicalVolume.GetLvGlobalInfo(
+      _get_report_fn=_Report(True, good_lines))
     self.assertEqual(expected_output, good_res)
 
   @testutils.patch_object(bdev.LogicalVolume, "Attach")
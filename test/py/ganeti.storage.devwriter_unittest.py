@@ -0,0 +1,208 @@
+#!/usr/bin/python3
+#
+
+# Copyright (C) 2014 Google Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS
+# IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+# TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+# PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+"""Script for unittesting the ganeti.storage.devwriter module"""
+
+import errno
+import os
+import shutil
+import tempfile
+import unittest
+
+from ganeti import errors
+from ganeti.storage import devwriter
+
+import testutils
+
+
+_CHUNK = 4 * devwriter.DIRECT_ALIGNMENT
+
+
+class TestDeviceWriter(unittest.TestCase):
+  def setUp(self):
+    self.tmpdir = tempfile.mkdtemp()
+    self.target = os.path.join(self.tmpdir, "disk")
+    self.data = os.urandom(10 * _CHUNK)
+    with open(self.target, "wb") as fd:
+      fd.write(self.data)
+
+  def tearDown(self):
+    shutil.rmtree(self.tmpdir)
+
+  def _Read(self):
+    with open(self.target, "rb") as fd:
+      return fd.read()
+
+  def _Writer(self, **kwargs):
+    return devwriter.DeviceWriter(self.target, chunk_size=_CHUNK, **kwargs)
+
+  def testOpenMissing(self):
+    self.assertRaises(errors.BlockDeviceError, devwriter.DeviceWriter,
+                      os.path.join(self.tmpdir, "missing"))
+
+  def testZero(self):
+    writer = self._Writer()
+    writer.Zero(2 * _CHUNK, 3 * _CHUNK)
+    (_, written, _) = writer.Close()
+    self.assertEqual(written, 3 * _CHUNK)
+    self.assertEqual(self._Read(),
+                     self.data[:2 * _CHUNK] + bytes(3 * _CHUNK) +
+                     self.data[5 * _CHUNK:])
+
+  def testZeroByWriting(self):
+    writer = self._Writer()
+    # pylint: disable=W0212
+    writer._zero_methods = []
+    writer.Zero(_CHUNK, 2 * _CHUNK + 100)
+    (methods, written, _) = writer.Close()
+    self.assertEqual(methods, devwriter.METHOD_WRITE)
+    self.assertEqual(written, 2 * _CHUNK + 100)
+    self.assertEqual(self._Read(),
+                     self.data[:_CHUNK] + bytes(2 * _CHUNK + 100) +
+                     self.data[3 * _CHUNK + 100:])
+
+  def testZeroUnsupported(self):
+    def _Unsupported(offset, length):
+      raise OSError(errno.EOPNOTSUPP, "Not supported")
+
+    writer = self._Writer()
+    # pylint: disable=W0212
+    writer._zero_methods = [("fake", _Unsupported)]
+    writer.Zero(0, _CHUNK)
+    (methods, _, _) = writer.Close()
+    self.assertEqual(methods, devwriter.METHOD_WRITE)
+    self.assertEqual(self._Read(), bytes(_CHUNK) + self.data[_CHUNK:])
+
+  def testZeroError(self):
+    def _Fail(offset, length):
+      raise OSError(errno.EIO, "I/O error")
+
+    writer = self._Writer()
+    # pylint: disable=W0212
+    writer._zero_methods = [("fake", _Fail)]
+    self.assertRaises(errors.BlockDeviceError, writer.Zero, 0, _CHUNK)
+    writer.Abort()
+    self.assertEqual(self._Read(), self.data)
+
+  def testZeroTruncated(self):
+    writer = self._Writer()
+    writer.Truncate(_CHUNK)
+    writer.Zero(_CHUNK, 2 * _CHUNK)
+    writer.Close()
+    self.assertEqual(self._Read(), self.data[:_CHUNK] + bytes(2 * _CHUNK))
+
+  def testCopyFile(self):
+    source = os.path.join(self.tmpdir, "image")
+    image = os.urandom(2 * _CHUNK + 123)
+    with open(source, "wb") as fd:
+      fd.write(image)
+
+    writer = self._Writer()
+    self.assertEqual(writer.CopyFile(source, 0, 5 * _CHUNK), len(image))
+    (methods, written, _) = writer.Close()
+    self.assertEqual(methods, devwriter.METHOD_WRITE)
+    self.assertEqual(written, len(image))
+    self.assertEqual(self._Read(), image + self.data[len(image):])
+
+  def testCopyFileLimit(self):
+    source = os.path.join(self.tmpdir, "image")
+    image = os.urandom(3 * _CHUNK)
+    with open(source, "wb") as fd:
+      fd.write(image)
+
+    writer = self._Writer()
+    self.assertEqual(writer.CopyFile(source, _CHUNK, _CHUNK), _CHUNK)
+    writer.Close()
+    self.assertEqual(self._Read(),
+                     self.data[:_CHUNK] + image[:_CHUNK] +
+                     self.data[2 * _CHUNK:])
+
+  def testCopyFileMissing(self):
+    writer = self._Writer()
+    self.assertRaises(errors.BlockDeviceError, writer.CopyFile,
+                      os.path.join(self.tmpdir, "missing"), 0, _CHUNK)
+    writer.Abort()
+
+  def testZeroAfterCopy(self):
+    source = os.path.join(self.tmpdir, "image")
+    with open(source, "wb") as fd:
+      fd.write(os.urandom(_CHUNK))
+
+    writer = self._Writer()
+    # pylint: disable=W0212
+    writer._zero_methods = []
+    writer.CopyFile(source, 0, _CHUNK)
+    writer.Zero(_CHUNK, _CHUNK)
+    writer.Close()
+    self.assertEqual(self._Read()[_CHUNK:2 * _CHUNK], bytes(_CHUNK))
+
+  def testStream(self):
+    image = os.urandom(3 * _CHUNK + 17)
+    writer = self._Writer()
+    writer.BeginStream(0, 5 * _CHUNK)
+    for pos in range(0, len(image), 1000):
+      self.assertTrue(writer.Feed(image[pos:pos + 1000]))
+    self.assertEqual(writer.EndStream(), len(image))
+    (_, written, _) = writer.Close()
+    self.assertEqual(written, len(image))
+    self.assertEqual(self._Read(), image + self.data[len(image):])
+
+  def testStreamLimit(self):
+    writer = self._Writer()
+    writer.BeginStream(0, _CHUNK)
+    self.assertTrue(writer.Feed(bytes(_CHUNK - 10)))
+    self.assertFalse(writer.Feed(bytes(11)))
+    self.assertTrue(writer.Feed(bytes(10)))
+    self.assertEqual(writer.EndStream(), _CHUNK)
+    writer.Close()
+
+  def testProgress(self):
+    now = [0.0]
+    reports = []
+
+    def _Time():
+      now[0] += 4
+      return now[0]
+
+    writer = self._Writer(progress_fn=lambda done, total:
+                            reports.append((done, total)),
+                          _time_fn=_Time)
+    # pylint: disable=W0212
+    writer._zero_methods = []
+    writer.Zero(0, 8 * _CHUNK)
+    writer.Close()
+
+    self.assertTrue(len(reports) > 1)
+    self.assertEqual(reports[-1], (8 * _CHUNK, 8 * _CHUNK))
+    self.assertEqual(reports, sorted(reports))
+
+
+if __name__ == "__main__":
+  testutils.GanetiTestProgram()
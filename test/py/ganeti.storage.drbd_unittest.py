@@ -435,6 +435,104 @@ class TestDRBD8Status(testutils.GanetiTestCase):
                       filename=self.proc80ev_data)
 
 
+class TestDRBD8SyncWatcher(testutils.GanetiTestCase):
+  """Testing case for DRBD8SyncWatcher"""
+
+  # (is_degraded, ldisk_status) of the minors in proc_drbd84_sync.txt
+  _STANDALONE = (True, constants.LDS_OKAY)
+  _SYNC = (True, constants.LDS_OKAY)
+  _IN_SYNC = (False, constants.LDS_OKAY)
+
+  def setUp(self):
+    testutils.GanetiTestCase.setUp(self)
+    self.proc_data = \
+      testutils.ReadTestData("proc_drbd84_sync.txt").splitlines()
+    self.infos = []
+    self.now = 0.0
+    self.sleeps = []
+
+  def _MakeInfo(self, percent=None, cstatus=None):
+    lines = self.proc_data
+    if percent is not None:
+      lines = [line.replace("68.5%", "%.1f%%" % percent) for line in lines]
+    if cstatus is not None:
+      lines = [line.replace("cs:SyncSource", "cs:%s" % cstatus)
+               for line in lines]
+    return drbd.DRBD8Info.CreateFromLines(lines)
+
+  def _Info(self):
+    if len(self.infos) > 1:
+      return self.infos.pop(0)
+    return self.infos[0]
+
+  def _Time(self):
+    return self.now
+
+  def _Sleep(self, duration):
+    self.sleeps.append(duration)
+    self.now += duration
+
+  def _GetWatcher(self, minors):
+    return drbd.DRBD8SyncWatcher(minors, _info_fn=self._Info,
+                                 _time_fn=self._Time, _sleep_fn=self._Sleep)
+
+  def testPoll(self):
+    self.infos = [self._MakeInfo()]
+    result = self._GetWatcher([0, 5, 7]).Poll()
+    self.assertEqual(sorted(result.keys()), [0, 5])
+    self.assertAlmostEqual(result[5].sync_percent, 68.5)
+
+  def testNoMinors(self):
+    self.assertFalse(self._GetWatcher([]).Wait([], [], 5.0, 10))
+    self.assertEqual(self.sleeps, [10])
+
+  def testKnownProgressChanged(self):
+    # The master last saw 50%, the device is already at 68.5%
+    self.infos = [self._MakeInfo()]
+    self.assertTrue(self._GetWatcher([5]).Wait([50.0], [self._SYNC], 5.0, 10))
+    self.assertEqual(self.sleeps, [])
+
+  def testKnownStateChanged(self):
+    # The minor was connected when the master looked at it last and lost
+    # its peer before the wait started
+    self.infos = [self._MakeInfo()]
+    self.assertTrue(self._GetWatcher([0]).Wait([None], [self._IN_SYNC],
+                                               5.0, 10))
+    self.assertEqual(self.sleeps, [])
+
+  def testUnknownState(self):
+    self.infos = [self._MakeInfo(), self._MakeInfo(percent=70.1)]
+    self.assertTrue(self._GetWatcher([5]).Wait([68.5], [None], 5.0, 10))
+    self.assertEqual(self.sleeps, [0.5])
+
+  def testTimeout(self):
+    self.infos = [self._MakeInfo(), self._MakeInfo(percent=69.5)]
+    watcher = self._GetWatcher([0, 5])
+    self.assertFalse(watcher.Wait([None, 68.5], [self._STANDALONE, self._SYNC],
+                                  5.0, 10))
+    self.assertEqual(len(self.sleeps), 20)
+    self.assertAlmostEqual(sum(self.sleeps), 10)
+
+  def testProgressStep(self):
+    self.infos = [self._MakeInfo(), self._MakeInfo(percent=69.9),
+                  self._MakeInfo(percent=70.1)]
+    watcher = self._GetWatcher([0, 5])
+    self.assertTrue(watcher.Wait([None, 68.5], [self._STANDALONE, self._SYNC],
+                                 5.0, 10))
+    self.assertEqual(self.sleeps, [0.5, 0.5])
+
+  def testSyncFinished(self):
+    self.infos = [self._MakeInfo(), self._MakeInfo(cstatus="Connected")]
+    self.assertTrue(self._GetWatcher([5]).Wait([68.5], [self._SYNC], 5.0, 10))
+    self.assertEqual(self.sleeps, [0.5])
+
+  def testMinorDisappeared(self):
+    self.infos = [self._MakeInfo(),
+                  drbd.DRBD8Info.CreateFromLines(self.proc_data[:5])]
+    self.assertTrue(self._GetWatcher([5]).Wait([68.5], [self._SYNC], 5.0, 10))
+    self.assertEqual(self.sleeps, [0.5])
+
+
 class TestDRBD8Construction(testutils.GanetiTestCase):
 
   def setUp(self):
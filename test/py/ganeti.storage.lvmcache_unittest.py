@@ -0,0 +1,217 @@
+#!/usr/bin/python3
+#
+
+# Copyright (C) 2014 Google Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS
+# IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+# TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+# PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+"""Script for unittesting the ganeti.storage.lvmcache module"""
+
+import unittest
+
+from ganeti import errors
+from ganeti import utils
+from ganeti.storage import bdev
+from ganeti.storage import container
+from ganeti.storage import lvmcache
+
+import testutils
+
+
+_LVS_OUTPUT = \
+  "  xenvg|inst1.disk0|21474836480|-wi-ao|253|0|4194304|1|/dev/sda5(0)\n" \
+  "  xenvg|inst1.disk1|1073741824|-wi-a-|253|1|4194304|1|/dev/sda5(5120)\n"
+
+_PVS_OUTPUT = \
+  "  /dev/sda5|xenvg|107374182400|22548578304|84825604096|a--|inst1.disk0\n" \
+  "  /dev/sda5|xenvg|107374182400|22548578304|84825604096|a--|inst1.disk1\n" \
+  "  /dev/sda5|xenvg|107374182400|22548578304|84825604096|a--|\n" \
+  "  /dev/sdb1|xenvg|53687091200|0|53687091200|u--|\n"
+
+_VGS_OUTPUT = "  xenvg|161061273600|138512695296|wz--n-\n"
+
+
+class _FakeLvm(object):
+  def __init__(self):
+    self.outputs = {
+      lvmcache.LVS: _LVS_OUTPUT,
+      lvmcache.PVS: _PVS_OUTPUT,
+      lvmcache.VGS: _VGS_OUTPUT,
+      }
+    self.calls = []
+    self.now = 1000.0
+
+  def RunCmd(self, cmd):
+    self.calls.append(cmd[0])
+    output = self.outputs[cmd[0]]
+    if output is None:
+      return utils.RunResult(5, None, "", "Fake failure", cmd, None, None)
+    return utils.RunResult(0, None, output, "", cmd, None, None)
+
+  def Time(self):
+    return self.now
+
+
+class TestLvmCache(unittest.TestCase):
+  def setUp(self):
+    self.lvm = _FakeLvm()
+    self.cache = lvmcache.LvmCache(ttl=10, _run_cmd_fn=self.lvm.RunCmd,
+                                   _time_fn=self.lvm.Time)
+
+  def testParse(self):
+    rows = self.cache.GetReport(lvmcache.LVS)
+    self.assertEqual(len(rows), 2)
+    self.assertEqual(rows[0]["lv_name"], "inst1.disk0")
+    self.assertEqual(rows[0]["lv_size"], 20480.0)
+    self.assertEqual(rows[0]["vg_extent_size"], 4.0)
+    self.assertEqual(rows[1]["devices"], "/dev/sda5(5120)")
+
+    (vg, ) = self.cache.GetReport(lvmcache.VGS)
+    self.assertEqual(vg, {"vg_name": "xenvg", "vg_size": 153600.0,
+                          "vg_free": 132096.0, "vg_attr": "wz--n-"})
+
+  def testParseTrailingSeparator(self):
+    self.lvm.outputs[lvmcache.VGS] = "  xenvg|1048576|0|wz--n-|\n"
+    (vg, ) = self.cache.GetReport(lvmcache.VGS)
+    self.assertEqual(vg["vg_attr"], "wz--n-")
+
+  def testParseError(self):
+    for output in ["xenvg|1048576\n", "xenvg|big|0|wz--n-\n"]:
+      self.lvm.outputs[lvmcache.VGS] = output
+      self.cache.Invalidate()
+      self.assertRaises(errors.BlockDeviceError, self.cache.GetReport,
+                        lvmcache.VGS)
+
+  def testCommandFailure(self):
+    self.lvm.outputs[lvmcache.LVS] = None
+    self.assertRaises(errors.CommandError, self.cache.GetReport, lvmcache.LVS)
+    self.assertRaises(errors.CommandError, self.cache.GetReport, lvmcache.LVS)
+    self.assertEqual(self.lvm.calls, [lvmcache.LVS, lvmcache.LVS])
+
+  def testCaching(self):
+    first = self.cache.GetReport(lvmcache.LVS)
+    self.lvm.now += 9
+    self.assertTrue(self.cache.GetReport(lvmcache.LVS) is first)
+    self.cache.GetReport(lvmcache.PVS)
+    self.assertEqual(self.lvm.calls, [lvmcache.LVS, lvmcache.PVS])
+
+    self.lvm.now += 2
+    self.assertFalse(self.cache.GetReport(lvmcache.LVS) is first)
+    self.assertEqual(self.lvm.calls,
+                     [lvmcache.LVS, lvmcache.PVS, lvmcache.LVS])
+
+  def testInvalidate(self):
+    self.cache.GetReport(lvmcache.LVS)
+    self.cache.GetReport(lvmcache.VGS)
+    self.cache.Invalidate()
+    self.cache.GetReport(lvmcache.LVS)
+    self.cache.GetReport(lvmcache.VGS)
+    self.assertEqual(self.lvm.calls, [lvmcache.LVS, lvmcache.VGS] * 2)
+
+  def testInvalidateWhileRunning(self):
+    run_cmd = self.lvm.RunCmd
+
+    def _RunCmd(cmd):
+      result = run_cmd(cmd)
+      self.cache.Invalidate()
+      return result
+
+    self.cache._run_cmd_fn = _RunCmd
+    self.cache.GetReport(lvmcache.LVS)
+    self.cache._run_cmd_fn = run_cmd
+    self.cache.GetReport(lvmcache.LVS)
+    self.assertEqual(self.lvm.calls, [lvmcache.LVS, lvmcache.LVS])
+
+  def testInvalidatesCache(self):
+    calls = []
+
+    @lvmcache.InvalidatesCache
+    def _Modify(value):
+      calls.append(value)
+      if value is None:
+        raise errors.CommandError("Failed")
+      return value
+
+    generation = lvmcache._CACHE._generation
+    self.assertEqual(_Modify(1), 1)
+    self.assertRaises(errors.CommandError, _Modify, None)
+    self.assertEqual(calls, [1, None])
+    self.assertEqual(lvmcache._CACHE._generation, generation + 2)
+
+
+class TestLvmUsers(unittest.TestCase):
+  def setUp(self):
+    self.lvm = _FakeLvm()
+    self.cache = lvmcache.LvmCache(_run_cmd_fn=self.lvm.RunCmd)
+    self._get_report = lvmcache.GetReport
+    lvmcache.GetReport = self.cache.GetReport
+
+  def tearDown(self):
+    lvmcache.GetReport = self._get_report
+
+  def testListPvs(self):
+    fields = ["name", "size", "free", "allocatable"]
+    self.assertEqual(container.LvmPvStorage().List(None, fields),
+                     [["/dev/sda5", 102400, 80896, True],
+                      ["/dev/sdb1", 51200, 51200, False]])
+    self.assertEqual(container.LvmPvStorage().List("/dev/sdb1", ["name"]),
+                     [["/dev/sdb1"]])
+    self.assertRaises(errors.StorageError, container.LvmPvStorage().List,
+                      "/dev/sdc", ["name"])
+    self.assertEqual(self.lvm.calls, [lvmcache.PVS])
+
+  def testListVgs(self):
+    fields = ["name", "size", "used"]
+    self.assertEqual(container.LvmVgStorage().List(None, fields),
+                     [["xenvg", 153600, 21504]])
+
+  def testGetPVInfo(self):
+    pvs = bdev.LogicalVolume.GetPVInfo(["xenvg"])
+    self.assertEqual([(pv.name, pv.size, pv.free, pv.lv_list) for pv in pvs],
+                     [("/dev/sda5", 102400.0, 80896.0, [])])
+    pvs = bdev.LogicalVolume.GetPVInfo([], filter_allocatable=False,
+                                       include_lvs=True)
+    self.assertEqual([(pv.name, pv.lv_list) for pv in pvs],
+                     [("/dev/sda5", ["inst1.disk0", "inst1.disk1"]),
+                      ("/dev/sdb1", [])])
+    self.assertEqual(self.lvm.calls, [lvmcache.PVS])
+
+  def testGetVGInfo(self):
+    self.assertEqual(bdev.LogicalVolume.GetVGInfo(["xenvg"], False),
+                     [(132096.0, 153600.0, "xenvg")])
+    self.assertEqual(bdev.LogicalVolume.GetVGInfo(["other"], False), [])
+    self.lvm.outputs[lvmcache.VGS] = None
+    self.cache.Invalidate()
+    self.assertEqual(bdev.LogicalVolume.GetVGInfo([], False), None)
+
+  def testListFailure(self):
+    self.lvm.outputs[lvmcache.VGS] = None
+    self.assertRaises(errors.StorageError, container.LvmVgStorage().List,
+                      None, ["name"])
+
+
+if __name__ == "__main__":
+  testutils.GanetiTestProgram()
@@ -32,7 +32,9 @@
 
 import unittest
 
+from ganeti import compat
 from ganeti import constants
+from ganeti import serializer
 from ganeti.tools import burnin
 
 import testutils
@@ -48,5 +50,118 @@ class TestConstants(unittest.TestCase):
     self.assertEqual(burnin._SUPPORTED_DISK_TEMPLATES, supported)
 
 
+class TestPercentile(unittest.TestCase):
+  def test(self):
+    fn = burnin._Percentile
+    self.assertEqual(fn([3.0], 50), 3.0)
+    self.assertEqual(fn([3.0], 99), 3.0)
+
+    values = list(range(100, 0, -1))
+    self.assertEqual(fn(values, 50), 50)
+    self.assertEqual(fn(values, 95), 95)
+    self.assertEqual(fn(values, 99), 99)
+    self.assertEqual(fn(values, 100), 100)
+    self.assertEqual(fn(values, 0), 1)
+
+    self.assertEqual(fn([1, 2, 3, 4], 50), 2)
+    self.assertEqual(fn([1, 2, 3, 4], 95), 4)
+
+
+class TestBenchmarkRecorder(unittest.TestCase):
+  def test(self):
+    recorder = burnin._BenchmarkRecorder()
+    self.assertEqual(recorder.GetStats(None), [])
+
+    # Job with two opcodes
+    recorder.AddJob(["OP_A", "OP_B"], (100, 0),
+                    [(101, 0), (106, 0)],
+                    [(103, 0), (106, 500000)],
+                    [(105, 0), (110, 0)])
+    # Job whose second opcode didn't run
+    recorder.AddJob(["OP_A", "OP_B"], (200, 0),
+                    [(200, 0), None],
+                    [(200, 0), None],
+                    [(202, 0), None])
+    # Job without timestamps
+    recorder.AddJob(["OP_A"], None, [None], [None], [None])
+
+    stats = dict(((entry["opcode"], entry["phase"]), entry)
+                 for entry in recorder.GetStats(4))
+
+    self.assertEqual(len(stats), 8)
+    self.assertTrue(compat.all(entry["concurrency"] == 4
+                               for entry in stats.values()))
+
+    self.assertEqual(stats[("OP_A", "queue")]["count"], 2)
+    self.assertEqual(stats[("OP_A", "queue")]["p99"], 1.0)
+    self.assertEqual(stats[("OP_A", "queue")]["p50"], 0.0)
+    self.assertEqual(stats[("OP_A", "lock")]["p99"], 2.0)
+    self.assertEqual(stats[("OP_A", "exec")]["p50"], 2.0)
+    self.assertEqual(stats[("OP_A", "total")]["p99"], 5.0)
+
+    # The second opcode is queued from the end of the first one
+    self.assertEqual(stats[("OP_B", "queue")]["count"], 1)
+    self.assertEqual(stats[("OP_B", "queue")]["p50"], 1.0)
+    self.assertEqual(stats[("OP_B", "lock")]["p50"], 0.5)
+    self.assertEqual(stats[("OP_B", "exec")]["p50"], 3.5)
+    self.assertEqual(stats[("OP_B", "total")]["p50"], 5.0)
+
+    self.assertEqual([(entry["opcode"], entry["phase"])
+                      for entry in recorder.GetStats(4)],
+                     [(op_id, phase)
+                      for op_id in ["OP_A", "OP_B"]
+                      for phase in burnin._BENCHMARK_PHASES])
+
+
+class TestBenchmarkResults(unittest.TestCase):
+  _RESULTS = [
+    {"concurrency": 1, "opcode": "OP_INSTANCE_CREATE", "phase": "total",
+     "count": 3, "p50": 10.0, "p95": 12.0, "p99": 12.5},
+    {"concurrency": 1, "opcode": "OP_INSTANCE_REMOVE", "phase": "lock",
+     "count": 3, "p50": 0.01, "p95": 0.02, "p99": 0.02},
+    ]
+
+  def testJson(self):
+    data = burnin._FormatBenchmarkResults("json", {"nodes": 1},
+                                          self._RESULTS)
+    self.assertEqual(serializer.LoadJson(data), {
+      "parameters": {"nodes": 1},
+      "results": self._RESULTS,
+      })
+
+  def testCsv(self):
+    data = burnin._FormatBenchmarkResults("csv", {}, self._RESULTS)
+    self.assertEqual(data.splitlines(), [
+      "concurrency,opcode,phase,count,p50,p95,p99",
+      "1,OP_INSTANCE_CREATE,total,3,10.0,12.0,12.5",
+      "1,OP_INSTANCE_REMOVE,lock,3,0.01,0.02,0.02",
+      ])
+
+  def testCompare(self):
+    fn = burnin._CompareBenchmarkResults
+
+    self.assertEqual(fn(self._RESULTS, self._RESULTS, 20), [])
+    self.assertEqual(fn([], self._RESULTS, 20), [])
+
+    current = [dict(entry) for entry in self._RESULTS]
+    # Within tolerance
+    current[0]["p50"] = 11.9
+    # Above tolerance, but too small to matter
+    current[1]["p95"] = 0.08
+    self.assertEqual(fn(self._RESULTS, current, 20), [])
+
+    current[0]["p99"] = 16.0
+    regressions = fn(self._RESULTS, current, 20)
+    self.assertEqual(len(regressions), 1)
+    self.assertTrue("OP_INSTANCE_CREATE/total" in regressions[0])
+    self.assertTrue("p99" in regressions[0])
+    self.assertEqual(fn(self._RESULTS, current, 50), [])
+
+    # Results of other concurrency levels aren't compared
+    for entry in current:
+      entry["concurrency"] = 2
+    self.assertEqual(fn(self._RESULTS, current, 20), [])
+
+
 if __name__ == "__main__":
   testutils.GanetiTestProgram()
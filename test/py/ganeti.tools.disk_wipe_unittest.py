@@ -0,0 +1,237 @@
+#!/usr/bin/python3
+#
+
+# Copyright (C) 2014 Google Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS
+# IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+# TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+# PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+"""Script for testing ganeti.tools.disk_wipe"""
+
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+from ganeti import constants
+from ganeti import objects
+from ganeti import serializer
+from ganeti import utils
+from ganeti.tools import disk_wipe
+
+import testutils
+
+
+def _MakeDisks(*args):
+  return [{
+    "path": "/dev/disk%s" % idx,
+    "group": group,
+    "offset": offset,
+    "size": size,
+    } for (idx, (group, offset, size)) in enumerate(args)]
+
+
+class TestStatusFile(unittest.TestCase):
+  def setUp(self):
+    self.tmpdir = tempfile.mkdtemp()
+    self.path = utils.PathJoin(self.tmpdir, "status")
+
+  def tearDown(self):
+    shutil.rmtree(self.tmpdir)
+
+  def _Read(self):
+    return objects.DiskWipeStatus.FromDict(
+      serializer.LoadJson(utils.ReadFile(self.path)))
+
+  def testProgress(self):
+    now = [100.0]
+    disks = _MakeDisks(("vg", 0, 1000), ("vg", 500, 1500))
+    status = disk_wipe.StatusFile(self.path, disks, _time_fn=lambda: now[0])
+
+    status.Update(False)
+    data = self._Read()
+    self.assertEqual(data.ctime, 100.0)
+    self.assertTrue(data.progress_percent is None)
+    self.assertTrue(data.exit_status is None)
+    self.assertEqual([i["offset"] for i in data.disks], [0, 500])
+
+    now[0] += 10.0
+    status.SetOffset(0, 500)
+    status.Update(False)
+    data = self._Read()
+    self.assertEqual(data.disks[0]["offset"], 500)
+    self.assertEqual(data.progress_percent, 25.0)
+    self.assertEqual(data.progress_eta, 30.0)
+
+    # Not written again within the minimum interval
+    now[0] += 1.0
+    status.SetOffset(1, 1500)
+    status.Update(False)
+    self.assertEqual(self._Read().disks[1]["offset"], 500)
+
+    status.SetDone(1, "zeroout")
+    status.SetExitStatus(0, None)
+    status.Update(True)
+    data = self._Read()
+    self.assertEqual(data.disks[1], {
+      "offset": 1500,
+      "size": 1500,
+      "methods": "zeroout",
+      "error": None,
+      })
+    self.assertEqual(data.exit_status, 0)
+    self.assertEqual(status.GetData().exit_status, 0)
+
+
+class _FakeWiper:
+  def __init__(self, fail=frozenset()):
+    self._fail = fail
+    self._lock = threading.Lock()
+    self._active = {}
+    self.max_active = {}
+    self.wiped = []
+
+  def __call__(self, path, offset, size, set_offset_fn, stop_event):
+    group = os.path.basename(path)[:-1]
+
+    with self._lock:
+      self._active[group] = self._active.get(group, 0) + 1
+      self.max_active[group] = max(self.max_active.get(group, 0),
+                                   self._active[group])
+
+    try:
+      time.sleep(0.01)
+
+      if path in self._fail:
+        raise EnvironmentError("Wiping %s failed" % path)
+
+      set_offset_fn(size)
+
+      with self._lock:
+        self.wiped.append(path)
+    finally:
+      with self._lock:
+        self._active[group] -= 1
+
+    return "write"
+
+
+class TestWipeDisks(unittest.TestCase):
+  def setUp(self):
+    self.tmpdir = tempfile.mkdtemp()
+    self.path = utils.PathJoin(self.tmpdir, "status")
+
+  def tearDown(self):
+    shutil.rmtree(self.tmpdir)
+
+  @staticmethod
+  def _MakeGroupDisks(groups):
+    disks = []
+    for (group, count) in groups:
+      for idx in range(count):
+        disks.append({
+          "path": "/dev/%s%s" % (group, idx),
+          "group": group,
+          "offset": 0,
+          "size": 100,
+          })
+    return disks
+
+  def testParallel(self):
+    disks = self._MakeGroupDisks([("a", 5), ("b", 1), ("c", 3)])
+    status = disk_wipe.StatusFile(self.path, disks)
+    wiper = _FakeWiper()
+
+    self.assertTrue(disk_wipe.WipeDisks(status, disks, 2, _wipe_fn=wiper))
+
+    self.assertEqual(sorted(wiper.wiped), sorted(d["path"] for d in disks))
+    for (group, max_active) in wiper.max_active.items():
+      self.assertTrue(max_active <= 2, msg=group)
+
+    data = status.GetData()
+    self.assertEqual([i["offset"] for i in data.disks], [100] * len(disks))
+    self.assertEqual([i["methods"] for i in data.disks], ["write"] * len(disks))
+    self.assertEqual(data.progress_percent, 100.0)
+
+  def testFailure(self):
+    disks = self._MakeGroupDisks([("a", 3)])
+    status = disk_wipe.StatusFile(self.path, disks)
+    wiper = _FakeWiper(fail=frozenset(["/dev/a0"]))
+
+    self.assertFalse(disk_wipe.WipeDisks(status, disks, 1, _wipe_fn=wiper))
+
+    # No further disks were started after the failure
+    self.assertEqual(wiper.wiped, [])
+
+    data = status.GetData()
+    self.assertEqual(data.disks[0]["error"], "Wiping /dev/a0 failed")
+    self.assertEqual([i["offset"] for i in data.disks], [0, 0, 0])
+    self.assertEqual(self._ReadStatus().disks[0]["error"],
+                     "Wiping /dev/a0 failed")
+
+  def _ReadStatus(self):
+    return objects.DiskWipeStatus.FromDict(
+      serializer.LoadJson(utils.ReadFile(self.path)))
+
+
+class TestWipeDisk(unittest.TestCase):
+  def setUp(self):
+    self.tmpdir = tempfile.mkdtemp()
+    self.path = utils.PathJoin(self.tmpdir, "disk")
+
+  def tearDown(self):
+    shutil.rmtree(self.tmpdir)
+
+  def testFile(self):
+    mib = constants.DD_BLOCK_SIZE
+    utils.WriteFile(self.path, data=b"x" * (3 * mib))
+
+    offsets = []
+    methods = disk_wipe._WipeDisk(self.path, 1, 4, offsets.append,
+                                  threading.Event())
+    self.assertTrue(methods)
+    self.assertEqual(offsets, [4])
+
+    data = utils.ReadBinaryFile(self.path)
+    self.assertEqual(len(data), 4 * mib)
+    self.assertEqual(data[:mib], b"x" * mib)
+    self.assertEqual(data[mib:], bytes(3 * mib))
+
+  def testStopped(self):
+    utils.WriteFile(self.path, data=b"x" * constants.DD_BLOCK_SIZE)
+
+    stop_event = threading.Event()
+    stop_event.set()
+
+    offsets = []
+    self.assertTrue(disk_wipe._WipeDisk(self.path, 0, 1, offsets.append,
+                                        stop_event) is None)
+    self.assertEqual(offsets, [])
+
+
+if __name__ == "__main__":
+  testutils.GanetiTestProgram()
@@ -0,0 +1,172 @@
+#!/usr/bin/python3
+#
+
+# Copyright (C) 2014 Google Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS
+# IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+# TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+# PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+"""Script for testing ganeti.watcher"""
+
+import threading
+import unittest
+
+from ganeti import constants
+from ganeti import watcher
+
+import testutils
+
+
+_GROUP1 = "98c8f99b-6f2e-4d47-9b1a-6b1a3f5bd5b9"
+_GROUP2 = "1b3c4a5e-3b0f-4f8e-8b1e-7d2c9a0f6e21"
+_GROUP3 = "c7d6e5f4-1a2b-4c3d-9e8f-0a1b2c3d4e5f"
+
+
+class _QueryResult(object):
+  def __init__(self, rows):
+    self.data = [[(constants.RS_NORMAL, value) for value in row]
+                 for row in rows]
+
+
+class _FakeQueryClient(object):
+  def __init__(self):
+    self.queries = []
+
+  def Query(self, what, fields, qfilter):
+    self.queries.append((what, qfilter))
+
+    if what == constants.QR_LOCK:
+      return _QueryResult([["instance/inst1", "exclusive"],
+                           ["instance/inst2", None],
+                           ["node/node1", "shared"]])
+
+    if what == constants.QR_INSTANCE:
+      self.assertFields(fields, watcher._INSTANCE_FIELDS)
+      return _QueryResult([
+        ["inst1", constants.INSTST_RUNNING, constants.ADMINST_UP, "admin",
+         True, ["node2"], [_GROUP1], constants.DT_DRBD8, _GROUP1],
+        ["inst2", constants.INSTST_ERRORDOWN, constants.ADMINST_UP, "admin",
+         True, [], [], constants.DT_PLAIN, _GROUP2],
+        ["split", constants.INSTST_RUNNING, constants.ADMINST_UP, "admin",
+         True, ["node3"], [_GROUP2], constants.DT_DRBD8, _GROUP1],
+        ["unknown", constants.INSTST_RUNNING, constants.ADMINST_UP, "admin",
+         True, [], [], constants.DT_PLAIN, "unknown-group"],
+        ])
+
+    if what == constants.QR_NODE:
+      self.assertFields(fields, watcher._NODE_FIELDS)
+      return _QueryResult([
+        ["node1", "boot1", False, _GROUP1],
+        ["node2", "boot2", False, _GROUP1],
+        ["node3", None, True, _GROUP2],
+        ])
+
+    raise AssertionError("Unexpected query %s" % what)
+
+  @staticmethod
+  def assertFields(fields, expected):
+    assert fields == expected
+
+
+class TestGetAllGroupData(unittest.TestCase):
+  def test(self):
+    qcl = _FakeQueryClient()
+    result = watcher._GetAllGroupData(qcl, [_GROUP1, _GROUP2, _GROUP3])
+
+    self.assertEqual(qcl.queries, [
+      (constants.QR_LOCK, None),
+      (constants.QR_INSTANCE, None),
+      (constants.QR_NODE, None),
+      ])
+    self.assertEqual(sorted(result), sorted([_GROUP1, _GROUP2, _GROUP3]))
+
+    (nodes, instances, locks) = result[_GROUP1]
+    self.assertEqual(sorted(nodes), ["node1", "node2"])
+    self.assertEqual(sorted(instances), ["inst1"])
+    self.assertEqual(nodes["node2"].secondaries, set(["inst1"]))
+    self.assertEqual(nodes["node1"].secondaries, set())
+    self.assertEqual(locks, set(["inst1"]))
+
+    (nodes, instances, _) = result[_GROUP2]
+    self.assertEqual(sorted(nodes), ["node3"])
+    self.assertTrue(nodes["node3"].offline)
+    self.assertEqual(sorted(instances), ["inst2"])
+    self.assertEqual(instances["inst2"].status, constants.INSTST_ERRORDOWN)
+
+    self.assertEqual(result[_GROUP3], ({}, {}, set(["inst1"])))
+
+  def testSingleGroup(self):
+    qcl = _FakeQueryClient()
+    (nodes, instances, locks) = watcher._GetGroupData(qcl, _GROUP1)
+
+    self.assertEqual([what for (what, _) in qcl.queries],
+                     [constants.QR_LOCK, constants.QR_INSTANCE,
+                      constants.QR_NODE])
+    self.assertTrue(qcl.queries[1][1])
+    self.assertTrue(qcl.queries[2][1])
+    self.assertEqual(locks, set(["inst1"]))
+    self.assertTrue("split" not in instances)
+
+
+class TestWatchAllGroups(unittest.TestCase):
+  def test(self):
+    groups = [_GROUP1, _GROUP2, _GROUP3]
+    status = {}
+    merged = []
+    watched = {}
+    lock = threading.Lock()
+
+    def _UpdateInstanceStatus(filename, instances):
+      status[filename] = sorted(inst.name for inst in instances)
+
+    def _MergeInstanceStatus(filename, pergroup_filename, known_groups):
+      self.assertEqual(len(status), len(groups))
+      merged.append(known_groups)
+
+    def _WatchGroup(opts, group_uuid, group_data):
+      with lock:
+        self.assertFalse(group_uuid in watched)
+        watched[group_uuid] = sorted(group_data[1])
+
+    with testutils.patch_object(watcher, "_LoadKnownGroups",
+                                lambda: groups), \
+         testutils.patch_object(watcher, "_UpdateInstanceStatus",
+                                _UpdateInstanceStatus), \
+         testutils.patch_object(watcher, "_MergeInstanceStatus",
+                                _MergeInstanceStatus), \
+         testutils.patch_object(watcher, "_WatchGroup", _WatchGroup):
+      watcher._WatchAllGroups(NotImplemented, _FakeQueryClient())
+
+    self.assertEqual(merged, [groups])
+    self.assertEqual(watched, {
+      _GROUP1: ["inst1"],
+      _GROUP2: ["inst2"],
+      _GROUP3: [],
+      })
+    self.assertEqual(sorted(status.values()), [[], ["inst1"], ["inst2"]])
+
+
+if __name__ == "__main__":
+  testutils.GanetiTestProgram()
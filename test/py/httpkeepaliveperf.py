@@ -0,0 +1,151 @@
+#!/usr/bin/python3
+#
+
+# Copyright (C) 2014 Google Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS
+# IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+# TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+# PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+
+
+"""Script for measuring node daemon requests with and without keep-alive.
+
+An HTTP server with a pool of worker processes is started on the loopback
+interface, once closing every connection after a single request and once
+keeping idle connections open. A number of SSL requests are then sent
+through a L{ganeti.http.client.HttpClientPool}, one after another like the
+RPC calls made by a logical unit, and the time per request is measured.
+
+"""
+
+import os
+import time
+import shutil
+import optparse
+import tempfile
+
+import pycurl
+
+from ganeti import http
+from ganeti import utils
+
+import ganeti.http.client
+import ganeti.http.server
+
+
+def ParseOptions():
+  """Parses the command line options.
+
+  In case of command line errors, it will show the usage and exit the
+  program.
+
+  @return: the options in a tuple
+
+  """
+  parser = optparse.OptionParser()
+  parser.add_option("-n", dest="requests", default=200, type="int",
+                    help="Number of requests", metavar="NUM")
+  parser.add_option("-w", dest="workers", default=4, type="int",
+                    help="Number of worker processes", metavar="NUM")
+  parser.add_option("-t", dest="keep_alive_timeout", default=2.0,
+                    type="float", help="Keep-alive timeout in seconds",
+                    metavar="SECONDS")
+
+  (opts, args) = parser.parse_args()
+
+  if opts.requests < 1:
+    parser.error("Number of requests must be at least 1")
+
+  if opts.workers < 1:
+    parser.error("Number of worker processes must be at least 1")
+
+  if opts.keep_alive_timeout <= 0:
+    parser.error("Keep-alive timeout must be positive")
+
+  return (opts, args)
+
+
+class _FakeMainloop(object):
+  def RegisterSignal(self, owner):
+    pass
+
+
+class _EchoHandler(http.server.HttpServerHandler):
+  def HandleRequest(self, req):
+    return req.request_body
+
+
+def _ConfigCurl(curl):
+  curl.setopt(pycurl.SSL_VERIFYPEER, False)
+  curl.setopt(pycurl.SSL_VERIFYHOST, 0)
+
+
+def _Measure(cert_file, opts, keep_alive_timeout):
+  """Returns the average number of milliseconds per request.
+
+  """
+  ssl_params = http.HttpSslParams(cert_file, cert_file)
+  server = http.server.HttpServer(_FakeMainloop(), "127.0.0.1", 0, 20,
+                                  _EchoHandler(), ssl_params=ssl_params,
+                                  worker_pool_size=opts.workers,
+                                  keep_alive_timeout=keep_alive_timeout)
+  server.Start()
+  try:
+    port = server.socket.getsockname()[1]
+    pool = http.client.HttpClientPool(4, 16, 30)
+    try:
+      start = time.time()
+      for _ in range(opts.requests):
+        req = http.client.HttpClientRequest("127.0.0.1", port, "POST", "/",
+                                            post_data="x" * 1024,
+                                            curl_config_fn=_ConfigCurl)
+        http.client.ProcessRequests([req], curl_pool=pool)
+        assert req.success, req.error
+      return 1000.0 * (time.time() - start) / opts.requests
+    finally:
+      pool.Close()
+  finally:
+    server.Stop()
+    for pid in server._workers: # pylint: disable=W0212
+      os.waitpid(pid, 0)
+
+
+def main():
+  (opts, _) = ParseOptions()
+
+  tmpdir = tempfile.mkdtemp()
+  try:
+    cert_file = utils.PathJoin(tmpdir, "server.pem")
+    utils.GenerateSelfSignedSslCert(cert_file, 1)
+
+    print("%d requests, %d workers" % (opts.requests, opts.workers))
+    for (title, timeout) in [("Closed after request", 0),
+                             ("Keep-alive %.1fs" % opts.keep_alive_timeout,
+                              opts.keep_alive_timeout)]:
+      print("%-22s %8.3f ms/request" %
+            (title, _Measure(cert_file, opts, timeout)))
+  finally:
+    shutil.rmtree(tmpdir)
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,214 @@
+#!/usr/bin/python3
+#
+
+# Copyright (C) 2014 Google Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS
+# IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+# TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+# PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+"""Script for measuring disk transfers of the import/export daemon.
+
+This creates a disk image consisting of zeroes, compressible and random data
+and transfers it over a local pipe, once with the dd(1) and compression
+utility pipeline and once with L{ganeti.impexpd.transfer}. The socat(1)
+part, which is the same for both transports, is left out.
+
+"""
+
+import filecmp
+import os
+import random
+import shutil
+import optparse
+import tempfile
+import time
+
+from ganeti import constants
+from ganeti import utils
+from ganeti.impexpd import transfer
+
+
+#: Commands used by the pipeline for each compression method
+_PIPELINE_COMPRESS = {
+  constants.IEC_NONE: (None, None),
+  constants.IEC_GZIP: ("gzip -1 -c", "gzip -d -c"),
+  constants.IEC_GZIP_FAST: ("gzip -1 -c", "gzip -d -c"),
+  constants.IEC_GZIP_SLOW: ("gzip -c", "gzip -d -c"),
+  "xz": ("xz -c", "xz -d"),
+  }
+
+
+def ParseOptions():
+  """Parses the command line options.
+
+  In case of command line errors, it will show the usage and exit the
+  program.
+
+  @return: the options in a tuple
+
+  """
+  parser = optparse.OptionParser()
+  parser.add_option("-s", dest="size", default=512, type="int",
+                    help="Size of the disk image (MiB)", metavar="MIB")
+  parser.add_option("-z", dest="zero", default=50, type="int",
+                    help="Percentage of the image only containing zeroes",
+                    metavar="PERCENT")
+  parser.add_option("-r", dest="random", default=25, type="int",
+                    help="Percentage of the image containing random data",
+                    metavar="PERCENT")
+  parser.add_option("-c", dest="compress", default=constants.IEC_GZIP,
+                    choices=sorted(_PIPELINE_COMPRESS),
+                    help="Compression method", metavar="METHOD")
+  parser.add_option("-t", dest="threads", default=transfer.DEFAULT_THREADS,
+                    type="int", help="Number of threads for the native"
+                    " transport", metavar="NUM")
+
+  (opts, args) = parser.parse_args()
+
+  if opts.size < 1:
+    parser.error("Size must be at least 1 MiB")
+
+  if opts.zero < 0 or opts.random < 0 or opts.zero + opts.random > 100:
+    parser.error("Invalid percentages")
+
+  return (opts, args)
+
+
+def _BuildImage(path, opts):
+  """Writes the disk image.
+
+  Zeroes are written explicitly, like on a block device, so they have to be
+  detected by looking at the data.
+
+  """
+  rnd = random.Random(4242)
+  text = b"".join(b"%08d The quick brown fox jumps over the lazy dog\n" % i
+                  for i in range(1024 * 1024 // 54 + 1))[:1024 * 1024]
+  zero = bytes(1024 * 1024)
+
+  with open(path, "wb") as fh:
+    for _ in range(opts.size):
+      value = rnd.randrange(100)
+      if value < opts.zero:
+        fh.write(zero)
+      elif value < opts.zero + opts.random:
+        fh.write(os.urandom(1024 * 1024))
+      else:
+        fh.write(text)
+
+
+def _RunPipeline(src, dest, compress):
+  """Transfers the image using dd(1) and compression utilities.
+
+  The commands are the ones used for raw disks, including the dd(1) the
+  daemon uses to measure the throughput on both sides.
+
+  """
+  (compress_cmd, decompress_cmd) = _PIPELINE_COMPRESS[compress]
+  dd_cmd = "dd bs=%s" % transfer.CHUNK_SIZE
+
+  parts = ["dd if=%s bs=%s iflag=direct" %
+           (utils.ShellQuote(src), transfer.CHUNK_SIZE), dd_cmd]
+  if compress_cmd:
+    parts.extend([compress_cmd, decompress_cmd])
+  parts.extend([dd_cmd,
+                "dd of=%s bs=%s oflag=direct conv=notrunc" %
+                (utils.ShellQuote(dest), transfer.CHUNK_SIZE)])
+
+  result = utils.RunCmd(["bash", "-o", "errexit", "-o", "pipefail", "-c",
+                         " | ".join(parts)])
+  if result.failed:
+    raise Exception("Pipeline failed: %s" % result.output)
+
+
+def _RunNative(src, dest, compress, threads):
+  """Transfers the image using the native transport.
+
+  """
+  (read_fd, write_fd) = os.pipe()
+
+  sender = transfer.TransferThread(constants.IEM_EXPORT, src, write_fd,
+                                   transfer.Transfer(compress, "magic",
+                                                     threads=threads))
+  receiver = transfer.TransferThread(constants.IEM_IMPORT, dest, read_fd,
+                                     transfer.Transfer(compress, "magic",
+                                                       threads=threads))
+  sender.start()
+  receiver.start()
+  sender.join()
+  receiver.join()
+
+  for thread in [sender, receiver]:
+    if thread.error:
+      raise thread.error
+
+  return sender.transfer.transferred
+
+
+def _Measure(fn):
+  """Returns the number of seconds a function took to run.
+
+  """
+  start = time.time()
+  result = fn()
+  return (time.time() - start, result)
+
+
+def main():
+  (opts, _) = ParseOptions()
+
+  tmpdir = tempfile.mkdtemp()
+  try:
+    src = utils.PathJoin(tmpdir, "src")
+    dest = utils.PathJoin(tmpdir, "dest")
+    _BuildImage(src, opts)
+
+    print("%d MiB image, %d%% zeroes, %d%% random data, compression '%s'" %
+          (opts.size, opts.zero, opts.random, opts.compress))
+
+    for (title, fn) in [
+      ("Pipeline", lambda: _RunPipeline(src, dest, opts.compress)),
+      ("Native (%d threads)" % opts.threads,
+       lambda: _RunNative(src, dest, opts.compress, opts.threads)),
+      ]:
+      utils.RemoveFile(dest)
+      (duration, sent) = _Measure(fn)
+
+      if not filecmp.cmp(src, dest, shallow=False):
+        raise Exception("%s: data differs" % title)
+
+      if sent is None:
+        sent_info = ""
+      else:
+        sent_info = ", %.1f MiB sent" % (float(sent) / 1024 / 1024)
+
+      print("%-22s %8.3f s, %8.1f MiB/s%s" %
+            (title, duration, opts.size / duration, sent_info))
+  finally:
+    shutil.rmtree(tmpdir)
+
+
+if __name__ == "__main__":
+  main()
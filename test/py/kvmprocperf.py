@@ -0,0 +1,210 @@
+#!/usr/bin/python3
+#
+
+# Copyright (C) 2014 Google Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS
+# IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+# TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+# PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+"""Script for measuring the KVM process information lookups.
+
+This creates a synthetic proc directory with a given number of processes,
+some of which are KVM instances, and measures listing the running instances
+with the per-instance parsing of command lines used previously and with
+L{ganeti.hypervisor.hv_kvm.process.ProcessInfoCache}, both with an empty
+and with a populated cache.
+
+"""
+
+import os
+import time
+import shutil
+import optparse
+import tempfile
+
+from ganeti import utils
+from ganeti.hypervisor import hv_base
+from ganeti.hypervisor import hv_kvm
+from ganeti.hypervisor.hv_kvm import process
+
+
+def ParseOptions():
+  """Parses the command line options.
+
+  In case of command line errors, it will show the usage and exit the
+  program.
+
+  @return: the options in a tuple
+
+  """
+  parser = optparse.OptionParser()
+  parser.add_option("-p", dest="processes", default=500, type="int",
+                    help="Number of processes", metavar="NUM")
+  parser.add_option("-i", dest="instances", default=100, type="int",
+                    help="Number of KVM instances among the processes",
+                    metavar="NUM")
+  parser.add_option("-n", dest="repetitions", default=100, type="int",
+                    help="Number of times to list the instances",
+                    metavar="NUM")
+
+  (opts, args) = parser.parse_args()
+
+  if opts.instances > opts.processes:
+    parser.error("There can't be more instances than processes")
+
+  if opts.repetitions < 1:
+    parser.error("Number of repetitions must be at least 1")
+
+  return (opts, args)
+
+
+def _KvmCmdline(name):
+  """Returns a command line resembling the one of a KVM instance.
+
+  """
+  cmdline = ["/usr/bin/kvm", "-name", name, "-m", "1024", "-smp", "2",
+             "-pidfile", "/var/run/ganeti/kvm-hypervisor/pid/%s" % name,
+             "-daemonize", "-machine", "pc", "-cpu", "host"]
+  for idx in range(8):
+    cmdline.extend(["-drive", "file=/dev/disk%d,format=raw,if=none,"
+                    "id=hotdisk-%d,bus=0,unit=%d" % (idx, idx, idx),
+                    "-device", "virtio-blk-pci,drive=hotdisk-%d" % idx,
+                    "-netdev", "type=tap,id=hotnic-%d,fd=%d" % (idx, idx + 8),
+                    "-device", "virtio-net-pci,netdev=hotnic-%d" % idx])
+  return cmdline
+
+
+def _BuildProcDir(proc_dir, pids_dir, processes, instances):
+  """Creates the synthetic proc directory and instance pid files.
+
+  """
+  for pid in range(1000, 1000 + processes):
+    idx = pid - 1000
+    if idx < instances:
+      name = "inst%d.example.com" % idx
+      cmdline = _KvmCmdline(name)
+      utils.WriteFile(utils.PathJoin(pids_dir, name), data="%d\n" % pid)
+    else:
+      cmdline = ["/usr/sbin/daemon%d" % idx, "--foreground"]
+
+    pid_dir = utils.PathJoin(proc_dir, str(pid))
+    os.mkdir(pid_dir)
+    fields = ["S", "1"] + ["0"] * 17 + [str(pid * 10)] + ["0"] * 30
+    utils.WriteFile(utils.PathJoin(pid_dir, "stat"),
+                    data="%d (%s) %s\n" % (pid, os.path.basename(cmdline[0]),
+                                           " ".join(fields)))
+    utils.WriteFile(utils.PathJoin(pid_dir, "cmdline"),
+                    data="\x00".join(cmdline) + "\x00")
+    utils.WriteFile(utils.PathJoin(pid_dir, "status"), data="State: S\n")
+
+
+def _LegacyListInstances(proc_dir, pids_dir):
+  """Lists the instances the way it was done before the cache existed.
+
+  Each instance's process is checked for existence and its command line is
+  read and parsed.
+
+  """
+  result = []
+  for name in os.listdir(pids_dir):
+    pid = utils.ReadPidFile(utils.PathJoin(pids_dir, name))
+    try:
+      os.stat(utils.PathJoin(proc_dir, str(pid), "status"))
+    except EnvironmentError:
+      continue
+    cmdline = utils.ReadFile(utils.PathJoin(proc_dir, str(pid), "cmdline"))
+    instance = None
+    arg_list = cmdline.split("\x00")
+    while arg_list:
+      arg = arg_list.pop(0)
+      if arg == "-name":
+        instance = arg_list.pop(0).split(",")[0]
+      elif arg == "-m":
+        int(arg_list.pop(0))
+      elif arg == "-smp":
+        int(arg_list.pop(0).split(",")[0])
+    if instance == name:
+      result.append(name)
+  return result
+
+
+def _MakeHypervisor(proc_dir, pids_dir):
+  """Returns a KVM hypervisor working on the synthetic directories.
+
+  """
+  class _Hypervisor(hv_kvm.KVMHypervisor):
+    _PIDS_DIR = pids_dir
+    _PROCESS_INFO = process.ProcessInfoCache(proc_dir=proc_dir)
+
+    def __init__(self): # pylint: disable=W0231
+      hv_base.BaseHypervisor.__init__(self) # pylint: disable=W0233
+
+  return _Hypervisor()
+
+
+def _Measure(fn, repetitions):
+  """Returns the average number of milliseconds per call of a function.
+
+  """
+  start = time.time()
+  for _ in range(repetitions):
+    fn()
+  return 1000.0 * (time.time() - start) / repetitions
+
+
+def main():
+  (opts, _) = ParseOptions()
+
+  tmpdir = tempfile.mkdtemp()
+  try:
+    proc_dir = utils.PathJoin(tmpdir, "proc")
+    pids_dir = utils.PathJoin(tmpdir, "pid")
+    os.mkdir(proc_dir)
+    os.mkdir(pids_dir)
+    _BuildProcDir(proc_dir, pids_dir, opts.processes, opts.instances)
+
+    expected = sorted(_LegacyListInstances(proc_dir, pids_dir))
+    assert len(expected) == opts.instances
+    warm = _MakeHypervisor(proc_dir, pids_dir)
+    assert sorted(warm.ListInstances()) == expected
+
+    results = [
+      ("Per-instance parsing",
+       lambda: _LegacyListInstances(proc_dir, pids_dir)),
+      ("Cache, cold",
+       lambda: _MakeHypervisor(proc_dir, pids_dir).ListInstances()),
+      ("Cache, warm", warm.ListInstances),
+      ]
+
+    print("%d processes, %d KVM instances" %
+          (opts.processes, opts.instances))
+    for (title, fn) in results:
+      print("%-22s %8.3f ms/call" % (title, _Measure(fn, opts.repetitions)))
+  finally:
+    shutil.rmtree(tmpdir)
+
+
+if __name__ == "__main__":
+  main()
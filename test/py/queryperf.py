@@ -0,0 +1,252 @@
+#!/usr/bin/python3
+#
+
+# Copyright (C) 2014 Google Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS
+# IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+# TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+# PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+"""Script for measuring the evaluation of queries.
+
+Instance and node queries with typical field lists and filters are run
+over synthetic L{query.InstanceQueryData} and L{query.NodeQueryData}
+containers of a given size.
+
+"""
+
+import time
+import optparse
+
+from ganeti import constants
+from ganeti import objects
+from ganeti import qlang
+from ganeti import query
+
+
+#: Fields of instance queries, similar to "gnt-instance list -o+..."
+INSTANCE_FIELDS = [
+  "name", "os", "pnode", "pnode.group", "snodes", "admin_state", "status",
+  "oper_state", "oper_ram", "be/maxmem", "be/vcpus", "hv/kernel_path",
+  "nic.ips", "nic.macs", "nic.modes", "nic.links", "nic.bridges",
+  "disk_template", "network_port", "tags",
+  ]
+
+#: Fields of node queries, similar to "gnt-node list -o+..."
+NODE_FIELDS = [
+  "name", "dtotal", "dfree", "mtotal", "mnode", "mfree", "pinst_cnt",
+  "sinst_cnt", "pip", "sip", "group", "role", "master_candidate", "offline",
+  "ndp/spindle_count", "ndp/exclusive_storage", "ctotal", "tags",
+  ]
+
+
+def ParseOptions():
+  """Parses the command line options.
+
+  In case of command line errors, it will show the usage and exit the
+  program.
+
+  @return: the options in a tuple
+
+  """
+  parser = optparse.OptionParser()
+  parser.add_option("-i", dest="instance_counts", default="1000,10000",
+                    help="Comma-separated numbers of instances",
+                    metavar="NUM[,NUM...]")
+  parser.add_option("-n", dest="names", default=100, type="int",
+                    help="Number of names in name filters", metavar="NUM")
+  parser.add_option("-r", dest="repetitions", default=3, type="int",
+                    help="Number of times each query is run", metavar="NUM")
+
+  (opts, args) = parser.parse_args()
+
+  try:
+    opts.instance_counts = [int(i) for i in opts.instance_counts.split(",")]
+  except ValueError:
+    parser.error("Invalid number of instances")
+
+  if opts.repetitions < 1:
+    parser.error("Number of repetitions must be at least 1")
+
+  return (opts, args)
+
+
+def _BuildCluster():
+  """Builds a cluster object with default parameters.
+
+  """
+  cluster = objects.Cluster(cluster_name="cluster.example.com", serial_no=1,
+                            enabled_hypervisors=[constants.HT_KVM],
+                            enabled_user_shutdown=True,
+                            hvparams=constants.HVC_DEFAULTS,
+                            beparams={
+                              constants.PP_DEFAULT: constants.BEC_DEFAULTS,
+                              },
+                            nicparams={
+                              constants.PP_DEFAULT: constants.NICC_DEFAULTS,
+                              },
+                            ndparams=constants.NDC_DEFAULTS,
+                            os_hvp={}, osparams={}, tcpudp_port_pool=set())
+  cluster.UpgradeConfig()
+  return cluster
+
+
+def _BuildInstanceData(instance_count):
+  """Builds an instance query data container.
+
+  Each instance has two disks and two NICs, and is mirrored between two
+  of a hundred nodes; every tenth instance has a primary node not
+  responding.
+
+  @rtype: L{query.InstanceQueryData}
+
+  """
+  cluster = _BuildCluster()
+  group = objects.NodeGroup(uuid="group-uuid", name="default", ndparams={})
+  nodes = dict(("node%d-uuid" % i,
+                objects.Node(uuid="node%d-uuid" % i,
+                             name="node%d.example.com" % i,
+                             group=group.uuid, ndparams={}))
+               for i in range(100))
+  node_uuids = sorted(nodes)
+  bad_nodes = node_uuids[::10]
+
+  instances = []
+  live_data = {}
+  for i in range(instance_count):
+    nics = [objects.NIC(mac="aa:00:00:%02x:%02x:%02x" %
+                        (i >> 16, (i >> 8) & 0xff, i & 0xff),
+                        ip="192.0.2.%d" % (i % 250 + 1), nicparams={}),
+            objects.NIC(mac="aa:00:01:%02x:%02x:%02x" %
+                        (i >> 16, (i >> 8) & 0xff, i & 0xff),
+                        nicparams={constants.NIC_MODE: constants.NIC_MODE_OVS,
+                                   constants.NIC_LINK: "ovs0"})]
+    disks = [objects.Disk(dev_type=constants.DT_DRBD8, size=1024 * (j + 1))
+             for j in range(2)]
+    pnode = node_uuids[i % len(node_uuids)]
+    snode = node_uuids[(i + 1) % len(node_uuids)]
+    inst = objects.Instance(uuid="inst%d-uuid" % i,
+                            name="inst%d.example.com" % i,
+                            os="debian-image", hypervisor=constants.HT_KVM,
+                            primary_node=pnode, secondary_nodes=[snode],
+                            admin_state=constants.ADMINST_UP,
+                            admin_state_source=constants.ADMIN_SOURCE,
+                            disk_template=constants.DT_DRBD8,
+                            network_port=11000 + i, disks=disks, nics=nics,
+                            hvparams={}, beparams={}, osparams={},
+                            tags=set(["tag%d" % (i % 7)]))
+    instances.append(inst)
+    if pnode not in bad_nodes:
+      live_data[inst.uuid] = {"state": "running", "memory": 128, "vcpus": 1}
+
+  return query.InstanceQueryData(instances, cluster, None, [], bad_nodes,
+                                 live_data, set(), {}, nodes,
+                                 {group.uuid: group}, {})
+
+
+def _BuildNodeData(node_count):
+  """Builds a node query data container.
+
+  @rtype: L{query.NodeQueryData}
+
+  """
+  cluster = _BuildCluster()
+  group = objects.NodeGroup(uuid="group-uuid", name="default", ndparams={})
+  nodes = [objects.Node(uuid="node%d-uuid" % i, name="node%d.example.com" % i,
+                        primary_ip="192.0.2.%d" % (i % 250 + 1),
+                        secondary_ip="198.51.100.%d" % (i % 250 + 1),
+                        group=group.uuid, ndparams={}, master_candidate=True,
+                        offline=False, drained=False, vm_capable=True,
+                        tags=set())
+           for i in range(node_count)]
+  live_data = dict((node.uuid, {"storage_size": 1024 * 1024,
+                                "storage_free": 512 * 1024,
+                                "memory_total": 65536, "memory_dom0": 1024,
+                                "memory_free": 32768, "cpu_total": 32})
+                   for node in nodes)
+  node_to_primary = dict((node.uuid, set(["a", "b"])) for node in nodes)
+  node_to_secondary = dict((node.uuid, set(["c"])) for node in nodes)
+  return query.NodeQueryData(nodes, live_data, nodes[0].uuid,
+                             node_to_primary, node_to_secondary, {},
+                             {group.uuid: group}, {}, cluster)
+
+
+def _NameFilter(names):
+  """Builds a filter selecting items by name."""
+  return [qlang.OP_OR] + [[qlang.OP_EQUAL, "name", name] for name in names]
+
+
+def _Measure(fields, selected, qfilter, data, repetitions):
+  """Measures a query.
+
+  @return: the number of result rows and the average milliseconds per query
+
+  """
+  start = time.time()
+  for _ in range(repetitions):
+    q = query.Query(fields, selected, qfilter=qfilter, namefield="name")
+    rows = q.Query(data)
+  return (len(rows), 1000.0 * (time.time() - start) / repetitions)
+
+
+def _Run(instance_count, name_count, repetitions):
+  """Runs the measurements for one number of instances.
+
+  @return: list of (description, rows, milliseconds)
+
+  """
+  idata = _BuildInstanceData(instance_count)
+  ndata = _BuildNodeData(instance_count // 10)
+  step = max(instance_count // name_count, 1)
+  inst_names = [inst.name.split(".")[0]
+                for inst in idata.instances[::step][:name_count]]
+  node_names = [node.name for node in ndata.nodes[::step][:name_count]]
+
+  queries = [
+    ("instances", query.INSTANCE_FIELDS, INSTANCE_FIELDS, None, idata),
+    ("instances by name", query.INSTANCE_FIELDS, INSTANCE_FIELDS,
+     _NameFilter(inst_names), idata),
+    ("running instances", query.INSTANCE_FIELDS, INSTANCE_FIELDS,
+     [qlang.OP_AND, [qlang.OP_EQUAL, "status", constants.INSTST_RUNNING],
+      [qlang.OP_GT, "be/maxmem", 64]], idata),
+    ("nodes", query.NODE_FIELDS, NODE_FIELDS, None, ndata),
+    ("nodes by name", query.NODE_FIELDS, NODE_FIELDS,
+     _NameFilter(node_names), ndata),
+    ]
+
+  return [(descr, ) + _Measure(fields, selected, qfilter, data, repetitions)
+          for (descr, fields, selected, qfilter, data) in queries]
+
+
+def main():
+  (opts, _) = ParseOptions()
+
+  print("%9s %-18s %7s %10s" % ("Instances", "Query", "Rows", "ms/query"))
+  for count in opts.instance_counts:
+    for (descr, rows, msecs) in _Run(count, opts.names, opts.repetitions):
+      print("%9d %-18s %7d %10.1f" % (count, descr, rows, msecs))
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,162 @@
+#!/usr/bin/python3
+#
+
+# Copyright (C) 2014 Google Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS
+# IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+# TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+# PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+"""Script for measuring the preparation of RPC requests.
+
+A call is made to a given number of nodes, with the HTTP requests not
+actually being sent; what's measured is the time spent encoding and
+serializing the request bodies.
+
+"""
+
+import os
+import time
+import optparse
+import tempfile
+
+from ganeti import compat
+from ganeti import constants
+from ganeti import http
+from ganeti import rpc_defs
+from ganeti import serializer
+from ganeti.rpc import node as rpc
+
+import mocks
+
+
+def ParseOptions():
+  """Parses the command line options.
+
+  In case of command line errors, it will show the usage and exit the
+  program.
+
+  @return: the options in a tuple
+
+  """
+  parser = optparse.OptionParser()
+  parser.add_option("-n", dest="node_count", default=300, type="int",
+                    help="Number of nodes", metavar="NUM")
+  parser.add_option("-s", dest="size", default=1024 * 1024, type="int",
+                    help="Size of the uploaded data in bytes", metavar="NUM")
+  parser.add_option("-r", dest="repetitions", default=5, type="int",
+                    help="Number of times each call is made", metavar="NUM")
+
+  (opts, args) = parser.parse_args()
+
+  if opts.node_count < 1:
+    parser.error("Number of nodes must be at least 1")
+
+  if opts.repetitions < 1:
+    parser.error("Number of repetitions must be at least 1")
+
+  return (opts, args)
+
+
+def _ProcessRequests(reqs, lock_monitor_cb=None):
+  """Fake request processor answering all requests successfully.
+
+  """
+  # pylint: disable=W0613
+  for req in reqs:
+    req.success = True
+    req.resp_status_code = http.HTTP_OK
+    req.resp_body = serializer.DumpJson((True, None))
+
+
+def _EncodeDisks(node, disks):
+  """Node-dependent encoder standing in for disk parameter annotation.
+
+  """
+  return [dict(disk, node=node) for disk in disks]
+
+
+def _Measure(client, cdef, nodes, args, repetitions):
+  """Measures a call.
+
+  @return: average milliseconds per call
+
+  """
+  start = time.time()
+  for _ in range(repetitions):
+    client._Call(cdef, nodes, args) # pylint: disable=W0212
+  return 1000.0 * (time.time() - start) / repetitions
+
+
+def main():
+  (opts, _) = ParseOptions()
+
+  nodes = ["node%d.example.com" % i for i in range(opts.node_count)]
+  resolver = rpc._StaticResolver(["192.0.2.%d" % (i % 250 + 1)
+                                  for i in range(opts.node_count)])
+
+  encoders = rpc._ENCODERS.copy()
+  encoders.update({
+    rpc_defs.ED_FILE_DETAILS: compat.partial(rpc._PrepareFileUpload,
+                                             mocks.FakeGetentResolver),
+    rpc_defs.ED_DISKS_DICT_DP: _EncodeDisks,
+    })
+
+  client = rpc._RpcClientBase(resolver, encoders.get,
+                              _req_process_fn=_ProcessRequests)
+
+  (fd, filename) = tempfile.mkstemp()
+  try:
+    os.write(fd, os.urandom(opts.size // 2) + b"\0" * (opts.size // 2))
+    os.close(fd)
+
+    disks = [{"size": 1024 * (i + 1), "dev_type": constants.DT_PLAIN}
+             for i in range(4)]
+
+    calls = [
+      ("upload_file", [
+        ("file_name", rpc_defs.ED_FILE_DETAILS, None),
+        ], [filename]),
+      ("jobqueue_update", [
+        ("file_name", None, None),
+        ("content", rpc_defs.ED_COMPRESS, None),
+        ], ["/var/lib/ganeti/queue/job-1", b"x" * opts.size]),
+      ("mixed", [
+        ("disks", rpc_defs.ED_DISKS_DICT_DP, None),
+        ("content", rpc_defs.ED_COMPRESS, None),
+        ], [disks, b"x" * opts.size]),
+      ]
+
+    print("%6s %-16s %10s" % ("Nodes", "Call", "ms/call"))
+    for (name, argdefs, args) in calls:
+      cdef = (name, rpc_defs.MULTI, None, constants.RPC_TMO_NORMAL, argdefs,
+              None, None, None)
+      msecs = _Measure(client, cdef, nodes, args, opts.repetitions)
+      print("%6d %-16s %10.1f" % (opts.node_count, name, msecs))
+  finally:
+    os.unlink(filename)
+
+
+if __name__ == "__main__":
+  main()
@@ -872,6 +872,7 @@ class ConfigMock(config.ConfigWriter):
     instance.serial_no = 1
     instance.ctime = instance.mtime = time.time()
     self._ConfigData().instances[instance.uuid] = instance
+    self._UpdateIndex("instances", instance.uuid)
     self._ConfigData().cluster.serial_no += 1 # pylint: disable=E1103
     self.ReleaseDRBDMinors(instance.uuid)
     self._UnlockedCommitTemporaryIps(ec_id)
@@ -879,6 +880,7 @@ class ConfigMock(config.ConfigWriter):
   def _UnlockedAddDisk(self, disk):
     disk.UpgradeConfig()
     self._ConfigData().disks[disk.uuid] = disk
+    self._UpdateIndex("disks", disk.uuid)
     self._ConfigData().cluster.serial_no += 1 # pylint: disable=E1103
     self.ReleaseDRBDMinors(disk.uuid)
 
@@ -892,6 +894,7 @@ class ConfigMock(config.ConfigWriter):
       disk.iv_name = "disk/%s" % (idx + disk_idx)
     instance.serial_no += 1
     instance.mtime = time.time()
+    self._UpdateIndex("instances", inst_uuid)
 
   def AddInstanceDisk(self, inst_uuid, disk, idx=None, replace=False):
     self._UnlockedAddDisk(disk)
@@ -910,23 +913,24 @@ class ConfigMock(config.ConfigWriter):
     return 1
 
   def Update(self, target, feedback_fn, ec_id=None):
-    def replace_in(target, tdict):
-      tdict[target.uuid] = target
+    def replace_in(target, key):
+      getattr(self._ConfigData(), key)[target.uuid] = target
+      self._UpdateIndex(key, target.uuid)
 
     update_serial = False
     if isinstance(target, objects.Cluster):
       self._ConfigData().cluster = target
     elif isinstance(target, objects.Node):
-      replace_in(target, self._ConfigData().nodes)
+      replace_in(target, "nodes")
       update_serial = True
     elif isinstance(target, objects.Instance):
-      replace_in(target, self._ConfigData().instances)
+      replace_in(target, "instances")
     elif isinstance(target, objects.NodeGroup):
-      replace_in(target, self._ConfigData().nodegroups)
+      replace_in(target, "nodegroups")
     elif isinstance(target, objects.Network):
-      replace_in(target, self._ConfigData().networks)
+      replace_in(target, "networks")
     elif isinstance(target, objects.Disk):
-      replace_in(target, self._ConfigData().disks)
+      replace_in(target, "disks")
 
     target.serial_no += 1
     target.mtime = now = time.time()
@@ -937,6 +941,7 @@ class ConfigMock(config.ConfigWriter):
 
   def SetInstancePrimaryNode(self, inst_uuid, target_node_uuid):
     self._UnlockedGetInstanceInfo(inst_uuid).primary_node = target_node_uuid
+    self._UpdateIndex("instances", inst_uuid)
 
   def _SetInstanceStatus(self, inst_uuid, status,
                          disks_active, admin_state_source):
@@ -992,6 +997,7 @@ class ConfigMock(config.ConfigWriter):
     _UpdateIvNames(idx, instance_disks[idx:])
     instance.serial_no += 1
     instance.mtime = time.time()
+    self._UpdateIndex("instances", inst_uuid)
 
   def DetachInstanceDisk(self, inst_uuid, disk_uuid):
     self._UnlockedDetachInstanceDisk(inst_uuid, disk_uuid)
@@ -1002,6 +1008,7 @@ class ConfigMock(config.ConfigWriter):
 
   def RemoveInstance(self, inst_uuid):
     del self._ConfigData().instances[inst_uuid]
+    self._UpdateIndex("instances", inst_uuid)
 
   def AddTcpUdpPort(self, port):
     self._ConfigData().cluster.tcpudp_port_pool.add(port)